@@ -0,0 +1,174 @@
+"""
+Fingerprints of the inputs of the demand calculation, used to skip buildings whose inputs did not change since the
+last run of the demand script.
+
+The fingerprint of a building is a hash of:
+
+- the building properties as read by :py:class:`cea.demand.building_properties.BuildingProperties`. These combine the
+  rows of the building in the zone geometry and building properties files with the rows of the databases they refer
+  to (envelope assemblies, HVAC and supply systems), as well as the solar insolation of the building
+- the contents of the schedule file (or the deduplicated schedule profile and scaling factors) and of the radiation
+  file of the building
+- the contents of the weather file
+- the settings of the demand script that change its results and the version of the CEA
+"""
+
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+import cea
+from cea.demand.schedule_maker.schedule_maker import read_schedule_factors
+
+__author__ = "Daren Thomas"
+__copyright__ = "Copyright 2024, Architecture and Building Systems - ETH Zurich"
+__credits__ = ["Daren Thomas"]
+__license__ = "MIT"
+__version__ = "0.1"
+__maintainer__ = "Daren Thomas"
+__email__ = "cea@arch.ethz.ch"
+__status__ = "Production"
+
+BLOCK_SIZE = 2 ** 20
+
+
+def calc_settings_fingerprint(config):
+    """Hash the settings of the demand script that change its results"""
+    settings = {
+        'version': cea.__version__,
+        'use_dynamic_infiltration_calculation': config.demand.use_dynamic_infiltration_calculation,
+        'resolution_output': config.demand.resolution_output,
+        'loads_output': config.demand.loads_output,
+        'massflows_output': config.demand.massflows_output,
+        'temperatures_output': config.demand.temperatures_output,
+        'rc_model_solver': config.demand.rc_model_solver,
+        'results_format': config.demand.results_format,
+        'results_float32': config.demand.results_float32,
+    }
+    h = hashlib.sha256()
+    update_hash(h, settings)
+    return h.hexdigest()
+
+
+def calc_building_fingerprint(locator, bpr, shared_fingerprint):
+    """
+    Calculate the fingerprint of a building.
+
+    :param locator: an InputLocator for locating the input files
+    :param bpr: the BuildingPropertiesRow of the building
+    :param str shared_fingerprint: hash of the inputs shared by all buildings (weather file and settings)
+    :rtype: str
+    """
+    h = hashlib.sha256()
+    h.update(shared_fingerprint.encode())
+    update_hash(h, vars(bpr))
+    schedule_model_file = locator.find_schedule_model_file(bpr.name)
+    if schedule_model_file == locator.get_schedule_model_buildings():
+        # deduplicated schedules: the profile id is a hash of the weekly schedules, the factors scale it to the building
+        factors = read_schedule_factors(locator)
+        update_hash(h, factors.loc[bpr.name] if bpr.name in factors.index else None)
+    else:
+        h.update(hash_file(schedule_model_file).encode())
+    h.update(hash_file(locator.get_radiation_building(bpr.name)).encode())
+    return h.hexdigest()
+
+
+def hash_file(path):
+    """Hash the contents of a file (an empty string is returned for missing files)"""
+    if not os.path.exists(path):
+        return ''
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def update_hash(h, value):
+    """
+    Feed a (nested) structure of dicts, lists, pandas objects, numpy arrays and objects (their attributes) to the hash
+    ``h``. Values without a stable representation (the default ``repr`` includes the address of the object) raise a
+    ``TypeError``.
+    """
+    if isinstance(value, (pd.Series, pd.DataFrame)):
+        value = value.to_dict()
+    if isinstance(value, dict):
+        for key in sorted(value, key=str):
+            h.update(str(key).encode())
+            update_hash(h, value[key])
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            update_hash(h, item)
+    elif isinstance(value, np.ndarray):
+        h.update(str(value.dtype).encode())
+        h.update(np.ascontiguousarray(value).tobytes())
+    elif hasattr(value, '__dict__'):
+        update_hash(h, vars(value))
+    elif get_slots(value):
+        update_hash(h, {slot: getattr(value, slot, None) for slot in get_slots(value)})
+    elif type(value).__repr__ is object.__repr__:
+        raise TypeError("Can't calculate the fingerprint of {value!r}".format(value=value))
+    else:
+        h.update(repr(value).encode())
+
+
+def get_slots(value):
+    """The names of the ``__slots__`` of the class of ``value`` and its base classes"""
+    slots = []
+    for cls in type(value).__mro__:
+        cls_slots = cls.__dict__.get('__slots__', ())
+        slots.extend([cls_slots] if isinstance(cls_slots, str) else cls_slots)
+    return [slot for slot in slots if slot not in ('__dict__', '__weakref__')]
+
+
+def read_fingerprints(locator):
+    """Read the fingerprints of the last run of the demand script as a dict ``building -> fingerprint``"""
+    fingerprints_file = locator.get_demand_fingerprints()
+    if not os.path.exists(fingerprints_file):
+        return {}
+    fingerprints = pd.read_csv(fingerprints_file)
+    return dict(zip(fingerprints['Name'], fingerprints['fingerprint']))
+
+
+def write_fingerprints(locator, fingerprints):
+    """Update the fingerprints file with the fingerprints of the buildings just simulated"""
+    all_fingerprints = read_fingerprints(locator)
+    all_fingerprints.update(fingerprints)
+    save_fingerprints(locator, all_fingerprints)
+
+
+def find_unchanged_buildings(locator, fingerprints):
+    """
+    Return the buildings that do not need to be simulated again: their fingerprint is the same as in the last run and
+    their results (including their row in the total demand file) are still there.
+
+    :param locator: an InputLocator for locating the input files
+    :param dict fingerprints: the current fingerprint of each building
+    :return: the list of unchanged buildings and a DataFrame with the rows of the total demand file for them
+    :rtype: tuple[list[str], pandas.DataFrame]
+    """
+    previous_fingerprints = read_fingerprints(locator)
+    if not previous_fingerprints or not os.path.exists(locator.get_total_demand()):
+        return [], None
+    previous_totals = pd.read_csv(locator.get_total_demand()).set_index('Name', drop=False)
+    unchanged_buildings = [building for building, fingerprint in fingerprints.items()
+                           if previous_fingerprints.get(building) == fingerprint
+                           and building in previous_totals.index
+                           and os.path.exists(locator.find_demand_results_file(building))]
+    return unchanged_buildings, previous_totals.loc[unchanged_buildings].reset_index(drop=True)
+
+
+def remove_fingerprints(locator, buildings):
+    """Forget the fingerprints of buildings simulated without recording their fingerprints"""
+    fingerprints = read_fingerprints(locator)
+    if any(building in fingerprints for building in buildings):
+        for building in buildings:
+            fingerprints.pop(building, None)
+        save_fingerprints(locator, fingerprints)
+
+
+def save_fingerprints(locator, fingerprints):
+    pd.DataFrame({'Name': list(fingerprints.keys()),
+                  'fingerprint': list(fingerprints.values())}).to_csv(locator.get_demand_fingerprints(), index=False)
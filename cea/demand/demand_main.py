@@ -12,10 +12,11 @@ import cea.config
 import cea.inputlocator
 import cea.utilities.parallel
 from cea import MissingInputDataException
-from cea.demand import thermal_loads
+from cea.demand import demand_fingerprint, thermal_loads
 from cea.demand.building_properties import BuildingProperties
 from cea.utilities import epwreader
 from cea.utilities.date import get_date_range_hours_from_year
+from cea.utilities.shared_arrays import SharedMemoryBlock, share_dataframe
 from cea.demand import demand_writers
 from cea.datamanagement.data_migrator import is_3_22
 
@@ -98,28 +99,68 @@ def demand_calculation(locator, config):
         print(
             'Warning! The following list of buildings have less than 100 m2 of gross floor area, CEA might fail: %s' % list_buildings_less_100m2)
 
+    # SKIP BUILDINGS WITH UNCHANGED INPUTS
+    fingerprints = {}
+    unchanged_buildings, previous_totals = [], None
+    if config.demand.skip_unchanged_buildings:
+        shared_fingerprint = demand_fingerprint.calc_settings_fingerprint(config) + demand_fingerprint.hash_file(
+            weather_path)
+        fingerprints = dict((building_name, demand_fingerprint.calc_building_fingerprint(
+            locator, building_properties[building_name], shared_fingerprint)) for building_name in building_names)
+        unchanged_buildings, previous_totals = demand_fingerprint.find_unchanged_buildings(locator, fingerprints)
+        print('Skipping %i buildings with unchanged inputs' % len(unchanged_buildings))
+    else:
+        demand_fingerprint.remove_fingerprints(locator, building_names)
+    unchanged_buildings = set(unchanged_buildings)
+    buildings_to_simulate = [b for b in building_names if b not in unchanged_buildings]
+
+    # share the weather data and the solar gains of the buildings with the worker processes instead of copying them
+    # into each worker (see `cea.utilities.shared_arrays`)
+    shared_weather, weather_data = share_dataframe(weather_data, config.get_number_of_processes())
+    bprs = dict((b, building_properties[b]) for b in buildings_to_simulate)
+    shared_solar = SharedMemoryBlock([bpr.solar.I_sol for bpr in bprs.values()], config.get_number_of_processes())
+    for bpr, I_sol in zip(bprs.values(), shared_solar.arrays):
+        bpr.solar.I_sol = I_sol
+
     # DEMAND CALCULATION
-    n = len(building_names)
-    calc_thermal_loads = cea.utilities.parallel.vectorize(thermal_loads.calc_thermal_loads,
-                                                          config.get_number_of_processes(), on_complete=print_progress)
-
-    calc_thermal_loads(
-        building_names,
-        [building_properties[b] for b in building_names],
-        repeat(weather_data, n),
-        repeat(date_range, n),
-        repeat(locator, n),
-        repeat(use_dynamic_infiltration, n),
-        repeat(resolution_output, n),
-        repeat(loads_output, n),
-        repeat(massflows_output, n),
-        repeat(temperatures_output, n),
-         repeat(config, n),
-        repeat(debug, n))
+    if config.demand.rc_model_solver == 'annual' and config.demand.batch_size > 1:
+        # simulate batches of buildings together, see `thermal_loads.calc_thermal_loads_batch`
+        batches = split_into_batches(buildings_to_simulate, config.demand.batch_size,
+                                     config.get_number_of_processes())
+        n = len(batches)
+        calc_thermal_loads = cea.utilities.parallel.vectorize(thermal_loads.calc_thermal_loads_batch,
+                                                              config.get_number_of_processes(),
+                                                              on_complete=print_batch_progress)
+        building_names_per_task = batches
+        building_properties_per_task = [[bprs[b] for b in batch] for batch in batches]
+    else:
+        n = len(buildings_to_simulate)
+        calc_thermal_loads = cea.utilities.parallel.vectorize(thermal_loads.calc_thermal_loads,
+                                                              config.get_number_of_processes(),
+                                                              on_complete=print_progress)
+        building_names_per_task = buildings_to_simulate
+        building_properties_per_task = [bprs[b] for b in buildings_to_simulate]
+
+    with shared_weather, shared_solar:
+        calc_thermal_loads(
+            building_names_per_task,
+            building_properties_per_task,
+            repeat(weather_data, n),
+            repeat(date_range, n),
+            repeat(locator, n),
+            repeat(use_dynamic_infiltration, n),
+            repeat(resolution_output, n),
+            repeat(loads_output, n),
+            repeat(massflows_output, n),
+            repeat(temperatures_output, n),
+            repeat(config, n),
+            repeat(debug, n))
 
     # WRITE TOTAL YEARLY VALUES
     writer_totals = demand_writers.YearlyDemandWriter(loads_output, massflows_output, temperatures_output)
-    writer_totals.write_to_csv(building_names, locator)
+    writer_totals.write_to_csv(building_names, locator, previous_totals)
+    if fingerprints:
+        demand_fingerprint.write_fingerprints(locator, fingerprints)
     time_elapsed = time.perf_counter() - t0
     print('done - time elapsed: %d.2 seconds' % time_elapsed)
 
@@ -128,6 +169,20 @@ def print_progress(i, n, args, _):
     print("Building No. {i} completed out of {n}: {building}".format(i=i + 1, n=n, building=args[0]))
 
 
+def print_batch_progress(i, n, args, _):
+    print("Batch No. {i} completed out of {n}: {buildings}".format(i=i + 1, n=n, buildings=", ".join(args[0])))
+
+
+def split_into_batches(building_names, batch_size, number_of_processes):
+    """
+    Split the buildings into batches of at most ``batch_size`` buildings, making sure there is at least one batch
+    per process.
+    """
+    n = len(building_names)
+    batch_size = max(1, min(batch_size, -(-n // number_of_processes)))
+    return [building_names[i:i + batch_size] for i in range(0, n, batch_size)]
+
+
 def main(config):
     assert os.path.exists(config.scenario), 'Scenario not found: %s' % config.scenario
     locator = cea.inputlocator.InputLocator(scenario=config.scenario)
@@ -2,11 +2,15 @@
 A collection of classes that write out the demand results files. The default is `HourlyDemandWriter`. A `MonthlyDemandWriter` is provided
 that sums the values up monthly. See the `cea.analysis.sensitivity.sensitivity_demand` module for an example of using
 the `MonthlyDemandWriter`.
+
+The per-building results can be written either as csv files or as parquet files (see the `results-format` parameter
+of the demand script). Use `InputLocator.read_demand_results` to read them back regardless of the format.
 """
 
 
 
 
+import os
 
 import numpy as np
 import pandas as pd
@@ -57,6 +61,17 @@ class DemandWriter(object):
             locator.get_temporary_file('%(building_name)sT.csv' % locals()),
             index=False, columns=columns, float_format='%.3f', na_rep='nan')
 
+    def results_to_parquet(self, tsd, bpr, locator, date, building_name, float32=False):
+        # save hourly data
+        columns, hourly_data = self.calc_hourly_dataframe(building_name, date, tsd)
+        self.write_to_parquet(building_name, columns, hourly_data, locator, float32)
+
+        # save annual values to a temp file for YearlyDemandWriter
+        columns, data = self.calc_yearly_dataframe(bpr, building_name, tsd)
+        pd.DataFrame(data, index=[0]).to_csv(
+            locator.get_temporary_file('%(building_name)sT.csv' % locals()),
+            index=False, columns=columns, float_format='%.3f', na_rep='nan')
+
     def calc_yearly_dataframe(self, bpr, building_name, tsd):
         # if printing total values is necessary
         # treating timeseries data from W to MWh
@@ -98,6 +113,28 @@ class DemandWriter(object):
         return columns, hourly_data
 
 
+def write_parquet(data, locator, building_name, float32=False):
+    """
+    Write the results of a building to the parquet store. The file is written to a temporary location first and
+    then moved into place, so that readers never see a partially written file even while other workers are still
+    writing their buildings. Any csv results of the same building are removed, as they would be stale.
+    """
+    if float32:
+        float_columns = data.select_dtypes(include='float64').columns
+        data = data.astype(dict((column, np.float32) for column in float_columns))
+    results_file = locator.get_demand_results_file(building_name, 'parquet')
+    temporary_file = results_file + '.tmp'
+    data.to_parquet(temporary_file, index=False)
+    os.replace(temporary_file, results_file)
+    remove_stale_results(locator, building_name, 'csv')
+
+
+def remove_stale_results(locator, building_name, format):
+    stale_file = locator.get_demand_results_file(building_name, format)
+    if os.path.exists(stale_file):
+        os.remove(stale_file)
+
+
 class HourlyDemandWriter(DemandWriter):
     """Write out the hourly demand results"""
 
@@ -107,6 +144,13 @@ class HourlyDemandWriter(DemandWriter):
     def write_to_csv(self, building_name, columns, hourly_data, locator):
         hourly_data.to_csv(locator.get_demand_results_file(building_name, 'csv'), columns=columns,
                            float_format=FLOAT_FORMAT, na_rep='nan')
+        remove_stale_results(locator, building_name, 'parquet')
+
+    def write_to_parquet(self, building_name, columns, hourly_data, locator, float32=False):
+        # store the DATE the same way it is written to the csv files
+        hourly_data = hourly_data[columns].reset_index()
+        hourly_data['DATE'] = hourly_data['DATE'].astype(str)
+        write_parquet(hourly_data, locator, building_name, float32)
 
     def write_to_hdf5(self, building_name, columns, hourly_data, locator):
         # fixing columns with strings
@@ -127,6 +171,12 @@ class MonthlyDemandWriter(DemandWriter):
         monthly_data_new = self.calc_monthly_dataframe(building_name, hourly_data)
         monthly_data_new.to_csv(locator.get_demand_results_file(building_name, 'csv'), index=False,
                                 float_format=FLOAT_FORMAT, na_rep='nan')
+        remove_stale_results(locator, building_name, 'parquet')
+
+    def write_to_parquet(self, building_name, columns, hourly_data, locator, float32=False):
+        # get monthly totals and rename to MWhyr
+        monthly_data_new = self.calc_monthly_dataframe(building_name, hourly_data)
+        write_parquet(monthly_data_new, locator, building_name, float32)
 
     def write_to_hdf5(self, building_name, columns, hourly_data, locator):
         # get monthly totals and rename to MWhyr
@@ -158,15 +208,18 @@ class YearlyDemandWriter(DemandWriter):
     def __init__(self, loads, massflows, temperatures):
         super(YearlyDemandWriter, self).__init__(loads, massflows, temperatures)
 
-    def write_to_csv(self, list_buildings, locator):
-        """read in the temporary results files and append them to the Totals.csv file."""
-        df = None
-        for name in list_buildings:
-            temporary_file = locator.get_temporary_file('%(name)sT.csv' % locals())
-            if df is None:
-                df = pd.read_csv(temporary_file)
-            else:
-                df = pd.concat([df, pd.read_csv(temporary_file)], ignore_index=True)
+    def write_to_csv(self, list_buildings, locator, previous_totals=None):
+        """read in the temporary results files and append them to the Totals.csv file.
+
+        :param previous_totals: rows of the previous Totals.csv file to keep for buildings that were not simulated
+            again (see ``cea.demand.demand_fingerprint``)
+        """
+        if previous_totals is None:
+            previous_totals = pd.DataFrame(columns=['Name'])
+        previous_totals = previous_totals.set_index('Name', drop=False)
+        df = pd.concat([previous_totals.loc[[name]] if name in previous_totals.index
+                        else pd.read_csv(locator.get_temporary_file('%(name)sT.csv' % locals()))
+                        for name in list_buildings], ignore_index=True)
         df.to_csv(locator.get_total_demand('csv'), index=False, float_format='%.3f', na_rep='nan')
 
         # """read saved data of monthly values and return as totals"""
@@ -177,13 +230,8 @@ class YearlyDemandWriter(DemandWriter):
 
     def write_to_hdf5(self, list_buildings, locator):
         """read in the temporary results files and append them to the Totals.csv file."""
-        df = None
-        for name in list_buildings:
-            temporary_file = locator.get_temporary_file('%(name)sT.hdf' % locals())
-            if df is None:
-                df = pd.read_hdf(temporary_file, key='dataset')
-            else:
-                df = df.append(pd.read_hdf(temporary_file, key='dataset'))
+        df = pd.concat([pd.read_hdf(locator.get_temporary_file('%(name)sT.hdf' % locals()), key='dataset')
+                        for name in list_buildings])
         df.to_hdf(locator.get_total_demand('hdf'), key='dataset')
 
         """read saved data of monthly values and return as totals"""
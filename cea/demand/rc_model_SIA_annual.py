@@ -0,0 +1,647 @@
+# -*- coding: utf-8 -*-
+"""
+Whole-year solver for the SIA 2044 R-C-model
+
+The hourly procedure in :py:mod:`cea.demand.hourly_procedure_heating_cooling_system_load` steps through the year one
+hour at a time, evaluating the R-C-model two to three times per hour through scalar Python functions and looking up
+every input in the ``tsd`` dict. This module solves the same model for a whole year at once:
+
+- all coefficients that do not depend on the state of the building (conductances, gain factors, internal gains,
+  ventilation air flows, ...) are calculated once as arrays for all hours of the year,
+- only the state recurrence (``theta_m``, ``theta_c``, ``T_int`` and ``x_int`` of the previous hour) is run in a
+  compiled loop,
+- the results are written back to ``tsd`` with array operations.
+
+Several buildings can be solved together with :py:func:`calc_heating_cooling_loads_batch`: their inputs are stacked
+into arrays with one column per building and the compiled loop steps all buildings through each simulation hour.
+
+The results are identical to the hourly procedure. The solver covers buildings without air-conditioning systems, i.e.
+radiator and floor heating, ceiling and floor cooling or no system at all, with static infiltration and without
+night flushing or economizer control. Use :py:func:`can_use_annual_solver` to check a building before calling
+:py:func:`calc_heating_cooling_loads_annual`.
+"""
+
+import warnings
+
+import numpy as np
+from numba import jit
+
+from cea.constants import HOURS_IN_YEAR, HOURS_PRE_CONDITIONING, BOLTZMANN, KELVIN_OFFSET
+from cea.demand import control_heating_cooling_systems, constants, space_emission_systems
+from cea.demand import rc_model_SIA
+from cea.demand.latent_loads import convert_rh_to_moisture_content, RHO_A, DELTA_T
+
+__author__ = "Daren Thomas"
+__copyright__ = "Copyright 2024, Architecture and Building Systems - ETH Zurich"
+__credits__ = ["Gabriel Happle", "Daren Thomas"]
+__license__ = "MIT"
+__version__ = "0.1"
+__maintainer__ = "Daren Thomas"
+__email__ = "cea@arch.ethz.ch"
+__status__ = "Production"
+
+ETA_REC = constants.ETA_REC
+B_F = constants.B_F
+T_WARNING_LOW = constants.T_WARNING_LOW
+T_WARNING_HIGH = constants.T_WARNING_HIGH
+
+# state of a time step, as determined by the control logic of `calc_heating_cooling_loads`
+MODE_NO_SEASON = 0  # neither heating nor cooling season
+MODE_HEATING_OFF = 1  # heating season, no (active) heating system
+MODE_HEATING = 2  # heating season, radiator or floor heating
+MODE_COOLING_OFF = 3  # cooling season, no (active) cooling system
+MODE_COOLING = 4  # cooling season, ceiling or floor cooling
+
+# errors reported by the compiled loop
+ERROR_NONE = 0
+ERROR_TEMPERATURE_OUT_OF_BOUNDS = 1
+ERROR_NEGATIVE_MOISTURE = 2
+ERROR_HEATING_STATUS = 3
+ERROR_COOLING_STATUS = 4
+
+SUPPORTED_HEATING_SYSTEMS = {'NONE', 'RADIATOR', 'FLOOR_HEATING'}
+SUPPORTED_COOLING_SYSTEMS = {'NONE', 'CEILING_COOLING', 'FLOOR_COOLING'}
+
+TEMP_TOLERANCE = 0.001  # same tolerance as `rc_model_SIA.has_sensible_heating_demand`
+
+# gain factors of section 2.1.4 in SIA 2044, copied as plain floats for the compiled functions
+F_SA = rc_model_SIA.f_sa
+F_R_L = rc_model_SIA.f_r_l
+F_R_P = rc_model_SIA.f_r_p
+F_R_A = rc_model_SIA.f_r_a
+
+
+def can_use_annual_solver(bpr, use_dynamic_infiltration_calculation):
+    """
+    Check if the thermal loads of a building can be calculated with :py:func:`calc_heating_cooling_loads_annual`.
+
+    The whole-year solver requires the ventilation air flows to be independent of the zone temperature, which rules
+    out dynamic infiltration, night flushing and economizers, and supports only emission systems that are controlled
+    directly by the R-C-model (no air-handling or air-recirculation units).
+
+    :param bpr: Building Properties
+    :type bpr: BuildingPropertiesRow
+    :param bool use_dynamic_infiltration_calculation: dynamic infiltration is calculated from the zone temperature
+    :rtype: bool
+    """
+    if use_dynamic_infiltration_calculation:
+        return False
+    if bpr.hvac['NIGHT_FLSH']:
+        return False
+    if bpr.hvac['MECH_VENT'] and bpr.hvac['ECONOMIZER']:
+        return False
+    return bpr.hvac['class_hs'] in SUPPORTED_HEATING_SYSTEMS and bpr.hvac['class_cs'] in SUPPORTED_COOLING_SYSTEMS
+
+
+def calc_rc_model_constants(bpr):
+    """
+    Calculate the hour-independent coefficients of the R-C-model of a building, see 2.1.3 and 2.1.4 in SIA 2044.
+
+    :param bpr: Building Properties
+    :type bpr: BuildingPropertiesRow
+    :return: coefficients keyed by their name in :py:mod:`cea.demand.rc_model_SIA`
+    :rtype: dict
+    """
+    a_t = bpr.rc_model['Atot']
+    a_m = bpr.rc_model['Am']
+    a_w = bpr.rc_model['Awin_ag']
+
+    h_ec = rc_model_SIA.calc_h_ec(Htr_w=bpr.rc_model['Htr_w'])
+    h_op_m = rc_model_SIA.calc_h_op_m(Htr_op=bpr.rc_model['Htr_op'])
+    h_mc = rc_model_SIA.calc_h_mc(a_m=a_m)
+
+    return {'h_ec': h_ec,
+            'h_ac': rc_model_SIA.calc_h_ac(a_t),
+            'h_mc': h_mc,
+            'h_op_m': h_op_m,
+            'h_em': rc_model_SIA.calc_h_em(h_op_m, h_mc),
+            'f_ic': rc_model_SIA.calc_f_ic(a_t, a_m, h_ec),
+            'f_sc': rc_model_SIA.calc_f_sc(a_t, a_m, a_w, h_ec),
+            'f_im': rc_model_SIA.calc_f_im(a_t=a_t, a_m=a_m),
+            'f_sm': rc_model_SIA.calc_f_sm(a_t=a_t, a_m=a_m, a_w=a_w),
+            'c_m': bpr.rc_model['Cm'] / 3600,  # (Wh/K) SIA 2044 unit is Wh/K, ISO unit is J/K
+            # account for a proportion of internal and solar gains (see `rc_model_SIA.calc_rc_model_temperatures`)
+            'f_gains': min(bpr.rc_model['Af'] / bpr.rc_model['Aef'], 1.0),
+            'f_sol': np.sqrt(bpr.architecture.Hs_ag)}
+
+
+def calc_rc_model_hourly_coefficients(rc_constants, m_ve_mech, m_ve_window, m_ve_inf, El, Ea, Epro, Qs):
+    """
+    Calculate the coefficients of the R-C-model that vary over the year but do not depend on the state of the
+    building. All inputs are arrays of the same shape (e.g. ``(HOURS_IN_YEAR,)`` for a single building).
+
+    :param dict rc_constants: see :py:func:`calc_rc_model_constants`
+    :return: ``h_ea``, ``h_1``, ``h_2``, ``h_3``, ``phi_i_l``, ``phi_i_a``, ``phi_i_p``
+    :rtype: dict
+    """
+    # (13) in SIA 2044 - adapted for mass flows instead of volume flows
+    cp = 1.005 / 3.6  # (Wh/kg/K)
+    h_ea = (m_ve_mech * 3600 + m_ve_window * 3600 + m_ve_inf * 3600) * cp
+    # (26) - (28) in SIA 2044
+    h_1 = 1 / (1 / h_ea + 1 / rc_constants['h_ac'])
+    h_2 = h_1 + rc_constants['h_ec']
+    h_3 = 1.0 / (1.0 / h_2 + 1.0 / rc_constants['h_mc'])
+
+    return {'h_ea': h_ea, 'h_1': h_1, 'h_2': h_2, 'h_3': h_3,
+            'phi_i_l': rc_model_SIA.calc_phi_i_l(El * rc_constants['f_gains']),
+            'phi_i_a': 0.9 * (Ea * rc_constants['f_gains'] + Epro),
+            'phi_i_p': Qs}
+
+
+def calc_heating_cooling_loads_annual(bpr, tsd, config):
+    """
+    Calculate the heating and cooling loads of a building for the whole year. This is a drop-in replacement for the
+    hourly loop in :py:func:`cea.demand.thermal_loads.calc_Qhs_Qcs` for buildings that pass
+    :py:func:`can_use_annual_solver`.
+
+    :param bpr: Building Properties
+    :type bpr: BuildingPropertiesRow
+    :param tsd: Time series data of building, with ventilation requirements and set points already calculated
+    :type tsd: dict
+    :return: updated tsd
+    :rtype: dict
+    """
+    return calc_heating_cooling_loads_batch([bpr], [tsd], config)[0]
+
+
+def calc_heating_cooling_loads_batch(bprs, tsds, config):
+    """
+    Calculate the heating and cooling loads of several buildings at once. The inputs of the buildings are stacked into
+    arrays of shape ``(HOURS_IN_YEAR, number of buildings)`` and the R-C-model of all buildings is stepped together,
+    one simulation hour at a time. All buildings need to pass :py:func:`can_use_annual_solver`.
+
+    :param bprs: Building Properties of each building
+    :type bprs: list[BuildingPropertiesRow]
+    :param tsds: Time series data of each building, with ventilation requirements and set points already calculated
+    :type tsds: list[dict]
+    :return: updated tsds
+    :rtype: list[dict]
+    """
+    from cea.demand.thermal_loads import get_hours
+
+    n_buildings = len(bprs)
+    hours = np.empty((HOURS_IN_YEAR + HOURS_PRE_CONDITIONING, n_buildings), dtype=np.int64)
+    for b, bpr in enumerate(bprs):
+        hours[:, b] = np.fromiter(get_hours(bpr), dtype=np.int64)
+
+    inputs = [_calc_state_independent_inputs(bpr, tsd) for bpr, tsd in zip(bprs, tsds)]
+    rc_constants = [calc_rc_model_constants(bpr) for bpr in bprs]
+    coefficients = [calc_rc_model_hourly_coefficients(c, i['m_ve_mech'], i['m_ve_window'], i['m_ve_inf'], i['El'],
+                                                      i['Ea'], i['Epro'], i['Qs'])
+                    for c, i in zip(rc_constants, inputs)]
+
+    def stack(key, source):
+        # buildings are the contiguous axis, so that one simulation hour of all buildings is adjacent in memory
+        return np.ascontiguousarray(np.column_stack([s[key] for s in source]))
+
+    # state variables are updated in place, starting from the initial values of `calc_set_points`
+    state = {key: stack(key, tsds).astype(np.float64) for key in ['T_int', 'theta_m', 'theta_c', 'theta_o', 'x_int']}
+    results = {key: np.full((HOURS_IN_YEAR, n_buildings), np.nan)
+               for key in ['theta_ea', 'theta_ve_mech', 'I_sol_and_I_rad', 'I_rad', 'phi_hc']}
+    mode = np.zeros((HOURS_IN_YEAR, n_buildings), dtype=np.int64)
+    error_code = np.zeros(n_buildings, dtype=np.int64)
+    error_hour = np.zeros(n_buildings, dtype=np.int64)
+    error_temperatures = np.zeros((n_buildings, 3))
+
+    _solve_rc_model_batch(
+        hours, stack('T_ext', inputs), stack('T_sky', inputs), stack('I_sol', inputs), stack('RSE_wall', inputs),
+        stack('RSE_roof', inputs), stack('RSE_win', inputs), stack('m_ve_mech', inputs),
+        stack('m_ve_window', inputs), stack('m_ve_inf', inputs), stack('x_ve', inputs), stack('w_int', inputs),
+        stack('ta_hs_set', inputs), stack('ta_cs_set', inputs), stack('heating_season', inputs),
+        stack('cooling_season', inputs), stack('heat_recovery', inputs), stack('h_ea', coefficients),
+        stack('h_1', coefficients), stack('h_2', coefficients), stack('h_3', coefficients),
+        stack('phi_i_l', coefficients), stack('phi_i_a', coefficients), stack('phi_i_p', coefficients),
+        np.array([_get_building_constants(bpr, c) for bpr, c in zip(bprs, rc_constants)]),
+        bool(config.demand.overheating_warning),
+        state['T_int'], state['theta_m'], state['theta_c'], state['theta_o'], state['x_int'],
+        results['theta_ea'], results['theta_ve_mech'], results['I_sol_and_I_rad'], results['I_rad'],
+        results['phi_hc'], mode, error_code, error_hour, error_temperatures)
+
+    for b, bpr in enumerate(bprs):
+        _raise_solver_error(error_code[b], error_hour[b], error_temperatures[b], bpr)
+
+    for b, (bpr, tsd) in enumerate(zip(bprs, tsds)):
+        _results_to_tsd(bpr, tsd, hours[:, b], inputs[b], rc_constants[b], coefficients[b],
+                        {key: state[key][:, b].copy() for key in state},
+                        {key: results[key][:, b].copy() for key in results},
+                        mode[:, b].copy())
+
+    return tsds
+
+
+def calc_season(has_season, season_starts, season_ends):
+    """
+    Vectorized version of ``control_heating_cooling_systems.is_heating_season`` and
+    ``control_heating_cooling_systems.is_cooling_season`` for all hours of the year.
+
+    :param bool has_season: the building has a heating (cooling) season
+    :param str season_starts: start of the season in 'DD|MM' format
+    :param str season_ends: end of the season in 'DD|MM' format
+    :return: True for the hours of the year that are part of the season
+    :rtype: np.ndarray
+    """
+    t = np.arange(HOURS_IN_YEAR)
+    if not has_season:
+        return np.zeros(HOURS_IN_YEAR, dtype=np.bool_)
+
+    season_start = control_heating_cooling_systems.convert_date_to_hour(season_starts)
+    season_end = control_heating_cooling_systems.convert_date_to_hour(season_ends) + 23  # last hour of the day
+    if season_start < season_end:
+        # season in the middle of the year
+        return (season_start <= t) & (t <= season_end)
+    elif season_start > season_end:
+        # season over the year end
+        return (season_start <= t) | (t <= season_end)
+    return np.zeros(HOURS_IN_YEAR, dtype=np.bool_)
+
+
+def _calc_state_independent_inputs(bpr, tsd):
+    """
+    Collect the inputs of the solver as contiguous float arrays and calculate the ventilation air flows, which are
+    independent of the zone temperature for buildings that pass :py:func:`can_use_annual_solver`.
+    """
+    inputs = {key: np.asarray(tsd[key], dtype=np.float64) for key in
+              ['T_ext', 'T_sky', 'rh_ext', 'RSE_wall', 'RSE_roof', 'RSE_win', 'm_ve_inf', 'm_ve_required', 'w_int',
+               'ta_hs_set', 'ta_cs_set', 'El', 'Ea', 'Epro', 'Qs']}
+    inputs['I_sol'] = np.asarray(bpr.solar.I_sol, dtype=np.float64)
+
+    # see `ventilation_air_flows_simple.calc_air_mass_flow_mechanical_ventilation` and
+    # `ventilation_air_flows_simple.calc_air_mass_flow_window_ventilation`
+    is_mechanical_ventilation_active = bool(bpr.hvac['MECH_VENT']) & (inputs['m_ve_required'] > 0)
+    is_window_ventilation_active = bool(bpr.hvac['WIN_VENT']) & ~is_mechanical_ventilation_active
+    m_ve_demand = np.maximum(inputs['m_ve_required'] - inputs['m_ve_inf'], 0.0)
+    inputs['m_ve_mech'] = np.where(is_mechanical_ventilation_active, m_ve_demand, 0.0)
+    inputs['m_ve_window'] = np.where(is_window_ventilation_active, m_ve_demand, 0.0)
+
+    # see `latent_loads.calc_moisture_content_airflows`
+    inputs['x_ve'] = convert_rh_to_moisture_content(inputs['rh_ext'], inputs['T_ext'])
+
+    inputs['heating_season'] = calc_season(bpr.hvac['has-heating-season'], bpr.hvac['heat_starts'],
+                                           bpr.hvac['heat_ends'])
+    inputs['cooling_season'] = calc_season(bpr.hvac['has-cooling-season'], bpr.hvac['cool_starts'],
+                                           bpr.hvac['cool_ends'])
+    # the heat recovery is switched by the zone temperature in the cooling season, see
+    # `control_ventilation_systems.is_mechanical_ventilation_heat_recovery_active`
+    inputs['heat_recovery'] = is_mechanical_ventilation_active & bool(bpr.hvac['HEAT_REC'])
+
+    return inputs
+
+
+# position of the building constants in the rows returned by `_get_building_constants`
+(I_U_WALL, I_U_ROOF, I_U_WIN, I_A_WALL, I_A_ROOF, I_A_WIN, I_E_WALL, I_E_ROOF, I_E_WIN, I_VOLUME, I_AF,
+ I_F_HC_CV_HEATING, I_F_HC_CV_COOLING, I_Q_HS_MAX_WM2, I_Q_CS_MAX_WM2, I_T_SUP_AIR_MAX, I_HAS_HEATING_SYSTEM,
+ I_HAS_COOLING_SYSTEM, I_H_EC, I_H_AC, I_H_MC, I_H_EM, I_F_IC, I_F_SC, I_F_IM, I_F_SM, I_C_M, I_F_SOL) = range(28)
+
+
+def _get_building_constants(bpr, rc_constants):
+    """Collect the scalar properties of a building used by `_solve_rc_model_batch` as one row of floats"""
+    return [bpr.rc_model['U_wall'], bpr.rc_model['U_roof'], bpr.rc_model['U_win'],
+            bpr.rc_model['Awall_ag'], bpr.rc_model['Aroof'], bpr.rc_model['Awin_ag'],
+            bpr.architecture.e_wall, bpr.architecture.e_roof, bpr.architecture.e_win,
+            bpr.rc_model['Af'] * bpr.geometry['floor_height'],  # zone volume for the moisture balance
+            bpr.rc_model['Af'],
+            rc_model_SIA.lookup_f_hc_cv_heating(bpr), rc_model_SIA.lookup_f_hc_cv_cooling(bpr),
+            bpr.hvac['Qhsmax_Wm2'], bpr.hvac['Qcsmax_Wm2'],
+            np.max([bpr.hvac['Tc_sup_air_ahu_C'], bpr.hvac['Tc_sup_air_aru_C']]),
+            float(control_heating_cooling_systems.has_heating_system(bpr.hvac['class_hs'])),
+            float(control_heating_cooling_systems.has_cooling_system(bpr.hvac['class_cs'])),
+            rc_constants['h_ec'], rc_constants['h_ac'], rc_constants['h_mc'], rc_constants['h_em'],
+            rc_constants['f_ic'], rc_constants['f_sc'], rc_constants['f_im'], rc_constants['f_sm'],
+            rc_constants['c_m'], rc_constants['f_sol']]
+
+
+@jit(nopython=True)
+def _calc_hr(emissivity, theta_ss):
+    # see `sensible_loads.calc_hr`
+    return 4.0 * emissivity * BOLTZMANN * (theta_ss + KELVIN_OFFSET) ** 3.0
+
+
+@jit(nopython=True)
+def _calc_rc_temperatures(phi_hc_cv, phi_hc_r, theta_m_t_1, I_sol, T_ext, theta_ea, h_ea, h_1, h_2, h_3, phi_i_l,
+                          phi_i_a, phi_i_p, h_ec, h_ac, h_mc, h_em, f_ic, f_sc, f_im, f_sm, c_m):
+    """
+    Node temperatures of the R-C-model for one hour, see ``rc_model_SIA._calc_rc_model_temperatures``. The operations
+    are kept in the same order so that the results are identical.
+    """
+    # (14) - (16) in SIA 2044
+    phi_a = F_SA * I_sol + (1 - F_R_L) * phi_i_l + (1 - F_R_P) * phi_i_p + (1 - F_R_A) * phi_i_a + phi_hc_cv
+    phi_m = f_im * (F_R_L * phi_i_l + F_R_P * phi_i_p + F_R_A * phi_i_a + phi_hc_r) + (1 - F_SA) * f_sm * I_sol
+    phi_c = f_ic * (F_R_L * phi_i_l + F_R_P * phi_i_p + F_R_A * phi_i_a + phi_hc_r) + (1 - F_SA) * f_sc * I_sol
+
+    # (22), (23) in SIA 2044 - theta_ec and theta_em are the outdoor temperature
+    theta_em = T_ext
+    theta_ec = T_ext
+
+    # (29), (25), (30) - (33) in SIA 2044
+    phi_m_tot = phi_m + h_em * theta_em + (h_3 * (phi_c + h_ec * theta_ec + h_1 * (phi_a / h_ea + theta_ea))) / h_2
+    theta_m_t = (theta_m_t_1 * (c_m - 0.5 * (h_3 + h_em)) + phi_m_tot) / (c_m + 0.5 * (h_3 + h_em))
+    theta_m = (theta_m_t + theta_m_t_1) / 2
+    theta_c = (h_mc * theta_m + phi_c + h_ec * theta_ec + h_1 * (phi_a / h_ea + theta_ea)) / (h_mc + h_ec + h_1)
+    T_int = (h_ac * theta_c + h_ea * theta_ea + phi_a) / (h_ac + h_ea)
+    theta_o = T_int * 0.31 + theta_c * 0.69
+
+    return T_int, theta_c, theta_m, theta_o
+
+
+@jit(nopython=True)
+def _is_out_of_bounds(T_int, theta_c, theta_m):
+    return (T_WARNING_LOW > T_int or T_WARNING_LOW > theta_c or T_WARNING_LOW > theta_m
+            or T_int > T_WARNING_HIGH or theta_c > T_WARNING_HIGH or theta_m > T_WARNING_HIGH)
+
+
+@jit(nopython=True)
+def _solve_rc_model_batch(hours, T_ext, T_sky, I_sol_gross, RSE_wall, RSE_roof, RSE_win, m_ve_mech, m_ve_window,
+                          m_ve_inf, x_ve, w_int, ta_hs_set, ta_cs_set, heating_season, cooling_season, heat_recovery,
+                          h_ea, h_1, h_2, h_3, phi_i_l, phi_i_a, phi_i_p, building_constants, overheating_warning,
+                          T_int, theta_m, theta_c, theta_o, x_int,
+                          theta_ea_out, theta_ve_mech_out, I_sol_and_I_rad_out, I_rad_out, phi_hc_out, mode_out,
+                          error_code, error_hour, error_temperatures):
+    """
+    Run the control logic of ``hourly_procedure_heating_cooling_system_load.calc_heating_cooling_loads`` and the
+    R-C-model state recurrence over the simulation hours of all buildings. Hourly arrays have the shape
+    ``(HOURS_IN_YEAR, number of buildings)``, ``hours`` holds the simulation hours of each building (see
+    ``thermal_loads.get_hours``). The state arrays (``T_int``, ``theta_m``, ``theta_c``, ``theta_o``, ``x_int``) and
+    the output arrays are updated in place.
+
+    A building that fails is not simulated any further, its error code, hour of the error and the temperatures
+    ``T_int``, ``theta_c``, ``theta_m`` at that hour are written to ``error_code``, ``error_hour`` and
+    ``error_temperatures``.
+    """
+    n_steps, n_buildings = hours.shape
+
+    for i in range(n_steps):
+        for b in range(n_buildings):
+            if error_code[b] != ERROR_NONE:
+                continue
+            t = hours[i, b]
+            constants = building_constants[b]
+            h_ec = constants[I_H_EC]
+            h_ac = constants[I_H_AC]
+            h_mc = constants[I_H_MC]
+            h_em = constants[I_H_EM]
+            f_ic = constants[I_F_IC]
+            f_sc = constants[I_F_SC]
+            f_im = constants[I_F_IM]
+            f_sm = constants[I_F_SM]
+            c_m = constants[I_C_M]
+            Af = constants[I_AF]
+
+            # net solar gains, see `sensible_loads.calc_I_sol`
+            temp_s_prev = theta_c[t - 1, b]
+            if np.isnan(temp_s_prev):
+                temp_s_prev = T_ext[t - 1, b]
+            theta_ss = 0.5 * (T_sky[t, b] + temp_s_prev)
+            delta_theta_er = T_ext[t, b] - T_sky[t, b]
+            I_rad_win = RSE_win[t, b] * constants[I_U_WIN] * _calc_hr(constants[I_E_WIN], theta_ss) * \
+                constants[I_A_WIN] * delta_theta_er
+            I_rad_roof = RSE_roof[t, b] * constants[I_U_ROOF] * _calc_hr(constants[I_E_ROOF], theta_ss) * \
+                constants[I_A_ROOF] * delta_theta_er
+            I_rad_wall = RSE_wall[t, b] * constants[I_U_WALL] * _calc_hr(constants[I_E_WALL], theta_ss) * \
+                constants[I_A_WALL] * delta_theta_er
+            I_rad = 0.5 * I_rad_wall + 0.5 * I_rad_win + 1 * I_rad_roof
+            I_sol_and_I_rad = I_sol_gross[t, b] - I_rad
+            I_rad_out[t, b] = I_rad
+            I_sol_and_I_rad_out[t, b] = I_sol_and_I_rad
+            I_sol = I_sol_and_I_rad * constants[I_F_SOL]
+
+            # supply temperature of mechanical ventilation, see `ventilation_air_flows_simple.calc_theta_ve_mech`
+            if heat_recovery[t, b] and (heating_season[t, b] or (cooling_season[t, b]
+                                                                 and T_int[t - 1, b] < T_ext[t, b])):
+                theta_ve_mech = T_ext[t, b] + ETA_REC * (T_int[t - 1, b] - T_ext[t, b])
+            else:
+                theta_ve_mech = T_ext[t, b]
+            theta_ve_mech_out[t, b] = theta_ve_mech
+
+            # (21) in SIA 2044
+            theta_ea = (m_ve_mech[t, b] * theta_ve_mech + (m_ve_window[t, b] + m_ve_inf[t, b]) * T_ext[t, b]) / (
+                    m_ve_mech[t, b] + m_ve_window[t, b] + m_ve_inf[t, b])
+            theta_ea_out[t, b] = theta_ea
+
+            theta_m_t_1 = theta_m[t - 1, b]
+            if np.isnan(theta_m_t_1):
+                theta_m_t_1 = T_ext[t - 1, b]
+
+            # control logic
+            f_hc_cv = 0.0
+            t_set = np.nan
+            if heating_season[t, b] and not cooling_season[t, b]:
+                if constants[I_HAS_HEATING_SYSTEM] > 0.0 and not np.isnan(ta_hs_set[t, b]):
+                    mode = MODE_HEATING
+                    f_hc_cv = constants[I_F_HC_CV_HEATING]
+                    t_set = ta_hs_set[t, b]
+                else:
+                    mode = MODE_HEATING_OFF
+            elif cooling_season[t, b] and not heating_season[t, b]:
+                if constants[I_HAS_COOLING_SYSTEM] > 0.0 and not np.isnan(ta_cs_set[t, b]) \
+                        and not T_int[t - 1, b] <= constants[I_T_SUP_AIR_MAX]:
+                    mode = MODE_COOLING
+                    f_hc_cv = constants[I_F_HC_CV_COOLING]
+                    t_set = ta_cs_set[t, b]
+                else:
+                    mode = MODE_COOLING_OFF
+            else:
+                mode = MODE_NO_SEASON
+            mode_out[t, b] = mode
+
+            # temperatures with zero heating / cooling power
+            T_int_t, theta_c_t, theta_m_t, theta_o_t = _calc_rc_temperatures(
+                0.0, 0.0, theta_m_t_1, I_sol, T_ext[t, b], theta_ea, h_ea[t, b], h_1[t, b], h_2[t, b], h_3[t, b],
+                phi_i_l[t, b], phi_i_a[t, b], phi_i_p[t, b], h_ec, h_ac, h_mc, h_em, f_ic, f_sc, f_im, f_sm, c_m)
+            error = ERROR_NONE
+            if overheating_warning and _is_out_of_bounds(T_int_t, theta_c_t, theta_m_t):
+                error = ERROR_TEMPERATURE_OUT_OF_BOUNDS
+            phi_hc = 0.0
+
+            if error == ERROR_NONE and ((mode == MODE_HEATING and T_int_t < t_set - TEMP_TOLERANCE) or (
+                    mode == MODE_COOLING and T_int_t > t_set + TEMP_TOLERANCE)):
+                # see `calc_rc_heating_demand` and `calc_rc_cooling_demand`
+                phi_hc_10 = 10.0 * Af
+                T_int_10, theta_c_10, theta_m_10, theta_o_10 = _calc_rc_temperatures(
+                    f_hc_cv * phi_hc_10, (1 - f_hc_cv) * phi_hc_10, theta_m_t_1, I_sol, T_ext[t, b], theta_ea,
+                    h_ea[t, b], h_1[t, b], h_2[t, b], h_3[t, b], phi_i_l[t, b], phi_i_a[t, b], phi_i_p[t, b], h_ec,
+                    h_ac, h_mc, h_em, f_ic, f_sc, f_im, f_sm, c_m)
+
+                # (64) in SIA 2044
+                phi_hc_ul = phi_hc_10 * (t_set - T_int_t) / (T_int_10 - T_int_t)
+
+                if overheating_warning and _is_out_of_bounds(T_int_10, theta_c_10, theta_m_10):
+                    error = ERROR_TEMPERATURE_OUT_OF_BOUNDS
+                    T_int_t, theta_c_t, theta_m_t = T_int_10, theta_c_10, theta_m_10
+                elif mode == MODE_HEATING:
+                    phi_h_max = constants[I_Q_HS_MAX_WM2] * Af
+                    if 0.0 < phi_hc_ul <= phi_h_max:
+                        phi_hc = phi_hc_ul
+                    elif 0.0 < phi_hc_ul > phi_h_max:
+                        phi_hc = phi_h_max
+                    else:
+                        error = ERROR_HEATING_STATUS
+                else:
+                    phi_c_max = -constants[I_Q_CS_MAX_WM2] * Af
+                    if 0.0 > phi_hc_ul >= phi_c_max:
+                        phi_hc = phi_hc_ul
+                    elif 0.0 > phi_hc_ul < phi_c_max:
+                        phi_hc = phi_c_max
+                    else:
+                        error = ERROR_COOLING_STATUS
+
+                if error == ERROR_NONE:
+                    T_int_t, theta_c_t, theta_m_t, theta_o_t = _calc_rc_temperatures(
+                        f_hc_cv * phi_hc, (1 - f_hc_cv) * phi_hc, theta_m_t_1, I_sol, T_ext[t, b], theta_ea,
+                        h_ea[t, b], h_1[t, b], h_2[t, b], h_3[t, b], phi_i_l[t, b], phi_i_a[t, b], phi_i_p[t, b],
+                        h_ec, h_ac, h_mc, h_em, f_ic, f_sc, f_im, f_sm, c_m)
+                    if overheating_warning and _is_out_of_bounds(T_int_t, theta_c_t, theta_m_t):
+                        error = ERROR_TEMPERATURE_OUT_OF_BOUNDS
+
+            if error == ERROR_NONE:
+                # moisture balance without (de)humidification, see `latent_loads.calc_moisture_content_in_zone_local`
+                m_air_zone = (RHO_A * constants[I_VOLUME]) / DELTA_T
+                m_ve_inf_t = m_ve_inf[t, b] + m_ve_window[t, b]
+                x_int_t = (m_ve_mech[t, b] * x_ve[t, b] + m_ve_inf_t * x_ve[t, b] + 0.0 + 0.0 + w_int[t, b]
+                           + m_air_zone * x_int[t - 1, b]) / ((m_ve_mech[t, b] + m_ve_inf_t) + m_air_zone)
+                if x_int_t < 0:
+                    error = ERROR_NEGATIVE_MOISTURE
+
+            if error != ERROR_NONE:
+                error_code[b] = error
+                error_hour[b] = t
+                error_temperatures[b, 0] = T_int_t
+                error_temperatures[b, 1] = theta_c_t
+                error_temperatures[b, 2] = theta_m_t
+                continue
+
+            phi_hc_out[t, b] = phi_hc
+            T_int[t, b] = T_int_t
+            theta_c[t, b] = theta_c_t
+            theta_m[t, b] = theta_m_t
+            theta_o[t, b] = theta_o_t
+            x_int[t, b] = x_int_t
+
+
+def _raise_solver_error(error_code, t, temperatures, bpr):
+    """Raise the same exceptions as the hourly procedure for errors reported by `_solve_rc_model_batch`"""
+    if error_code == ERROR_NONE:
+        return
+    if error_code == ERROR_TEMPERATURE_OUT_OF_BOUNDS:
+        T_int, theta_c, theta_m = temperatures
+        raise Exception("Temperature in RC-Model of building {} out of bounds! First occurred at timestep = {}. "
+                        "The results were Tint = {}, theta_c = {}, theta_m = {}.\n"
+                        "If it is an expected behavior, consider turning off over-heating warning in the "
+                        "advanced parameters to continue the simulation.\n"
+                        "If it is not expected, check building geometry and internal loads.\n"
+                        "Building might be too small in size or architecture parameter Hs_ag = {} might be too "
+                        "small for this geometry. Current bounds of range for RC-model temperatures are "
+                        "between {} and {}.".format(bpr.name, t, round(T_int, 2), round(theta_c, 2),
+                                                    round(theta_m, 2), bpr.architecture.Hs_ag, T_WARNING_LOW,
+                                                    T_WARNING_HIGH))
+    if error_code == ERROR_NEGATIVE_MOISTURE:
+        raise Exception("Bug in moisture balance in zone. Negative moisture content detected.")
+    if error_code == ERROR_HEATING_STATUS:
+        raise Exception("Unexpected status in 'calc_rc_heating_demand'")
+    if error_code == ERROR_COOLING_STATUS:
+        raise Exception("Unexpected status in 'calc_rc_cooling_demand'")
+    raise ValueError("Unknown error code {} in annual RC-model solver".format(error_code))
+
+
+def _results_to_tsd(bpr, tsd, hours, inputs, rc_constants, coefficients, state, results, mode):
+    """
+    Write the results of the solver to ``tsd``, setting the same keys for each hour as the procedures in
+    :py:mod:`cea.demand.hourly_procedure_heating_cooling_system_load`.
+    """
+    for key in ['T_int', 'theta_m', 'theta_c', 'theta_o', 'x_int']:
+        tsd[key] = state[key]
+    for key in ['theta_ve_mech', 'I_sol_and_I_rad', 'I_rad']:
+        tsd[key] = results[key]
+    tsd['I_sol'] = inputs['I_sol'].copy()
+    tsd['m_ve_mech'] = inputs['m_ve_mech']
+    tsd['m_ve_window'] = inputs['m_ve_window']
+    tsd['x_ve_inf'] = inputs['x_ve'].copy()
+    tsd['x_ve_mech'] = inputs['x_ve'].copy()
+    tsd['g_hu_ld'] = np.zeros(HOURS_IN_YEAR)
+    tsd['g_dhu_ld'] = np.zeros(HOURS_IN_YEAR)
+    tsd['Ehs_lat_aux'] = np.zeros(HOURS_IN_YEAR)
+
+    heating = mode == MODE_HEATING
+    cooling = mode == MODE_COOLING
+    phi_hc = results['phi_hc']
+
+    # no heating loads, see `update_tsd_no_heating`
+    for key in ['Qhs_sen_rc', 'Qhs_sen_shu', 'Qhs_sen_aru', 'Qhs_sen_ahu', 'Qhs_sen_sys', 'Qhs_lat_sys', 'Qhs_em_ls',
+                'ma_sup_hs_ahu', 'ma_sup_hs_aru', 'Qcs_sen_rc', 'Qcs_sen_scu', 'Qcs_sen_aru', 'Qcs_sen_ahu',
+                'Qcs_lat_aru', 'Qcs_lat_ahu', 'Qcs_sen_sys', 'Qcs_lat_sys', 'Qcs_em_ls', 'ma_sup_cs_ahu',
+                'ma_sup_cs_aru']:
+        tsd[key] = np.zeros(HOURS_IN_YEAR)
+    for key in ['ta_sup_hs_ahu', 'ta_re_hs_ahu', 'ta_sup_hs_aru', 'ta_re_hs_aru', 'ta_sup_cs_ahu', 'ta_re_cs_ahu',
+                'ta_sup_cs_aru', 'ta_re_cs_aru']:
+        tsd[key] = np.full(HOURS_IN_YEAR, np.nan)
+    # `calc_heat_loads_radiator` does not reset the latent loads of air-handling units
+    tsd['Qhs_lat_aru'] = np.where(heating, tsd['Qhs_lat_aru'], 0.0)
+    tsd['Qhs_lat_ahu'] = np.where(heating, tsd['Qhs_lat_ahu'], 0.0)
+
+    # loads of radiative emission systems, see `calc_heat_loads_radiator` and `calc_cool_loads_radiator`
+    for key in ['Qhs_sen_rc', 'Qhs_sen_shu', 'Qhs_sen_sys']:
+        tsd[key][heating] = phi_hc[heating]
+    for key in ['Qcs_sen_rc', 'Qcs_sen_scu', 'Qcs_sen_sys']:
+        tsd[key][cooling] = phi_hc[cooling]
+
+    calc_q_em_ls = np.vectorize(space_emission_systems.calc_q_em_ls, otypes=[float])
+    if heating.any():
+        delta_theta_int_inc = space_emission_systems.calc_delta_theta_int_inc_heating(bpr)
+        tsd['Qhs_em_ls'][heating] = calc_q_em_ls(
+            phi_hc[heating], delta_theta_int_inc, tsd['T_int'][heating] + delta_theta_int_inc,
+            inputs['T_ext'][heating], bpr.hvac['Qhsmax_Wm2'] * bpr.rc_model['Af'])
+    if cooling.any():
+        delta_theta_int_inc = space_emission_systems.calc_delta_theta_int_inc_cooling(bpr)
+        tsd['Qcs_em_ls'][cooling] = calc_q_em_ls(
+            phi_hc[cooling], delta_theta_int_inc, tsd['T_int'][cooling] + delta_theta_int_inc,
+            inputs['T_ext'][cooling] + space_emission_systems.get_delta_theta_e_sol(bpr),
+            -bpr.hvac['Qcsmax_Wm2'] * bpr.rc_model['Af'])
+
+    # system status
+    emission = heating | cooling
+    for key in ['sys_status_ahu', 'sys_status_aru', 'sys_status_sen']:
+        tsd[key][~emission] = 'system off'
+    tsd['sys_status_ahu'][emission] = 'no system'
+    tsd['sys_status_aru'][emission] = 'no system'
+    tsd['sys_status_sen'][emission & (phi_hc != 0.0)] = 'On'
+    tsd['sys_status_sen'][emission & (phi_hc == 0.0)] = 'Off'
+
+    for t in np.flatnonzero(mode == MODE_NO_SEASON):
+        warnings.warn('Timestep %s not in heating season nor cooling season' % t)
+
+    _detailed_thermal_balance_to_tsd(bpr, tsd, hours, rc_constants, coefficients, results, mode != MODE_NO_SEASON)
+
+
+def _detailed_thermal_balance_to_tsd(bpr, tsd, hours, rc_constants, coefficients, results, balance):
+    """
+    Vectorized version of ``hourly_procedure_heating_cooling_system_load.detailed_thermal_balance_to_tsd`` for the
+    hours in the boolean mask ``balance``.
+    """
+    tsd['Q_gain_sen_light'][balance] = rc_model_SIA.calc_phi_i_l(tsd['El'][balance])
+    tsd['Q_gain_sen_app'][balance] = (rc_model_SIA.calc_phi_i_a(tsd['Ea'][balance], tsd['Epro'][balance])
+                                      - 0.9 * tsd['Epro'][balance]) / 0.9
+    tsd['Q_gain_sen_pro'][balance] = tsd['Epro'][balance]
+    tsd['Q_gain_sen_data'][balance] = tsd['Qcdata_sys'][balance]
+    tsd['Q_gain_sen_peop'][balance] = rc_model_SIA.calc_phi_i_p(tsd['Qs'][balance])
+
+    # the hourly procedure overwrites this key with a scalar for every hour, keeping the value of the last hour
+    balance_hours = hours[balance[hours]]
+    if len(balance_hours):
+        tsd['Q_loss_sen_ref'] = -tsd['Qcre_sys'][balance_hours[-1]]
+
+    h_em = rc_constants['h_em']
+    h_op_m = rc_constants['h_op_m']
+    h_ec = rc_constants['h_ec']
+    theta_m = tsd['theta_m'][balance]
+    theta_c = tsd['theta_c'][balance]
+    T_ext = tsd['T_ext'][balance]
+
+    h_wall_em = h_em * bpr.rc_model['Awall_ag'] * bpr.rc_model['U_wall'] / h_op_m
+    h_base_em = h_em * bpr.rc_model['Aop_bg'] * B_F * bpr.rc_model['U_base'] / h_op_m
+    h_roof_em = h_em * bpr.rc_model['Aroof'] * bpr.rc_model['U_roof'] / h_op_m
+
+    tsd['Q_gain_sen_wall'][balance] = h_wall_em * (T_ext - theta_m)
+    tsd['Q_gain_sen_base'][balance] = h_base_em * (T_ext - theta_m)
+    tsd['Q_gain_sen_roof'][balance] = h_roof_em * (T_ext - theta_m)
+    tsd['Q_gain_sen_wind'][balance] = h_ec * (T_ext - theta_c)
+    tsd['Q_gain_sen_vent'][balance] = coefficients['h_ea'][balance] * (
+            results['theta_ea'][balance] - tsd['T_int'][balance])
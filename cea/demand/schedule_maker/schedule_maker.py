@@ -1,5 +1,6 @@
+import hashlib
 import os
-import random
+import zlib
 
 import numpy as np
 import pandas as pd
@@ -28,6 +29,22 @@ __maintainer__ = "Daren Thomas"
 __email__ = "cea@arch.ethz.ch"
 __status__ = "Production"
 
+OCCUPANT_BLOCK_SIZE = 512  # occupants whose random numbers are drawn at once by the stochastic occupancy model
+MOBILITY_CLASSES = 10  # groups of occupants of the aggregate stochastic occupancy model
+
+# day type, hour of the day and month of the time steps of the last date range (see get_yearly_indices)
+_yearly_indices = {}
+
+# codes of the set point temperatures in the deduplicated schedule profiles (see calc_schedule_profile)
+SETPOINT_CODE = 1.0
+SETBACK_CODE = 2.0
+# change this when calc_schedule_profile changes, so the schedule profiles of previous runs are not reused
+SCHEDULE_PROFILE_VERSION = 2
+
+# deduplicated schedules read by this process, keyed by path and modification time (see read_schedule_model)
+_schedule_model_cache = {}
+SCHEDULE_MODEL_CACHE_SIZE = 32
+
 
 def schedule_maker_main(locator, config, building=None):
     # local variables
@@ -41,6 +58,9 @@ def schedule_maker_main(locator, config, building=None):
     else:
         raise ValueError("Invalid schedule model: {schedule_model}".format(**locals()))
 
+    stochastic_mode = config.schedule_maker.stochastic_mode
+    random_seed = config.schedule_maker.random_seed
+
     if building is not None:
         buildings = [building]  # this is to run the tests
 
@@ -68,6 +88,14 @@ def schedule_maker_main(locator, config, building=None):
     date_range = get_date_range_hours_from_year(year)
 
     # SCHEDULE MAKER
+    if config.schedule_maker.deduplicate_schedules:
+        if not stochastic_schedule:
+            calc_deduplicated_schedules(locator, buildings, date_range, internal_loads.loc[buildings],
+                                        indoor_comfort.loc[buildings], prop_geometry.loc[buildings])
+            return None
+        print("Schedules are only deduplicated with the deterministic schedule model.")
+    remove_deduplicated_schedules(locator, buildings)
+
     n = len(buildings)
     calc_schedules_multiprocessing = cea.utilities.parallel.vectorize(calc_schedules,
                                                                       config.get_number_of_processes(),
@@ -79,7 +107,9 @@ def schedule_maker_main(locator, config, building=None):
                                    [internal_loads.loc[b] for b in buildings],
                                    [indoor_comfort.loc[b] for b in buildings],
                                    [prop_geometry.loc[b] for b in buildings],
-                                   repeat(stochastic_schedule, n))
+                                   repeat(stochastic_schedule, n),
+                                   repeat(stochastic_mode, n),
+                                   repeat(random_seed, n))
     return None
 
 
@@ -93,7 +123,9 @@ def calc_schedules(locator,
                    internal_loads_building,
                    indoor_comfort_building,
                    prop_geometry_building,
-                   stochastic_schedule):
+                   stochastic_schedule,
+                   stochastic_mode='individual',
+                   random_seed=None):
     """
     Calculate the profile of occupancy, electricity demand and domestic hot water consumption from the input schedules.
     For variables that depend on the number of people (humidity gains, heat gains and ventilation demand), additional
@@ -102,7 +134,9 @@ def calc_schedules(locator,
     Two occupant models are included: a deterministic one, which simply uses the schedules provided by the user; and a
     stochastic one, which is based on the two-state Markov chain model of Page et al. (2008). In the latter case,
     occupant presence is modeled based on the probability of occupant presence at the current and next time step as
-    given by the occupant schedules used in the deterministic model.
+    given by the occupant schedules used in the deterministic model. The stochastic model either follows every
+    occupant of the building (``stochastic_mode='individual'``) or only the number of occupants present in groups of
+    occupants with a similar mobility (``stochastic_mode='aggregate'``), which is much faster for large buildings.
 
     :param cea.inputlocator.InputLocator locator: InputLocator instance
     :param str building: name of current building
@@ -115,6 +149,10 @@ def calc_schedules(locator,
     :param indoor_comfort_building: indoor comfort properties for the current building (from case study inputs)
     :param prop_geometry_building: building geometry (from case study inputs)
     :param stochastic_schedule: Boolean that defines whether the stochastic occupancy model should be used
+    :param str stochastic_mode: 'individual' or 'aggregate' (see above)
+    :param random_seed: seed of the random numbers of the stochastic occupancy model (``None`` for a different result
+        in each run). Each building uses its own random numbers derived from the seed and the building name.
+    :type random_seed: int or None
 
     .. [Page, J., et al., 2008] Page, J., et al. A generalised stochastic model for the simulation of occupant presence.
         Energy and Buildings, Vol. 40, No. 2, 2008, pp 83-98.
@@ -134,10 +172,11 @@ def calc_schedules(locator,
         yearly_array = get_yearly_vectors(date_range, days_in_schedule, array, monthly_multiplier)
         number_of_occupants = int(1 / internal_loads_building['Occ_m2p'] * prop_geometry_building['Aocc'])
         if stochastic_schedule:
-            # if the stochastic schedules are used, the stochastic schedule generator is called once for every occupant
-            final_schedule['Occ_m2p'] = np.zeros(HOURS_IN_YEAR)
-            for occupant in range(number_of_occupants):
-                final_schedule['Occ_m2p'] += calc_individual_occupant_schedule(yearly_array)
+            rng = get_random_generator(random_seed, building)
+            if stochastic_mode == 'aggregate':
+                final_schedule['Occ_m2p'] = calc_aggregate_occupancy_schedule(yearly_array, number_of_occupants, rng)
+            else:
+                final_schedule['Occ_m2p'] = calc_occupancy_schedule(yearly_array, number_of_occupants, rng)
         else:
             final_schedule['Occ_m2p'] = np.round(yearly_array * number_of_occupants)
     else:
@@ -273,6 +312,220 @@ def calc_schedules(locator,
     # return final_dict
 
 
+def calc_deduplicated_schedules(locator, buildings, date_range, internal_loads, indoor_comfort, prop_geometry):
+    """
+    Calculate the schedules of the buildings with the deterministic schedule model, calculating the yearly profile of
+    each distinct weekly schedule only once. Instead of one schedule file per building, the profiles
+    (``locator.get_schedule_model_profile``) and, for each building, its profile and the factors to scale the profile
+    to the building with (``locator.get_schedule_model_buildings``) are stored. Use :py:func:`read_schedule_model` to
+    read the schedules of a building.
+
+    :param cea.inputlocator.InputLocator locator: InputLocator instance
+    :param buildings: names of the buildings
+    :param DatetimeIndex date_range: range of dates being considered
+    :param internal_loads: internal loads of the buildings (indexed by building name)
+    :param indoor_comfort: indoor comfort properties of the buildings (indexed by building name)
+    :param prop_geometry: geometry of the buildings (indexed by building name)
+    """
+    # the profiles of previous runs are reused if they were calculated in the same way, for the same dates
+    profile_key = '{version}/{start}/{end}/{hours}/{setpoint}/{setback}'.format(
+        version=SCHEDULE_PROFILE_VERSION, start=date_range[0], end=date_range[-1], hours=len(date_range),
+        setpoint=SETPOINT_CODE, setback=SETBACK_CODE).encode('utf-8')
+    profiles = []
+    calculated_profiles = set()
+    for building in buildings:
+        weekly_schedules_file = locator.get_building_weekly_schedules(building)
+        with open(weekly_schedules_file, 'rb') as f:
+            profile = hashlib.sha256(f.read() + profile_key).hexdigest()[:16]
+        profiles.append(profile)
+        if profile not in calculated_profiles:
+            calculated_profiles.add(profile)
+            profile_file = locator.get_schedule_model_profile(profile)
+            if not os.path.exists(profile_file):
+                # at full precision, the profiles are rounded only after scaling them to the buildings
+                calc_schedule_profile(weekly_schedules_file, date_range).to_csv(profile_file, index=False)
+    print("Schedules of {n} buildings calculated from {m} distinct schedules".format(n=len(buildings),
+                                                                                 m=len(calculated_profiles)))
+
+    factors = calc_schedule_factors(internal_loads, indoor_comfort, prop_geometry)
+    factors.insert(0, 'profile', profiles)
+    factors.insert(0, 'Name', list(buildings))
+
+    schedule_model_buildings = locator.get_schedule_model_buildings()
+    if os.path.exists(schedule_model_buildings):
+        previous_factors = pd.read_csv(schedule_model_buildings)
+        factors = pd.concat([previous_factors[~previous_factors['Name'].isin(buildings)], factors], ignore_index=True)
+    factors.to_csv(schedule_model_buildings, index=False)
+
+    # the schedule files of the buildings would take precedence over the deduplicated schedules
+    for building in buildings:
+        if os.path.exists(locator.get_schedule_model_file(building)):
+            os.remove(locator.get_schedule_model_file(building))
+    remove_unused_schedule_profiles(locator, set(factors['profile']))
+
+
+def calc_schedule_profile(weekly_schedules_file, date_range):
+    """
+    Calculate the yearly schedule profile of a weekly schedule, i.e. the schedules of a building per unit of the
+    internal loads, occupant density and area of the building (see :py:func:`calc_schedule_factors`). The set point
+    temperatures are coded as ``SETPOINT_CODE``, ``SETBACK_CODE`` or ``NaN`` (off).
+
+    :param str weekly_schedules_file: path to the weekly schedules (``locator.get_building_weekly_schedules``)
+    :param DatetimeIndex date_range: range of dates being considered
+    :rtype: pandas.DataFrame
+    """
+    schedule = read_cea_schedule(weekly_schedules_file)
+    daily_schedule_building = schedule[0]
+    monthly_multiplier = schedule[1]['MONTHLY_MULTIPLIER']
+    days_in_schedule = len(list(set(daily_schedule_building['DAY'])))
+    no_multiplier = list(np.ones(MONTHS_IN_YEAR))
+
+    profile = {'DATE': date_range}
+    array = daily_schedule_building[VARIABLE_CEA_SCHEDULE_RELATION['Occ_m2p']]
+    profile['Occ_m2p'] = get_yearly_vectors(date_range, days_in_schedule, array, monthly_multiplier)
+    for variable in ['Vww_ldp', 'Vw_ldp']:
+        array = daily_schedule_building[VARIABLE_CEA_SCHEDULE_RELATION[variable]]
+        profile[variable] = get_yearly_vectors(date_range, days_in_schedule, array, monthly_multiplier,
+                                               normalize_first_daily_profile=True)
+    for variable in ['Ea_Wm2', 'El_Wm2', 'Ev_kWveh']:
+        # base load is independent of monthly variations
+        array = daily_schedule_building[VARIABLE_CEA_SCHEDULE_RELATION[variable]]
+        base_load = np.min(array)
+        occupant_load = array - base_load
+        profile[variable] = get_yearly_vectors(date_range, days_in_schedule, occupant_load,
+                                               monthly_multiplier) + base_load
+    for variable in ['Ed_Wm2', 'Epro_Wm2', 'Qcre_Wm2', 'Qhpro_Wm2', 'Qcpro_Wm2']:
+        array = daily_schedule_building[VARIABLE_CEA_SCHEDULE_RELATION[variable]]
+        profile[variable] = get_yearly_vectors(date_range, days_in_schedule, array, monthly_multiplier=no_multiplier)
+    for variable in ['Ths_set_C', 'Tcs_set_C']:
+        array = daily_schedule_building[VARIABLE_CEA_SCHEDULE_RELATION[variable]]
+        array = np.vectorize(convert_schedule_string_to_temperature)(array, variable, SETPOINT_CODE, SETBACK_CODE,
+                                                                     SETPOINT_CODE, SETBACK_CODE)
+        profile[variable] = get_yearly_vectors(date_range, days_in_schedule, array, monthly_multiplier=no_multiplier)
+    return pd.DataFrame(profile)
+
+
+def calc_schedule_factors(internal_loads, indoor_comfort, prop_geometry):
+    """
+    Calculate the factors to scale the schedule profiles (see :py:func:`calc_schedule_profile`) to each building.
+
+    :param internal_loads: internal loads of the buildings (indexed by building name)
+    :param indoor_comfort: indoor comfort properties of the buildings (indexed by building name)
+    :param prop_geometry: geometry of the buildings (indexed by building name)
+    :rtype: pandas.DataFrame
+    """
+    occupant_density = internal_loads['Occ_m2p'].values
+    with np.errstate(divide='ignore'):
+        number_of_occupants = np.where(occupant_density > 0.0,
+                                       1 / occupant_density * prop_geometry['Aocc'].values, 0.0).astype(int)
+    factors = pd.DataFrame({'people_p': number_of_occupants})
+    for variable in ['Qs_Wp', 'X_ghp', 'Vww_ldp', 'Vw_ldp', 'Ea_Wm2', 'El_Wm2', 'Ev_kWveh', 'Ed_Wm2', 'Epro_Wm2',
+                     'Qcre_Wm2', 'Qhpro_Wm2', 'Qcpro_Wm2']:
+        factors[variable] = internal_loads[variable].values
+    for variable in ['Ve_lsp', 'Ths_set_C', 'Ths_setb_C', 'Tcs_set_C', 'Tcs_setb_C']:
+        factors[variable] = indoor_comfort[variable].values
+    factors['Aef'] = prop_geometry['Aef'].values
+    return factors
+
+
+def scale_schedule_profile(profile, factors):
+    """
+    Scale a schedule profile (see :py:func:`calc_schedule_profile`) to a building, giving the same schedules as
+    :py:func:`calc_schedules` with the deterministic schedule model.
+
+    :param pandas.DataFrame profile: the schedule profile
+    :param pandas.Series factors: the factors of the building (a row of the result of :py:func:`calc_schedule_factors`)
+    :rtype: pandas.DataFrame
+    """
+    people = np.round(profile['Occ_m2p'].values * factors['people_p'])
+
+    def set_point(variable):
+        code = profile[variable].values
+        return np.where(code == SETPOINT_CODE, float(factors[variable]),
+                        np.where(code == SETBACK_CODE, float(factors[variable.replace('_set_', '_setb_')]), np.nan))
+
+    def area_load(variable):
+        return profile[variable].values * factors[variable] * factors['Aef']
+
+    return pd.DataFrame({
+        'DATE': profile['DATE'],
+        'Ths_set_C': set_point('Ths_set_C'),
+        'Tcs_set_C': set_point('Tcs_set_C'),
+        'people_p': people,
+        'Ve_lps': people * factors['Ve_lsp'],
+        'Qs_W': people * factors['Qs_Wp'],
+        'X_gh': people * factors['X_ghp'],
+        'Vww_lph': profile['Vww_ldp'].values * factors['Vww_ldp'] * factors['people_p'],
+        'Vw_lph': profile['Vw_ldp'].values * factors['Vw_ldp'] * factors['people_p'],
+        'Ea_W': area_load('Ea_Wm2'),
+        'El_W': area_load('El_Wm2'),
+        'Ed_W': area_load('Ed_Wm2'),
+        'Ev_W': profile['Ev_kWveh'].values * factors['Ev_kWveh'] * 1000,  # convert to Wh
+        'Qcpro_W': area_load('Qcpro_Wm2'),
+        'Epro_W': area_load('Epro_Wm2'),
+        'Qcre_W': area_load('Qcre_Wm2'),
+        'Qhpro_W': area_load('Qhpro_Wm2'),
+    })
+
+
+def read_schedule_model(locator, building):
+    """
+    Read the schedules of a building as calculated by the schedule-maker, either from the schedule file of the building
+    or from the deduplicated schedules (see :py:func:`calc_deduplicated_schedules`).
+
+    :param cea.inputlocator.InputLocator locator: InputLocator instance
+    :param str building: name of the building
+    :rtype: pandas.DataFrame
+    """
+    schedule_model_file = locator.find_schedule_model_file(building)
+    if schedule_model_file != locator.get_schedule_model_buildings():
+        return pd.read_csv(schedule_model_file)
+    factors = read_schedule_factors(locator)
+    if building not in factors.index:
+        raise ValueError("No schedules found for building {building}, please run the schedule-maker".format(
+            building=building))
+    factors = factors.loc[building]
+    return scale_schedule_profile(read_cached_csv(locator.get_schedule_model_profile(factors['profile'])), factors)
+
+
+def read_schedule_factors(locator):
+    """Read the profile and scaling factors of the buildings with deduplicated schedules, indexed by building name"""
+    return read_cached_csv(locator.get_schedule_model_buildings()).set_index('Name')
+
+
+def read_cached_csv(path):
+    """Read a csv file, reusing the DataFrame read by this process before if the file was not modified since"""
+    key = (path, os.path.getmtime(path))
+    if key not in _schedule_model_cache:
+        # forget the previous versions of the file and, if the cache is full, the file read first
+        for previous_key in [k for k in _schedule_model_cache if k[0] == path]:
+            del _schedule_model_cache[previous_key]
+        if len(_schedule_model_cache) >= SCHEDULE_MODEL_CACHE_SIZE:
+            del _schedule_model_cache[next(iter(_schedule_model_cache))]
+        _schedule_model_cache[key] = pd.read_csv(path)
+    return _schedule_model_cache[key]
+
+
+def remove_deduplicated_schedules(locator, buildings):
+    """Forget the deduplicated schedules of buildings whose schedule files are calculated again"""
+    schedule_model_buildings = locator.get_schedule_model_buildings()
+    if not os.path.exists(schedule_model_buildings):
+        return
+    factors = pd.read_csv(schedule_model_buildings)
+    if factors['Name'].isin(buildings).any():
+        factors = factors[~factors['Name'].isin(buildings)]
+        factors.to_csv(schedule_model_buildings, index=False)
+        remove_unused_schedule_profiles(locator, set(factors['profile']))
+
+
+def remove_unused_schedule_profiles(locator, profiles):
+    """Remove the schedule profiles not in ``profiles`` (i.e. not used by any building anymore)"""
+    profiles_folder = locator.get_schedule_model_profiles_folder()
+    for profile_file in os.listdir(profiles_folder):
+        if os.path.splitext(profile_file)[0] not in profiles:
+            os.remove(os.path.join(profiles_folder, profile_file))
+
+
 def convert_schedule_string_to_temperature(schedule_string, schedule_type, Ths_set_C, Ths_setb_C, Tcs_set_C,
                                            Tcs_setb_C):
     """
@@ -313,154 +566,176 @@ def convert_schedule_string_to_temperature(schedule_string, schedule_type, Ths_s
     return schedule_float
 
 
-def calc_individual_occupant_schedule(deterministic_schedule):
+def get_random_generator(random_seed, building):
     """
-    Calculates the stochastic occupancy pattern for an individual based on Page et al. (2008). The so-called parameter
-    of mobility mu is assumed to be a uniformly-distributed random float between 0 and 0.5 based on the range of values
-    presented in the aforementioned paper.
+    Create the random number generator of the stochastic occupancy model for a building. The random numbers only depend
+    on the seed and the name of the building, not on the order in which the buildings are calculated.
 
-    :param deterministic_schedule: deterministic schedule of occupancy provided in the user inputs
-    :type deterministic_schedule: array(float)
-
-    :return pattern: yearly occupancy pattern for a given occupant in a given occupancy type
-    :rtype pattern: list[int]
+    :param random_seed: seed of the random numbers (``None`` for fresh random numbers in each run)
+    :type random_seed: int or None
+    :param str building: name of the building
+    :rtype: numpy.random.Generator
     """
+    if random_seed is None:
+        return np.random.default_rng()
+    return np.random.default_rng([random_seed, zlib.crc32(building.encode('utf-8'))])
 
-    # get a random mobility parameter mu between 0 and 0.5
-    mu = random.uniform(0, 0.5)
 
-    # assign initial state by comparing a random number to the deterministic schedule's probability of occupant presence at t = 0
-    if random.random() <= deterministic_schedule[0]:
-        state = 1
-    else:
-        state = 0
+def calc_occupancy_schedule(deterministic_schedule, number_of_occupants, rng):
+    """
+    Calculates the number of occupants present at each time step with the stochastic occupancy model of Page et al.
+    (2008), following the presence of every occupant. The so-called parameter of mobility mu of each occupant is
+    assumed to be a uniformly-distributed random float between 0 and 0.5 based on the range of values presented in the
+    aforementioned paper.
 
-    # start list of occupancy states throughout the year
-    pattern = [state]
+    The random numbers of all the transitions of a block of occupants are drawn at once, only the (cheap) update of the
+    states of the occupants is done time step by time step.
 
-    # calculate probability of presence for each hour of the year
-    for i in range(len(deterministic_schedule[:-1])):
-        # get probability of presence at t and t+1 from archetypal schedule
-        p_0 = deterministic_schedule[i]
-        p_1 = deterministic_schedule[i + 1]
-        # calculate probability of transition from absence to presence (T01) and from presence to presence (T11)
-        T01, T11 = calculate_transition_probabilities(mu, p_0, p_1)
+    :param deterministic_schedule: deterministic schedule of occupancy provided in the user inputs
+    :type deterministic_schedule: array(float)
+    :param int number_of_occupants: number of occupants of the building
+    :param numpy.random.Generator rng: random number generator (see :py:func:`get_random_generator`)
 
-        if state == 1:
-            next = get_random_presence(T11)
-        else:
-            next = get_random_presence(T01)
+    :return: yearly occupancy pattern (number of occupants present) of the building
+    :rtype: array(float)
+    """
+    deterministic_schedule = np.asarray(deterministic_schedule, dtype=float)
+    occupancy = np.zeros(len(deterministic_schedule))
+    for start in range(0, number_of_occupants, OCCUPANT_BLOCK_SIZE):
+        block_size = min(OCCUPANT_BLOCK_SIZE, number_of_occupants - start)
+        # get a random mobility parameter mu between 0 and 0.5 for each occupant
+        mu = rng.uniform(0, 0.5, block_size)
+        random_numbers = rng.random((len(deterministic_schedule), block_size), dtype=np.float32)
+
+        # assign initial state by comparing a random number to the probability of occupant presence at t = 0
+        state = random_numbers[0] <= deterministic_schedule[0]
+        occupancy[0] += state.sum()
+
+        # probability of transition from absence to presence (T01) and from presence to presence (T11) at each time step
+        T01, T11 = calculate_transition_probabilities(mu[np.newaxis, :],
+                                                      deterministic_schedule[:-1, np.newaxis],
+                                                      deterministic_schedule[1:, np.newaxis])
+        arrive = random_numbers[1:] < T01
+        stay = random_numbers[1:] < T11
+        del T01, T11, random_numbers
+
+        for t in range(len(deterministic_schedule) - 1):
+            state = np.where(state, stay[t], arrive[t])
+            occupancy[t + 1] += state.sum()
+
+    return occupancy
+
+
+def calc_aggregate_occupancy_schedule(deterministic_schedule, number_of_occupants, rng):
+    """
+    Calculates the number of occupants present at each time step with the stochastic occupancy model of Page et al.
+    (2008) without following the individual occupants: the occupants are grouped in ``MOBILITY_CLASSES`` classes of
+    similar mobility (see :py:func:`calc_occupancy_schedule`) and the number of occupants of each class staying and
+    arriving at each time step are drawn from binomial distributions. The effort does not depend on the number of
+    occupants.
 
-        pattern.append(next)
-        state = next
+    :param deterministic_schedule: deterministic schedule of occupancy provided in the user inputs
+    :type deterministic_schedule: array(float)
+    :param int number_of_occupants: number of occupants of the building
+    :param numpy.random.Generator rng: random number generator (see :py:func:`get_random_generator`)
 
-    return np.array(pattern)
+    :return: yearly occupancy pattern (number of occupants present) of the building
+    :rtype: array(float)
+    """
+    deterministic_schedule = np.asarray(deterministic_schedule, dtype=float)
+    # group the occupants by their mobility parameter mu and use the mean mu of each group
+    mu = rng.uniform(0, 0.5, number_of_occupants)
+    mobility_class = np.minimum((mu * 2 * MOBILITY_CLASSES).astype(int), MOBILITY_CLASSES - 1)
+    occupants_per_class = np.bincount(mobility_class, minlength=MOBILITY_CLASSES)
+    mu_per_class = np.bincount(mobility_class, weights=mu, minlength=MOBILITY_CLASSES) / np.maximum(
+        occupants_per_class, 1)
+
+    T01, T11 = calculate_transition_probabilities(mu_per_class[np.newaxis, :],
+                                                  deterministic_schedule[:-1, np.newaxis],
+                                                  deterministic_schedule[1:, np.newaxis])
+    T01 = np.clip(T01, 0.0, 1.0)
+    T11 = np.clip(T11, 0.0, 1.0)
+
+    occupancy = np.zeros(len(deterministic_schedule))
+    present = rng.binomial(occupants_per_class, np.clip(deterministic_schedule[0], 0.0, 1.0))
+    occupancy[0] = present.sum()
+    for t in range(len(deterministic_schedule) - 1):
+        present = rng.binomial(present, T11[t]) + rng.binomial(occupants_per_class - present, T01[t])
+        occupancy[t + 1] = present.sum()
+
+    return occupancy
 
 
 def calculate_transition_probabilities(mu, P0, P1):
     """
     Calculates the transition probabilities at a given time step as defined by Page et al. (2008). These are the
     probability of arriving (T01) and the probability of staying in (T11) given the parameter of mobility mu, the
-    probability of the present state (P0), and the probability of the next state t+1 (P1).
+    probability of the present state (P0), and the probability of the next state t+1 (P1). The parameters can also be
+    arrays (e.g. of the time steps and of the occupants), which are broadcast against each other.
 
     :param mu: parameter of mobility
-    :type mu: float
+    :type mu: float or array(float)
     :param P0: probability of presence at the current time step t
-    :type P0: float
+    :type P0: float or array(float)
     :param P1: probability of presence at the next time step t+1
-    :type P1: float
+    :type P1: float or array(float)
 
     :return T01: probability of transition from absence to presence at current time step
-    :rtype T01: float
+    :rtype T01: float or array(float)
     :return T11: probability of transition from presence to presence at current time step
-    :rtype T11: float
+    :rtype T11: float or array(float)
     """
 
+    P0 = np.asarray(P0, dtype=float)
+    P1 = np.asarray(P1, dtype=float)
+
     # Calculate mobility factor fraction from Page et al. equation 5
     m = (mu - 1) / (mu + 1)
 
     # Calculate transition probability of arriving and transition probability of staying
-    T01 = (m) * P0 + P1
-    if P0 != 0:
-        T11 = ((P0 - 1) / P0) * (m * P0 + P1) + P1 / P0
-    else:
-        T11 = 0
+    T01 = m * P0 + P1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        T11 = np.where(P0 != 0, ((P0 - 1) / P0) * T01 + P1 / P0, 0.0)
 
     # For some instances of mu the probabilities are bigger than 1, so the min function is used in the return statement.
-    return min(1, T01), min(1, T11)
-
-
-def get_random_presence(p):
-    """
-    Get the current occupant state (presence=1 or absence=0) at the current time step given a probability p.
-
-    :param p: A probability (e.g. T01, T11)
-    :type p: float
-
-    Returns the randomly-chosen state (0 or 1).
-    """
-
-    # Calculate probability of presence
-    P1 = int(p * 100)
-    # Calculate probability of absence
-    P0 = 100 - P1
-
-    # Create population of possible values and choose one value
-    weighted_choices = [(1, P1), (0, P0)]
-    population = [val for val, cnt in weighted_choices for i in range(cnt)]
-
-    return random.choice(population)
+    return np.minimum(1, T01), np.minimum(1, T11)
 
 
 def get_yearly_vectors(date_range, days_in_schedule, schedule_array, monthly_multiplier,
                        normalize_first_daily_profile=False):
+    """
+    Expand a schedule of a weekday, a saturday and a sunday to the hours of ``date_range``, multiplied by the monthly
+    multiplier (and normalized if requested). The daily profiles are arranged in a lookup table of day type and hour of
+    the day, which is indexed with the day type and hour of all the time steps at once.
+    """
     # transform into arrays
     # per weekday, saturday, sunday
-    array_per_day = schedule_array.reshape(3, int(len(schedule_array) / days_in_schedule))
-    array_week = array_per_day[0]
-    array_sat = array_per_day[1]
-    array_sun = array_per_day[2]
+    array_per_day = np.asarray(schedule_array, dtype=float).reshape(3, int(len(schedule_array) / days_in_schedule))
+
+    day_type, hour_day, month = get_yearly_indices(date_range)
+    yearly_array = array_per_day[day_type, hour_day] * np.asarray(monthly_multiplier, dtype=float)[month]
     if normalize_first_daily_profile:
         # for water consumption we need to normalize to the daily maximum
         # this is to account for typical units of water consumption in liters per person per day (lpd).
+        # the hourly values are multiplied by the monthly multiplier first, then by the normalization factor
+        norm_max = np.array([array_day.sum() ** -1 if array_day.sum() != 0.0 else 0.0 for array_day in array_per_day])
+        yearly_array = yearly_array * norm_max[day_type]
+    return yearly_array
 
-        if array_week.sum() != 0.0:
-            norm_weekday_max = array_week.sum() ** -1
-        else:
-            norm_weekday_max = 0.0
 
-        if array_sat.sum() != 0.0:
-            norm_sat_max = array_sat.sum() ** -1
-        else:
-            norm_sat_max = 0.0
+def get_yearly_indices(date_range):
+    """
+    Return the day type (0: weekday, 1: saturday, 2: sunday), the hour of the day and the month (0-11) of each time step
+    of ``date_range``. They are calculated once per date range and shared by all the schedules and buildings.
+    """
+    key = (date_range[0], date_range[-1], len(date_range))
+    if key not in _yearly_indices:
+        dayofweek = np.asarray(date_range.dayofweek)
+        day_type = np.where(dayofweek < 5, 0, np.where(dayofweek == 5, 1, 2))
+        _yearly_indices.clear()
+        _yearly_indices[key] = (day_type, np.asarray(date_range.hour), np.asarray(date_range.month) - 1)
+    return _yearly_indices[key]
 
-        if array_sun.sum() != 0.0:
-            norm_sun_max = array_sun.sum() ** -1
-        else:
-            norm_sun_max = 0.0
-    else:
-        norm_weekday_max = 1.0
-        norm_sat_max = 1.0
-        norm_sun_max = 1.0
-
-    yearly_array = [
-        calc_hourly_value(date, array_week, array_sat, array_sun, norm_weekday_max, norm_sat_max, norm_sun_max,
-                          monthly_multiplier) for date in date_range]
-
-    return np.array(yearly_array)
-
-
-def calc_hourly_value(date, array_week, array_sat, array_sun, norm_weekday_max, norm_sat_max, norm_sun_max,
-                      monthly_multiplier):
-    month_year = monthly_multiplier[date.month - 1]
-    hour_day = date.hour
-    dayofweek = date.dayofweek
-    if 0 <= dayofweek < 5:  # weekday
-        return array_week[hour_day] * month_year * norm_weekday_max  # normalized dhw demand flow rates
-    elif dayofweek == 5:  # saturday
-        return array_sat[hour_day] * month_year * norm_sat_max  # normalized dhw demand flow rates
-    else:  # sunday
-        return array_sun[hour_day] * month_year * norm_sun_max  # normalized dhw demand flow rates
 
 
 def main(config):
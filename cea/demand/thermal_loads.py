@@ -7,16 +7,16 @@ Demand model of thermal loads
 
 
 import numpy as np
-import pandas as pd
 
 from cea.constants import HOURS_IN_YEAR, HOURS_PRE_CONDITIONING
 from cea.demand import demand_writers
 from cea.demand import hourly_procedure_heating_cooling_system_load, ventilation_air_flows_simple
-from cea.demand import latent_loads
+from cea.demand import latent_loads, rc_model_SIA_annual
 from cea.demand import sensible_loads, electrical_loads, hotwater_loads, refrigeration_loads, datacenter_loads
 from cea.demand import ventilation_air_flows_detailed, control_heating_cooling_systems
 from cea.demand.building_properties import get_thermal_resistance_surface
 from cea.demand.latent_loads import convert_rh_to_moisture_content
+from cea.demand.schedule_maker.schedule_maker import read_schedule_model
 from cea.utilities import reporting
 
 
@@ -73,7 +73,82 @@ def calc_thermal_loads(building_name, bpr, weather_data, date_range, locator,
 
 """
     schedules, tsd = initialize_inputs(bpr, weather_data, locator)
+    tsd = calc_loads_before_space_conditioning(building_name, bpr, weather_data, date_range, locator, schedules, tsd,
+                                               config)
 
+    # CALCULATE SPACE CONDITIONING DEMANDS
+    if has_conditioned_area(bpr):
+        tsd = calc_Qhs_Qcs(bpr, tsd,
+                           use_dynamic_infiltration_calculation, config)  # end-use demand latent and sensible + ventilation
+
+    tsd = calc_loads_after_space_conditioning(bpr, locator, schedules, tsd)
+
+    # WRITE SOLAR RESULTS
+    write_results(bpr, building_name, date_range, loads_output, locator, massflows_output,
+                  resolution_outputs, temperatures_output, tsd, debug,
+                  config.demand.results_format, config.demand.results_float32)
+
+    return
+
+
+def calc_thermal_loads_batch(building_names, bprs, weather_data, date_range, locator,
+                             use_dynamic_infiltration_calculation, resolution_outputs, loads_output, massflows_output,
+                             temperatures_output, config, debug):
+    """
+    Calculate thermal loads of a batch of buildings, see :py:func:`calc_thermal_loads`.
+
+    The space heating and cooling demand of all buildings in the batch that are supported by the annual R-C-model
+    solver is calculated in a single call to :py:func:`cea.demand.rc_model_SIA_annual.calc_heating_cooling_loads_batch`,
+    the other buildings are calculated with the hourly procedure.
+
+    :param building_names: names of the buildings in the batch
+    :type building_names: list[str]
+    :param bprs: building properties of each building in the batch
+    :type bprs: list[BuildingPropertiesRow]
+
+    :returns: This function does not return anything
+    :rtype: NoneType
+    """
+    schedules = []
+    tsds = []
+    for building_name, bpr in zip(building_names, bprs):
+        building_schedules, tsd = initialize_inputs(bpr, weather_data, locator)
+        tsds.append(calc_loads_before_space_conditioning(building_name, bpr, weather_data, date_range, locator,
+                                                         building_schedules, tsd, config))
+        schedules.append(building_schedules)
+
+    # CALCULATE SPACE CONDITIONING DEMANDS
+    batch = []
+    for i, bpr in enumerate(bprs):
+        if not has_conditioned_area(bpr):
+            continue
+        if rc_model_SIA_annual.can_use_annual_solver(bpr, use_dynamic_infiltration_calculation):
+            ventilation_air_flows_simple.calc_m_ve_required(tsds[i])
+            ventilation_air_flows_simple.calc_m_ve_leakage_simple(bpr, tsds[i])
+            batch.append(i)
+        else:
+            tsds[i] = calc_Qhs_Qcs(bpr, tsds[i], use_dynamic_infiltration_calculation, config)
+    if batch:
+        rc_model_SIA_annual.calc_heating_cooling_loads_batch([bprs[i] for i in batch], [tsds[i] for i in batch],
+                                                             config)
+
+    for building_name, bpr, building_schedules, tsd in zip(building_names, bprs, schedules, tsds):
+        tsd = calc_loads_after_space_conditioning(bpr, locator, building_schedules, tsd)
+        write_results(bpr, building_name, date_range, loads_output, locator, massflows_output,
+                      resolution_outputs, temperatures_output, tsd, debug,
+                      config.demand.results_format, config.demand.results_float32)
+
+
+def has_conditioned_area(bpr):
+    return not np.isclose(bpr.rc_model['Af'], 0.0)
+
+
+def calc_loads_before_space_conditioning(building_name, bpr, weather_data, date_range, locator, schedules, tsd,
+                                         config):
+    """
+    Calculate the loads that the space heating and cooling demand depends on (electricity, refrigeration, data
+    centers, internal gains) and prepare the inputs of the R-C-model (surface resistances, set points).
+    """
     # CALCULATE ELECTRICITY LOADS
     tsd = electrical_loads.calc_Eal_Epro(tsd, schedules)
 
@@ -102,8 +177,8 @@ def calc_thermal_loads(building_name, bpr, weather_data, date_range, locator,
         tsd['mcpcdata_sys'] = tsd['Tcdata_sys_re'] = tsd['Tcdata_sys_sup'] = np.zeros(HOURS_IN_YEAR)
         tsd['Edata'] = tsd['E_cdata'] = np.zeros(HOURS_IN_YEAR)
 
-    # CALCULATE SPACE CONDITIONING DEMANDS
-    if np.isclose(bpr.rc_model['Af'], 0.0):  # if building does not have conditioned area
+    # PREPARE SPACE CONDITIONING DEMANDS
+    if not has_conditioned_area(bpr):
         tsd['T_int'] = tsd['T_ext']
         tsd['x_int'] = np.vectorize(convert_rh_to_moisture_content)(tsd['rh_ext'], tsd['T_int'])
         tsd['E_cs'] = tsd['E_hs'] = np.zeros(HOURS_IN_YEAR)
@@ -118,8 +193,16 @@ def calc_thermal_loads(building_name, bpr, weather_data, date_range, locator,
         tsd = latent_loads.calc_Qgain_lat(tsd, schedules)
         tsd = calc_set_points(bpr, date_range, tsd, building_name, config, locator,
                               schedules)  # calculate the setpoints for every hour
-        tsd = calc_Qhs_Qcs(bpr, tsd,
-                           use_dynamic_infiltration_calculation, config)  # end-use demand latent and sensible + ventilation
+
+    return tsd
+
+
+def calc_loads_after_space_conditioning(bpr, locator, schedules, tsd):
+    """
+    Calculate the system and final loads from the space heating and cooling demand, as well as the hot water and
+    electricity loads that do not depend on it.
+    """
+    if has_conditioned_area(bpr):
         tsd = sensible_loads.calc_Qhs_Qcs_loss(bpr, tsd)  # losses
         tsd = sensible_loads.calc_Qhs_sys_Qcs_sys(tsd)  # system (incl. losses)
         tsd = sensible_loads.calc_temperatures_emission_systems(bpr, tsd)  # calculate temperatures
@@ -158,11 +241,7 @@ def calc_thermal_loads(building_name, bpr, weather_data, date_range, locator,
     tsd = electrical_loads.calc_E_sys(tsd)  # system (incl. losses)
     tsd = electrical_loads.calc_Ef(bpr, tsd)  # final (incl. self. generated)
 
-    # WRITE SOLAR RESULTS
-    write_results(bpr, building_name, date_range, loads_output, locator, massflows_output,
-                  resolution_outputs, temperatures_output, tsd, debug)
-
-    return
+    return tsd
 
 
 def calc_QH_sys_QC_sys(tsd):
@@ -173,7 +252,7 @@ def calc_QH_sys_QC_sys(tsd):
 
 
 def write_results(bpr, building_name, date, loads_output, locator, massflows_output,
-                  resolution_outputs, temperatures_output, tsd, debug):
+                  resolution_outputs, temperatures_output, tsd, debug, results_format='csv', results_float32=False):
     if resolution_outputs == 'hourly':
         writer = demand_writers.HourlyDemandWriter(loads_output, massflows_output, temperatures_output)
     elif resolution_outputs == 'monthly':
@@ -188,7 +267,10 @@ def write_results(bpr, building_name, date, loads_output, locator, massflows_out
         reporting.quick_visualization_tsd(tsd, locator.get_demand_results_folder(), building_name)
         reporting.full_report_to_xls(tsd, locator.get_demand_results_folder(), building_name)
 
-    writer.results_to_csv(tsd, bpr, locator, date, building_name)
+    if results_format == 'parquet':
+        writer.results_to_parquet(tsd, bpr, locator, date, building_name, results_float32)
+    else:
+        writer.results_to_csv(tsd, bpr, locator, date, building_name)
 
 
 def calc_Qcs_sys(bpr, tsd):
@@ -314,6 +396,11 @@ def calc_Qhs_Qcs(bpr, tsd, use_dynamic_infiltration_calculation, config):
     ventilation_air_flows_simple.calc_m_ve_required(tsd)
     ventilation_air_flows_simple.calc_m_ve_leakage_simple(bpr, tsd)
 
+    if config.demand.rc_model_solver == 'annual' \
+            and rc_model_SIA_annual.can_use_annual_solver(bpr, use_dynamic_infiltration_calculation):
+        # solve the whole year at once
+        return rc_model_SIA_annual.calc_heating_cooling_loads_annual(bpr, tsd, config)
+
     # end-use demand calculation
     for t in get_hours(bpr):
 
@@ -366,7 +453,7 @@ def initialize_inputs(bpr, weather_data, locator):
     tsd = initialize_timestep_data(bpr, weather_data)
 
     # get occupancy file
-    occupancy_yearly_schedules = pd.read_csv(locator.get_schedule_model_file(building_name))
+    occupancy_yearly_schedules = read_schedule_model(locator, building_name)
 
     tsd['people'] = occupancy_yearly_schedules['people_p']
     tsd['ve_lps'] = occupancy_yearly_schedules['Ve_lps']
@@ -692,6 +692,42 @@ class InputLocator(object):
         """
         return os.path.join(self.get_schedule_model_folder(), '{}.csv'.format(building))
 
+    def get_schedule_model_profiles_folder(self):
+        """scenario/outputs/data/occupancy/profiles
+        Folder to store the yearly schedule profiles shared by buildings with identical weekly schedules to.
+        """
+        return self._ensure_folder(self.get_schedule_model_folder(), 'profiles')
+
+    def get_schedule_model_profile(self, profile):
+        """
+        scenario/outputs/data/occupancy/profiles/{profile}.csv
+
+        Yearly schedule profile (8760 values per year) shared by all buildings with identical weekly schedules, before
+        scaling it to a building (see ``get_schedule_model_buildings``).
+        :param profile: The id of the profile (a hash of the weekly schedules and the calculation year).
+        """
+        return os.path.join(self.get_schedule_model_profiles_folder(), '{}.csv'.format(profile))
+
+    def get_schedule_model_buildings(self):
+        """
+        scenario/outputs/data/occupancy/schedule_profiles.csv
+
+        The schedule profile of each building calculated with deduplicated schedules and the factors to scale it to the
+        building with. Read the schedules of a building with
+        :py:func:`cea.demand.schedule_maker.schedule_maker.read_schedule_model`.
+        """
+        return os.path.join(self.get_schedule_model_folder(), 'schedule_profiles.csv')
+
+    def find_schedule_model_file(self, building):
+        """
+        Return the schedule file of a building: its own file or, if the building was calculated with deduplicated
+        schedules, the file listing the schedule profiles of the buildings
+        """
+        schedule_model_file = self.get_schedule_model_file(building)
+        if not os.path.exists(schedule_model_file) and os.path.exists(self.get_schedule_model_buildings()):
+            return self.get_schedule_model_buildings()
+        return schedule_model_file
+
     def get_terrain(self):
         """scenario/inputs/topography/terrain.tif"""
         return os.path.join(self.get_terrain_folder(), 'terrain.tif')
@@ -1020,6 +1056,28 @@ class InputLocator(object):
             file_name = network_type + "_" + network_name + "_plant_thermal_load_kW.csv"
         return os.path.join(folder, file_name)
 
+    def get_thermal_network_time_windows_folder(self, network_type, network_name):
+        """scenario/outputs/data/thermal-network/time-windows/DH_{network_name}
+        Results of the time windows of the thermal-hydraulic calculation of a district heating or cooling network
+        """
+        return self._ensure_folder(self.get_thermal_network_folder(), 'time-windows',
+                                   network_type + "_" + network_name)
+
+    def get_thermal_network_time_window_results_file(self, network_type, network_name, start_t, stop_t):
+        """scenario/outputs/data/thermal-network/time-windows/DH_{network_name}/hours_{start_t}_{stop_t}.parquet
+        Results of the hours start_t to stop_t of the thermal-hydraulic calculation of a district heating or cooling
+        network
+        """
+        return os.path.join(self.get_thermal_network_time_windows_folder(network_type, network_name),
+                            'hours_%04i_%04i.parquet' % (start_t, stop_t))
+
+    def get_thermal_network_checkpoint_file(self, network_type, network_name):
+        """scenario/outputs/data/thermal-network/time-windows/DH_{network_name}/checkpoint.json
+        Finished time windows of the thermal-hydraulic calculation of a district heating or cooling network
+        """
+        return os.path.join(self.get_thermal_network_time_windows_folder(network_type, network_name),
+                            'checkpoint.json')
+
     def get_networks_folder(self):
         return self._ensure_folder(self.scenario, 'inputs', 'networks')
 
@@ -1125,10 +1183,51 @@ class InputLocator(object):
         """scenario/outputs/data/demand/Total_demand.csv"""
         return os.path.join(self.get_demand_results_folder(), 'Total_demand.%(format)s' % locals())
 
+    def get_demand_fingerprints(self):
+        """scenario/outputs/data/demand/demand_fingerprints.csv"""
+        return os.path.join(self.get_demand_results_folder(), 'demand_fingerprints.csv')
+
     def get_demand_results_file(self, building, format='csv'):
         """scenario/outputs/data/demand/{building}.csv"""
         return os.path.join(self.get_demand_results_folder(), '%(building)s.%(format)s' % locals())
 
+    def find_demand_results_file(self, building):
+        """Return the demand results file of a building, preferring the parquet store over the csv file"""
+        parquet_file = self.get_demand_results_file(building, 'parquet')
+        if os.path.exists(parquet_file):
+            return parquet_file
+        return self.get_demand_results_file(building, 'csv')
+
+    def read_demand_results(self, building, columns=None):
+        """
+        Read the demand results of a building, as written by the demand script in either csv or parquet format.
+
+        :param building: name of the building
+        :param columns: list of columns to read, or ``None`` to read all columns
+        :rtype: pandas.DataFrame
+        """
+        import pandas as pd
+        demand_results_file = self.find_demand_results_file(building)
+        if demand_results_file.endswith('.parquet'):
+            return pd.read_parquet(demand_results_file, columns=columns)
+        return pd.read_csv(demand_results_file, usecols=columns)
+
+    def read_demand_results_for_buildings(self, buildings, columns=None):
+        """
+        Read the demand results of several buildings into a single DataFrame (one block of rows per building, in the
+        order of ``buildings``). Buildings stored in parquet format are read in one go as a dataset.
+
+        :param buildings: list of building names
+        :param columns: list of columns to read, or ``None`` to read all columns
+        :rtype: pandas.DataFrame
+        """
+        import pandas as pd
+        demand_results_files = [self.find_demand_results_file(building) for building in buildings]
+        if demand_results_files and all(f.endswith('.parquet') for f in demand_results_files):
+            import pyarrow.dataset
+            return pyarrow.dataset.dataset(demand_results_files).to_table(columns=columns).to_pandas()
+        return pd.concat([self.read_demand_results(building, columns) for building in buildings], ignore_index=True)
+
     # EMISSIONS
     def get_lca_emissions_results_folder(self):
         """scenario/outputs/data/emissions"""
@@ -150,7 +150,7 @@ def check_input_files(config, locator):
 
 def demand_files_exist(locator):
     """verify that the necessary demand files exist"""
-    return all(os.path.exists(locator.get_demand_results_file(building_name)) for building_name in
+    return all(os.path.exists(locator.find_demand_results_file(building_name)) for building_name in
                locator.get_zone_building_names())
 
 
@@ -95,7 +95,10 @@ class Building(object):
         Load the buildings relevant demand profile, i.e. 'QC_sys_kWh' for the district heating optimisation &
         'QC_sys_kWh' for the district cooling optimisation)
         """
-        demand_dataframe = pd.read_csv(self.demands_file_path)
+        if self.demands_file_path.endswith('.parquet'):
+            demand_dataframe = pd.read_parquet(self.demands_file_path)
+        else:
+            demand_dataframe = pd.read_csv(self.demands_file_path)
 
         if energy_system_type == 'DC':
             self.demand_flow = EnergyFlow('primary', 'consumer', 'T10W', demand_dataframe['QC_sys_kWh'])
@@ -111,7 +111,7 @@ class DemandPlotBase(PlotBase):
         self.input_files = [(self.locator.get_total_demand, [])]  # all these scripts depend on demand
         # Add building to input files if buildings are selected
         if self.buildings:
-            self.input_files += [(self.locator.get_demand_results_file, [building]) for building in self.buildings]
+            self.input_files += [(self.locator.find_demand_results_file, [building]) for building in self.buildings]
 
     @property
     def hourly_loads(self):
@@ -128,7 +128,7 @@ class DemandPlotBase(PlotBase):
         return df1
 
     def _calculate_hourly_loads(self):
-        data_demand = functools.reduce(self.add_fields, (pd.read_csv(self.locator.get_demand_results_file(building))
+        data_demand = functools.reduce(self.add_fields, (self.locator.read_demand_results(building)
                                                          for building in self.buildings)).set_index('DATE')
         return data_demand
 
@@ -138,8 +138,7 @@ class DemandPlotBase(PlotBase):
         return data_demand
 
     def calculate_external_temperature(self):
-        data_path = self.locator.get_demand_results_file(self.buildings[0])
-        data = pd.read_csv(data_path)
+        data = self.locator.read_demand_results(self.buildings[0])
         data = self.resample_time_data(data)
         return data
 
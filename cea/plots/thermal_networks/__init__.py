@@ -89,7 +89,7 @@ class ThermalNetworksPlotBase(PlotBase):
     def date(self):
         """Read in the date information from demand results of the first building in the zone"""
         buildings = self.locator.get_zone_building_names()
-        df_date = pd.read_csv(self.locator.get_demand_results_file(buildings[0]))
+        df_date = self.locator.read_demand_results(buildings[0])
         return df_date["DATE"]
 
     @property
@@ -8,6 +8,8 @@ from typing import Optional, Tuple, NamedTuple
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import scipy.sparse
 from py4design import py3dmodel, py2radiance
 
 __author__ = "Jimeno A. Fonseca"
@@ -21,19 +23,52 @@ __status__ = "Production"
 
 from pyarrow import feather
 
-from cea.constants import HOURS_IN_YEAR
 from cea.resources.radiation.geometry_generator import BuildingGeometry
+from cea.utilities.solar_equations import SENSOR_SCALE_KEY
 
 BUILT_IN_BINARIES_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "bin")
 REQUIRED_BINARIES = {"ds_illum", "epw2wea", "gen_dc", "oconv", "radfiles2daysim", "rtrace_dc"}
 REQUIRED_LIBS = {"rayinit.cal", "isotrop_sky.cal"}
 
+# the size of the blocks of Daysim results read at once (in bytes)
+DEFAULT_RESULTS_MEMORY_LIMIT = 1024 * 2 ** 20
+
 
 class GridSize(NamedTuple):
     roof: int
     walls: int
 
 
+class SensorGrid(NamedTuple):
+    """
+    The sensors of a building (or of all the buildings of a chunk) as contiguous arrays, the position of a sensor in
+    the arrays is its id. ``type`` and ``orientation`` are indices into ``SENSOR_TYPES`` and ``SENSOR_ORIENTATIONS``.
+    """
+    coords: np.ndarray  # n x 3
+    dirs: np.ndarray  # n x 3
+    area: np.ndarray
+    type: np.ndarray
+    orientation: np.ndarray
+    intersection: np.ndarray
+
+
+SENSOR_TYPES = ('walls', 'windows', 'roofs')
+SENSOR_ORIENTATIONS = ('north', 'east', 'south', 'west', 'top')
+
+# the surfaces of a building in the radiation results, the radiation of their sensors is summed
+SURFACE_GROUPS = ('roofs_top',
+                  'walls_east', 'walls_north', 'walls_south', 'walls_west',
+                  'windows_east', 'windows_north', 'windows_south', 'windows_west')
+# the index in SURFACE_GROUPS of a sensor by its type and orientation (-1: not a surface of a building)
+_SURFACE_GROUP_INDEX = np.array([[SURFACE_GROUPS.index(f"{srf_type}_{orientation}")
+                                  if f"{srf_type}_{orientation}" in SURFACE_GROUPS else -1
+                                  for orientation in SENSOR_ORIENTATIONS] for srf_type in SENSOR_TYPES])
+
+# storage of the radiation of the sensors: float32 or int16 in units of SENSOR_INT16_SCALE [Wh/m2]
+DEFAULT_SENSOR_DATA_FORMAT = 'float32'
+SENSOR_INT16_SCALE = 0.1
+
+
 def create_temp_daysim_directory(directory):
     daysim_dir = os.path.join(BUILT_IN_BINARIES_PATH, sys.platform)
 
@@ -162,7 +197,14 @@ def create_sensor_input_file(rad, chunk_n):
     rad.sensor_file_path = sensor_file_path
 
 
-def generate_sensor_surfaces(occface, grid_size, srf_type, orientation, normal, intersection):
+def generate_sensor_surfaces(occface, grid_size, normal, intersection):
+    """
+    Subdivide a face into sensor surfaces of (at most) ``grid_size`` x ``grid_size`` meters.
+
+    :return: the coordinates (n x 3) and the areas (n) of the sensors, the area of sensors intersecting with other
+        buildings is 0
+    :rtype: tuple[numpy.ndarray, numpy.ndarray]
+    """
     mid_pt = py3dmodel.calculate.face_midpt(occface)
     location_pt = py3dmodel.modify.move_pt(mid_pt, normal, 0.01)
     moved_oface = py3dmodel.fetch.topo2topotype(py3dmodel.modify.move(mid_pt, location_pt, occface))
@@ -170,28 +212,48 @@ def generate_sensor_surfaces(occface, grid_size, srf_type, orientation, normal,
     # put it into occ and subdivide surfaces
     sensor_surfaces = py3dmodel.construct.grid_face(moved_oface, grid_size, grid_size)
 
-    # calculate list of properties per surface
-    sensor_intersection = [intersection for x in sensor_surfaces]
-    sensor_dir = [normal for x in sensor_surfaces]
-    sensor_cord = [py3dmodel.calculate.face_midpt(x) for x in sensor_surfaces]
-    sensor_type = [srf_type for x in sensor_surfaces]
-    sensor_orientation = [orientation for x in sensor_surfaces]
-    sensor_area = [py3dmodel.calculate.face_area(x) * (1.0 - scalar)
-                   for x, scalar in zip(sensor_surfaces, sensor_intersection)]
+    sensor_cord = np.array([py3dmodel.calculate.face_midpt(x) for x in sensor_surfaces],
+                           dtype=np.float64).reshape(-1, 3)
+    sensor_area = np.array([py3dmodel.calculate.face_area(x) for x in sensor_surfaces], dtype=np.float64)
+    sensor_area *= 1.0 - intersection
+
+    return sensor_cord, sensor_area
+
+
+def slice_sensor_grid(sensors: SensorGrid, start, stop) -> SensorGrid:
+    """The sensors ``start`` to ``stop`` of a SensorGrid (e.g. the sensors of one building of a chunk)"""
+    return SensorGrid(*(array[start:stop] for array in sensors))
+
 
-    return sensor_dir, sensor_cord, sensor_type, sensor_area, sensor_orientation, sensor_intersection
+def concatenate_sensor_grids(sensor_grids):
+    """Concatenate the SensorGrid of several buildings, the ids of the sensors of each building follow each other"""
+    if not sensor_grids:
+        return SensorGrid(coords=np.empty((0, 3)), dirs=np.empty((0, 3)), area=np.empty(0),
+                          type=np.empty(0, dtype=np.uint8), orientation=np.empty(0, dtype=np.uint8),
+                          intersection=np.empty(0, dtype=np.int8))
+    return SensorGrid(*(np.concatenate(arrays) for arrays in zip(*sensor_grids)))
 
 
-def calc_sensors_building(building_geometry: BuildingGeometry, grid_size: GridSize):
-    sensor_dir_list = []
-    sensor_cord_list = []
-    sensor_type_list = []
-    sensor_area_list = []
-    sensor_orientation_list = []
-    sensor_intersection_list = []
-    surfaces_types = ['walls', 'windows', 'roofs']
+_sensor_codes = np.empty(0, dtype=object)
+
+
+def get_sensor_codes(sensors_number):
+    """
+    The names of the sensors of a building in the radiation files (``srf0``, ``srf1``, ...). The names are only
+    created when writing the files, the sensors are identified by their position in the SensorGrid otherwise.
+
+    :rtype: pandas.Index
+    """
+    global _sensor_codes
+    if sensors_number > len(_sensor_codes):
+        _sensor_codes = np.array(['srf' + str(x) for x in range(max(sensors_number, 2 * len(_sensor_codes)))],
+                                 dtype=object)
+    return pd.Index(_sensor_codes[:sensors_number])
 
-    for srf_type in surfaces_types:
+
+def calc_sensors_building(building_geometry: BuildingGeometry, grid_size: GridSize) -> SensorGrid:
+    sensor_grids = []
+    for type_code, srf_type in enumerate(SENSOR_TYPES):
         occface_list = getattr(building_geometry, srf_type)
         if srf_type == 'roofs':
             orientation_list = ['top'] * len(occface_list)
@@ -207,192 +269,190 @@ def calc_sensors_building(building_geometry: BuildingGeometry, grid_size: GridSi
             interesection_list = getattr(building_geometry, "intersect_{srf_type}".format(srf_type=srf_type))
         for orientation, normal, face, intersection in zip(orientation_list, normals_list, occface_list,
                                                            interesection_list):
-            sensor_dir, \
-            sensor_cord, \
-            sensor_type, \
-            sensor_area, \
-            sensor_orientation, \
-            sensor_intersection = generate_sensor_surfaces(face,
-                                                           grid_size.roof if srf_type == "roofs" else grid_size.walls,
-                                                           srf_type,
-                                                           orientation,
-                                                           normal,
-                                                           intersection)
-            sensor_intersection_list.extend(sensor_intersection)
-            sensor_dir_list.extend(sensor_dir)
-            sensor_cord_list.extend(sensor_cord)
-            sensor_type_list.extend(sensor_type)
-            sensor_area_list.extend(sensor_area)
-            sensor_orientation_list.extend(sensor_orientation)
-
-    return sensor_dir_list, sensor_cord_list, sensor_type_list, sensor_area_list, sensor_orientation_list, sensor_intersection_list
+            sensor_cord, sensor_area = generate_sensor_surfaces(face,
+                                                                grid_size.roof if srf_type == "roofs" else grid_size.walls,
+                                                                normal,
+                                                                intersection)
+            # the properties of the face are the same for all its sensors
+            sensors_number = len(sensor_area)
+            sensor_grids.append(SensorGrid(coords=sensor_cord,
+                                           dirs=np.tile(np.asarray(normal, dtype=np.float64), (sensors_number, 1)),
+                                           area=sensor_area,
+                                           type=np.full(sensors_number, type_code, dtype=np.uint8),
+                                           orientation=np.full(sensors_number, SENSOR_ORIENTATIONS.index(orientation),
+                                                               dtype=np.uint8),
+                                           intersection=np.full(sensors_number, intersection, dtype=np.int8)))
+
+    return concatenate_sensor_grids(sensor_grids)
+
+
+def write_sensor_metadata(building_name, sensors: SensorGrid, locator):
+    """Save the geometry of the sensors of a building to disk"""
+    pd.DataFrame({'BUILDING': building_name,
+                  'SURFACE': get_sensor_codes(len(sensors.area)),
+                  'orientation': np.array(SENSOR_ORIENTATIONS, dtype=object)[sensors.orientation],
+                  'intersection': sensors.intersection,
+                  'Xcoor': sensors.coords[:, 0],
+                  'Ycoor': sensors.coords[:, 1],
+                  'Zcoor': sensors.coords[:, 2],
+                  'Xdir': sensors.dirs[:, 0],
+                  'Ydir': sensors.dirs[:, 1],
+                  'Zdir': sensors.dirs[:, 2],
+                  'AREA_m2': sensors.area,
+                  'TYPE': np.array(SENSOR_TYPES, dtype=object)[sensors.type]}).to_csv(
+        locator.get_radiation_metadata(building_name), index=False)
 
 
 def calc_sensors_zone(building_names, locator, grid_size: GridSize, geometry_pickle_dir):
-    sensors_coords_zone = []
-    sensors_dir_zone = []
+    """
+    Calculate the sensors of the buildings and save their geometry to disk.
+
+    :return: the sensors of all the buildings (the sensors of each building follow each other in the order of
+        ``building_names``), the number of sensors of each building and the names of the buildings
+    :rtype: tuple[SensorGrid, list[int], list[str]]
+    """
+    sensor_grids = []
     sensors_total_number_list = []
     names_zone = []
-    sensors_code_zone = []
-    sensor_intersection_zone = []
     for building_name in building_names:
         building_geometry = BuildingGeometry.load(os.path.join(geometry_pickle_dir, 'zone', building_name))
         # get sensors in the building
-        sensors_dir_building, \
-        sensors_coords_building, \
-        sensors_type_building, \
-        sensors_area_building, \
-        sensor_orientation_building, \
-        sensor_intersection_building = calc_sensors_building(building_geometry, grid_size)
-
-        # get the total number of sensors and store in lst
-        sensors_number = len(sensors_coords_building)
-        sensors_total_number_list.append(sensors_number)
+        sensors_building = calc_sensors_building(building_geometry, grid_size)
 
-        sensors_code = ['srf' + str(x) for x in range(sensors_number)]
-        sensors_code_zone.append(sensors_code)
-
-        # get the total list of coordinates and directions to send to daysim
-        sensors_coords_zone.extend(sensors_coords_building)
-        sensors_dir_zone.extend(sensors_dir_building)
-
-        # get total list of intersections
-        sensor_intersection_zone.append(sensor_intersection_building)
-
-        # get the name of all buildings
+        sensor_grids.append(sensors_building)
+        sensors_total_number_list.append(len(sensors_building.area))
         names_zone.append(building_name)
 
         # save sensors geometry result to disk
-        pd.DataFrame({'BUILDING': building_name,
-                      'SURFACE': sensors_code,
-                      'orientation': sensor_orientation_building,
-                      'intersection': sensor_intersection_building,
-                      'Xcoor': [x[0] for x in sensors_coords_building],
-                      'Ycoor': [x[1] for x in sensors_coords_building],
-                      'Zcoor': [x[2] for x in sensors_coords_building],
-                      'Xdir': [x[0] for x in sensors_dir_building],
-                      'Ydir': [x[1] for x in sensors_dir_building],
-                      'Zdir': [x[2] for x in sensors_dir_building],
-                      'AREA_m2': sensors_area_building,
-                      'TYPE': sensors_type_building}).to_csv(locator.get_radiation_metadata(building_name), index=False)
-
-    return sensors_coords_zone, sensors_dir_zone, sensors_total_number_list, names_zone, sensors_code_zone, sensor_intersection_zone
+        write_sensor_metadata(building_name, sensors_building, locator)
+
+    return concatenate_sensor_grids(sensor_grids), sensors_total_number_list, names_zone
 
 
 def isolation_daysim(chunk_n, cea_daysim, building_names, locator, radiance_parameters, write_sensor_data,
                      grid_size: GridSize,
-                     max_global, weatherfile, geometry_pickle_dir):
+                     max_global, weatherfile, geometry_pickle_dir, results_memory_limit=DEFAULT_RESULTS_MEMORY_LIMIT,
+                     sensor_data_format=DEFAULT_SENSOR_DATA_FORMAT, daylight_coefficients_dir=None):
     # initialize daysim project
     daysim_project = cea_daysim.initialize_daysim_project('chunk_{n}'.format(n=chunk_n))
     print('Creating daysim project in: {daysim_dir}'.format(daysim_dir=daysim_project.project_path))
 
     # calculate sensors
     print("Calculating and sending sensor points")
-    sensors_coords_zone, \
-    sensors_dir_zone, \
-    sensors_number_zone, \
-    names_zone, \
-    sensors_code_zone, \
-    sensor_intersection_zone = calc_sensors_zone(building_names, locator, grid_size, geometry_pickle_dir)
+    sensors_zone, sensors_number_zone, names_zone = calc_sensors_zone(building_names, locator, grid_size,
+                                                                      geometry_pickle_dir)
 
-    daysim_project.create_sensor_input_file(sensors_coords_zone, sensors_dir_zone)
+    daysim_project.create_sensor_input_file(sensors_zone.coords, sensors_zone.dirs)
 
     print(f"Starting Daysim simulation for buildings: {names_zone}")
-    print(f"Total number of sensors: {len(sensors_coords_zone)}")
+    print(f"Total number of sensors: {len(sensors_zone.area)}")
 
     print('Writing radiance parameters')
     daysim_project.write_radiance_parameters(**radiance_parameters)
 
     print('Executing hourly solar isolation calculation')
-    daysim_project.execute_gen_dc()
+    key = None
+    if daylight_coefficients_dir is None:
+        daysim_project.execute_gen_dc()
+    else:
+        # the daylight coefficients don't depend on the weather data, reuse them if the other inputs did not change
+        key = daysim_project.daylight_coefficients_key(cea_daysim.hash_common_inputs(), radiance_parameters)
+        if daysim_project.load_daylight_coefficients(daylight_coefficients_dir, key):
+            print('Reusing daylight coefficients of a previous run')
+        else:
+            daysim_project.execute_gen_dc()
+            daysim_project.save_daylight_coefficients(daylight_coefficients_dir, key)
     daysim_project.execute_ds_illum()
 
-    print('Reading results...')
-    solar_res = daysim_project.eval_ill()
-
     # check inconsistencies and replace by max value of weather file
-    print('Fixing inconsistencies, if any')
-    solar_res = np.clip(solar_res, a_min=0.0, a_max=max_global)
-
-    # Check if leap year and remove extra day
-    if solar_res.shape[1] == HOURS_IN_YEAR + 24:
-        print('Removing leap day')
-        leap_day_hours = range(1416, 1440)
-        solar_res = np.delete(solar_res, leap_day_hours, axis=1)
+    print('Reading results and fixing inconsistencies, if any')
+    solar_res = daysim_project.eval_ill(results_memory_limit, max_value=max_global)
 
     print("Writing results to disk")
+    date = weatherfile["date"]
     index = 0
-    for building_name, sensors_number, sensor_code, sensor_intersection \
-            in zip(names_zone, sensors_number_zone, sensors_code_zone, sensor_intersection_zone):
+    for building_name, sensors_number in zip(names_zone, sensors_number_zone):
 
-        # select sensors data
-        sensor_data = solar_res[index:index+sensors_number]
+        # select sensors data (only the results of this building are loaded in memory)
+        sensor_data = np.array(solar_res[index:index+sensors_number])
+        sensors_building = slice_sensor_grid(sensors_zone, index, index + sensors_number)
         # set sensors that intersect with buildings to 0
-        sensor_data[np.array(sensor_intersection) == 1] = 0
-        items_sensor_name_and_result = pd.DataFrame(sensor_data, index=sensor_code)
+        sensor_data[sensors_building.intersection == 1] = 0
 
         # create summary and save to disk
-        date = weatherfile["date"]
-        write_aggregated_results(building_name, items_sensor_name_and_result, locator, date)
+        write_aggregated_results(building_name, sensor_data, sensors_building, locator, date)
 
         if write_sensor_data:
             sensor_data_path = locator.get_radiation_building_sensors(building_name)
-            write_sensor_results(sensor_data_path, items_sensor_name_and_result)
+            write_sensor_results(sensor_data_path, sensor_data, sensor_data_format)
 
         # Increase sensor index
         index = index + sensors_number
 
     # erase daysim folder to avoid conflicts after every iteration
     print('Removing results folder')
+    del solar_res
     daysim_project.cleanup_project()
+    # the key of the daylight coefficients in the cache (None if they are not cached)
+    return key
 
 
-def write_sensor_results(sensor_data_path, sensor_values):
-    feather.write_feather(sensor_values.T, sensor_data_path, compression="zstd")
-
+def write_sensor_results(sensor_data_path, sensor_values, data_format=DEFAULT_SENSOR_DATA_FORMAT):
+    """
+    Save the hourly radiation of the sensors of a building (one column per sensor) in the feather format.
 
-def write_aggregated_results(building_name, sensor_values, locator, date):
-    # Get sensor properties
-    geometry = pd.read_csv(locator.get_radiation_metadata(building_name)).set_index('SURFACE')
+    :param numpy.ndarray sensor_values: the radiation of the sensors (sensors x hours) [Wh/m2]
+    :param str data_format: ``float32`` or ``int16`` (the radiation in units of ``SENSOR_INT16_SCALE``)
+    """
+    sensor_values = np.asarray(sensor_values, dtype=np.float32).T
+    metadata = {}
+    if data_format == 'int16':
+        sensor_values = np.clip(np.rint(sensor_values / SENSOR_INT16_SCALE),
+                                np.iinfo(np.int16).min, np.iinfo(np.int16).max).astype(np.int16)
+        metadata[SENSOR_SCALE_KEY] = str(SENSOR_INT16_SCALE).encode()
+    elif data_format != 'float32':
+        raise ValueError(f"Unrecognized sensor data format {data_format}")
+    names = get_sensor_codes(sensor_values.shape[1])
+    table = pa.Table.from_arrays([pa.array(column) for column in sensor_values.T], names=list(names),
+                                 metadata=metadata)
+    feather.write_feather(table, sensor_data_path, compression="zstd")
+
+
+def calc_surface_groups(sensors: SensorGrid):
+    """
+    The index of the surface (in ``SURFACE_GROUPS``) of each sensor, e.g. the walls facing east.
 
-    # Create map between sensors and building surfaces
-    labels = geometry['TYPE'] + '_' + geometry['orientation']
-    group_dict = labels.to_dict()
+    :rtype: numpy.ndarray
+    """
+    groups = _SURFACE_GROUP_INDEX[sensors.type, sensors.orientation]
+    if (groups < 0).any():
+        type_code, orientation_code = sensors.type[groups < 0][0], sensors.orientation[groups < 0][0]
+        raise ValueError(f"Unrecognized surface name {SENSOR_TYPES[type_code]}_{SENSOR_ORIENTATIONS[orientation_code]}")
+    return groups
 
-    # Ensure surface columns (sometimes windows do not exist)
-    surfaces = {'windows_east',
-                'windows_west',
-                'windows_south',
-                'windows_north',
-                'walls_east',
-                'walls_west',
-                'walls_south',
-                'walls_north',
-                'roofs_top'}
 
-    for label in labels.unique():
-        if label not in surfaces:
-            raise ValueError(f"Unrecognized surface name {label}")
-        surfaces.remove(label)
+def write_aggregated_results(building_name, sensor_values, sensors: SensorGrid, locator, date):
+    """
+    Save the hourly radiation of the surfaces of a building (see ``SURFACE_GROUPS``) and their area.
 
-    # Transform data
-    sensor_values_kw = sensor_values.multiply(geometry['AREA_m2'], axis="index") / 1000
-    data = sensor_values_kw.groupby(group_dict).sum().T.add_suffix('_kW')
+    :param numpy.ndarray sensor_values: the radiation of the sensors of the building (sensors x hours) [Wh/m2]
+    :param SensorGrid sensors: the sensors of the building
+    """
+    # the (sparse) matrix summing the radiation of the sensors of each surface weighted by their area
+    groups = calc_surface_groups(sensors)
+    aggregation = scipy.sparse.csr_matrix((sensors.area / 1000, (groups, np.arange(len(groups)))),
+                                          shape=(len(SURFACE_GROUPS), len(groups)))
+    radiation_kW = aggregation @ np.asarray(sensor_values, dtype=np.float64)
+    area_m2 = np.bincount(groups, weights=sensors.area, minlength=len(SURFACE_GROUPS))
 
     # TODO: Remove total sensor area information from output. Area information is repeated over rows.
-    # Add area to data
-    area = geometry['AREA_m2'].groupby(group_dict).sum().add_suffix('_m2')
-    area_cols = pd.concat([area] * len(data), axis=1).T.set_index(data.index)
-    data = pd.concat([data, area_cols], axis=1)
-
-    # Add missing surfaces to output
-    for surface in surfaces:
-        data[f"{surface}_kW"] = 0.0
-        data[f"{surface}_m2"] = 0.0
+    data = pd.DataFrame(np.hstack([radiation_kW.T, np.tile(area_m2, (radiation_kW.shape[1], 1))]),
+                        columns=[f"{surface}_kW" for surface in SURFACE_GROUPS] +
+                                [f"{surface}_m2" for surface in SURFACE_GROUPS])
 
     # Round values and add date index
     data = data.round(2)
-    data["Date"] = date
+    data["Date"] = np.asarray(date)
     data.set_index("Date", inplace=True)
 
     data.to_csv(locator.get_radiation_building(building_name))
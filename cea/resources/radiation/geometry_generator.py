@@ -6,6 +6,7 @@ and .tiff (terrain)
 into 3D geometry with windows and roof equivalent to LOD3
 
 """
+import hashlib
 import math
 import os
 import pickle
@@ -19,6 +20,9 @@ import py4design.py3dmodel.construct as construct
 import py4design.py3dmodel.fetch as fetch
 import py4design.py3dmodel.modify as modify
 import py4design.py3dmodel.utility as utility
+import scipy.interpolate
+import scipy.spatial
+import shapely
 from OCC.Core.IntCurvesFace import IntCurvesFace_ShapeIntersector
 from OCC.Core.gp import gp_Pnt, gp_Lin, gp_Ax1, gp_Dir
 from osgeo import osr, gdal
@@ -41,6 +45,12 @@ __status__ = "Production"
 from cea.utilities.standardize_coordinates import (get_lat_lon_projected_shapefile, get_projected_coordinate_system,
                                                    crs_to_epsg)
 
+NEIGHBOUR_DISTANCE = 0.5  # m, max. distance between the bounding boxes of buildings checked for intersections
+PRISM_TOLERANCE = 0.01  # m, margin of the 2.5D prisms around the building solids
+GEOMETRY_CACHE_VERSION = 2  # change to invalidate the geometry cache (e.g. when the geometry generation changes)
+TERRAIN_MARGIN_CELLS = 5  # cells of the terrain raster read around the bounds of the scene
+TERRAIN_TIN_TOLERANCE = 1e-6  # m2, min. area of the triangles of the terrain
+
 
 def identify_surfaces_type(occface_list):
     roof_list = []
@@ -114,7 +124,7 @@ def create_hollowed_facade(surface_facade, window):
     return hollowed_facade_clean, hole_facade
 
 
-def calc_building_solids(buildings_df, geometry_simplification, elevation_map, num_processes):
+def calc_building_solids(buildings_df, geometry_simplification, elevations, num_processes):
     height_col_name = 'height_ag'
     nfloor_col_name = "floors_ag"
 
@@ -129,7 +139,7 @@ def calc_building_solids(buildings_df, geometry_simplification, elevation_map, n
     n = len(geometries)
     out = cea.utilities.parallel.vectorize(process_geometries, num_processes,
                                            on_complete=print_terrain_intersection_progress)(
-        geometries, repeat(elevation_map, n), range_floors, floor_to_floor_height)
+        geometries, elevations, range_floors, floor_to_floor_height)
     return out
 
 
@@ -140,10 +150,9 @@ def calc_floor_to_floor_height(building_height, number_of_floors):
     return building_height / number_of_floors
 
 
-def process_geometries(geometry, elevation_map, range_floors, floor_to_floor_height):
-    elevation_map_for_geometry = elevation_map.get_elevation_map_from_geometry(geometry)
-    # burn buildings footprint into the terrain and return the location of the new face
-    face_footprint = burn_buildings(geometry, elevation_map_for_geometry, 1e-12)
+def process_geometries(geometry, elevation, range_floors, floor_to_floor_height):
+    # place the footprint of the building on the terrain
+    face_footprint = burn_buildings(geometry, elevation)
     # create floors and form a solid
     building_solid = calc_solid(face_footprint, range_floors, floor_to_floor_height)
 
@@ -169,45 +178,110 @@ def calc_building_geometry_surroundings(name, building_solid, geometry_pickle_di
 
 
 def building_2d_to_3d(zone_df, surroundings_df, architecture_wwr_df, elevation_map, config, geometry_pickle_dir):
+    """
+    Create the 3D geometry of the buildings and save it to ``geometry_pickle_dir``. The geometry of a building is only
+    created again if its inputs changed since it was saved (see :py:func:`calc_solid_keys` and
+    :py:func:`calc_zone_keys`), for the other buildings the saved geometry is reused.
+    """
     # Config variables
     num_processes = config.get_number_of_processes()
     zone_simplification = config.radiation.zone_geometry
     surroundings_simplification = config.radiation.surrounding_geometry
     neglect_adjacent_buildings = config.radiation.neglect_adjacent_buildings
 
-    print('Calculating terrain intersection of building geometries')
     zone_buildings_df = zone_df.set_index('Name')
     zone_building_names = zone_buildings_df.index.values
-    zone_building_solid_list = calc_building_solids(zone_buildings_df, zone_simplification, elevation_map,
-                                                    num_processes)
+    zone_geometries = zone_buildings_df.geometry.simplify(zone_simplification, preserve_topology=True)
 
     surroundings_buildings_df = surroundings_df.set_index('Name')
     surroundings_building_names = surroundings_buildings_df.index.values
-    surroundings_building_solid_list = calc_building_solids(surroundings_buildings_df, surroundings_simplification,
-                                                            elevation_map, num_processes)
+    surroundings_geometries = surroundings_buildings_df.geometry.simplify(surroundings_simplification,
+                                                                          preserve_topology=True)
+
+    # find the buildings close to each zone building, which might intersect it (index in zone + surroundings)
+    n = len(zone_building_names)
+    all_geometries = np.append(zone_geometries.values, surroundings_geometries.values)
+    if not neglect_adjacent_buildings:
+        all_building_bounds = shapely.bounds(all_geometries).reshape(-1, 4)
+        all_building_boxes = np.column_stack([all_building_bounds[:, :2], np.zeros(len(all_building_bounds)),
+                                              all_building_bounds[:, 2:], np.zeros(len(all_building_bounds))])
+        neighbours = find_potentially_intersecting_buildings(all_building_boxes[:n], all_building_boxes)
+    else:
+        neighbours = [np.array([], dtype=int) for _ in range(n)]
+
+    # the elevation of the terrain under the buildings
+    all_elevations = elevation_map.get_elevation(shapely.get_coordinates(shapely.centroid(all_geometries)))
+
+    # find the buildings whose inputs changed since their geometry was saved
+    solid_keys = calc_solid_keys(all_geometries, pd.concat([zone_buildings_df, surroundings_buildings_df]),
+                                 all_elevations)
+    zone_keys = calc_zone_keys(zone_building_names, solid_keys, neighbours, architecture_wwr_df,
+                               neglect_adjacent_buildings)
+    surroundings_keys = solid_keys[n:]
+    geometry_cache = read_geometry_cache(geometry_pickle_dir)
+    zone_changed = np.array([not is_geometry_cached(geometry_cache, geometry_pickle_dir, 'zone', name, key)
+                             for name, key in zip(zone_building_names, zone_keys)], dtype=bool)
+    surroundings_changed = np.array([not is_geometry_cached(geometry_cache, geometry_pickle_dir, 'surroundings', name,
+                                                            key)
+                                     for name, key in zip(surroundings_building_names, surroundings_keys)],
+                                    dtype=bool)
+    print('Reusing the geometry of {z} of {n} zone buildings and {s} of {m} surrounding buildings'.format(
+        z=n - zone_changed.sum(), n=n, s=len(surroundings_changed) - surroundings_changed.sum(),
+        m=len(surroundings_changed)))
+
+    # the solids of the changed buildings and of the buildings close to the changed zone buildings are needed
+    needs_solid = np.append(zone_changed, surroundings_changed)
+    for i in np.flatnonzero(zone_changed):
+        needs_solid[neighbours[i]] = True
+    zone_needs_solid = np.flatnonzero(needs_solid[:n])
+    surroundings_needs_solid = np.flatnonzero(needs_solid[n:])
+
+    print('Calculating terrain intersection of building geometries')
+    all_building_solid_list = np.empty(len(all_geometries), dtype=object)
+    zone_solids = calc_building_solids(zone_buildings_df.iloc[zone_needs_solid], zone_simplification,
+                                       all_elevations[zone_needs_solid], num_processes)
+    surroundings_solids = calc_building_solids(surroundings_buildings_df.iloc[surroundings_needs_solid],
+                                               surroundings_simplification,
+                                               all_elevations[n + surroundings_needs_solid], num_processes)
+    for i, building_solid in zip(np.append(zone_needs_solid, n + surroundings_needs_solid),
+                                 zone_solids + surroundings_solids):
+        all_building_solid_list[i] = building_solid
 
     # calculate geometry for the surroundings
     print('Generating geometry for surrounding buildings')
-    geometry_3D_surroundings = [calc_building_geometry_surroundings(x, y, geometry_pickle_dir) for x, y in
-                                zip(surroundings_building_names, surroundings_building_solid_list)]
+    for name, building_solid in zip(surroundings_building_names[surroundings_changed],
+                                    all_building_solid_list[n:][surroundings_changed]):
+        calc_building_geometry_surroundings(name, building_solid, geometry_pickle_dir)
+    geometry_3D_surroundings = list(surroundings_building_names)
 
     # calculate geometry for the zone of analysis
     print('Generating geometry for buildings in the zone of analysis')
-    n = len(zone_building_names)
+    zone_changed_index = np.flatnonzero(zone_changed)
+    m = len(zone_changed_index)
     calc_zone_geometry_multiprocessing = cea.utilities.parallel.vectorize(calc_building_geometry_zone,
                                                                           num_processes,
                                                                           on_complete=print_progress)
 
+    zone_building_solid_list = all_building_solid_list[zone_changed_index]
     if not neglect_adjacent_buildings:
-        all_building_solid_list = np.append(zone_building_solid_list, surroundings_building_solid_list)
+        all_building_prisms = calc_building_prisms(all_geometries, all_building_solid_list)
     else:
         all_building_solid_list = []
-    geometry_3D_zone = calc_zone_geometry_multiprocessing(zone_building_names,
-                                                          zone_building_solid_list,
-                                                          repeat(all_building_solid_list, n),
-                                                          repeat(architecture_wwr_df, n),
-                                                          repeat(geometry_pickle_dir, n),
-                                                          repeat(neglect_adjacent_buildings, n))
+        all_building_prisms = None
+    calc_zone_geometry_multiprocessing(zone_building_names[zone_changed_index],
+                                       zone_building_solid_list,
+                                       repeat(all_building_solid_list, m),
+                                       repeat(architecture_wwr_df, m),
+                                       repeat(geometry_pickle_dir, m),
+                                       repeat(neglect_adjacent_buildings, m),
+                                       repeat(all_building_prisms, m),
+                                       [neighbours[i] for i in zone_changed_index])
+    geometry_3D_zone = list(zone_building_names)
+
+    geometry_cache.update((('zone', str(name)), key) for name, key in zip(zone_building_names, zone_keys))
+    geometry_cache.update((('surroundings', str(name)), key) for name, key in zip(surroundings_building_names,
+                                                                                  surroundings_keys))
+    write_geometry_cache(geometry_pickle_dir, geometry_cache)
     return geometry_3D_zone, geometry_3D_surroundings
 
 
@@ -219,15 +293,149 @@ def print_terrain_intersection_progress(i, n, _, __):
     print("Calculation of terrain intersection for building {i} completed out of {n}".format(i=i + 1, n=n))
 
 
-def are_buildings_close_to_eachother(x_1, y_1, solid2):
-    box2 = calculate.get_bounding_box(solid2)
-    x_2 = box2[0]
-    y_2 = box2[1]
-    delta = math.sqrt((y_2 - y_1) ** 2 + (x_2 - x_1) ** 2)
-    if delta <= 100:
-        return True
-    else:
-        return False
+class BuildingPrisms(object):
+    """
+    The 2.5D prisms (footprint and range of elevation) around building solids. A point outside the prism of a solid is
+    outside the solid, so the prisms are used to avoid most of the (slow) point in solid tests of OCC.
+    """
+    __slots__ = ['footprints', 'z_min', 'z_max']
+
+    def __init__(self, footprints, z_min, z_max):
+        self.footprints = footprints
+        self.z_min = z_min
+        self.z_max = z_max
+
+    def __getstate__(self):
+        return [getattr(self, k) for k in self.__slots__]
+
+    def __setstate__(self, data):
+        for k, v in zip(self.__slots__, data):
+            setattr(self, k, v)
+
+    def __getitem__(self, indices):
+        """Return the prisms at ``indices``"""
+        indices = np.asarray(indices, dtype=int)
+        return BuildingPrisms(self.footprints[indices], self.z_min[indices], self.z_max[indices])
+
+    def __len__(self):
+        return len(self.footprints)
+
+    def contains(self, points):
+        """
+        Check which points lie in which prisms.
+
+        :param points: coordinates (x, y, z) of the points
+        :return: boolean array of shape (number of points, number of prisms)
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+        shapely.prepare(self.footprints)
+        in_prism = np.zeros((len(points), len(self)), dtype=bool)
+        for i, footprint in enumerate(self.footprints):
+            in_range = (self.z_min[i] <= points[:, 2]) & (points[:, 2] <= self.z_max[i])
+            if in_range.any():
+                in_prism[in_range, i] = shapely.contains_xy(footprint, points[in_range, 0], points[in_range, 1])
+        return in_prism
+
+
+def calc_building_prisms(geometries, building_solid_list):
+    """
+    Calculate the prisms around the building solids.
+
+    :param geometries: the (simplified) footprints the solids were created from
+    :param building_solid_list: the building solids (``None`` for solids that are not needed, their prism is empty)
+    :rtype: BuildingPrisms
+    """
+    z_min = np.full(len(building_solid_list), np.nan)
+    z_max = np.full(len(building_solid_list), np.nan)
+    for i, solid in enumerate(building_solid_list):
+        if solid is not None:
+            box = calculate.get_bounding_box(solid)
+            z_min[i], z_max[i] = box[2], box[5]
+    # the solids are extruded from the exterior ring of the footprints
+    footprints = shapely.polygons(shapely.force_2d(shapely.get_exterior_ring(np.asarray(geometries))))
+    footprints = shapely.buffer(footprints, PRISM_TOLERANCE)
+    return BuildingPrisms(footprints, z_min - PRISM_TOLERANCE, z_max + PRISM_TOLERANCE)
+
+
+def find_potentially_intersecting_buildings(query_boxes, boxes, distance=NEIGHBOUR_DISTANCE):
+    """
+    Find the buildings whose bounding boxes are closer than ``distance`` to each of the query bounding boxes, using a
+    spatial index (STRtree) of the bounding boxes.
+
+    :param query_boxes: array with a row (x_min, y_min, z_min, x_max, y_max, z_max) per building to query
+    :param boxes: array with a row (x_min, y_min, z_min, x_max, y_max, z_max) per building to search
+    :return: for each query bounding box, the sorted indices of the buildings in ``boxes`` close to it
+    :rtype: list[numpy.ndarray]
+    """
+    tree = shapely.STRtree(shapely.box(boxes[:, 0], boxes[:, 1], boxes[:, 3], boxes[:, 4]))
+    query_index, tree_index = tree.query(shapely.box(query_boxes[:, 0] - distance, query_boxes[:, 1] - distance,
+                                                     query_boxes[:, 3] + distance, query_boxes[:, 4] + distance))
+    order = np.lexsort((tree_index, query_index))
+    query_index, tree_index = query_index[order], tree_index[order]
+    splits = np.searchsorted(query_index, np.arange(1, len(query_boxes)))
+    return np.split(tree_index, splits) if len(query_boxes) else []
+
+
+def calc_solid_keys(geometries, buildings_df, elevations):
+    """
+    Calculate a key (hash) of the inputs of the solid of each building: its (simplified) footprint, height, number of
+    floors and the elevation of the terrain under it.
+
+    :param geometries: the (simplified) footprints of the buildings
+    :param buildings_df: the buildings (in the same order as ``geometries``)
+    :param elevations: the elevation of the terrain under the buildings
+    :rtype: list[str]
+    """
+    keys = []
+    for geometry, height, floors, elevation in zip(geometries, buildings_df['height_ag'], buildings_df['floors_ag'],
+                                                   elevations):
+        h = hashlib.sha256()
+        h.update(repr((GEOMETRY_CACHE_VERSION, float(height), int(floors), float(elevation))).encode('utf-8'))
+        h.update(shapely.to_wkb(geometry))
+        keys.append(h.hexdigest())
+    return keys
+
+
+def calc_zone_keys(zone_building_names, solid_keys, neighbours, architecture_wwr_df, neglect_adjacent_buildings):
+    """
+    Calculate a key (hash) of the inputs of the geometry of each zone building: its solid, window to wall ratios and
+    the solids of the buildings that might intersect it.
+
+    :param zone_building_names: the names of the zone buildings
+    :param solid_keys: the keys of the solids of the zone buildings followed by the surrounding buildings
+    :param neighbours: the indices (in ``solid_keys``) of the buildings close to each zone building
+    :rtype: list[str]
+    """
+    keys = []
+    for i, name in enumerate(zone_building_names):
+        wwr = architecture_wwr_df.loc[name, ["wwr_west", "wwr_east", "wwr_north", "wwr_south"]]
+        h = hashlib.sha256()
+        h.update(repr((solid_keys[i], [float(x) for x in wwr], bool(neglect_adjacent_buildings))).encode('utf-8'))
+        for j in neighbours[i]:
+            h.update(solid_keys[j].encode('utf-8'))
+        keys.append(h.hexdigest())
+    return keys
+
+
+def read_geometry_cache(geometry_pickle_dir):
+    """Read the keys of the saved building geometries as a dict ``(type, name) -> key``"""
+    geometry_cache_file = os.path.join(geometry_pickle_dir, 'geometry_cache.csv')
+    if not os.path.exists(geometry_cache_file):
+        return {}
+    geometry_cache = pd.read_csv(geometry_cache_file, dtype=str)
+    return dict(zip(zip(geometry_cache['type'], geometry_cache['Name']), geometry_cache['key']))
+
+
+def write_geometry_cache(geometry_pickle_dir, geometry_cache):
+    pd.DataFrame([[building_type, name, key] for (building_type, name), key in geometry_cache.items()],
+                 columns=['type', 'Name', 'key']).to_csv(os.path.join(geometry_pickle_dir, 'geometry_cache.csv'),
+                                                         index=False)
+
+
+def is_geometry_cached(geometry_cache, geometry_pickle_dir, building_type, name, key):
+    """True if the saved geometry of a building was created from the same inputs"""
+    return (geometry_cache.get((building_type, str(name))) == key
+            and os.path.exists(os.path.join(geometry_pickle_dir, building_type, str(name))))
 
 
 class BuildingGeometry(object):
@@ -264,7 +472,8 @@ class BuildingGeometry(object):
 
 
 def calc_building_geometry_zone(name, building_solid, all_building_solid_list, architecture_wwr_df,
-                                geometry_pickle_dir, neglect_adjacent_buildings):
+                                geometry_pickle_dir, neglect_adjacent_buildings, all_building_prisms=None,
+                                neighbours=None):
     # now get all surfaces and create windows only if the buildings are in the area of study
     window_list = []
     wall_list = []
@@ -274,14 +483,15 @@ def calc_building_geometry_zone(name, building_solid, all_building_solid_list, a
     normals_win = []
     intersect_wall = []
 
-    # check if buildings are close together and it merits to check the intersection
+    # the buildings close together (see find_potentially_intersecting_buildings) merit to check the intersection
     potentially_intersecting_solids = []
+    potentially_intersecting_prisms = None
     if not neglect_adjacent_buildings:
-        box = calculate.get_bounding_box(building_solid)
-        x, y = box[0], box[1]
-        for solid in all_building_solid_list:
-            if are_buildings_close_to_eachother(x, y, solid):
-                potentially_intersecting_solids.append(solid)
+        if neighbours is None:
+            neighbours = range(len(all_building_solid_list))
+        potentially_intersecting_solids = [all_building_solid_list[i] for i in neighbours]
+        if all_building_prisms is not None:
+            potentially_intersecting_prisms = all_building_prisms[neighbours]
 
     # identify building surfaces according to angle:
     face_list = fetch.faces_frm_solid(building_solid)
@@ -298,7 +508,8 @@ def calc_building_geometry_zone(name, building_solid, all_building_solid_list, a
     wall_west, \
     normals_windows_west, \
     normals_walls_west, \
-    wall_intersects_west = calc_windows_walls(facade_list_west, wwr_west, potentially_intersecting_solids)
+    wall_intersects_west = calc_windows_walls(facade_list_west, wwr_west, potentially_intersecting_solids,
+                                              potentially_intersecting_prisms)
     if len(window_west) != 0:
         window_list.extend(window_west)
         orientation_win.extend(['west'] * len(window_west))
@@ -312,7 +523,8 @@ def calc_building_geometry_zone(name, building_solid, all_building_solid_list, a
     wall_east, \
     normals_windows_east, \
     normals_walls_east, \
-    wall_intersects_east = calc_windows_walls(facade_list_east, wwr_east, potentially_intersecting_solids)
+    wall_intersects_east = calc_windows_walls(facade_list_east, wwr_east, potentially_intersecting_solids,
+                                              potentially_intersecting_prisms)
     if len(window_east) != 0:
         window_list.extend(window_east)
         orientation_win.extend(['east'] * len(window_east))
@@ -326,7 +538,8 @@ def calc_building_geometry_zone(name, building_solid, all_building_solid_list, a
     wall_north, \
     normals_windows_north, \
     normals_walls_north, \
-    wall_intersects_north = calc_windows_walls(facade_list_north, wwr_north, potentially_intersecting_solids)
+    wall_intersects_north = calc_windows_walls(facade_list_north, wwr_north, potentially_intersecting_solids,
+                                               potentially_intersecting_prisms)
     if len(window_north) != 0:
         window_list.extend(window_north)
         orientation_win.extend(['north'] * len(window_north))
@@ -340,7 +553,8 @@ def calc_building_geometry_zone(name, building_solid, all_building_solid_list, a
     wall_south, \
     normals_windows_south, \
     normals_walls_south, \
-    wall_intersects_south = calc_windows_walls(facade_list_south, wwr_south, potentially_intersecting_solids)
+    wall_intersects_south = calc_windows_walls(facade_list_south, wwr_south, potentially_intersecting_solids,
+                                               potentially_intersecting_prisms)
     if len(window_south) != 0:
         window_list.extend(window_south)
         orientation_win.extend(['south'] * len(window_south))
@@ -361,30 +575,17 @@ def calc_building_geometry_zone(name, building_solid, all_building_solid_list, a
     return name
 
 
-def burn_buildings(geometry, elevation_map, tolerance):
+def burn_buildings(geometry, elevation):
+    """The footprint of a building at the elevation of the terrain (see :py:meth:`ElevationMap.get_elevation`)"""
     if geometry.has_z:
-        # remove elevation - we'll add it back later by intersecting with the topography
+        # remove elevation - we'll add it back from the topography
         point_list_2D = ((a, b) for (a, b, _) in geometry.exterior.coords)
     else:
         point_list_2D = geometry.exterior.coords
-    point_list_3D = [(a, b, 0) for (a, b) in point_list_2D]  # add 0 elevation
+    point_list_3D = [(a, b, float(elevation)) for (a, b) in point_list_2D]
 
     # creating floor surface in pythonocc
-    face = construct.make_polygon(point_list_3D)
-    # get the midpt of the face
-    face_midpt = calculate.face_midpt(face)
-
-    terrain_tin = elevation_map.generate_tin(tolerance)
-    # make shell out of tin_occface_list and create OCC object
-    terrain_shell = construct.make_shell(terrain_tin)
-
-    # project the face_midpt to the terrain and get the elevation
-    inter_pt, inter_face = calc_intersection(terrain_shell, face_midpt, (0, 0, 1), tolerance)
-
-    # reconstruct the footprint with the elevation
-    loc_pt = (inter_pt.X(), inter_pt.Y(), inter_pt.Z())
-    face = fetch.topo2topotype(modify.move(face_midpt, loc_pt, face))
-    return face
+    return construct.make_polygon(point_list_3D)
 
 
 def calc_solid(face_footprint, range_floors, floor_to_floor_height):
@@ -430,26 +631,39 @@ class Points(object):
         self.point_to_evaluate = point_to_evaluate
 
 
-def calc_windows_walls(facade_list, wwr, potentially_intersecting_solids):
+def calc_windows_walls(facade_list, wwr, potentially_intersecting_solids, potentially_intersecting_prisms=None):
+    """
+    Create the windows and walls of the facades. The facades intersecting one of the ``potentially_intersecting_solids``
+    are walls. If the :py:class:`BuildingPrisms` of the solids are given, only the solids whose prism contains the
+    point in front of a facade are checked.
+    """
     window_list = []
     wall_list = []
     normals_win = []
     normals_wall = []
     wall_intersects = []
     number_intersecting_solids = len(potentially_intersecting_solids)
-    for surface_facade in facade_list:
-        # get coordinates of surface
-        ref_pypt = calculate.face_midpt(surface_facade)
-        standard_normal = calculate.face_normal(surface_facade)  # to avoid problems with fuzzy normals
 
-        # evaluate if the surface intersects any other solid (important to erase non-active surfaces in the building
-        # simulation model)
-        data_point = Points(modify.move_pt(ref_pypt, standard_normal, 0.1))
+    # get coordinates of surfaces
+    ref_pypts = [calculate.face_midpt(surface_facade) for surface_facade in facade_list]
+    # to avoid problems with fuzzy normals
+    standard_normals = [calculate.face_normal(surface_facade) for surface_facade in facade_list]
+    # evaluate if the surfaces intersect any other solid (important to erase non-active surfaces in the building
+    # simulation model)
+    data_points = [modify.move_pt(ref_pypt, standard_normal, 0.1)
+                   for ref_pypt, standard_normal in zip(ref_pypts, standard_normals)]
+    if number_intersecting_solids and potentially_intersecting_prisms is not None and len(data_points):
+        in_prisms = potentially_intersecting_prisms.contains(data_points)
+    else:
+        in_prisms = np.ones((len(data_points), number_intersecting_solids), dtype=bool)
 
+    for surface_facade, ref_pypt, standard_normal, data_point, in_prism in zip(facade_list, ref_pypts,
+                                                                            standard_normals, data_points,
+                                                                            in_prisms):
         if number_intersecting_solids:
             # flag weather it intersects a surrounding geometry
-            intersects = np.vectorize(calc_intersection_face_solid)(potentially_intersecting_solids, data_point)
-            intersects = sum(intersects)
+            intersects = sum(calc_intersection_face_solid(potentially_intersecting_solids[i], Points(data_point))
+                             for i in np.flatnonzero(in_prism))
         else:
             intersects = 0
 
@@ -493,7 +707,7 @@ def calc_intersection_face_solid(potentially_intersecting_solid, point):
 
 
 class ElevationMap(object):
-    __slots__ = ['elevation_map', 'x_coords', 'y_coords', 'x_size', 'y_size', 'nodata']
+    __slots__ = ['elevation_map', 'x_coords', 'y_coords', 'x_size', 'y_size', 'nodata', '_triangulation']
 
     def __init__(self, elevation_map, x_coords, y_coords, x_size, y_size, nodata=None):
         self.elevation_map = elevation_map
@@ -504,20 +718,42 @@ class ElevationMap(object):
         self.y_size = y_size
 
         self.nodata = nodata
+        self._triangulation = None
+
+    def __getstate__(self):
+        return self.elevation_map, self.x_coords, self.y_coords, self.x_size, self.y_size, self.nodata
+
+    def __setstate__(self, state):
+        self.__init__(*state)
 
     @classmethod
-    def read_raster(cls, raster):
+    def read_raster(cls, raster, bounds=None):
+        """
+        Read the terrain raster. If ``bounds`` (minx, miny, maxx, maxy) are given, only the cells covering the bounds
+        (and a margin of ``TERRAIN_MARGIN_CELLS`` cells) are read.
+        """
         band = raster.GetRasterBand(1)
         nodata = band.GetNoDataValue()
 
-        a = band.ReadAsArray()
-
-        y, x = np.shape(a)
         upper_left_x, x_size, x_rotation, upper_left_y, y_rotation, y_size = raster.GetGeoTransform()
 
         if x_rotation != 0 or y_rotation != 0:
             raise ValueError("Rotation in raster is not supported.")
 
+        if bounds is None:
+            a = band.ReadAsArray()
+        else:
+            minx, miny, maxx, maxy = bounds
+            x_start = max(math.floor((minx - upper_left_x) / x_size) - TERRAIN_MARGIN_CELLS, 0)
+            x_end = min(math.ceil((maxx - upper_left_x) / x_size) + TERRAIN_MARGIN_CELLS, raster.RasterXSize)
+            y_start = max(math.floor((maxy - upper_left_y) / y_size) - TERRAIN_MARGIN_CELLS, 0)
+            y_end = min(math.ceil((miny - upper_left_y) / y_size) + TERRAIN_MARGIN_CELLS, raster.RasterYSize)
+            a = band.ReadAsArray(x_start, y_start, x_end - x_start, y_end - y_start)
+            upper_left_x += x_start * x_size
+            upper_left_y += y_start * y_size
+
+        y, x = np.shape(a)
+
         x_coords = np.arange(start=0, stop=x) * x_size + upper_left_x + (x_size / 2)  # add half the cell size
         y_coords = np.arange(start=0, stop=y) * y_size + upper_left_y + (y_size / 2)  # to centre the point
 
@@ -548,17 +784,81 @@ class ElevationMap(object):
 
         return ElevationMap(new_elevation_map, new_x_coords, new_y_coords, self.x_size, self.y_size, self.nodata)
 
-    def generate_tin(self, tolerance=1e-6):
+    def get_points(self):
+        """The centres of the cells of the raster with data (n x 3)"""
         # Ignore no data values from raster
         y_index, x_index = np.nonzero(self.elevation_map != self.nodata)
-        _x_coords = self.x_coords[x_index]
-        _y_coords = self.y_coords[y_index]
+        return np.column_stack([self.x_coords[x_index], self.y_coords[y_index],
+                                self.elevation_map[y_index, x_index]]).astype(np.float64)
+
+    def get_triangulation(self):
+        """The Delaunay triangulation (in 2D) of the points of the raster, see :py:meth:`get_points`"""
+        if self._triangulation is None:
+            self._triangulation = scipy.spatial.Delaunay(self.get_points()[:, :2])
+        return self._triangulation
+
+    def get_elevation(self, points):
+        """
+        The elevation of the terrain (the TIN of the raster) at the points (n x 2). Points outside of the TIN get the
+        elevation of the closest point of the raster.
+
+        :rtype: numpy.ndarray
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        triangulation = self.get_triangulation()
+        z = self.get_points()[:, 2]
+        elevation = scipy.interpolate.LinearNDInterpolator(triangulation, z)(points)
+        outside = np.isnan(elevation)
+        if outside.any():
+            elevation[outside] = scipy.interpolate.NearestNDInterpolator(triangulation.points, z)(points[outside])
+        return elevation
+
+    def calc_hash(self):
+        """Hash the raster (e.g. to cache the TIN generated from it)"""
+        h = hashlib.sha256()
+        h.update(repr((self.x_coords[0], self.y_coords[0], len(self.x_coords), len(self.y_coords), self.x_size,
+                       self.y_size, self.nodata)).encode('utf-8'))
+        h.update(np.ascontiguousarray(self.elevation_map).tobytes())
+        return h.hexdigest()
+
+    def generate_tin(self, tolerance=TERRAIN_TIN_TOLERANCE):
+        """
+        The triangulated irregular network (TIN) of the terrain as a list of OCC faces (the triangles with an area
+        above ``tolerance``).
+        """
+        triangles = self.get_points()[self.get_triangulation().simplices]
+        area = 0.5 * np.linalg.norm(np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0]),
+                                    axis=1)
+
+        tin_occface_list = [construct.make_polygon(triangle) for triangle in triangles[area > tolerance].tolist()]
 
-        raster_points = ((x, y, z) for x, y, z in zip(_x_coords, _y_coords, self.elevation_map[y_index, x_index]))
+        return tin_occface_list
 
-        tin_occface_list = construct.delaunay3d(raster_points, tolerance=tolerance)
 
-        return tin_occface_list
+def generate_cached_tin(elevation_map, cache_dir, tolerance=TERRAIN_TIN_TOLERANCE):
+    """
+    Generate the TIN of the terrain (see :py:meth:`ElevationMap.generate_tin`), reusing the TIN saved in ``cache_dir``
+    if it was generated from the same raster and tolerance.
+    """
+    h = hashlib.sha256()
+    h.update(repr((GEOMETRY_CACHE_VERSION, tolerance)).encode('utf-8'))
+    h.update(elevation_map.calc_hash().encode('utf-8'))
+    tin_path = os.path.join(cache_dir, 'terrain_tin_{key}.pickle'.format(key=h.hexdigest()[:16]))
+    if os.path.exists(tin_path):
+        print('Reusing terrain geometry: {tin_path}'.format(tin_path=tin_path))
+        with open(tin_path, 'rb') as f:
+            return pickle.load(f)
+
+    terrain_tin = elevation_map.generate_tin(tolerance)
+
+    # only keep the TIN of the latest raster
+    os.makedirs(cache_dir, exist_ok=True)
+    for file_name in os.listdir(cache_dir):
+        if file_name.startswith('terrain_tin_'):
+            os.remove(os.path.join(cache_dir, file_name))
+    with open(tin_path, 'wb') as f:
+        pickle.dump(terrain_tin, f)
+    return terrain_tin
 
 
 def standardize_coordinate_systems(zone_df, surroundings_df, trees_df, terrain_raster):
@@ -603,7 +903,8 @@ def tree_geometry_generator(tree_df, terrain_raster):
     proj4_str = osr.SpatialReference(wkt=terrian_projection).ExportToProj4()
     tree_df = tree_df.to_crs(proj4_str)
 
-    elevation_map = ElevationMap.read_raster(terrain_raster)
+    elevation_map = ElevationMap.read_raster(terrain_raster, tree_df.total_bounds)
+    elevations = elevation_map.get_elevation(shapely.get_coordinates(shapely.centroid(tree_df.geometry.values)))
 
     from multiprocessing.pool import Pool
     from multiprocessing import cpu_count
@@ -612,7 +913,8 @@ def tree_geometry_generator(tree_df, terrain_raster):
         surfaces = [
             fetch.faces_frm_solid(result) for result in pool.starmap(
                 process_geometries, (
-                    (geom, elevation_map, (0, 1), z) for geom, z in zip(tree_df['geometry'], tree_df['height_tc'])
+                    (geom, elevation, (0, 1), z)
+                    for geom, elevation, z in zip(tree_df['geometry'], elevations, tree_df['height_tc'])
                 )
             )
         ]
@@ -631,14 +933,15 @@ def geometry_main(config, zone_df, surroundings_df, trees_df, terrain_raster, ar
 
     check_terrain_bounds(zone_df, surroundings_df, trees_df, terrain_raster)
 
-    # Create a triangulated irregular network of terrain from raster
+    # Create a triangulated irregular network of terrain from raster (only the part around the scene is read)
     print("Reading terrain geometry")
-    elevation_map = ElevationMap.read_raster(terrain_raster)
-    terrain_tin = elevation_map.generate_tin()
+    scene_bounds = pd.concat([zone_df.geometry, surroundings_df.geometry, trees_df.geometry]).total_bounds
+    elevation_map = ElevationMap.read_raster(terrain_raster, scene_bounds)
+    os.makedirs(geometry_pickle_dir, exist_ok=True)
+    terrain_tin = generate_cached_tin(elevation_map, geometry_pickle_dir)
 
     # transform buildings 2D to 3D and add windows
     print("Creating 3D building surfaces")
-    os.makedirs(geometry_pickle_dir, exist_ok=True)
     geometry_3D_zone, geometry_3D_surroundings = building_2d_to_3d(zone_df, surroundings_df, architecture_wwr_df,
                                                                    elevation_map, config, geometry_pickle_dir)
 
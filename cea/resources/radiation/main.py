@@ -2,13 +2,17 @@
 Radiation engine and geometry handler for CEA
 """
 
+import heapq
+import math
 import os
 import shutil
 import time
 from itertools import repeat
 
+import numpy as np
 import pandas as pd
 import geopandas as gpd
+import shapely
 from osgeo import gdal
 
 import cea.config
@@ -16,9 +20,10 @@ import cea.inputlocator
 from cea.datamanagement.databases_verification import verify_input_geometry_zone, verify_input_geometry_surroundings
 from cea.resources.radiation import daysim, geometry_generator
 from cea.resources.radiation.daysim import GridSize
-from cea.resources.radiation.radiance import CEADaySim
+from cea.resources.radiation.radiance import CEADaySim, prune_daylight_coefficients
 from cea.utilities import epwreader
 from cea.utilities.parallel import vectorize
+from cea.utilities.standardize_coordinates import get_lat_lon_projected_shapefile, get_projected_coordinate_system
 
 __author__ = "Paul Neitzel, Kian Wee Chen"
 __copyright__ = "Copyright 2016, Architecture and Building Systems - ETH Zurich"
@@ -63,6 +68,71 @@ def read_surface_properties(locator) -> pd.DataFrame:
     return surface_properties.set_index('Name').round(decimals=2)
 
 
+def to_projected_coordinate_system(zone_df):
+    """
+    Reproject the zone geometry to the projected coordinate system (in meters) of the 3D geometry (see
+    :py:func:`geometry_generator.standardize_coordinate_systems`), e.g. to measure distances and areas.
+
+    :param geopandas.GeoDataFrame zone_df: the zone geometry, in any coordinate system
+    :rtype: geopandas.GeoDataFrame
+    """
+    lat, lon = get_lat_lon_projected_shapefile(zone_df)
+    return zone_df.to_crs(get_projected_coordinate_system(lat, lon))
+
+
+def estimate_sensors_number(zone_df, grid_size: GridSize):
+    """
+    Estimate the number of sensors of each building from its footprint and height, without creating its 3D geometry.
+    Each wall is divided into cells of ``grid_size.walls`` and the roof into cells of ``grid_size.roof``.
+
+    :param geopandas.GeoDataFrame zone_df: the zone geometry, indexed by building name
+    :rtype: pandas.Series
+    """
+    if zone_df.empty:
+        return pd.Series(0, index=zone_df.index, dtype=np.int64)
+    parts, part_index = shapely.get_parts(zone_df.geometry.values, return_index=True)
+    rings, ring_index = shapely.get_rings(parts, return_index=True)
+    coords, coord_index = shapely.get_coordinates(rings, return_index=True)
+    # the edges of the rings (between consecutive points of the same ring)
+    same_ring = coord_index[1:] == coord_index[:-1]
+    edge_length = np.linalg.norm(np.diff(coords, axis=0), axis=1)[same_ring]
+    edge_building = part_index[ring_index[coord_index[1:][same_ring]]]
+
+    height = zone_df['height_ag'].to_numpy(dtype=float)
+    wall_sensors = np.ceil(edge_length / grid_size.walls) * np.ceil(height[edge_building] / grid_size.walls)
+    roof_sensors = np.ceil(shapely.area(zone_df.geometry.values) / grid_size.roof ** 2)
+    sensors_number = np.bincount(edge_building, weights=wall_sensors, minlength=len(zone_df)) + roof_sensors
+    return pd.Series(sensors_number.astype(np.int64), index=zone_df.index)
+
+
+def calc_chunks(sensors_number, num_chunks):
+    """
+    Split the buildings into ``num_chunks`` chunks with about the same number of sensors: the buildings are assigned
+    from largest to smallest to the chunk with the fewest sensors so far.
+
+    :param pandas.Series sensors_number: the (estimated) number of sensors of each building
+    :return: the chunks (lists of building names) sorted by number of sensors, from largest to smallest
+    :rtype: list[list[str]]
+    """
+    num_chunks = max(1, min(num_chunks, len(sensors_number)))
+    # the order of the buildings is kept for buildings with the same number of sensors
+    order = np.argsort(-sensors_number.to_numpy(), kind='stable')
+    heap = [(0, n) for n in range(num_chunks)]
+    chunk_sensors = [0] * num_chunks
+    chunk_positions = [[] for _ in range(num_chunks)]
+    for position in order:
+        sensors, n = heapq.heappop(heap)
+        chunk_positions[n].append(position)
+        chunk_sensors[n] = sensors + int(sensors_number.iloc[position])
+        heapq.heappush(heap, (chunk_sensors[n], n))
+
+    building_names = list(sensors_number.index)
+    chunks = [[building_names[position] for position in sorted(positions)]
+              for positions in chunk_positions if positions]
+    chunk_sensors = [sensors for sensors, positions in zip(chunk_sensors, chunk_positions) if positions]
+    return [chunk for _, chunk in sorted(zip(chunk_sensors, chunks), key=lambda item: -item[0])]
+
+
 def run_daysim_simulation(cea_daysim: CEADaySim, zone_building_names, locator, settings, geometry_pickle_dir, num_processes):
     weather_path = locator.get_weather_file()
     # check inconsistencies and replace by max value of weather file
@@ -71,28 +141,41 @@ def run_daysim_simulation(cea_daysim: CEADaySim, zone_building_names, locator, s
 
     list_of_building_names = [building_name for building_name in settings.buildings
                               if building_name in zone_building_names]
-    # get chunks of buildings to iterate
-    chunks = [list_of_building_names[i:i + settings.n_buildings_in_chunk] for i in
-              range(0, len(list_of_building_names),
-                    settings.n_buildings_in_chunk)]
+    grid_size = GridSize(walls=settings.walls_grid, roof=settings.roof_grid)
+
+    # get chunks of buildings to iterate, with about the same number of sensors in each chunk
+    # the sensors are estimated in meters, in the projected coordinate system of the 3D geometry
+    zone_df = to_projected_coordinate_system(gpd.GeoDataFrame.from_file(locator.get_zone_geometry())).set_index('Name')
+    sensors_number = estimate_sensors_number(zone_df.loc[list_of_building_names], grid_size)
+    num_chunks = max(math.ceil(len(list_of_building_names) / settings.n_buildings_in_chunk),
+                     min(num_processes, len(list_of_building_names)))
+    chunks = calc_chunks(sensors_number, num_chunks)
 
     write_sensor_data = settings.write_sensor_data
+    results_memory_limit = settings.results_memory_limit * 2 ** 20
+    sensor_data_format = settings.sensor_data_format
+    if settings.reuse_daylight_coefficients:
+        daylight_coefficients_dir = os.path.join(locator.get_solar_radiation_folder(), "daylight_coefficients")
+        # hash the inputs once, before sending cea_daysim to the workers
+        cea_daysim.hash_common_inputs()
+    else:
+        daylight_coefficients_dir = None
     radiance_parameters = {"rad_ab": settings.rad_ab, "rad_ad": settings.rad_ad, "rad_as": settings.rad_as,
                            "rad_ar": settings.rad_ar, "rad_aa": settings.rad_aa,
                            "rad_lr": settings.rad_lr, "rad_st": settings.rad_st, "rad_sj": settings.rad_sj,
                            "rad_lw": settings.rad_lw, "rad_dj": settings.rad_dj,
                            "rad_ds": settings.rad_ds, "rad_dr": settings.rad_dr, "rad_dp": settings.rad_dp}
 
-    grid_size = GridSize(walls=settings.walls_grid, roof=settings.roof_grid)
-
     num_chunks = len(chunks)
 
     if num_chunks == 1:
-        daysim.isolation_daysim(
+        daylight_coefficients_keys = [daysim.isolation_daysim(
             0, cea_daysim, chunks[0], locator, radiance_parameters, write_sensor_data, grid_size,
-            max_global, weatherfile, geometry_pickle_dir)
+            max_global, weatherfile, geometry_pickle_dir, results_memory_limit, sensor_data_format,
+            daylight_coefficients_dir)]
     else:
-        vectorize(daysim.isolation_daysim, num_processes)(
+        # the chunks are sorted from largest to smallest, send them to the workers one by one in this order
+        daylight_coefficients_keys = vectorize(daysim.isolation_daysim, num_processes, chunksize=1)(
             range(0, num_chunks),
             repeat(cea_daysim, num_chunks),
             chunks,
@@ -102,9 +185,17 @@ def run_daysim_simulation(cea_daysim: CEADaySim, zone_building_names, locator, s
             repeat(grid_size, num_chunks),
             repeat(max_global, num_chunks),
             repeat(weatherfile, num_chunks),
-            repeat(geometry_pickle_dir, num_chunks)
+            repeat(geometry_pickle_dir, num_chunks),
+            repeat(results_memory_limit, num_chunks),
+            repeat(sensor_data_format, num_chunks),
+            repeat(daylight_coefficients_dir, num_chunks)
         )
 
+    daylight_coefficients_keys = {key for key in daylight_coefficients_keys if key is not None}
+    if daylight_coefficients_dir is not None and daylight_coefficients_keys:
+        # keep only the daylight coefficients of this run
+        prune_daylight_coefficients(daylight_coefficients_dir, daylight_coefficients_keys)
+
 
 def main(config):
     """
@@ -1,4 +1,5 @@
 import csv
+import hashlib
 import math
 import os
 import shutil
@@ -9,10 +10,25 @@ from enum import Enum
 
 import numpy as np
 
+from cea.constants import HOURS_IN_YEAR
 from cea.resources.radiation.geometry_generator import BuildingGeometry
 from py4design.py3dmodel.fetch import points_frm_occface
 
 
+# change this when the inputs of gen_dc change, so the cached daylight coefficients are not reused
+DAYLIGHT_COEFFICIENTS_CACHE_VERSION = 1
+# the name of the project in the file names of the cached daylight coefficients
+CACHED_PROJECT_NAME = "PROJECT"
+# the site information used by gen_dc (the name of the place in the weather file is not)
+DAYLIGHT_COEFFICIENTS_SITE_KEYS = ("latitude", "longitude", "time_zone", "site_elevation", "ground_reflectance")
+
+# the first hour of the 29th of February
+LEAP_DAY_START_HOUR = 1416
+
+# coordinates with a precision of 1 micrometer
+SENSOR_FILE_FORMAT = "%.6f"
+
+
 class SensorOutputUnit(Enum):
     w_m2 = 1
     lux = 2
@@ -54,6 +70,7 @@ class CEADaySim:
 
         # Header Properties
         self.site_info = None
+        self._common_inputs_hash = None
 
     def _create_folders(self):
         os.makedirs(self.common_inputs, exist_ok=True)
@@ -70,6 +87,22 @@ class CEADaySim:
                              self.daysim_material_path, self.daysim_geometry_path, self.wea_weather_path,
                              self.site_info, self.daysim_shading_path)
 
+    def hash_common_inputs(self):
+        """
+        Hash the inputs of the daylight coefficients shared by all Daysim projects: the geometry and materials, the
+        shading and the site information (``DAYLIGHT_COEFFICIENTS_SITE_KEYS``). The weather data itself is not
+        included. The hash is calculated once, call this before sending this object to the worker processes.
+        """
+        if self._common_inputs_hash is None:
+            h = hashlib.sha256()
+            for path in [self.daysim_material_path, self.daysim_geometry_path, self.daysim_shading_path]:
+                h.update(hash_file(path).encode())
+            site_info = parse_site_info(self.site_info)
+            for key in DAYLIGHT_COEFFICIENTS_SITE_KEYS:
+                h.update(f"{key} {site_info.get(key)}\n".encode())
+            self._common_inputs_hash = h.hexdigest()
+        return self._common_inputs_hash
+
     def create_radiance_material(self, building_surface_properties):
         add_rad_mat(self.rad_material_path, building_surface_properties)
 
@@ -258,15 +291,15 @@ class DaySimProject(object):
         n = 1 solar irradiance (W/m2)
         n = 2 illumiance (lux)
 
-        :param sensor_positions:
-        :param sensor_normals:
+        :param sensor_positions: the coordinates of the sensors (n x 3)
+        :param sensor_normals: the directions of the sensors (n x 3)
         :param sensor_output_unit: the unit for all sensor points (w/m2 or lux)
         """
+        sensors = np.hstack([np.asarray(sensor_positions, dtype=np.float64).reshape(-1, 3),
+                             np.asarray(sensor_normals, dtype=np.float64).reshape(-1, 3)])
         # create sensor file
         with open(self.sensor_path, "w") as sensor_file:
-            sensors = "".join(f"{pos[0]} {pos[1]} {pos[2]} {norm[0]} {norm[1]} {norm[2]}\n"
-                              for pos, norm in zip(sensor_positions, sensor_normals))
-            sensor_file.write(sensors)
+            np.savetxt(sensor_file, sensors, fmt=SENSOR_FILE_FORMAT)
 
         # add sensor file location to header file
         with open(self.hea_path, "a") as hea_file:
@@ -426,11 +459,54 @@ class DaySimProject(object):
         CEADaySim.run_cmd(command2, self.daysim_bin_directory, self.daysim_lib_directory)
         CEADaySim.run_cmd(command3, self.daysim_bin_directory, self.daysim_lib_directory)
 
+    def daylight_coefficients_key(self, common_inputs_hash, radiance_parameters):
+        """
+        The key of the daylight coefficients of this project in the cache: a hash of the common inputs (see
+        :py:meth:`CEADaySim.hash_common_inputs`), the sensors and the radiance parameters.
+        """
+        h = hashlib.sha256()
+        h.update(f"{DAYLIGHT_COEFFICIENTS_CACHE_VERSION}\n{common_inputs_hash}\n".encode())
+        h.update(hash_file(self.sensor_path).encode())
+        for name in sorted(radiance_parameters):
+            h.update(f"{name}={radiance_parameters[name]}\n".encode())
+        return h.hexdigest()
+
+    def save_daylight_coefficients(self, cache_dir, key):
+        """Copy the daylight coefficient files calculated by ``gen_dc`` to the cache"""
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_dir = os.path.join(cache_dir, f"{key}.{os.getpid()}.tmp")
+        os.makedirs(temp_dir, exist_ok=True)
+        for file_name in os.listdir(self.project_path):
+            if file_name.endswith(".dc"):
+                shutil.copyfile(os.path.join(self.project_path, file_name),
+                                os.path.join(temp_dir, file_name.replace(self.project_name, CACHED_PROJECT_NAME)))
+        try:
+            os.replace(temp_dir, os.path.join(cache_dir, key))
+        except OSError:
+            # saved by another process in the meantime
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def load_daylight_coefficients(self, cache_dir, key):
+        """
+        Copy the daylight coefficient files from the cache to the project, instead of running ``gen_dc``.
+
+        :return: False if the daylight coefficients are not in the cache
+        """
+        cached_dir = os.path.join(cache_dir, key)
+        if not os.path.isdir(cached_dir):
+            return False
+        # write the shading header
+        self.write_shading_parameters()
+        for file_name in os.listdir(cached_dir):
+            shutil.copyfile(os.path.join(cached_dir, file_name),
+                            os.path.join(self.project_path, file_name.replace(CACHED_PROJECT_NAME, self.project_name)))
+        return True
+
     def execute_ds_illum(self):
         command1 = f'ds_illum "{self.hea_path}"'
         CEADaySim.run_cmd(command1, self.daysim_bin_directory, self.daysim_lib_directory)
 
-    def eval_ill(self):
+    def eval_ill(self, memory_limit, max_value=None):
         """
         This function reads the output file from running `ds_illum`, parses the space separated values
         and returns the values as a numpy array.
@@ -438,19 +514,95 @@ class DaySimProject(object):
         Values in the file only have 2 decimal places, so we are using float32 to save memory
         Rows are hours, Columns are sensor. Transpose output to make rows sensors
 
-        :return: Numpy array of hourly irradiance results of sensor points
+        The file is read in blocks of hours of at most ``memory_limit`` bytes and the results are written to a memory
+        mapped file in the project folder, so the results of a large number of sensors don't need to fit in memory.
+        The results of the leap day (of a leap year weather file) are skipped.
+
+        :param int memory_limit: the size of the blocks of hours read at once (in bytes)
+        :param float max_value: the values are clipped to [0, max_value] if given
+        :return: Numpy array (memory mapped) of hourly irradiance results of sensor points
         """
 
         ill_path = os.path.join(self.project_path, f"{self.project_name}.ill")
         # if self.shading_exists:
         #     ill_path = os.path.join(self.project_path, f"shading_{self.project_name}.ill")
         with open(ill_path) as f:
-            reader = csv.reader(f, delimiter=' ')
-            data = np.array([np.array(row[4:], dtype=np.float32) for row in reader]).T
+            hours = sum(1 for _ in f)
+            f.seek(0)
+            sensors = len(f.readline().rstrip("\n").split(" ")) - 4 if hours else 0
+
+        if hours == HOURS_IN_YEAR + 24:
+            print('Removing leap day')
+            skip_hours = range(LEAP_DAY_START_HOUR, LEAP_DAY_START_HOUR + 24)
+        else:
+            skip_hours = range(0)
+
+        data = np.lib.format.open_memmap(os.path.join(self.project_path, f"{self.project_name}.ill.npy"), mode="w+",
+                                         dtype=np.float32, shape=(sensors, hours - len(skip_hours)))
+        block = np.empty((max(1, min(hours, memory_limit // max(1, 4 * sensors))), sensors), dtype=np.float32)
+
+        def write_block(start, size):
+            if max_value is not None:
+                np.clip(block[:size], 0.0, max_value, out=block[:size])
+            data[:, start:start + size] = block[:size].T
+
+        with open(ill_path) as f:
+            start = 0
+            size = 0
+            for hour, row in enumerate(f):
+                if hour in skip_hours:
+                    continue
+                block[size] = row.rstrip("\n").split(" ")[4:]
+                size += 1
+                if size == len(block):
+                    write_block(start, size)
+                    start += size
+                    size = 0
+            if size:
+                write_block(start, size)
+        data.flush()
 
         return data
 
 
+def parse_site_info(site_info):
+    """
+    Read the site information written by ``epw2wea`` (and the ground reflectance), one ``keyword value`` pair per line.
+
+    :param str site_info: the site information of the Daysim header (see :py:meth:`CEADaySim.execute_epw2wea`)
+    :rtype: dict[str, str]
+    """
+    parameters = {}
+    for line in (site_info or "").splitlines():
+        keyword, _, value = line.strip().partition(" ")
+        if keyword:
+            parameters[keyword] = value.strip()
+    return parameters
+
+
+def prune_daylight_coefficients(cache_dir, keys):
+    """
+    Remove the cached daylight coefficients (see :py:meth:`DaySimProject.save_daylight_coefficients`) of all keys
+    except ``keys``, i.e. the ones of previous runs that were not used by the current run.
+    """
+    if not os.path.isdir(cache_dir):
+        return
+    for file_name in os.listdir(cache_dir):
+        if file_name not in keys:
+            shutil.rmtree(os.path.join(cache_dir, file_name), ignore_errors=True)
+
+
+def hash_file(path):
+    """Hash the contents of a file (an empty string is returned for missing files)"""
+    if not os.path.exists(path):
+        return ''
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(2 ** 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
 class RadSurface(object):
     """
     An object that contains all the surface information running a Radiance/Daysim simulation.
@@ -5,74 +5,183 @@ import time
 import geopandas as gpd
 import numpy as np
 import pandas as pd
+import shapely
 from osgeo import gdal
 
 import cea.config
 import cea.inputlocator
+from cea.constants import HOURS_IN_YEAR
 from cea.datamanagement.databases_verification import verify_input_geometry_zone, verify_input_geometry_surroundings
 from cea.resources.radiation import daysim, geometry_generator
-from cea.resources.radiation.daysim import calc_sensors_zone, GridSize, write_aggregated_results, write_sensor_results
-from cea.resources.radiation.main import read_surface_properties, run_daysim_simulation
+from cea.resources.radiation.daysim import calc_sensors_zone, calc_surface_groups, slice_sensor_grid, GridSize, \
+    SENSOR_ORIENTATIONS, SURFACE_GROUPS, write_aggregated_results, write_sensor_results
+from cea.resources.radiation.main import read_surface_properties, run_daysim_simulation, \
+    to_projected_coordinate_system
 from cea.resources.radiation.radiance import CEADaySim
 from cea.utilities import epwreader
 
 
-def generate_sensor_data(sample_values, geometry_data):
-    def map_value(row):
-        surface = f"{row['TYPE']}_{row['orientation']}"
-        value = sample_values[surface]
-        return value
+# the features of the buildings used by the surrogate models of the radiation of their surfaces
+SURROGATE_FEATURES = {
+    'mean': [],
+    'regression': ['height_ag', 'obstruction'],
+}
+MIN_OBSTRUCTION_DISTANCE = 1.0  # m
 
-    sensor_data = geometry_data.apply(map_value, axis=1)
 
-    return sensor_data
+def generate_sensor_data(surface_values, sensors):
+    """The values of the surface of each sensor (sensors x hours), ``surface_values`` is ordered by SURFACE_GROUPS"""
+    return surface_values[calc_surface_groups(sensors)]
 
 
 def generate_sample_data(locator, sample_buildings):
     """
-    returns sample data for each surface in W/m2
+    returns sample data for each surface in W/m2 (samples x hours, NaN for the surfaces a sample building doesn't
+    have) in the order of SURFACE_GROUPS
     """
-    surfaces = {'windows_east',
-                'windows_west',
-                'windows_south',
-                'windows_north',
-                'walls_east',
-                'walls_west',
-                'walls_south',
-                'walls_north',
-                'roofs_top'}
-
-    sample_data = {k: [] for k in surfaces}
-
-    for building in sample_buildings:
+    sample_data = np.full((len(SURFACE_GROUPS), len(sample_buildings), HOURS_IN_YEAR), np.nan)
+    for i, building in enumerate(sample_buildings):
         data = pd.read_csv(locator.get_radiation_building(building))
-        for surface in sample_data.keys():
+        for g, surface in enumerate(SURFACE_GROUPS):
+            area = data[f"{surface}_m2"].to_numpy()
             # Convert to W/m2
-            sample_data[surface].append(data[f"{surface}_kW"]*1000/data[f"{surface}_m2"])
-
-    # Get mean of samples
-    for k, v in sample_data.items():
-        sample_data[k] = sum(v) / len(v)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                sample_data[g, i] = data[f"{surface}_kW"].to_numpy() * 1000 / area
 
     return sample_data
 
 
+def find_neighbours(zone_df, buffer_m):
+    """
+    Find the pairs of buildings closer than ``buffer_m`` to each other.
+
+    :return: the positions in ``zone_df`` of the buildings and of their neighbours
+    :rtype: tuple[numpy.ndarray, numpy.ndarray]
+    """
+    buffers = gpd.GeoDataFrame(geometry=zone_df.geometry.buffer(buffer_m).values, crs=zone_df.crs)
+    targets = gpd.GeoDataFrame(geometry=zone_df.geometry.values, crs=zone_df.crs)
+    pairs = gpd.sjoin(buffers, targets, how='inner', predicate='intersects')
+    building = pairs.index.to_numpy()
+    neighbour = pairs['index_right'].to_numpy()
+    return building[building != neighbour], neighbour[building != neighbour]
+
+
 def fetch_simulation_buildings(sample_buildings, zone_df, buffer_m):
-    simulation_buildings = set()
-    for building in sample_buildings:
-        buffer = zone_df[zone_df["Name"] == building].buffer(buffer_m).geometry
-        buildings_intersect = zone_df.intersects(buffer.values[0])
+    building, neighbour = find_neighbours(zone_df, buffer_m)
+    names = zone_df["Name"].to_numpy()
+    is_sample = np.isin(names, list(sample_buildings))
+    return set(names[is_sample]) | set(names[neighbour[is_sample[building]]])
 
-        for building_name in zone_df[buildings_intersect]["Name"].values:
-            simulation_buildings.add(building_name)
 
-    return simulation_buildings
+def calc_building_features(zone_df, buffer_m):
+    """
+    The features of the buildings used by the surrogate models: the height of the building and, for each orientation
+    of its surfaces, the largest obstruction angle [deg] of the buildings closer than ``buffer_m``. The facades are
+    obstructed by the part of the neighbours higher than half the building, the roof by the part higher than the
+    building. ``zone_df`` must be in a projected coordinate system (see :py:func:`to_projected_coordinate_system`).
+
+    :rtype: pandas.DataFrame
+    """
+    building, neighbour = find_neighbours(zone_df, buffer_m)
+    height = zone_df['height_ag'].to_numpy(dtype=float)
+    centroids = shapely.get_coordinates(zone_df.geometry.centroid.values)
+    dx, dy = (centroids[neighbour] - centroids[building]).T
+    distance = np.maximum(shapely.distance(zone_df.geometry.values[building], zone_df.geometry.values[neighbour]),
+                          MIN_OBSTRUCTION_DISTANCE)
+
+    # the facade facing the neighbour
+    facade = np.where(np.abs(dx) >= np.abs(dy),
+                      np.where(dx > 0, SENSOR_ORIENTATIONS.index('east'), SENSOR_ORIENTATIONS.index('west')),
+                      np.where(dy > 0, SENSOR_ORIENTATIONS.index('north'), SENSOR_ORIENTATIONS.index('south')))
+    obstruction = np.zeros((len(zone_df), len(SENSOR_ORIENTATIONS)))
+    np.maximum.at(obstruction, (building, facade),
+                  np.degrees(np.arctan(np.maximum(height[neighbour] - height[building] / 2, 0.0) / distance)))
+    np.maximum.at(obstruction, (building, np.full(len(building), SENSOR_ORIENTATIONS.index('top'))),
+                  np.degrees(np.arctan(np.maximum(height[neighbour] - height[building], 0.0) / distance)))
+
+    features = pd.DataFrame(obstruction, index=zone_df['Name'].to_numpy(),
+                            columns=[f"obstruction_{orientation}" for orientation in SENSOR_ORIENTATIONS])
+    features.insert(0, 'height_ag', height)
+    return features
+
+
+def select_sample_buildings(features, sample_size):
+    """
+    Select ``sample_size`` buildings covering the range of the features of the buildings: starting with the most
+    typical building, the building with the most different features from the buildings selected so far is added.
+    """
+    values = features.to_numpy(dtype=float)
+    std = values.std(axis=0)
+    values = (values - values.mean(axis=0)) / np.where(std > 0, std, 1.0)
+    selected = [int(np.argmin(np.linalg.norm(values, axis=1)))]
+    distance = np.linalg.norm(values - values[selected[0]], axis=1)
+    for _ in range(min(sample_size, len(values)) - 1):
+        selected.append(int(np.argmax(distance)))
+        distance = np.minimum(distance, np.linalg.norm(values - values[selected[-1]], axis=1))
+    return list(features.index[sorted(selected)])
+
+
+def calc_surface_features(features, surface, model):
+    """The design matrix of the surrogate model of a surface (an intercept and the features of the buildings)"""
+    orientation = surface.split('_')[1]
+    columns = [f"obstruction_{orientation}" if feature == 'obstruction' else feature
+               for feature in SURROGATE_FEATURES[model]]
+    return np.hstack([np.ones((len(features), 1)), features[columns].to_numpy(dtype=float)])
+
+
+def fit_surrogate_models(sample_data, sample_features, model):
+    """
+    Fit a linear model of the hourly radiation [W/m2] of each surface to the features of the sample buildings by least
+    squares (the ``mean`` model only has an intercept: it is the mean of the sample buildings). The error of the model
+    is estimated by leave-one-out cross-validation.
+
+    :param numpy.ndarray sample_data: the radiation of the surfaces of the sample buildings (see generate_sample_data)
+    :param pandas.DataFrame sample_features: the features of the sample buildings (see calc_building_features)
+    :param str model: ``mean`` or ``regression``
+    :return: the coefficients of the model of each surface (features x hours) and the error of the annual radiation
+        of each surface relative to its mean over the sample buildings (mean and maximum over the sample buildings)
+    :rtype: tuple[list[numpy.ndarray], pandas.DataFrame]
+    """
+    coefficients = []
+    errors = pd.DataFrame(np.nan, index=list(SURFACE_GROUPS), columns=['mean_error', 'max_error'])
+    for g, surface in enumerate(SURFACE_GROUPS):
+        valid = ~np.isnan(sample_data[g]).any(axis=1)
+        y = sample_data[g][valid]
+        x = calc_surface_features(sample_features, surface, model)[valid]
+        if len(y) <= x.shape[1]:
+            # not enough samples for the features, use the mean of the samples
+            x = x[:, :1]
+        if len(y) == 0:
+            coefficients.append(np.full((x.shape[1], sample_data.shape[2]), np.nan))
+            continue
+        x_inv = np.linalg.pinv(x)
+        beta = x_inv @ y
+        coefficients.append(beta)
+
+        # leave-one-out residuals of the annual radiation from the leverage of the samples
+        leverage = np.einsum('ij,ji->i', x, x_inv)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            loo_residual = (y - x @ beta).sum(axis=1) / (1.0 - leverage)
+            relative_error = np.abs(loo_residual) / y.sum(axis=1).mean()
+        relative_error = relative_error[np.isfinite(relative_error) & (leverage < 1.0 - 1e-9)]
+        if len(relative_error):
+            errors.loc[surface] = relative_error.mean(), relative_error.max()
+    return coefficients, errors
+
+
+def predict_surface_radiation(coefficients, features, model):
+    """The hourly radiation [W/m2] of the surfaces of a building (in the order of SURFACE_GROUPS)"""
+    surface_values = np.empty((len(SURFACE_GROUPS), coefficients[0].shape[1]))
+    for g, surface in enumerate(SURFACE_GROUPS):
+        beta = coefficients[g]
+        surface_values[g] = calc_surface_features(features, surface, model)[0, :len(beta)] @ beta
+    return np.maximum(surface_values, 0.0)
 
 
 def main(config):
     sample_buildings = config.radiation_simplified.sample_buildings
     buffer_m = config.radiation_simplified.buffer
-    config.radiation.buildings = sample_buildings
+    surrogate_model = config.radiation_simplified.surrogate_model
 
     locator = cea.inputlocator.InputLocator(scenario=config.scenario)
     daysim_bin_path, daysim_lib_path = daysim.check_daysim_bin_directory(config.radiation.daysim_bin_directory,
@@ -90,6 +199,13 @@ def main(config):
     print(f"surroundings: {surroundings_path}")
 
     zone_df = gpd.GeoDataFrame.from_file(zone_path)
+    # the distances between the buildings in meters
+    projected_zone_df = to_projected_coordinate_system(zone_df)
+    building_features = calc_building_features(projected_zone_df, buffer_m)
+    if not sample_buildings:
+        sample_buildings = select_sample_buildings(building_features, config.radiation_simplified.sample_size)
+        print(f"Sample buildings: {sample_buildings}")
+    config.radiation.buildings = sample_buildings
     if len(sample_buildings) == len(zone_df):
         raise ValueError("List of sample buildings is the same as all buildings. "
                          "Consider selecting a subset of buildings instead.")
@@ -132,7 +248,7 @@ def main(config):
                                                        architecture_wwr_df,
                                                        geometry_staging_location)
     # Fetch simulation buildings based on proximity to sample buildings
-    simulation_buildings = fetch_simulation_buildings(sample_buildings, zone_df, buffer_m)
+    simulation_buildings = fetch_simulation_buildings(sample_buildings, projected_zone_df, buffer_m)
 
     daysim_staging_location = os.path.join(locator.get_temporary_folder(), 'cea_radiation')
     cea_daysim = CEADaySim(daysim_staging_location, daysim_bin_path, daysim_lib_path)
@@ -163,36 +279,40 @@ def main(config):
     # Remove staging location after everything is successful
     shutil.rmtree(daysim_staging_location)
 
-    # Generate sample values
+    # Fit the surrogate models of the radiation of the surfaces to the sample buildings
     sample_values = generate_sample_data(locator, sample_buildings)
-
-    sensors_coords_zone, \
-        sensors_dir_zone, \
-        sensors_number_zone, \
-        names_zone, \
-        sensors_code_zone, \
-        sensor_intersection_zone = calc_sensors_zone(zone_building_names, locator,
-                                                     GridSize(walls=200, roof=200),
-                                                     geometry_staging_location)
+    coefficients, errors = fit_surrogate_models(sample_values, building_features.loc[sample_buildings],
+                                                surrogate_model)
+    print(f"Relative error of the annual radiation of the surfaces ({surrogate_model} model, "
+          f"leave-one-out cross-validation on the sample buildings):")
+    print(errors.round(3).to_string())
+
+    # the sample buildings keep the results of Daysim
+    estimated_buildings = [building for building in zone_building_names if building not in set(sample_buildings)]
+    sensors_zone, sensors_number_zone, names_zone = calc_sensors_zone(estimated_buildings, locator,
+                                                                      GridSize(walls=200, roof=200),
+                                                                      geometry_staging_location)
 
     weatherfile = epwreader.epw_reader(weather_file)
     date = weatherfile["date"]
-    for building_name, sensors_number, sensor_code, sensor_intersection \
-            in zip(names_zone, sensors_number_zone, sensors_code_zone, sensor_intersection_zone):
+    index = 0
+    for building_name, sensors_number in zip(names_zone, sensors_number_zone):
 
-        geometry = pd.read_csv(locator.get_radiation_metadata(building_name)).set_index('SURFACE')
-        sensor_data = generate_sensor_data(sample_values, geometry)
+        sensors_building = slice_sensor_grid(sensors_zone, index, index + sensors_number)
+        surface_values = predict_surface_radiation(coefficients, building_features.loc[[building_name]],
+                                                   surrogate_model)
+        sensor_data = generate_sensor_data(surface_values, sensors_building)
 
         # set sensors that intersect with buildings to 0
-        sensor_data[np.array(sensor_intersection) == 1] = 0
-        items_sensor_name_and_result = pd.DataFrame(sensor_data, index=sensor_code)
+        sensor_data[sensors_building.intersection == 1] = 0
+        index = index + sensors_number
 
         # create summary and save to disk
-        write_aggregated_results(building_name, items_sensor_name_and_result, locator, date)
+        write_aggregated_results(building_name, sensor_data, sensors_building, locator, date)
 
         if config.radiation.write_sensor_data:
             sensor_data_path = locator.get_radiation_building_sensors(building_name)
-            write_sensor_results(sensor_data_path, items_sensor_name_and_result)
+            write_sensor_results(sensor_data_path, sensor_data, config.radiation.sensor_data_format)
 
     print("Daysim simulation finished in %.2f mins" % ((time.time() - time1) / 60.0))
 
@@ -20,6 +20,8 @@ __maintainer__ = "Daren Thomas"
 __email__ = "cea@arch.ethz.ch"
 __status__ = "Production"
 
+DEMAND_COLUMNS = ['Qww_sys_kWh', 'Qww_kWh', 'Tww_sys_sup_C', 'Tww_sys_re_C', 'mcptw_kWperC', 'mcpww_sys_kWperC']
+
 
 def calc_sewage_heat_exchanger(locator, config):
     """
@@ -32,24 +34,19 @@ def calc_sewage_heat_exchanger(locator, config):
     Save the results to `SWP.csv`
     """
 
-    # local variables
-    mcpwaste = []
-    twaste = []
-    mXt = []
-    counter = 0
     names = pd.read_csv(locator.get_total_demand()).Name
     sewage_water_ratio = config.sewage.sewage_water_ratio
     heat_exchanger_length = config.sewage.heat_exchanger_length
     V_lps_external = config.sewage.sewage_water_district
 
-    for building_name in names:
-        building = pd.read_csv(locator.get_demand_results_file(building_name))
-        mcp_combi, t_to_sewage = np.vectorize(calc_Sewagetemperature)(building.Qww_sys_kWh, building.Qww_kWh, building.Tww_sys_sup_C,
-                                                     building.Tww_sys_re_C, building.mcptw_kWperC, building.mcpww_sys_kWperC, sewage_water_ratio)
-        mcpwaste.append(mcp_combi)
-        twaste.append(t_to_sewage)
-        mXt.append(mcp_combi*t_to_sewage)
-        counter = counter +1
+    # read the demand results of all buildings at once (one block of rows per building)
+    demand = locator.read_demand_results_for_buildings(list(names), DEMAND_COLUMNS)
+    mcp_combi, t_to_sewage = np.vectorize(calc_Sewagetemperature)(demand.Qww_sys_kWh, demand.Qww_kWh,
+                                                                  demand.Tww_sys_sup_C, demand.Tww_sys_re_C,
+                                                                  demand.mcptw_kWperC, demand.mcpww_sys_kWperC,
+                                                                  sewage_water_ratio)
+    mcpwaste = mcp_combi.reshape(len(names), -1)
+    mXt = (mcp_combi * t_to_sewage).reshape(len(names), -1)
     mcpwaste_zone = np.sum(mcpwaste, axis =0)
     mXt_zone = np.sum(mXt, axis =0)
     twaste_zone = [x * (y**-1) * 0.8 if y != 0 else 0 for x,y in zip (mXt_zone, mcpwaste_zone)] # losses in the grid of 20%
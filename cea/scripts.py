@@ -48,9 +48,7 @@ class CeaScript(object):
         print("---------------------------")
         print("ERROR: Missing input files:")
         for method_name, path in self.missing_input_files(config):
-            script_suggestions = (schema_data[method_name]['created_by']
-                                  if 'created_by' in schema_data[method_name]
-                                  else None)
+            script_suggestions = schema_data.get(method_name, {}).get('created_by')
             print('- {path}'.format(path=path))
             if script_suggestions:
                 print('  (HINT: try running {scripts})'.format(scripts=', '.join(script_suggestions)))
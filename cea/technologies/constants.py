@@ -33,6 +33,11 @@ NETWORK_DEPTH = 1  # m
 REDUCED_TIME_STEPS = 50 # number of time steps of maximum demand which are evaluated as an initial guess of the edge diameters
 MAX_INITIAL_DIAMETER_ITERATIONS = 20 #number of initial guess iterations for pipe diameters
 
+# Mass flows in looped thermal networks (global gradient algorithm)
+HYDRAULIC_TOLERANCE_KGS = 0.001  # convergence tolerance of the edge mass flows in kg/s
+MAX_HYDRAULIC_ITERATIONS = 100  # maximum number of iterations of the edge mass flows
+MAX_LOOP_PRESSURE_RESIDUAL_PA = 15000  # residual of the pressure balance in loops above which a warning is printed
+
 # Cogeneration (CCGT)
 SPEC_VOLUME_STEAM = 0.0010  # m3/kg
 
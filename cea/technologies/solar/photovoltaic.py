@@ -17,6 +17,7 @@ from scipy import interpolate
 import cea.config
 import cea.inputlocator
 import cea.utilities.parallel
+from cea.utilities.shared_arrays import share_dataframe
 from cea.analysis.costs.equations import calc_capex_annualized
 from cea.constants import HOURS_IN_YEAR
 from cea.technologies.solar import constants
@@ -130,24 +131,18 @@ def calc_PV(locator, config, latitude, longitude, weather_data, datetime_local,
 def calc_pv_generation(sensor_groups, weather_data, date_local, solar_properties, latitude, panel_properties_PV):
     """
     To calculate the electricity generated from PV panels.
+
+    The hourly values of all groups of sensors are calculated at once as arrays of shape (groups, hours): the panel
+    properties of the groups are column vectors and the weather and solar properties row vectors.
     """
 
     # local variables
-    number_groups = sensor_groups['number_groups']  # number of groups of sensor points
     prop_observers = sensor_groups['prop_observers']  # mean values of sensor properties of each group of sensors
     hourly_radiation = sensor_groups['hourlydata_groups']  # mean hourly radiation of sensors in each group [Wh/m2]
+    groups = prop_observers.index.values
 
     # convert degree to radians
-    lat = radians(latitude)
-    g_rad = np.radians(solar_properties.g)
-    ha_rad = np.radians(solar_properties.ha)
-    Sz_rad = np.radians(solar_properties.Sz)
-    Az_rad = np.radians(solar_properties.Az)
-
-    # empty list to store results
-    list_groups_area = [0 for i in range(number_groups)]
-    total_el_output_PV_kWh = [0 for i in range(number_groups)]
-    total_radiation_kWh = [0 for i in range(number_groups)]
+    Sz_rad = np.radians(solar_properties.Sz.values)
 
     potential = pd.DataFrame(index=range(HOURS_IN_YEAR))
     panel_orientations = ['walls_south', 'walls_north', 'roofs_top', 'walls_east', 'walls_west']
@@ -160,56 +155,44 @@ def calc_pv_generation(sensor_groups, weather_data, date_local, solar_properties
     Bref = panel_properties_PV['PV_Bref']
 
     misc_losses = panel_properties_PV['misc_losses']  # cabling, resistances etc..
-    for group in prop_observers.index.values:
-        # calculate radiation types (direct/diffuse) in group
-        radiation_Wperm2 = solar_equations.cal_radiation_type(group, hourly_radiation, weather_data)
-
-        # read panel properties of each group
-        teta_z_deg = prop_observers.loc[group, 'surface_azimuth_deg']
-        tot_module_area_m2 = prop_observers.loc[group, 'area_installed_module_m2']
-        tilt_angle_deg = prop_observers.loc[group, 'B_deg']  # tilt angle of panels
-        # degree to radians
-        tilt_rad = radians(tilt_angle_deg)  # tilt angle
-        teta_z_deg = radians(teta_z_deg)  # surface azimuth
-
-        # calculate effective incident angles necessary
-        teta_deg = pvlib.irradiance.aoi(tilt_angle_deg, teta_z_deg, solar_properties.Sz, solar_properties.Az)
-        teta_rad = teta_rad = [radians(x) for x in teta_deg]
-        teta_ed_rad, teta_eg_rad = calc_diffuseground_comp(tilt_rad)
-
-        absorbed_radiation_Wperm2 = np.vectorize(calc_absorbed_radiation_PV)(radiation_Wperm2.I_sol,
-                                                                             radiation_Wperm2.I_direct,
-                                                                             radiation_Wperm2.I_diffuse, tilt_rad,
-                                                                             Sz_rad, teta_rad, teta_ed_rad,
-                                                                             teta_eg_rad, panel_properties_PV)
-
-        T_cell_C = np.vectorize(calc_cell_temperature)(absorbed_radiation_Wperm2, weather_data.drybulb_C,
-                                                       panel_properties_PV)
-
-        el_output_PV_kW = np.vectorize(calc_PV_power)(absorbed_radiation_Wperm2, T_cell_C, eff_nom, tot_module_area_m2,
-                                                      Bref, misc_losses)
-
-        # write results from each group
-        panel_orientation = prop_observers.loc[group, 'type_orientation']
-        potential['PV_' + panel_orientation + '_E_kWh'] = potential[
-                                                              'PV_' + panel_orientation + '_E_kWh'] + el_output_PV_kW
-        potential['PV_' + panel_orientation + '_m2'] = potential['PV_' + panel_orientation + '_m2'] + tot_module_area_m2
-
-        # aggregate results from all modules
-        list_groups_area[group] = tot_module_area_m2
-        total_el_output_PV_kWh[group] = el_output_PV_kW
-        total_radiation_kWh[group] = (radiation_Wperm2['I_sol'] * tot_module_area_m2 / 1000)  # kWh
-
-    # check for missing groups and assign 0 as el_output_PV_kW
-    # panel_orientations = ['walls_south', 'walls_north', 'roofs_top', 'walls_east', 'walls_west']
-    # for panel_orientation in panel_orientations:
-    #     if panel_orientation not in prop_observers['type_orientation'].values:
-    #         potential['PV_' + panel_orientation + '_E_kWh'] = 0
-    #         potential['PV_' + panel_orientation + '_m2'] = 0
-
-    potential['E_PV_gen_kWh'] = sum(total_el_output_PV_kWh)
-    potential['radiation_kWh'] = sum(total_radiation_kWh).values
-    potential['Area_PV_m2'] = sum(list_groups_area)
+
+    # calculate radiation types (direct/diffuse) in each group
+    I_sol, I_direct, I_diffuse = solar_equations.calc_radiation_types(hourly_radiation[groups], weather_data)
+
+    # read panel properties of each group
+    teta_z_deg = prop_observers['surface_azimuth_deg'].values.astype(float)[:, np.newaxis]
+    tot_module_area_m2 = prop_observers['area_installed_module_m2'].values.astype(float)[:, np.newaxis]
+    tilt_angle_deg = prop_observers['B_deg'].values.astype(float)[:, np.newaxis]  # tilt angle of panels
+    # degree to radians
+    tilt_rad = np.radians(tilt_angle_deg)  # tilt angle
+    teta_z_deg = np.radians(teta_z_deg)  # surface azimuth
+
+    # calculate effective incident angles necessary
+    teta_deg = pvlib.irradiance.aoi(tilt_angle_deg, teta_z_deg, solar_properties.Sz.values, solar_properties.Az.values)
+    teta_rad = np.radians(teta_deg)
+    teta_ed_rad, teta_eg_rad = calc_diffuseground_comp(tilt_rad)
+
+    absorbed_radiation_Wperm2 = calc_absorbed_radiation_PV(I_sol, I_direct, I_diffuse, tilt_rad, Sz_rad, teta_rad,
+                                                           teta_ed_rad, teta_eg_rad, panel_properties_PV)
+
+    T_cell_C = calc_cell_temperature(absorbed_radiation_Wperm2, weather_data.drybulb_C.values, panel_properties_PV)
+
+    el_output_PV_kW = calc_PV_power(absorbed_radiation_Wperm2, T_cell_C, eff_nom, tot_module_area_m2, Bref,
+                                    misc_losses)
+
+    # write results of the groups of each orientation
+    type_orientation = prop_observers['type_orientation'].values
+    for panel_orientation in pd.unique(type_orientation):
+        in_orientation = type_orientation == panel_orientation
+        potential['PV_' + panel_orientation + '_E_kWh'] = potential['PV_' + panel_orientation + '_E_kWh'] + \
+                                                          el_output_PV_kW[in_orientation].sum(axis=0)
+        potential['PV_' + panel_orientation + '_m2'] = potential['PV_' + panel_orientation + '_m2'] + \
+                                                       tot_module_area_m2[in_orientation].sum()
+
+    # aggregate results from all modules
+    potential['E_PV_gen_kWh'] = el_output_PV_kW.sum(axis=0)
+    potential['radiation_kWh'] = (I_sol * tot_module_area_m2 / 1000).sum(axis=0)  # kWh
+    potential['Area_PV_m2'] = tot_module_area_m2.sum()
     potential['Date'] = date_local
     potential = potential.set_index('Date')
 
@@ -223,7 +206,7 @@ def calc_cell_temperature(absorbed_radiation_Wperm2, T_external_C, panel_propert
     :param absorbed_radiation_Wperm2: absorbed radiation on panel
     :type absorbed_radiation_Wperm2: np.array
     :param T_external_C: drybulb temperature from the weather file
-    :type T_external_C: series
+    :type T_external_C: np.array
     :param panel_properties_PV: panel property from the supply system database
     :type panel_properties_PV: dataframe
     :return T_cell_C: cell temperature of PV panels
@@ -277,25 +260,29 @@ def calc_diffuseground_comp(tilt_radians):
     """
     To calculate reflected radiation and diffuse radiation.
     :param tilt_radians:  surface tilt angle [rad]
-    :type tilt_radians: float
+    :type tilt_radians: float or np.ndarray
     :return teta_ed: effective incidence angle from diffuse radiation [rad]
     :return teta_eg: effective incidence angle from ground-reflected radiation [rad]
-    :rtype teta_ed: float
-    :rtype teta_eg: float
+    :rtype teta_ed: float or np.ndarray
+    :rtype teta_eg: float or np.ndarray
 
     :References: Duffie, J. A. and Beckman, W. A. (2013) Radiation Transmission through Glazing: Absorbed Radiation, in
                  Solar Engineering of Thermal Processes, Fourth Edition, John Wiley & Sons, Inc., Hoboken, NJ, USA.
                  doi: 10.1002/9781118671603.ch5
 
     """
-    tilt = degrees(tilt_radians)
+    tilt = np.degrees(tilt_radians)
     teta_ed = 59.68 - 0.1388 * tilt + 0.001497 * tilt ** 2  # [degrees] (5.4.2)
     teta_eG = 90 - 0.5788 * tilt + 0.002693 * tilt ** 2  # [degrees] (5.4.1)
-    return radians(teta_ed), radians(teta_eG)
+    return np.radians(teta_ed), np.radians(teta_eG)
 
 
 def calc_absorbed_radiation_PV(I_sol, I_direct, I_diffuse, tilt, Sz, teta, tetaed, tetaeg, panel_properties_PV):
     """
+    The arguments can be floats or arrays that broadcast against each other, e.g. the hourly radiation and incidence
+    angles of each group of panels (shape ``(groups, hours)``), the solar zenith angle of each hour (shape
+    ``(hours,)``) and the tilt angle of each group (shape ``(groups, 1)``).
+
     :param I_sol: total solar radiation [Wh/m2]
     :param I_direct: direct solar radiation [Wh/m2]
     :param I_diffuse: diffuse solar radiation [Wh/m2]
@@ -304,17 +291,18 @@ def calc_absorbed_radiation_PV(I_sol, I_direct, I_diffuse, tilt, Sz, teta, tetae
     :param teta: angle of incidence [rad]
     :param tetaed: effective incidence angle from diffuse radiation [rad]
     :param tetaeg: effective incidence angle from ground-reflected radiation [rad]
-    :type I_sol: float
-    :type I_direct: float
-    :type I_diffuse: float
-    :type tilt: float
-    :type Sz: float
-    :type teta: float
-    :type tetaed: float
-    :type tetaeg: float
+    :type I_sol: float or np.ndarray
+    :type I_direct: float or np.ndarray
+    :type I_diffuse: float or np.ndarray
+    :type tilt: float or np.ndarray
+    :type Sz: float or np.ndarray
+    :type teta: float or np.ndarray
+    :type tetaed: float or np.ndarray
+    :type tetaeg: float or np.ndarray
     :param panel_properties_PV: properties of the PV panel
     :type panel_properties_PV: dataframe
-    :return:
+    :return: absorbed radiation [W/m2]
+    :rtype: np.ndarray
 
     :References: Duffie, J. A. and Beckman, W. A. (2013) Radiation Transmission through Glazing: Absorbed Radiation, in
                  Solar Engineering of Thermal Processes, Fourth Edition, John Wiley & Sons, Inc., Hoboken, NJ, USA.
@@ -325,7 +313,6 @@ def calc_absorbed_radiation_PV(I_sol, I_direct, I_diffuse, tilt, Sz, teta, tetae
     n = constants.n  # refractive index of glass
     Pg = constants.Pg  # ground reflectance
     K = constants.K  # glazing extinction coefficient
-    NOCT = panel_properties_PV['PV_noct']
     a0 = panel_properties_PV['PV_a0']
     a1 = panel_properties_PV['PV_a1']
     a2 = panel_properties_PV['PV_a2']
@@ -339,66 +326,57 @@ def calc_absorbed_radiation_PV(I_sol, I_direct, I_diffuse, tilt, Sz, teta, tetae
     lim2 = radians(90)
     lim3 = radians(89.999)
 
-    if teta < lim1:
-        teta = min(lim3, abs(teta))
-    if teta >= lim2:
-        teta = lim3
+    teta = np.asarray(teta, dtype=float)
+    teta = np.where(teta < lim1, np.minimum(lim3, np.abs(teta)), teta)
+    teta = np.where(teta >= lim2, lim3, teta)
 
-    if Sz < lim1:
-        Sz = min(lim3, abs(Sz))
-    if Sz >= lim2:
-        Sz = lim3
+    Sz = np.asarray(Sz, dtype=float)
+    Sz = np.where(Sz < lim1, np.minimum(lim3, np.abs(Sz)), Sz)
+    Sz = np.where(Sz >= lim2, lim3, Sz)
 
     # Rb: ratio of beam radiation of tilted surface to that on horizontal surface
-    if Sz <= radians(85):  # Sz is Zenith angle   # TODO: FIND REFERENCE
-        Rb = cos(teta) / cos(Sz)
-    else:
-        Rb = 0  # Assume there is no direct radiation when the sun is close to the horizon.
+    # Sz is Zenith angle   # TODO: FIND REFERENCE
+    # Assume there is no direct radiation when the sun is close to the horizon.
+    Rb = np.where(Sz <= radians(85), np.cos(teta) / np.cos(Sz), 0)
 
     # calculate air mass modifier
-    m = 1 / cos(Sz)  # air mass
+    m = 1 / np.cos(Sz)  # air mass
     M = a0 + a1 * m + a2 * m ** 2 + a3 * m ** 3 + a4 * m ** 4  # air mass modifier
     M = np.clip(M, 0.001, 1.1)  # De Soto et al., 2006
 
     # incidence angle modifier for direct (beam) radiation
-    teta_r = asin(sin(teta) / n)  # refraction angle in radians(approximation according to Soteris A.) (5.1.4)
     Ta_n = exp(-K * L) * (1 - ((n - 1) / (n + 1)) ** 2)
-    if teta < radians(90):  # 90 degrees in radians
-        part1 = teta_r + teta
-        part2 = teta_r - teta
-        Ta_B = exp((-K * L) / cos(teta_r)) * (
-                1 - 0.5 * ((sin(part2) ** 2) / (sin(part1) ** 2) + (tan(part2) ** 2) / (tan(part1) ** 2)))
-        kteta_B = Ta_B / Ta_n
-    else:
-        kteta_B = 0
+    kteta_B = np.where(teta < radians(90), calc_transmittance_glazing(teta, n, K, L) / Ta_n, 0)  # 90 deg in radians
 
     # incidence angle modifier for diffuse radiation
-    teta_r = asin(sin(tetaed) / n)  # refraction angle for diffuse radiation [rad]
-    part1 = teta_r + tetaed
-    part2 = teta_r - tetaed
-    Ta_D = exp((-K * L) / cos(teta_r)) * (
-            1 - 0.5 * ((sin(part2) ** 2) / (sin(part1) ** 2) + (tan(part2) ** 2) / (tan(part1) ** 2)))
-    kteta_D = Ta_D / Ta_n
+    kteta_D = calc_transmittance_glazing(tetaed, n, K, L) / Ta_n
 
     # incidence angle modifier for ground-reflected radiation
-    teta_r = asin(sin(tetaeg) / n)  # refraction angle for ground-reflected radiation [rad]
-    part1 = teta_r + tetaeg
-    part2 = teta_r - tetaeg
-    Ta_eG = exp((-K * L) / cos(teta_r)) * (
-            1 - 0.5 * ((sin(part2) ** 2) / (sin(part1) ** 2) + (tan(part2) ** 2) / (tan(part1) ** 2)))
-    kteta_eG = Ta_eG / Ta_n
+    kteta_eG = calc_transmittance_glazing(tetaeg, n, K, L) / Ta_n
 
     # absorbed solar radiation
     absorbed_radiation_Wperm2 = M * Ta_n * (
-            kteta_B * I_direct * Rb + kteta_D * I_diffuse * (1 + cos(tilt)) / 2 + kteta_eG * I_sol * Pg * (
-            1 - cos(tilt)) / 2)  # [W/m2] (5.12.1)
-    if absorbed_radiation_Wperm2 < 0.0:  # when points are 0 and too much losses
-        # print ('the absorbed radiation', absorbed_radiation_Wperm2 ,'is negative, please check calc_absorbed_radiation_PVT')
-        absorbed_radiation_Wperm2 = 0.0
+            kteta_B * I_direct * Rb + kteta_D * I_diffuse * (1 + np.cos(tilt)) / 2 + kteta_eG * I_sol * Pg * (
+            1 - np.cos(tilt)) / 2)  # [W/m2] (5.12.1)
+    # when points are 0 and too much losses
+    absorbed_radiation_Wperm2 = np.where(absorbed_radiation_Wperm2 < 0.0, 0.0, absorbed_radiation_Wperm2)
 
     return absorbed_radiation_Wperm2
 
 
+def calc_transmittance_glazing(teta, n, K, L):
+    """
+    Transmittance of the glazing of a PV panel for radiation with the incidence angle ``teta`` [rad] (float or array),
+    taking into account the reflection and the absorption losses (Duffie and Beckman, 2013, eq. 5.1.4 and 5.3.1).
+    """
+    teta_r = np.arcsin(np.sin(teta) / n)  # refraction angle in radians(approximation according to Soteris A.) (5.1.4)
+    part1 = teta_r + teta
+    part2 = teta_r - teta
+    Ta = np.exp((-K * L) / np.cos(teta_r)) * (
+            1 - 0.5 * ((np.sin(part2) ** 2) / (np.sin(part1) ** 2) + (np.tan(part2) ** 2) / (np.tan(part1) ** 2)))
+    return Ta
+
+
 def calc_PV_power(absorbed_radiation_Wperm2, T_cell_C, eff_nom, tot_module_area_m2, Bref_perC, misc_losses):
     """
     To calculate the power production of PV panels.
@@ -813,13 +791,16 @@ def main(config):
 
     num_process = config.get_number_of_processes()
     n = len(building_names)
-    cea.utilities.parallel.vectorize(calc_PV, num_process)(repeat(locator, n),
-                                                           repeat(config, n),
-                                                           repeat(latitude, n),
-                                                           repeat(longitude, n),
-                                                           repeat(weather_data, n),
-                                                           repeat(date_local, n),
-                                                           building_names)
+    # share the weather data with the worker processes (see `cea.utilities.shared_arrays`)
+    shared_weather, weather_data = share_dataframe(weather_data, num_process)
+    with shared_weather:
+        cea.utilities.parallel.vectorize(calc_PV, num_process)(repeat(locator, n),
+                                                               repeat(config, n),
+                                                               repeat(latitude, n),
+                                                               repeat(longitude, n),
+                                                               repeat(weather_data, n),
+                                                               repeat(date_local, n),
+                                                               building_names)
 
     # aggregate results from all buildings
     write_aggregate_results(config, locator, building_names)
@@ -16,6 +16,7 @@ from numba import jit
 
 import cea.inputlocator
 import cea.utilities.parallel
+from cea.utilities.shared_arrays import share_dataframe
 import cea.utilities.workerstream
 from cea.constants import HOURS_IN_YEAR
 from cea.technologies.solar import constants
@@ -176,9 +177,9 @@ def calc_PVT_generation(sensor_groups, weather_data, date_local, solar_propertie
 
     # convert degree to radians
     lat_rad = radians(latitude)
-    g_rad = np.radians(solar_properties.g)
-    ha_rad = np.radians(solar_properties.ha)
-    Sz_rad = np.radians(solar_properties.Sz)
+    g_rad = np.radians(solar_properties.g.values)
+    ha_rad = np.radians(solar_properties.ha.values)
+    Sz_rad = np.radians(solar_properties.Sz.values)
 
     # calculate equivalent length of pipes
     total_area_module_m2 = prop_observers['area_installed_module_m2'].sum()  # total area for panel installation
@@ -209,42 +210,51 @@ def calc_PVT_generation(sensor_groups, weather_data, date_local, solar_propertie
     else:
         panel_properties_SC['Nseg'] = 10
 
+    # read panel properties of all groups as column vectors, the hourly values of all groups are calculated at once
+    # (groups x hours)
+    teta_z_deg_groups = prop_observers['surface_azimuth_deg'].values.astype(float)[:, np.newaxis]
+    tilt_angle_deg_groups = prop_observers['B_deg'].values.astype(float)[:, np.newaxis]  # tilt angle of panels
+
+    # degree to radians
+    tilt_rad_groups = np.radians(tilt_angle_deg_groups)  # tilt angle
+    teta_z_rad_groups = np.radians(teta_z_deg_groups)  # surface azimuth
+
+    # calculate radiation types (direct/diffuse) in each group
+    I_sol, I_direct, I_diffuse = solar_equations.calc_radiation_types(hourly_radiation_Wperm2[range(number_groups)],
+                                                                      weather_data)
+
+    ## calculate absorbed solar irradiation on tilt surfaces
+    # calculate effective indicent angles necessary
+    teta_rad = solar_equations.calc_angle_of_incidence(g_rad, lat_rad, ha_rad, tilt_rad_groups, teta_z_rad_groups)
+    teta_ed_rad, teta_eg_rad = calc_diffuseground_comp(tilt_rad_groups)
+
+    # absorbed radiation and Tcell
+    absorbed_radiation_PV_Wperm2_groups = calc_absorbed_radiation_PV(I_sol, I_direct, I_diffuse, tilt_rad_groups,
+                                                                     Sz_rad, teta_rad, teta_ed_rad, teta_eg_rad,
+                                                                     panel_properties_PV)
+
+    T_cell_C_groups = calc_cell_temperature(absorbed_radiation_PV_Wperm2_groups, weather_data.drybulb_C.values,
+                                            panel_properties_PV)
+
+    # calculate incidence angle modifier for beam radiation
+    IAM_b_groups = calc_IAM_beam_SC(solar_properties, teta_z_deg_groups, tilt_angle_deg_groups,
+                                    panel_properties_SC['type'], latitude)
+
     for group in range(number_groups):
         # read panel properties of each group
-        teta_z_deg = prop_observers.loc[group, 'surface_azimuth_deg']
         module_area_per_group_m2 = prop_observers.loc[group, 'area_installed_module_m2']
         tilt_angle_deg = prop_observers.loc[group, 'B_deg']  # tilt angle of panels
 
-        # degree to radians
-        tilt_rad = radians(tilt_angle_deg)  # tilt angle
-        teta_z_rad = radians(teta_z_deg)  # surface azimuth
-
         # calculate radiation types (direct/diffuse) in group
         radiation_Wperm2 = solar_equations.cal_radiation_type(group, hourly_radiation_Wperm2, weather_data)
 
-        ## calculate absorbed solar irradiation on tilt surfaces
-        # calculate effective indicent angles necessary
-        teta_rad = np.vectorize(solar_equations.calc_angle_of_incidence)(g_rad, lat_rad, ha_rad, tilt_rad, teta_z_rad)
-        teta_ed_rad, teta_eg_rad = calc_diffuseground_comp(tilt_rad)
-
-        # absorbed radiation and Tcell
-        absorbed_radiation_PV_Wperm2 = np.vectorize(calc_absorbed_radiation_PV)(radiation_Wperm2.I_sol,
-                                                                                radiation_Wperm2.I_direct,
-                                                                                radiation_Wperm2.I_diffuse, tilt_rad,
-                                                                                Sz_rad, teta_rad, teta_ed_rad,
-                                                                                teta_eg_rad, panel_properties_PV)
-
-        T_cell_C = np.vectorize(calc_cell_temperature)(absorbed_radiation_PV_Wperm2, weather_data.drybulb_C,
-                                                       panel_properties_PV)
-
         ## SC heat generation
-        # calculate incidence angle modifier for beam radiation
-        IAM_b = calc_IAM_beam_SC(solar_properties, teta_z_deg, tilt_angle_deg, panel_properties_SC['type'], latitude)
         list_results_from_PVT[group] = calc_PVT_module(config, radiation_Wperm2, panel_properties_SC,
                                                        panel_properties_PV,
-                                                       weather_data.drybulb_C, IAM_b, tilt_angle_deg,
-                                                       total_pipe_lengths,
-                                                       absorbed_radiation_PV_Wperm2, T_cell_C, module_area_per_group_m2)
+                                                       weather_data.drybulb_C.values, IAM_b_groups[group],
+                                                       tilt_angle_deg, total_pipe_lengths,
+                                                       absorbed_radiation_PV_Wperm2_groups[group],
+                                                       T_cell_C_groups[group], module_area_per_group_m2)
 
         # calculate results from each group
         panel_orientation = prop_observers.loc[group, 'type_orientation']
@@ -391,8 +401,8 @@ def calc_PVT_module(config, radiation_Wperm2, panel_properties_SC, panel_propert
 
     # calculate absorbed radiation
     tilt_rad = radians(tilt_angle_deg)
-    q_rad_vector = np.vectorize(calc_q_rad)(n0, IAM_b, IAM_d, radiation_Wperm2.I_direct, radiation_Wperm2.I_diffuse,
-                                            tilt_rad)  # absorbed solar radiation in W/m2 is a mean of the group
+    q_rad_vector = calc_q_rad(n0, IAM_b, IAM_d, radiation_Wperm2.I_direct.values, radiation_Wperm2.I_diffuse.values,
+                              tilt_rad)  # absorbed solar radiation in W/m2 is a mean of the group
     counter = 0
     Flag = False
     Flag2 = False
@@ -449,20 +459,22 @@ def calc_PVT_module(config, radiation_Wperm2, panel_properties_SC, panel_propert
             supply_out_kW[flow][t] = q_out_kW
             temperature_mean[flow][t] = (Tin_C + Tout_Seg_C) / 2  # Mean absorber temperature at present
 
-            q_gain_Wperm2 = 0
-            TavgB = 0
-            TavgA = 0
-            for Iseg in range(1, Nseg + 1):
-                q_gain_Wperm2 = q_gain_Wperm2 + q_gain_Seg * Aseg_m2  # W
-                TavgA = TavgA + TflA[Iseg] / Nseg
-                TavgB = TavgB + TflB[Iseg] / Nseg
-
-                # # OUT[9] = qgain/Area_a # in W/m2
-                # q_mtherm_Wperm2 = (TavgB - TavgA) * C_eff_Jperm2K * aperture_area_m2 / delts
-                # q_balance_error = q_gain_Wperm2 - q_mtherm_Wperm2 - q_out_kW
-
-                # OUT[11] = q_mtherm
-                # OUT[12] = q_balance_error
+            # the following lines do not perform meaningful operation, they are kept here as a reference to the
+            # original model in FORTRAN
+            # q_gain_Wperm2 = 0
+            # TavgB = 0
+            # TavgA = 0
+            # for Iseg in range(1, Nseg + 1):
+            #     q_gain_Wperm2 = q_gain_Wperm2 + q_gain_Seg * Aseg_m2  # W
+            #     TavgA = TavgA + TflA[Iseg] / Nseg
+            #     TavgB = TavgB + TflB[Iseg] / Nseg
+            #
+            #     # OUT[9] = qgain/Area_a # in W/m2
+            #     q_mtherm_Wperm2 = (TavgB - TavgA) * C_eff_Jperm2K * aperture_area_m2 / delts
+            #     q_balance_error = q_gain_Wperm2 - q_mtherm_Wperm2 - q_out_kW
+            #
+            #     OUT[11] = q_mtherm
+            #     OUT[12] = q_balance_error
         if flow < 4:
             auxiliary_electricity_kW[flow] = vectorize_calc_Eaux_SC(specific_flows_kgpers[flow],
                                                                     specific_pressure_losses_Pa[flow], pipe_lengths,
@@ -492,10 +504,9 @@ def calc_PVT_module(config, radiation_Wperm2, panel_properties_SC, panel_propert
             specific_flows_kgpers[5], specific_pressure_losses_Pa[5] = calc_optimal_mass_flow_2(m5, q5, dp5)
 
         if flow == 5:  # optimal mass flow
-            supply_losses_kW[flow] = np.vectorize(calc_qloss_network)(specific_flows_kgpers[flow],
-                                                                      pipe_lengths['l_ext_mperm2'],
-                                                                      aperture_area_m2, temperature_mean[flow],
-                                                                      Tamb_vector_C, msc_max_kgpers)
+            supply_losses_kW[flow] = calc_qloss_network(specific_flows_kgpers[flow], pipe_lengths['l_ext_mperm2'],
+                                                        aperture_area_m2, temperature_mean[flow],
+                                                        np.asarray(Tamb_vector_C), msc_max_kgpers)
             supply_out_pre = supply_out_kW[flow].copy() + supply_losses_kW[flow].copy()
             auxiliary_electricity_kW[flow] = vectorize_calc_Eaux_SC(specific_flows_kgpers[flow],
                                                                     specific_pressure_losses_Pa[flow], pipe_lengths,
@@ -507,9 +518,8 @@ def calc_PVT_module(config, radiation_Wperm2, panel_properties_SC, panel_propert
                                                               mcp_kWperK, supply_out_total_kW[5], temperature_in[5],
                                                               temperature_out[5])
 
-    el_output_PV_kW = np.vectorize(calc_PV_power)(absorbed_radiation_PV_Wperm2, T_module_C, eff_nom,
-                                                  module_area_per_group_m2,
-                                                  Bref, misc_losses)
+    el_output_PV_kW = calc_PV_power(absorbed_radiation_PV_Wperm2, T_module_C, eff_nom, module_area_per_group_m2,
+                                    Bref, misc_losses)
 
     # write results into a list
     result = [supply_losses_kW[5], supply_out_total_kW[5], auxiliary_electricity_kW[5], temperature_out[5],
@@ -700,13 +710,16 @@ def main(config):
     print('reading weather hourly_results_per_building done.')
 
     n = len(building_names)
-    cea.utilities.parallel.vectorize(calc_PVT, config.get_number_of_processes())(repeat(locator, n),
-                                                                                 repeat(config, n),
-                                                                                 repeat(latitude, n),
-                                                                                 repeat(longitude, n),
-                                                                                 repeat(weather_data, n),
-                                                                                 repeat(date_local, n),
-                                                                                 building_names)
+    # share the weather data with the worker processes (see `cea.utilities.shared_arrays`)
+    shared_weather, weather_data = share_dataframe(weather_data, config.get_number_of_processes())
+    with shared_weather:
+        cea.utilities.parallel.vectorize(calc_PVT, config.get_number_of_processes())(repeat(locator, n),
+                                                                                     repeat(config, n),
+                                                                                     repeat(latitude, n),
+                                                                                     repeat(longitude, n),
+                                                                                     repeat(weather_data, n),
+                                                                                     repeat(date_local, n),
+                                                                                     building_names)
 
     # aggregate results from all buildings
     aggregated_annual_results = {}
@@ -6,7 +6,7 @@ solar collectors
 import os
 import time
 from itertools import repeat
-from math import cos, atan, sin, degrees, radians, tan, log
+from math import radians, log
 
 import geopandas as gpd
 import numpy as np
@@ -17,6 +17,7 @@ from numba import jit
 import cea.config
 import cea.inputlocator
 import cea.utilities.parallel
+from cea.utilities.shared_arrays import share_dataframe
 from cea.constants import HOURS_IN_YEAR
 from cea.technologies.solar import constants
 from cea.utilities import epwreader
@@ -201,22 +202,23 @@ def calc_SC_generation(sensor_groups, weather_data, date_local, solar_properties
     else:
         panel_properties_SC['Nseg'] = 10
 
+    # calculate incidence angle modifier for beam radiation of all groups at once (groups x hours)
+    IAM_b_groups = calc_IAM_beam_SC(solar_properties,
+                                    prop_observers['surface_azimuth_deg'].values.astype(float)[:, np.newaxis],
+                                    prop_observers['B_deg'].values.astype(float)[:, np.newaxis],
+                                    panel_properties_SC['type'], latitude_deg)
+
     for group in range(number_groups):
         # calculate radiation types (direct/diffuse) in group
         radiation_Wperm2 = solar_equations.cal_radiation_type(group, hourly_radiation, weather_data)
 
         # load panel angles from each group
-        teta_z_deg = prop_observers.loc[group, 'surface_azimuth_deg']  # azimuth of panels of group
         tilt_angle_deg = prop_observers.loc[group, 'B_deg']  # tilt angle of panels
 
-        # calculate incidence angle modifier for beam radiation
-        IAM_b = calc_IAM_beam_SC(solar_properties, teta_z_deg, tilt_angle_deg, panel_properties_SC['type'],
-                                 latitude_deg)
-
         # calculate heat production from a solar collector of each group
         list_results_from_SC[group] = calc_SC_module(config, radiation_Wperm2, panel_properties_SC,
                                                      weather_data.drybulb_C.values,
-                                                     IAM_b, tilt_angle_deg, total_pipe_length)
+                                                     IAM_b_groups[group], tilt_angle_deg, total_pipe_length)
 
         # calculate results from each group
         panel_orientation = prop_observers.loc[group, 'type_orientation']
@@ -372,8 +374,8 @@ def calc_SC_module(config, radiation_Wperm2, panel_properties, Tamb_vector_C, IA
 
     # calculate absorbed radiation
     tilt_rad = radians(tilt_angle_deg)
-    q_rad_vector = np.vectorize(calc_q_rad)(n0, IAM_b, IAM_d, radiation_Wperm2.I_direct, radiation_Wperm2.I_diffuse,
-                                            tilt_rad)  # absorbed solar radiation in W/m2 is a mean of the group
+    q_rad_vector = calc_q_rad(n0, IAM_b, IAM_d, radiation_Wperm2.I_direct.values, radiation_Wperm2.I_diffuse.values,
+                              tilt_rad)  # absorbed solar radiation in W/m2 is a mean of the group
     for flow in range(6):
         mode_seg = 1  # mode of segmented heat loss calculation. only one mode is implemented.
         TIME0 = 0
@@ -467,11 +469,9 @@ def calc_SC_module(config, radiation_Wperm2, panel_properties, Tamb_vector_C, IA
             specific_flows_kgpers[5], specific_pressure_losses_Pa[5] = calc_optimal_mass_flow_2(m5, q5, dp5)
 
         if flow == 5:  # optimal mass flow
-            supply_losses_kW[flow] = np.vectorize(calc_qloss_network)(specific_flows_kgpers[flow],
-                                                                      pipe_lengths['l_ext_mperm2'],
-                                                                      aperture_area_m2,
-                                                                      temperature_mean_C[flow], Tamb_vector_C,
-                                                                      msc_max_kgpers)
+            supply_losses_kW[flow] = calc_qloss_network(specific_flows_kgpers[flow], pipe_lengths['l_ext_mperm2'],
+                                                        aperture_area_m2, temperature_mean_C[flow],
+                                                        np.asarray(Tamb_vector_C), msc_max_kgpers)
             auxiliary_electricity_kW[flow] = vectorize_calc_Eaux_SC(specific_flows_kgpers[flow],
                                                                     specific_pressure_losses_Pa[flow],
                                                                     pipe_lengths, aperture_area_m2)  # in kW
@@ -616,7 +616,6 @@ def update_negative_total_supply(aperture_area_m2, auxiliary_electricity_kW, flo
                                                                      pipe_lengths, aperture_area_m2)
 
 
-@jit(nopython=True)
 def calc_q_rad(n0, IAM_b, IAM_d, I_direct_Wperm2, I_diffuse_Wperm2, tilt):
     """
     Calculates the absorbed radiation for solar thermal collectors.
@@ -629,7 +628,7 @@ def calc_q_rad(n0, IAM_b, IAM_d, I_direct_Wperm2, I_diffuse_Wperm2, tilt):
     :return q_rad: absorbed radiation [W/m2]
     """
 
-    q_rad_Wperm2 = n0 * IAM_b * I_direct_Wperm2 + n0 * IAM_d * I_diffuse_Wperm2 * (1 + cos(tilt)) / 2
+    q_rad_Wperm2 = n0 * IAM_b * I_direct_Wperm2 + n0 * IAM_d * I_diffuse_Wperm2 * (1 + np.cos(tilt)) / 2
     return q_rad_Wperm2
 
 
@@ -716,40 +715,32 @@ def calc_IAM_beam_SC(solar_properties, teta_z_deg, tilt_angle_deg, type_SCpanel,
     :param solar_properties: solar properties
     :type solar_properties: dataframe
     :param teta_z_deg: panel surface azimuth angle [rad]
-    :type teta_z_deg: float
+    :type teta_z_deg: float or np.ndarray
     :param tilt_angle_deg: panel tilt angle
-    :type tilt_angle_deg: float
+    :type tilt_angle_deg: float or np.ndarray
     :param type_SCpanel: type of SC
     :type type_SCpanel: unicode
     :param latitude_deg: latitude of the case study site
     :type latitude_deg: float
-    :return:
+    :return: the incidence angle modifier of each hour, an array of shape (groups, hours) when the panel angles of
+        several groups are passed as column vectors (shape (groups, 1))
+    :rtype: np.ndarray
     """
 
+    def limit_incidence_angle(teta_deg):
+        teta_deg = np.where(teta_deg < 0, np.minimum(89, np.abs(teta_deg)), teta_deg)
+        teta_deg = np.where(teta_deg >= 90, 89.999, teta_deg)
+        return teta_deg
+
     def calc_teta_L(Az, teta_z, tilt, Sz):
-        teta_la = tan(Sz) * cos(teta_z - Az)
-        teta_l_deg = degrees(abs(atan(teta_la) - tilt))
-        if teta_l_deg < 0:
-            teta_l_deg = min(89, abs(teta_l_deg))
-        if teta_l_deg >= 90:
-            teta_l_deg = 89.999
-        return teta_l_deg  # longitudinal incidence angle in degrees
+        teta_la = np.tan(Sz) * np.cos(teta_z - Az)
+        teta_l_deg = np.degrees(np.abs(np.arctan(teta_la) - tilt))
+        return limit_incidence_angle(teta_l_deg)  # longitudinal incidence angle in degrees
 
     def calc_teta_T(Az, Sz, teta_z):
-        teta_ta = sin(Sz) * sin(abs(teta_z - Az))
-        teta_T_deg = degrees(atan(teta_ta / cos(teta_ta)))
-        if teta_T_deg < 0:
-            teta_T_deg = min(89, abs(teta_T_deg))
-        if teta_T_deg >= 90:
-            teta_T_deg = 89.999
-        return teta_T_deg  # transversal incidence angle in degrees
-
-    def calc_teta_L_max(teta_L_deg):
-        if teta_L_deg < 0:
-            teta_L_deg = min(89, abs(teta_L_deg))
-        if teta_L_deg >= 90:
-            teta_L_deg = 89.999
-        return teta_L_deg
+        teta_ta = np.sin(Sz) * np.sin(np.abs(teta_z - Az))
+        teta_T_deg = np.degrees(np.arctan(teta_ta / np.cos(teta_ta)))
+        return limit_incidence_angle(teta_T_deg)  # transversal incidence angle in degrees
 
     def calc_IAMb(teta_l, teta_T, type_SCpanel):
         if type_SCpanel == 'FP':  # # Flat plate collector   1636: SOLEX BLU, SPF, 2012
@@ -761,28 +752,27 @@ def calc_IAM_beam_SC(solar_properties, teta_z_deg, tilt_angle_deg, type_SCpanel,
         return IAM_b
 
     # convert to radians
-    g_rad = np.radians(solar_properties.g)  # declination [rad]
-    ha_rad = np.radians(solar_properties.ha)  # hour angle [rad]
-    Sz_rad = np.radians(solar_properties.Sz)  # solar zenith angle
-    Az_rad = np.radians(solar_properties.Az)  # solar azimuth angle [rad]
+    g_rad = np.radians(solar_properties.g.values)  # declination [rad]
+    ha_rad = np.radians(solar_properties.ha.values)  # hour angle [rad]
+    Sz_rad = np.radians(solar_properties.Sz.values)  # solar zenith angle
+    Az_rad = np.radians(solar_properties.Az.values)  # solar azimuth angle [rad]
     lat_rad = radians(latitude_deg)
-    teta_z_rad = radians(teta_z_deg)
-    tilt_rad = radians(tilt_angle_deg)
-
-    incidence_angle_rad = np.vectorize(solar_equations.calc_incident_angle_beam)(g_rad, lat_rad, ha_rad, tilt_rad,
-                                                                                 teta_z_rad)  # incident angle in radians
+    teta_z_rad = np.radians(teta_z_deg)
+    tilt_rad = np.radians(tilt_angle_deg)
 
     # calculate incident angles
     if type_SCpanel == 'FP':
+        incidence_angle_rad = solar_equations.calc_incident_angle_beam(g_rad, lat_rad, ha_rad, tilt_rad,
+                                                                       teta_z_rad)  # incident angle in radians
         incident_angle_deg = np.degrees(incidence_angle_rad)
-        teta_L_deg = np.vectorize(calc_teta_L_max)(incident_angle_deg)
+        teta_L_deg = limit_incidence_angle(incident_angle_deg)
         teta_T_deg = 0  # not necessary for flat plate collectors
     if type_SCpanel == 'ET':
-        teta_L_deg = np.vectorize(calc_teta_L)(Az_rad, teta_z_rad, tilt_rad, Sz_rad)  # in degrees
-        teta_T_deg = np.vectorize(calc_teta_T)(Az_rad, Sz_rad, teta_z_rad)  # in degrees
+        teta_L_deg = calc_teta_L(Az_rad, teta_z_rad, tilt_rad, Sz_rad)  # in degrees
+        teta_T_deg = calc_teta_T(Az_rad, Sz_rad, teta_z_rad)  # in degrees
 
     # calculate incident angle modifier for beam radiation
-    IAM_b_vector = np.vectorize(calc_IAMb)(teta_L_deg, teta_T_deg, type_SCpanel)
+    IAM_b_vector = calc_IAMb(teta_L_deg, teta_T_deg, type_SCpanel)
 
     return IAM_b_vector
 
@@ -809,7 +799,7 @@ def calc_properties_SC_db(database_path, config):
 def vectorize_calc_Eaux_SC(scpecific_flow_kgpers, dP_collector_Pa, pipe_lengths, Aa_m2):
     Leq_mperm2 = pipe_lengths['Leq_mperm2']
     l_int_mperm2 = pipe_lengths['l_int_mperm2']
-    return np.vectorize(calc_Eaux_SC)(scpecific_flow_kgpers, dP_collector_Pa, Leq_mperm2, l_int_mperm2, Aa_m2)
+    return calc_Eaux_SC(scpecific_flow_kgpers, dP_collector_Pa, Leq_mperm2, l_int_mperm2, Aa_m2)
 
 
 def calc_Eaux_SC(specific_flow_kgpers, dP_collector_Pa, Leq_mperm2, l_int_mperm2, Aa_m2):
@@ -898,18 +888,14 @@ def calc_optimal_mass_flow(q1, q2, q3, q4, E1, E2, E3, E4, m1, m2, m3, m4, dP1,
     Energy and Buildings, 2016.
     """
 
-    mass_flow_opt = np.empty(HOURS_IN_YEAR)
-    dP_opt = np.empty(HOURS_IN_YEAR)
     const = Area_a / 3600
-    mass_flow_all_kgpers = [m1 * const, m2 * const, m3 * const, m4 * const]  # [kg/s]
-    dP_all_Pa = [dP1 * Area_a, dP2 * Area_a, dP3 * Area_a, dP4 * Area_a]  # [Pa]
-    balances = [abs(q1) - E1 * 2, q2 - E2 * 2, q3 - E3 * 2, q4 - E4 * 2]  # energy generation function eq.(63)
-    for t in range(HOURS_IN_YEAR):
-        balances_time = [balances[0][t], balances[1][t], balances[2][t], balances[3][t]]
-        max_heat_production = np.max(balances_time)
-        ix_max_heat_production = np.where(balances_time == max_heat_production)
-        mass_flow_opt[t] = mass_flow_all_kgpers[ix_max_heat_production[0][0]]
-        dP_opt[t] = dP_all_Pa[ix_max_heat_production[0][0]]
+    mass_flow_all_kgpers = np.array([m1 * const, m2 * const, m3 * const, m4 * const])  # [kg/s]
+    dP_all_Pa = np.array([dP1 * Area_a, dP2 * Area_a, dP3 * Area_a, dP4 * Area_a])  # [Pa]
+    balances = np.array([abs(q1) - E1 * 2, q2 - E2 * 2, q3 - E3 * 2, q4 - E4 * 2])  # energy generation function eq.(63)
+    # the first of the flow rates with the maximum heat production in each time-step
+    ix_max_heat_production = np.argmax(balances, axis=0)
+    mass_flow_opt = mass_flow_all_kgpers[ix_max_heat_production]
+    dP_opt = dP_all_Pa[ix_max_heat_production]
     return mass_flow_opt, dP_opt
 
 
@@ -922,10 +908,9 @@ def calc_optimal_mass_flow_2(m, q, dp):
     :return m: hourly mass flow rate [kg/s]
     :return dp: hourly pressure drop [Pa]
     """
-    for t in range(HOURS_IN_YEAR):
-        if q[t] <= 0:
-            m[t] = 0
-            dp[t] = 0
+    no_heat_production = q <= 0
+    m[no_heat_production] = 0
+    dp[no_heat_production] = 0
     return m, dp
 
 
@@ -996,13 +981,16 @@ def main(config):
     print('reading weather data done')
 
     n = len(building_names)
-    cea.utilities.parallel.vectorize(calc_SC, config.get_number_of_processes())(repeat(locator, n),
-                                                                                repeat(config, n),
-                                                                                repeat(latitude, n),
-                                                                                repeat(longitude, n),
-                                                                                repeat(weather_data, n),
-                                                                                repeat(date_local, n),
-                                                                                building_names)
+    # share the weather data with the worker processes (see `cea.utilities.shared_arrays`)
+    shared_weather, weather_data = share_dataframe(weather_data, config.get_number_of_processes())
+    with shared_weather:
+        cea.utilities.parallel.vectorize(calc_SC, config.get_number_of_processes())(repeat(locator, n),
+                                                                                    repeat(config, n),
+                                                                                    repeat(latitude, n),
+                                                                                    repeat(longitude, n),
+                                                                                    repeat(weather_data, n),
+                                                                                    repeat(date_local, n),
+                                                                                    building_names)
 
     # aggregate results from all buildings
     aggregated_annual_results = {}
@@ -0,0 +1,163 @@
+"""
+Sparse solvers for the mass flows in the edges of a thermal network.
+
+The edge-node incidence matrix of a network only changes its signs when flow directions change, so everything that
+depends only on the topology of the network (the sparse matrices and, for tree networks, their LU factorization) is
+computed once per topology and reused for all time steps:
+
+- tree networks: the edge mass flows follow from the node mass flows by the conservation of mass alone, the
+  factorization of the (square) reduced incidence matrix is reused for every right hand side. The edge mass flows of
+  many time steps are obtained at once by multiplying the node mass flows with the inverse of that matrix (the path
+  operator).
+- looped networks: the edge mass flows also have to satisfy the pressure balance around each loop. They are solved
+  with the global gradient algorithm of Todini & Pilati (1987), a Newton method on the edge mass flows and the node
+  pressures at once.
+
+.. [Todini & Pilati, 1987] Todini & Pilati. "A gradient method for the analysis of pipe networks," in Computer
+   Applications in Water Supply Volume 1 - Systems Analysis and Simulation, 1987.
+"""
+
+import numpy as np
+import scipy.sparse
+import scipy.sparse.linalg
+
+__author__ = "Daren Thomas"
+__copyright__ = "Copyright 2024, Architecture and Building Systems - ETH Zurich"
+__credits__ = ["Daren Thomas"]
+__license__ = "MIT"
+__version__ = "0.1"
+__maintainer__ = "Daren Thomas"
+__email__ = "cea@arch.ethz.ch"
+__status__ = "Production"
+
+_hydraulics_cache = {}  # {topology key: NetworkHydraulics}
+HYDRAULICS_CACHE_SIZE = 16  # number of network topologies kept in the cache
+PATH_OPERATOR_BLOCK_SIZE = 1024  # number of nodes whose paths are computed at once (limits the memory used)
+
+
+class NetworkHydraulics(object):
+    """
+    The sparse matrices of the topology of a network with the equation of the node ``plant_index`` removed (the
+    equations of all nodes are linearly dependent). The matrices use the flow directions of the first edge-node matrix
+    of the topology (the reference directions), the flows of edge-node matrices with other flow directions are obtained
+    by flipping the signs of the flows in the edges that changed direction (see :py:meth:`edge_signs`).
+
+    :ivar incidence: reduced edge-node matrix in the reference directions ((n-1) x e, sparse)
+    :ivar is_tree: True if the network has no loops
+    """
+
+    _path_operator = None
+
+    def __init__(self, edge_node, plant_index):
+        edge_node = scipy.sparse.csc_matrix(edge_node)
+        self.reference_signs = edge_node.data[edge_node.indptr[:-1]]  # sign of the first node of each edge
+        self.reference_data = edge_node.data.copy()
+        keep = np.arange(edge_node.shape[0]) != plant_index
+        self.incidence = edge_node[keep].tocsc()
+        self.incidence_t = self.incidence.T.tocsc()
+        self.is_tree = self.incidence.shape[0] == self.incidence.shape[1]
+        if self.is_tree:
+            self._lu = scipy.sparse.linalg.splu(self.incidence)
+        else:
+            # the minimum-norm solution of the mass balance is used as an initial guess for looped networks
+            self._lu = scipy.sparse.linalg.splu((self.incidence @ self.incidence_t).tocsc())
+
+    def edge_signs(self, edge_node):
+        """
+        Return the direction of each edge of ``edge_node`` relative to the reference directions (1 or -1), or None if
+        ``edge_node`` doesn't only differ in flow directions from the reference edge-node matrix.
+        """
+        signs = edge_node.data[edge_node.indptr[:-1]] * self.reference_signs
+        if not np.array_equal(edge_node.data, self.reference_data * np.repeat(signs, np.diff(edge_node.indptr))):
+            return None
+        return signs
+
+    def solve_tree(self, node_mass_flows):
+        """
+        Edge mass flows of a tree network (in the reference directions) for the node mass flows ``node_mass_flows``
+        (without the removed node): a vector (n-1) or a matrix with a column for each time step ((n-1) x t).
+        """
+        return self._lu.solve(np.asarray(node_mass_flows, dtype=float))
+
+    @property
+    def path_operator(self):
+        """
+        The inverse of the reduced edge-node matrix of a tree network as a sparse matrix (e x (n-1)): the mass flow in
+        an edge is the sum of the mass flows of the nodes on its side away from the removed node, so the operator has a
+        1 or -1 for each node whose path to the removed node passes through the edge. Multiplying it with a matrix of
+        node mass flows ((n-1) x t) yields the edge mass flows of all time steps at once.
+        """
+        if self._path_operator is None:
+            size = self.incidence.shape[0]
+            blocks = []
+            for start in range(0, size, PATH_OPERATOR_BLOCK_SIZE):
+                identity = np.eye(size, min(PATH_OPERATOR_BLOCK_SIZE, size - start), -start)
+                blocks.append(scipy.sparse.csc_matrix(np.rint(self._lu.solve(identity))))
+            self._path_operator = scipy.sparse.hstack(blocks).tocsr()
+        return self._path_operator
+
+    def solve_looped(self, node_mass_flows, calc_pressure_losses, tolerance, max_iterations):
+        """
+        Solve the edge mass flows of a looped network (in the reference directions) with the global gradient algorithm.
+
+        :param node_mass_flows: mass flows at each node, without the removed node ((n-1) x 1)
+        :param calc_pressure_losses: function returning the pressure losses [Pa] in each edge for the edge mass flows
+            (with the sign of the mass flows) and their derivatives with respect to the mass flows (strictly positive)
+        :param tolerance: the iterations stop when no edge mass flow changes by more than this [kg/s]
+        :param max_iterations: maximum number of Newton iterations
+        :return: the edge mass flows [kg/s], the number of iterations, the remaining change of the mass flows and the
+            largest residual of the pressure balance of an edge [Pa] (the pressure losses around each loop add up to
+            the residuals of its edges)
+        :rtype: tuple[np.ndarray, int, float, float]
+        """
+        node_mass_flows = np.asarray(node_mass_flows, dtype=float)
+        mass_flow_edge = self.incidence_t @ self._lu.solve(node_mass_flows)  # minimum-norm initial guess
+        pressure_nodes = np.zeros(self.incidence.shape[0])
+        change = np.inf
+        iterations = 0
+        while change > tolerance and iterations < max_iterations:
+            pressure_loss, derivative = calc_pressure_losses(mass_flow_edge)
+            # residuals of the pressure balance of each edge and of the mass balance of each node
+            residual_edges = pressure_loss + self.incidence_t @ pressure_nodes
+            residual_nodes = self.incidence @ mass_flow_edge - node_mass_flows
+            # eliminate the edge mass flows from the newton step and solve for the node pressures
+            inverse_derivative = scipy.sparse.diags(1.0 / derivative)
+            schur_complement = (self.incidence @ inverse_derivative @ self.incidence_t).tocsc()
+            delta_pressure_nodes = scipy.sparse.linalg.spsolve(
+                schur_complement, residual_nodes - self.incidence @ (residual_edges / derivative))
+            delta_mass_flow_edge = -(residual_edges + self.incidence_t @ delta_pressure_nodes) / derivative
+            mass_flow_edge = mass_flow_edge + delta_mass_flow_edge
+            pressure_nodes = pressure_nodes + delta_pressure_nodes
+            change = np.abs(delta_mass_flow_edge).max(initial=0.0)
+            iterations += 1
+        pressure_loss, _ = calc_pressure_losses(mass_flow_edge)
+        pressure_residual = np.abs(pressure_loss + self.incidence_t @ pressure_nodes).max(initial=0.0)
+        return mass_flow_edge, iterations, change, pressure_residual
+
+
+def get_network_hydraulics(edge_node, plant_index):
+    """
+    Return the :py:class:`NetworkHydraulics` of the topology of the edge-node matrix ``edge_node`` (computed once per
+    topology) and the direction of each edge relative to its reference directions.
+
+    :param edge_node: edge-node matrix (n x e) as a DataFrame or array, each edge with a 1 at its end node and a -1 at
+        its start node
+    :param int plant_index: index of the node whose equation is removed
+    :rtype: tuple[NetworkHydraulics, np.ndarray]
+    """
+    edge_node = scipy.sparse.csc_matrix(np.asarray(edge_node, dtype=float))
+    key = (edge_node.shape, plant_index, edge_node.indptr.tobytes(), edge_node.indices.tobytes())
+    hydraulics = _hydraulics_cache.get(key)
+    signs = hydraulics.edge_signs(edge_node) if hydraulics is not None else None
+    if signs is None:
+        hydraulics = NetworkHydraulics(edge_node, plant_index)
+        add_to_cache(_hydraulics_cache, key, hydraulics, HYDRAULICS_CACHE_SIZE)
+        signs = np.ones(edge_node.shape[1])
+    return hydraulics, signs
+
+
+def add_to_cache(cache, key, value, cache_size):
+    """Add a value to a cache of at most ``cache_size`` values, dropping the oldest value if the cache is full"""
+    if key not in cache and len(cache) >= cache_size:
+        del cache[next(iter(cache))]
+    cache[key] = value
@@ -0,0 +1,302 @@
+"""
+Single-pass solvers for the node temperatures of the supply and return lines of a thermal network.
+
+When the water doesn't circulate around a loop, the nodes of a network can be ordered so that the water entering each
+node only comes from nodes earlier in the order (a topological order of the directed graph of the flows). The node
+temperatures then follow in a single pass over the nodes: the temperature of a node is the mixing temperature of the
+flows entering it, and the outlet temperatures of the pipes leaving it follow from their heat losses. The order only
+depends on the flow directions (and on which nodes have no flows at all), so it is computed once per flow pattern and
+reused for all time steps. The nodes are grouped in levels (the nodes whose inflows are all known after the previous
+levels) and each level is solved with array operations on the edges, without any edge x edge matrices.
+
+Flow patterns with circulating flows are left to the iterative solvers in
+:py:mod:`cea.technologies.thermal_network.thermal_network`.
+"""
+
+import numpy as np
+
+from cea.constants import HEAT_CAPACITY_OF_WATER_JPERKGK
+from cea.technologies.thermal_network.network_hydraulics import add_to_cache
+from cea.technologies.thermal_network.thermal_network_loss import calc_temperature_out_per_pipe
+
+__author__ = "Daren Thomas"
+__copyright__ = "Copyright 2024, Architecture and Building Systems - ETH Zurich"
+__credits__ = ["Daren Thomas"]
+__license__ = "MIT"
+__version__ = "0.1"
+__maintainer__ = "Daren Thomas"
+__email__ = "cea@arch.ethz.ch"
+__status__ = "Production"
+
+MAX_TEMPERATURE_LOSS_K = 30  # maximum temperature change along a pipe, larger changes only happen at very low flows
+
+FLOW_ORDER_CACHE_SIZE = 256  # number of flow patterns kept (the patterns change with the buildings without demand)
+
+_flow_order_cache = {}  # {flow pattern key: FlowOrder}
+_branch_ends_cache = {}  # {flow pattern key: ends of the branches of the return line}
+
+
+class FlowOrder(object):
+    """
+    The order in which the node temperatures of a flow pattern are solved.
+
+    :ivar sources: the nodes with a given temperature, solved first
+    :ivar source_edges: the edges flowing out of the sources
+    :ivar levels: for each level, a tuple of the nodes solved at this level, the edges flowing into them, the position
+        of the outlet node of each of these edges in the nodes of the level and the edges flowing out of them
+    :ivar has_outflow: True for the nodes with edges flowing out of them
+    :ivar is_complete: True if the temperatures of all nodes with flows follow from the sources
+    """
+
+    def __init__(self, inlet_node, outlet_node, isolated, sources):
+        number_of_nodes = len(isolated)
+        self.inlet_node = inlet_node
+        self.outlet_node = outlet_node
+        self.isolated = isolated
+        active = ~isolated[inlet_node] & ~isolated[outlet_node]  # the edges to and from isolated nodes carry no flow
+        self.has_outflow = np.bincount(inlet_node[active], minlength=number_of_nodes) > 0
+        self.sources = np.where(sources & ~isolated)[0]
+        self.source_edges = np.where(active & sources[inlet_node])[0]
+
+        # the nodes wait for the temperatures of all edges flowing into them, except the sources
+        waiting = active & ~sources[outlet_node]
+        remaining = np.bincount(outlet_node[waiting], minlength=number_of_nodes)
+        solved = sources | isolated
+        self.levels = []
+        solved_edges = self.source_edges
+        while True:
+            solved_edges = solved_edges[waiting[solved_edges]]
+            np.subtract.at(remaining, outlet_node[solved_edges], 1)
+            nodes = np.where(~solved & (remaining == 0))[0]
+            if not len(nodes):
+                break
+            solved[nodes] = True
+            level = np.zeros(number_of_nodes, dtype=bool)
+            level[nodes] = True
+            in_edges = np.where(active & level[outlet_node])[0]
+            out_edges = np.where(active & level[inlet_node])[0]
+            self.levels.append((nodes, in_edges, np.searchsorted(nodes, outlet_node[in_edges]), out_edges))
+            solved_edges = out_edges
+        self.is_complete = bool(solved.all())
+
+
+def get_flow_order(inlet_node, outlet_node, isolated, sources):
+    """Return the :py:class:`FlowOrder` of a flow pattern (computed once per flow pattern)"""
+    key = (inlet_node.tobytes(), outlet_node.tobytes(), isolated.tobytes(), sources.tobytes())
+    flow_order = _flow_order_cache.get(key)
+    if flow_order is None:
+        flow_order = FlowOrder(inlet_node, outlet_node, isolated, sources)
+        add_to_cache(_flow_order_cache, key, flow_order, FLOW_ORDER_CACHE_SIZE)
+    return flow_order
+
+
+def find_flow_pattern(edge_node, mass_flow_edge):
+    """
+    Find the inlet and outlet node of each edge and the nodes without any flows (isolated nodes) in an edge-node matrix.
+
+    :param edge_node: edge-node matrix (n x e), each edge with a 1 at its outlet node and a -1 at its inlet node
+    :param mass_flow_edge: mass flow in each edge (e)
+    :rtype: tuple[np.ndarray, np.ndarray, np.ndarray]
+    """
+    edge_node = np.asarray(edge_node)
+    inlet_node = edge_node.argmin(axis=0)
+    outlet_node = edge_node.argmax(axis=0)
+    number_of_nodes = edge_node.shape[0]
+    mass_flow_in = np.bincount(outlet_node, weights=mass_flow_edge, minlength=number_of_nodes)
+    mass_flow_out = np.bincount(inlet_node, weights=mass_flow_edge, minlength=number_of_nodes)
+    isolated = np.isclose(mass_flow_in, 0.0) & np.isclose(mass_flow_out, 0.0)
+    return inlet_node, outlet_node, isolated
+
+
+def get_supply_flow_order(edge_node, mass_flow_edge, plants):
+    """
+    Return the :py:class:`FlowOrder` of the supply line (starting at the plants), or None if the node temperatures
+    can't be solved in a single pass (e.g. flows circulating around a loop).
+
+    :param edge_node: edge-node matrix (n x e) in the flow directions
+    :param mass_flow_edge: mass flow in each edge (e)
+    :param plants: True for the plant nodes (n)
+    """
+    mass_flow_edge = np.asarray(mass_flow_edge, dtype=float)
+    if (mass_flow_edge < 0).any():
+        return None
+    inlet_node, outlet_node, isolated = find_flow_pattern(edge_node, mass_flow_edge)
+    flow_order = get_flow_order(inlet_node, outlet_node, isolated, np.asarray(plants, dtype=bool))
+    return flow_order if flow_order.is_complete else None
+
+
+def get_return_flow_order(edge_node, mass_flow_edge, t_return):
+    """
+    Return the :py:class:`FlowOrder` of the return line (starting at the ends of the branches), or None if the node
+    temperatures can't be solved in a single pass (e.g. flows circulating around a loop or several plants).
+
+    The nodes are visited in the order of the edge-node matrix: a node is an end of a branch if all the edges flowing
+    into it come from ends of branches visited before it. Ends of branches with a known return temperature (the
+    substations) are the sources of the return line.
+
+    :param edge_node: edge-node matrix (n x e) in the flow directions of the return line
+    :param mass_flow_edge: mass flow in each edge (e)
+    :param t_return: return temperature of the substation at each node, nan for other nodes (n)
+    """
+    mass_flow_edge = np.asarray(mass_flow_edge, dtype=float)
+    if (mass_flow_edge < 0).any():
+        return None
+    inlet_node, outlet_node, isolated = find_flow_pattern(edge_node, mass_flow_edge)
+    known = ~np.isnan(t_return)
+    key = (inlet_node.tobytes(), outlet_node.tobytes(), isolated.tobytes(), known.tobytes())
+    sources = _branch_ends_cache.get(key)
+    if sources is None:
+        sources = find_branch_ends(inlet_node, outlet_node, isolated, known)
+        add_to_cache(_branch_ends_cache, key, sources, FLOW_ORDER_CACHE_SIZE)
+    flow_order = get_flow_order(inlet_node, outlet_node, isolated, sources)
+    sinks = ~flow_order.has_outflow & ~isolated
+    return flow_order if flow_order.is_complete and sinks.sum() == 1 else None
+
+
+def find_branch_ends(inlet_node, outlet_node, isolated, known):
+    """
+    Find the ends of the branches of the return line with a known return temperature (see
+    :py:func:`get_return_flow_order`).
+    """
+    number_of_nodes = len(isolated)
+    active = ~isolated[inlet_node] & ~isolated[outlet_node]
+    active_edges = np.where(active)[0]
+    in_nodes = [[] for _ in range(number_of_nodes)]
+    for edge in active_edges:
+        in_nodes[outlet_node[edge]].append(inlet_node[edge])
+    has_outflow = np.bincount(inlet_node[active], minlength=number_of_nodes) > 0
+    branch_ends = np.zeros(number_of_nodes, dtype=bool)
+    for node in range(number_of_nodes):
+        if has_outflow[node] and all(branch_ends[in_node] for in_node in in_nodes[node]):
+            branch_ends[node] = known[node]
+    return branch_ends
+
+
+def calc_outlet_temperatures(edges, t_inlet, mass_flow_edge, k, t_ground, thermal_network):
+    """
+    Calculate the outlet temperatures of the edges ``edges`` (see :py:func:`thermal_network.calc_t_out`): nan for edges
+    without flow, temperature changes are limited to ``MAX_TEMPERATURE_LOSS_K``.
+
+    :param t_inlet: inlet temperature of each edge in ``edges`` [K]
+    :param mass_flow_edge: mass flow in each edge of the network [kg/s]
+    :param k: aggregated heat conduction coefficient of each edge of the network [kW/K]
+    :param t_ground: ground temperature [K]
+    """
+    mass_flow = np.round(mass_flow_edge[edges], decimals=5)  # round to avoid errors at very very low massflows
+    no_flow = np.isclose(abs(mass_flow), 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_outlet = calc_temperature_out_per_pipe(t_inlet, mass_flow, k[edges], t_ground)
+    t_outlet[no_flow] = np.nan
+    with np.errstate(invalid='ignore'):
+        high_loss = np.where(abs(t_inlet - t_outlet) > MAX_TEMPERATURE_LOSS_K)[0]
+    for i in high_loss:
+        e, m = edges[i], mass_flow[i]
+        print('High temperature loss on edge', e, '. Loss:', abs(t_inlet[i] - t_outlet[i]))
+        # store the lowest mass flow of the problematic edges
+        if str(e) not in thermal_network.problematic_edges.keys() or thermal_network.problematic_edges[str(e)] > m:
+            thermal_network.problematic_edges[str(e)] = m
+        if (k[e] / 2 - m * HEAT_CAPACITY_OF_WATER_JPERKGK / 1000) > 0:
+            print('Exit temperature decreasing at entry temperature increase. Possible at low massflows. Massflow:',
+                  m, ' on edge: ', e)
+        if thermal_network.network_type == 'DH':
+            t_outlet[i] = t_inlet[i] - MAX_TEMPERATURE_LOSS_K
+        else:
+            t_outlet[i] = t_inlet[i] + MAX_TEMPERATURE_LOSS_K
+    return t_outlet
+
+
+def solve_supply_temperatures(flow_order, t_plant, mass_flow_edge, k, t_ground, thermal_network):
+    """
+    Solve the node temperatures of the supply line in a single pass, starting at the plants. The temperature of a node
+    is the mixing temperature of the flows entering it, at the ends of the branches it is the highest temperature of
+    the flows entering it (nan if any of them has no flow).
+
+    :param FlowOrder flow_order: the flow order of the supply line (see :py:func:`get_supply_flow_order`)
+    :param t_plant: supply temperature of the plants [K]
+    :param mass_flow_edge: mass flow in each edge (e) [kg/s]
+    :param k: aggregated heat conduction coefficient of each edge (e) [kW/K]
+    :param t_ground: ground temperature [K]
+    :return: the temperature of each node (n) and the inlet and outlet temperature of each edge (e) [K]
+    :rtype: tuple[np.ndarray, np.ndarray, np.ndarray]
+    """
+    mass_flow_edge = np.asarray(mass_flow_edge, dtype=float)
+    inlet_node = flow_order.inlet_node
+    t_node = np.where(flow_order.isolated, np.nan, 0.0)
+    t_edge_in = np.zeros(len(inlet_node))
+    t_edge_out = np.zeros(len(inlet_node))
+
+    t_node[flow_order.sources] = t_plant
+    edges = flow_order.source_edges
+    t_edge_in[edges] = t_node[inlet_node[edges]]
+    t_edge_out[edges] = calc_outlet_temperatures(edges, t_edge_in[edges], mass_flow_edge, k, t_ground,
+                                                 thermal_network)
+    for nodes, in_edges, in_nodes, out_edges in flow_order.levels:
+        mass_flow_in = np.bincount(in_nodes, weights=mass_flow_edge[in_edges], minlength=len(nodes))
+        mcp_in = np.bincount(in_nodes, weights=mass_flow_edge[in_edges] * np.nan_to_num(t_edge_out[in_edges]),
+                             minlength=len(nodes))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t_mixing = mcp_in / mass_flow_in
+        mixing = flow_order.has_outflow[nodes]
+        if np.isnan(t_mixing[mixing]).any():
+            node = int(nodes[mixing][np.isnan(t_mixing[mixing])][0])
+            raise ValueError('There are no flow entering/existing node', node,
+                             '. Please check if the edge_node_df make sense.')
+        t_branch_end = np.zeros(len(nodes))
+        np.maximum.at(t_branch_end, in_nodes, t_edge_out[in_edges])
+        t_node[nodes] = np.where(mixing, t_mixing, t_branch_end)
+
+        t_edge_in[out_edges] = t_node[inlet_node[out_edges]]
+        t_edge_out[out_edges] = calc_outlet_temperatures(out_edges, t_edge_in[out_edges], mass_flow_edge, k, t_ground,
+                                                         thermal_network)
+    return t_node, t_edge_in, t_edge_out
+
+
+def solve_return_temperatures(flow_order, t_return, mass_flow_edge, mass_flow_substation, k, t_ground,
+                              thermal_network):
+    """
+    Solve the node temperatures of the return line in a single pass, starting at the ends of the branches. The
+    temperature of a node is the mixing temperature of the flows entering it from the edges and from its substation.
+
+    :param FlowOrder flow_order: the flow order of the return line (see :py:func:`get_return_flow_order`)
+    :param t_return: return temperature of the substation at each node, nan for other nodes (n) [K]
+    :param mass_flow_edge: mass flow in each edge (e) [kg/s]
+    :param mass_flow_substation: mass flow of the substation at each node (n) [kg/s]
+    :param k: aggregated heat conduction coefficient of each edge (e) [kW/K]
+    :param t_ground: ground temperature [K]
+    :return: the temperature of each node (n) and the inlet and outlet temperature of each edge (e) [K]
+    :rtype: tuple[np.ndarray, np.ndarray, np.ndarray]
+    """
+    mass_flow_edge = np.asarray(mass_flow_edge, dtype=float)
+    mass_flow_substation = np.maximum(np.asarray(mass_flow_substation, dtype=float), 0.0)  # the plants take no flow
+    inlet_node = flow_order.inlet_node
+    t_node = np.where(flow_order.isolated, np.nan, 0.0)
+    t_edge_in = np.zeros(len(inlet_node))
+    t_edge_out = np.zeros(len(inlet_node))
+
+    t_node[flow_order.sources] = t_return[flow_order.sources]
+    edges = flow_order.source_edges
+    t_edge_in[edges] = t_node[inlet_node[edges]]
+    t_edge_out[edges] = calc_outlet_temperatures(edges, t_edge_in[edges], mass_flow_edge, k, t_ground,
+                                                 thermal_network)
+    for nodes, in_edges, in_nodes, out_edges in flow_order.levels:
+        mass_flow_sub = mass_flow_substation[nodes]
+        total_mass_flow = np.bincount(in_nodes, weights=mass_flow_edge[in_edges], minlength=len(nodes)) + mass_flow_sub
+        mcp_edges = np.bincount(in_nodes, weights=mass_flow_edge[in_edges] * np.nan_to_num(t_edge_out[in_edges]),
+                                minlength=len(nodes))
+        mcp_substations = np.where(np.isclose(mass_flow_sub, 0), 0.0, mass_flow_sub * t_return[nodes])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t_node[nodes] = np.where(np.isclose(total_mass_flow, 0), np.nan,
+                                     (mcp_edges + mcp_substations) / total_mass_flow)
+
+        t_edge_in[out_edges] = t_node[inlet_node[out_edges]]
+        t_edge_out[out_edges] = calc_outlet_temperatures(out_edges, t_edge_in[out_edges], mass_flow_edge, k, t_ground,
+                                                         thermal_network)
+    return t_node, t_edge_in, t_edge_out
+
+
+def calc_edge_heat_losses(mass_flow_edge, t_edge_in, t_edge_out):
+    """Heat losses of the edges with flows [kW] (zero for edges whose temperatures are unknown)"""
+    mass_flow_edge = np.asarray(mass_flow_edge, dtype=float)
+    with np.errstate(invalid='ignore'):
+        dT_edge = np.nan_to_num(t_edge_in - t_edge_out)
+    return np.where(mass_flow_edge > 0, mass_flow_edge * HEAT_CAPACITY_OF_WATER_JPERKGK / 1000 * dT_edge, 0.0)
@@ -33,6 +33,16 @@ __maintainer__ = "Daren Thomas"
 __email__ = "cea@arch.ethz.ch"
 __status__ = "Production"
 
+# the heat exchangers of the substations: (key, load type, building system), see calc_hex_area_from_demand
+HEATING_SYSTEMS = [('hs_ahu', 'hs_sys', 'ahu_'), ('hs_aru', 'hs_sys', 'aru_'), ('hs_shu', 'hs_sys', 'shu_'),
+                   ('hs_ww', 'ww_sys', '')]
+COOLING_SYSTEMS = [('cs_ahu', 'cs_sys', 'ahu_'), ('cs_aru', 'cs_sys', 'aru_'), ('cs_scu', 'cs_sys', 'scu_'),
+                   ('cs_data', 'cdata_sys', ''), ('cs_re', 'cre_sys', '')]
+
+_substation_arrays_cache = {}  # {building names: SubstationArrays}
+SUBSTATION_ARRAYS_CACHE_SIZE = 8  # number of lists of buildings kept in the cache
+_capacity_mass_flows_index = pd.Index(['0'])  # index of the capacity mass flows of the minimum mass flow iteration
+
 
 # ============================
 # Substation model
@@ -83,8 +93,7 @@ def determine_building_supply_temperatures(building_names, locator, substation_s
     buildings_demands = {}
     for name in building_names:
         name = str(name)
-        buildings_demands[name] = pd.read_csv(locator.get_demand_results_file(name),
-                                              usecols=(BUILDINGS_DEMANDS_COLUMNS))
+        buildings_demands[name] = locator.read_demand_results(name, BUILDINGS_DEMANDS_COLUMNS)
         Q_substation_heating = 0
         T_supply_heating_C = np.nan
         for system in substation_systems['heating']:
@@ -255,246 +264,196 @@ def substation_return_model_main(thermal_network, T_substation_supply, t, consum
     """
     Calculate all substation return temperature and required flow rate at each time-step.
 
-    :param locator: an InputLocator instance set to the scenario to work on
-    :param buildings_demands: dictionarz of building demands
-    :param substations_HEX_specs: list of dataframes for substation heat exchanger Area and UA for heating, cooling and DHW
     :param T_substation_supply: supply temperature at each substation in [K]
     :param t: time-step
-    :param network_type: a string that defines whether the network is a district heating ('DH') or cooling ('DC')
-                         network
-    :param use_same_temperature_for_all_nodes: flag for calculating nominal flow rate, using one target temperature
+    :param consumer_building_names: the buildings whose substations are calculated
 
     :param thermal_network: container for all the
            thermal network data.
     :type thermal_network: cea.technologies.thermal_network.thermal_network.ThermalNetwork
 
-    :return:
+    :return: ``(T_return_all_K, mdot_sum_all_kgs, thermal_demand)`` the substation return temperatures [K] and flow
+        rates [kg/s] (DataFrames with a column per building) and the thermal demand of each building
 
     """
-    index = 0
-    # combi = [0] * len(building_names)
-    T_return_all_K = pd.DataFrame()
-    mdot_sum_all_kgs = pd.DataFrame()
-    thermal_demand = pd.DataFrame(np.zeros((1, len(consumer_building_names))), columns=consumer_building_names)
-    for name in consumer_building_names:
-        building = thermal_network.buildings_demands[name].loc[[t]]
-
-        # find substation supply temperature
-        T_substation_supply_K = T_substation_supply.loc['T_supply', name]
-
-        if thermal_network.network_type == 'DH':
-            for key in thermal_network.substation_heating_systems:
-                key = 'hs_' + key
-                if name not in thermal_network.ch_old[key][t].columns:
-                    thermal_network.ch_old[key][t][name] = 0.0
-
-            # calculate DH substation return temperature and substation flow rate
-            T_substation_return_K, \
-            mcp_sub, thermal_demand[name] = calc_substation_return_DH(building, T_substation_supply_K,
-                                                                      thermal_network.substations_HEX_specs.loc[name],
-                                                                      thermal_network, name, t)
-        else:
-            for key in thermal_network.substation_cooling_systems:
-                key = 'cs_' + key
-                if name not in thermal_network.cc_old[key][t].columns:
-                    thermal_network.cc_old[key][t][name] = 0.0
-            # calculate DC substation return temperature and substation flow rate
-            T_substation_return_K, mcp_sub, thermal_demand[name] = calc_substation_return_DC(
-                building, T_substation_supply_K, thermal_network.substations_HEX_specs.loc[name], thermal_network, name, t)
+    T_substation_supply_K = np.asarray(T_substation_supply.loc['T_supply', list(consumer_building_names)],
+                                       dtype=float).reshape(1, -1)
+    T_return_K, mcp_sub_kWK, thermal_demand = calc_substation_return(thermal_network, T_substation_supply_K, [t],
+                                                                     consumer_building_names)
+    T_return_all_K = pd.DataFrame(T_return_K, columns=consumer_building_names)
+    mdot_sum_all_kgs = pd.DataFrame(mcp_sub_kWK / (HEAT_CAPACITY_OF_WATER_JPERKGK / 1000),
+                                    columns=consumer_building_names)  # [kg/s]
+    mdot_sum_all_kgs = np.round(mdot_sum_all_kgs, 5)
 
-        T_return_all_K[name] = [T_substation_return_K]
-        mdot_sum_all_kgs[name] = [mcp_sub / (HEAT_CAPACITY_OF_WATER_JPERKGK / 1000)]  # [kg/s]
+    return T_return_all_K, mdot_sum_all_kgs, abs(thermal_demand)
 
-        index += 1
 
-    mdot_sum_all_kgs = np.round(mdot_sum_all_kgs, 5)
+def calc_substation_return(thermal_network, T_substation_supply_K, time_steps, building_names):
+    """
+    Calculate the substation return temperatures, the required heat capacities (mcp) of the supply streams and the
+    thermal demands of the buildings ``building_names`` at the time steps ``time_steps``. The heat exchangers of each
+    system (ahu, aru, shu, ww, ...) are calculated for all buildings and time steps at once.
 
-    return T_return_all_K, mdot_sum_all_kgs, abs(thermal_demand.values)
+    The capacity mass flows of the minimum mass flow iteration are read from and stored to ``thermal_network``
+    (``ch_old`` and ``ch_value`` for DH, ``cc_old`` and ``cc_value`` for DC) for each time step.
 
+    :param T_substation_supply_K: supply temperature at each substation in [K]                          (t x b)
+    :param time_steps: the time steps to calculate                                                      (t)
+    :param building_names: the buildings whose substations are calculated                               (b)
+    :type thermal_network: cea.technologies.thermal_network.thermal_network.ThermalNetwork
 
-def calc_substation_return_DH(building, T_DH_supply_K, substation_HEX_specs, thermal_network, name, t):
+    :return: ``(T_return_K, mcp_kWK, thermal_demand)`` the substation return temperatures [K], the heat capacities of
+        the supply streams [kW/K] and the thermal demands [W]                                           (t x b)
+    :rtype: tuple[ndarray, ndarray, ndarray]
     """
-    calculate individual substation return temperature and required heat capacity (mcp) of the supply stream
-    at each time step.
-    :param building: list of building information
-    :param T_DH_supply_K: matrix of the substation supply temperatures in K
-    :param substation_HEX_specs: substation heat exchanger properties
+    substations = get_substation_arrays(thermal_network, building_names)
+    rows = substations.get_rows(time_steps)
+    T_substation_supply_K = np.asarray(T_substation_supply_K, dtype=float)
+    delta_cap_mass_flow = np.array([[thermal_network.delta_cap_mass_flow[t]] for t in time_steps], dtype=float)
+
+    if thermal_network.network_type == 'DH':
+        systems, calc_HEX = HEATING_SYSTEMS, calc_HEX_heating
+        cap_old, cap_value = thermal_network.ch_old, thermal_network.ch_value
+    else:
+        systems, calc_HEX = COOLING_SYSTEMS, calc_HEX_cooling
+        cap_old, cap_value = thermal_network.cc_old, thermal_network.cc_value
 
-    :return t_return_DH: the substation return temperature
-    :return mcp_DH: the required heat capacity (mcp) from the DH
-    """
     temperatures = []
     mass_flows = []
     heat = []
+    for key, load_type, building_system in systems:
+        if key not in substations.UA:
+            continue
+        has_hex = substations.has_hex[key]
+        hex_building_names = pd.Index([name for name, has in zip(building_names, has_hex) if has])
+        Q, T_sup, T_ret, mcp = substations.get_demand(load_type, building_system, rows)
+        cap_mass_flow_old = np.array([read_capacity_mass_flows(cap_old[key][t], building_names) for t in time_steps])
+
+        Q, t_return, mcp_return, cap_mass_flow = calc_HEX(Q, T_substation_supply_K, T_sup, T_ret, mcp,
+                                                          substations.UA[key], cap_mass_flow_old, delta_cap_mass_flow)
+        temperatures.append(np.where(has_hex, t_return, np.nan))
+        mass_flows.append(np.where(has_hex, mcp_return, 0.0))
+        heat.append(np.where(has_hex, Q, 0.0))
 
-    # Heating ahu
-    if 'UA_heating_hs_ahu' in substation_HEX_specs.HEX_UA.columns:
-        Qhs_sys_ahu, t_DH_return_hs_ahu, mcp_DH_hs_ahu, ch_value = calc_HEX_heating(building, 'hs_sys', 'ahu_',
-                                                                                    T_DH_supply_K,
-                                                                                    substation_HEX_specs.HEX_UA.UA_heating_hs_ahu[
-                                                                                        '0'],
-                                                                                    thermal_network.ch_old['hs_ahu'][t][
-                                                                                        name],
-                                                                                    thermal_network.delta_cap_mass_flow[
-                                                                                        t])
-        temperatures.append(t_DH_return_hs_ahu)
-        mass_flows.append(mcp_DH_hs_ahu)
-        heat.append(Qhs_sys_ahu[0])
         # Store values for next run
-        thermal_network.ch_value['hs_ahu'][t][name] = float(ch_value)
-        thermal_network.ch_old['hs_ahu'][t][name] = float(ch_value)
-
-    # Heating aru
-    if 'UA_heating_hs_aru' in substation_HEX_specs.HEX_UA.columns:
-        Qhs_sys_aru, t_DH_return_hs_aru, mcp_DH_hs_aru, ch_value = calc_HEX_heating(building, 'hs_sys', 'aru_',
-                                                                                    T_DH_supply_K,
-                                                                                    substation_HEX_specs.HEX_UA.UA_heating_hs_aru[
-                                                                                        '0'],
-                                                                                    thermal_network.ch_old['hs_aru'][t][
-                                                                                        name],
-                                                                                    thermal_network.delta_cap_mass_flow[
-                                                                                        t])
-        temperatures.append(t_DH_return_hs_aru)
-        mass_flows.append(mcp_DH_hs_aru)
-        heat.append(Qhs_sys_aru[0])
-        # Store values for next run
-        thermal_network.ch_value['hs_aru'][t][name] = float(ch_value)
-        thermal_network.ch_old['hs_aru'][t][name] = float(ch_value)
-
-    # Heating shu
-    if 'UA_heating_hs_shu' in substation_HEX_specs.HEX_UA.columns:
-        Qhs_sys_shu, t_DH_return_hs_shu, mcp_DH_hs_shu, ch_value = calc_HEX_heating(building, 'hs_sys', 'shu_',
-                                                                                    T_DH_supply_K,
-                                                                                    substation_HEX_specs.HEX_UA.UA_heating_hs_shu[
-                                                                                        '0'],
-                                                                                    thermal_network.ch_old['hs_shu'][t][
-                                                                                        name],
-                                                                                    thermal_network.delta_cap_mass_flow[
-                                                                                        t])
-        temperatures.append(t_DH_return_hs_shu)
-        mass_flows.append(mcp_DH_hs_shu)
-        heat.append(Qhs_sys_shu[0])
-        # Store values for next run
-        thermal_network.ch_value['hs_shu'][t][name] = float(ch_value)
-        thermal_network.ch_old['hs_shu'][t][name] = float(ch_value)
-
-    if 'UA_heating_hs_ww' in substation_HEX_specs.HEX_UA.columns:
-        Qww_sys, t_DH_return_ww, mcp_DH_ww, ch_value = calc_HEX_heating(building, 'ww_sys', '', T_DH_supply_K,
-                                                                        substation_HEX_specs.HEX_UA.UA_heating_hs_ww[
-                                                                            '0'],
-                                                                        thermal_network.ch_old['hs_ww'][t][name],
-                                                                        thermal_network.delta_cap_mass_flow[t])
-        temperatures.append(t_DH_return_ww)
-        mass_flows.append(mcp_DH_ww)
-        heat.append(Qww_sys[0])
-        # Store values for next run
-        thermal_network.ch_value['hs_ww'][t][name] = float(ch_value)
-        thermal_network.ch_old['hs_ww'][t][name] = float(ch_value)
+        for row, t in enumerate(time_steps):
+            cap_value[key][t] = store_capacity_mass_flows(cap_value[key][t], hex_building_names,
+                                                          cap_mass_flow[row, has_hex])
+            cap_old[key][t] = store_capacity_mass_flows(cap_old[key][t], hex_building_names,
+                                                        cap_mass_flow[row, has_hex])
 
-    # calculate mix temperature of return DH
-    T_DH_return_K = calc_HEX_mix(heat, temperatures, mass_flows)
-    mcp_DH_kWK = sum(mass_flows)  # [kW/K]
-    heat_demand = sum(heat)
+    # calculate mix temperature of the return streams
+    shape = (len(time_steps), len(building_names))
+    T_return_K = np.broadcast_to(calc_HEX_mix(heat, temperatures, mass_flows), shape).copy()
+    mcp_kWK = np.broadcast_to(sum(mass_flows), shape).copy()  # [kW/K]
+    thermal_demand = np.broadcast_to(sum(heat), shape).copy()
 
-    return T_DH_return_K, mcp_DH_kWK, heat_demand
+    return T_return_K, mcp_kWK, thermal_demand
 
 
-def calc_substation_return_DC(building, T_DC_supply_K, substation_HEX_specs, thermal_network, name, t):
+def get_substation_arrays(thermal_network, building_names):
+    """
+    Return the :py:class:`SubstationArrays` of the buildings ``building_names``, which are reused as long as the demands
+    and the heat exchangers of the buildings don't change.
+    """
+    key = tuple(building_names)
+    substations = _substation_arrays_cache.get(key)
+    if substations is None or not substations.is_up_to_date(thermal_network):
+        substations = SubstationArrays(thermal_network, building_names)
+        # drop the oldest list of buildings if the cache is full
+        if key not in _substation_arrays_cache and len(_substation_arrays_cache) >= SUBSTATION_ARRAYS_CACHE_SIZE:
+            del _substation_arrays_cache[next(iter(_substation_arrays_cache))]
+        _substation_arrays_cache[key] = substations
+    return substations
+
+
+class SubstationArrays(object):
     """
-    calculate individual substation return temperature and required heat capacity (mcp) of the supply stream
-    at each time step.
-    :param building: list of building information
-    :param T_DC_supply_K: matrix of the substation supply temperatures in K
-    :param substation_HEX_specs: substation heat exchanger properties
+    The demands and the substation heat exchangers of a list of buildings as arrays with a column per building, for
+    calculating the substations of all buildings at once.
 
-    :return t_return_DC: the substation return temperature
-    :return mcp_DC: the required heat capacity (mcp) from the DC
+    :ivar UA: the UA of the heat exchangers of each system (b), e.g. ``UA['hs_ahu']``, NaN for buildings without one
+    :ivar has_hex: True for the buildings with a heat exchanger for the system (b)
     """
 
-    temperatures = []
-    mass_flows = []
-    heat = []
+    def __init__(self, thermal_network, building_names):
+        self.building_names = list(building_names)
+        self.buildings_demands = [thermal_network.buildings_demands[name] for name in self.building_names]
+        self.substations_HEX_specs = thermal_network.substations_HEX_specs
+        self.index = self.buildings_demands[0].index
+        for demand in self.buildings_demands[1:]:
+            if not demand.index.equals(self.index):
+                self.index = self.index.union(demand.index)
+        self._columns = {}
+
+        self.UA = {}
+        self.has_hex = {}
+        HEX_UA = [self.substations_HEX_specs.loc[name].HEX_UA for name in self.building_names]
+        for key, UA_column in [(key, 'UA_heating_' + key) for key, _, _ in HEATING_SYSTEMS] + [
+                (key, 'UA_cooling_' + key) for key, _, _ in COOLING_SYSTEMS]:
+            has_hex = np.array([UA_column in UA.columns for UA in HEX_UA], dtype=bool)
+            if has_hex.any():
+                self.has_hex[key] = has_hex
+                self.UA[key] = np.array([float(UA[UA_column]['0']) if has else np.nan
+                                         for UA, has in zip(HEX_UA, has_hex)])
+
+    def is_up_to_date(self, thermal_network):
+        """True if the demands and the heat exchangers of the buildings are still those of ``thermal_network``"""
+        return (self.substations_HEX_specs is thermal_network.substations_HEX_specs and
+                all(thermal_network.buildings_demands.get(name) is demand
+                    for name, demand in zip(self.building_names, self.buildings_demands)))
+
+    def get_rows(self, time_steps):
+        """The rows of the time steps ``time_steps`` (labels of the index of the building demands)"""
+        rows = self.index.get_indexer(list(time_steps))
+        if (rows < 0).any():
+            raise KeyError([t for t, row in zip(time_steps, rows) if row < 0])
+        return rows
+
+    def get_column(self, column, rows):
+        """The values of the column ``column`` of the demands in the rows ``rows``                  (t x b)"""
+        if column not in self._columns:
+            values = pd.concat([demand[column] for demand in self.buildings_demands], axis=1)
+            self._columns[column] = values.reindex(self.index).values.astype(float)
+        return self._columns[column][rows]
+
+    def get_demand(self, load_type, building_system, rows):
+        """
+        The demand of a system of the buildings in the rows ``rows``, see :py:func:`calc_hex_area_from_demand`
+
+        :return: ``(Q, T_sup, T_ret, mcp)`` the load [W], the supply and return temperatures [K] and the capacity mass
+            flow rate [W/K] of the building side                                                    (t x b)
+        """
+        Q = self.get_column('Q' + load_type + '_' + building_system + 'kWh', rows) * 1000  # in W
+        T_sup = self.get_column('T' + load_type + '_sup_' + building_system + 'C', rows) + 273  # in K
+        T_ret = self.get_column('T' + load_type + '_re_' + building_system + 'C', rows) + 273  # in K
+        mcp = self.get_column('mcp' + load_type + '_' + building_system + 'kWperC', rows) * 1000  # in W/K
+        return Q, T_sup, T_ret, mcp
+
+
+def read_capacity_mass_flows(capacity_mass_flows, building_names):
+    """
+    The capacity mass flows of the buildings ``building_names`` stored in ``capacity_mass_flows`` (a DataFrame with the
+    index ['0'] and a column per building), NaN for buildings without a stored value.
+    """
+    if not isinstance(capacity_mass_flows, pd.DataFrame) or capacity_mass_flows.columns.empty:
+        return np.full(len(building_names), np.nan)
+    return capacity_mass_flows.reindex(columns=building_names).values[0].astype(float)
 
-    # Cooling ahu
-    if 'UA_cooling_cs_ahu' in substation_HEX_specs.HEX_UA.columns:
-        Qcs_sys_ahu, t_DC_return_cs_ahu, mcp_DC_hs_ahu, cc_value = calc_HEX_cooling(building, 'cs_sys', 'ahu_',
-                                                                                    T_DC_supply_K,
-                                                                                    substation_HEX_specs.HEX_UA.UA_cooling_cs_ahu[
-                                                                                        '0'],
-                                                                                    thermal_network.cc_old['cs_ahu'][t][
-                                                                                        name],
-                                                                                    thermal_network.delta_cap_mass_flow[
-                                                                                        t])
-        temperatures.append(t_DC_return_cs_ahu)
-        mass_flows.append(mcp_DC_hs_ahu)
-        heat.append(Qcs_sys_ahu[0])
-        thermal_network.cc_old['cs_ahu'][t][name] = float(cc_value)
-        thermal_network.cc_value['cs_ahu'][t][name] = float(cc_value)
-
-    # Cooling aru
-    if 'UA_cooling_cs_aru' in substation_HEX_specs.HEX_UA.columns:
-        Qcs_sys_aru, t_DC_return_cs_aru, mcp_DC_hs_aru, cc_value = calc_HEX_cooling(building, 'cs_sys', 'aru_',
-                                                                                    T_DC_supply_K,
-                                                                                    substation_HEX_specs.HEX_UA.UA_cooling_cs_aru[
-                                                                                        '0'],
-                                                                                    thermal_network.cc_old['cs_aru'][t][
-                                                                                        name],
-                                                                                    thermal_network.delta_cap_mass_flow[
-                                                                                        t])
-        temperatures.append(t_DC_return_cs_aru)
-        mass_flows.append(mcp_DC_hs_aru)
-        heat.append(Qcs_sys_aru[0])
-        thermal_network.cc_old['cs_aru'][t][name] = float(cc_value)
-        thermal_network.cc_value['cs_aru'][t][name] = float(cc_value)
-
-    # Cooling scu
-    if 'UA_cooling_cs_scu' in substation_HEX_specs.HEX_UA.columns:
-        Qcs_sys_scu, t_DC_return_cs_scu, mcp_DC_hs_scu, cc_value = calc_HEX_cooling(building, 'cs_sys', 'scu_',
-                                                                                    T_DC_supply_K,
-                                                                                    substation_HEX_specs.HEX_UA.UA_cooling_cs_scu[
-                                                                                        '0'],
-                                                                                    thermal_network.cc_old['cs_scu'][t][
-                                                                                        name],
-                                                                                    thermal_network.delta_cap_mass_flow[
-                                                                                        t])
-        temperatures.append(t_DC_return_cs_scu)
-        mass_flows.append(mcp_DC_hs_scu)
-        heat.append(Qcs_sys_scu[0])
-        thermal_network.cc_old['cs_scu'][t][name] = float(cc_value)
-        thermal_network.cc_value['cs_scu'][t][name] = float(cc_value)
-
-    if 'UA_cooling_cs_data' in substation_HEX_specs.HEX_UA.columns:
-        Qcdata_sys, t_DC_return_data, mcp_DC_data, cc_value = calc_HEX_cooling(building, 'cdata_sys', '', T_DC_supply_K,
-                                                                               substation_HEX_specs.HEX_UA.UA_cooling_cs_data[
-                                                                                   '0'],
-                                                                               thermal_network.cc_old['cs_data'][t][
-                                                                                   name],
-                                                                               thermal_network.delta_cap_mass_flow[t])
-        temperatures.append(t_DC_return_data)
-        mass_flows.append(mcp_DC_data)
-        heat.append(Qcdata_sys[0])
-        thermal_network.cc_old['cs_data'][t][name] = float(cc_value)
-        thermal_network.cc_value['cs_data'][t][name] = float(cc_value)
-
-    if 'UA_cooling_cs_re' in substation_HEX_specs.HEX_UA.columns:
-        Qcre_sys, t_DC_return_re_sys, mcp_DC_re_sys, cc_value = calc_HEX_cooling(building, 'cre_sys', '', T_DC_supply_K,
-                                                                                 substation_HEX_specs.HEX_UA.UA_cooling_cs_re[
-                                                                                     '0'],
-                                                                                 thermal_network.cc_old['cs_re'][t][
-                                                                                     name],
-                                                                                 thermal_network.delta_cap_mass_flow[t])
-        temperatures.append(t_DC_return_re_sys)
-        mass_flows.append(mcp_DC_re_sys)
-        heat.append(Qcre_sys[0])
-        thermal_network.cc_old['cs_re'][t][name] = float(cc_value)
-        thermal_network.cc_value['cs_re'][t][name] = float(cc_value)
-
-    # calculate mix temperature of return DC
-    T_DC_return_K = calc_HEX_mix(heat, temperatures, mass_flows)
-    mcp_DC_kWK = sum(mass_flows)  # [kW/K]
-    cooling_demand = sum(heat)
-
-    return T_DC_return_K, mcp_DC_kWK, cooling_demand
+
+def store_capacity_mass_flows(capacity_mass_flows, building_names, values):
+    """
+    Return the capacity mass flows ``capacity_mass_flows`` (a DataFrame with the index ['0'] and a column per building)
+    with the values of the buildings ``building_names`` set to ``values``.
+    """
+    new_values = pd.DataFrame(np.reshape(values, (1, -1)), index=_capacity_mass_flows_index, columns=building_names)
+    if (isinstance(capacity_mass_flows, pd.DataFrame) and len(capacity_mass_flows.columns) and
+            not capacity_mass_flows.columns.equals(new_values.columns) and
+            len(capacity_mass_flows.columns.difference(new_values.columns))):
+        # keep the values of the other buildings
+        new_values = pd.concat([capacity_mass_flows.drop(columns=new_values.columns, errors='ignore'), new_values],
+                               axis=1)
+    return new_values
 
 
 # ============================
@@ -564,80 +523,84 @@ def calc_heating_substation_heat_exchange(cc_0, Qnom, thi_0, tci_0, tco_0):
 # ============================
 
 
-def calc_HEX_cooling(building, type, name, tci, UA, cc_old, delta_cap_mass_flow):
+def calc_HEX_cooling(Q, tci, tho, thi, ch, UA, cc_old, delta_cap_mass_flow):
     """
-    This function calculates the mass flow rate, temperature of return (secondary side)
-    and heat exchanger area for a plate heat exchanger.
+    This function calculates the mass flow rate and temperature of return (primary side) of plate heat exchangers,
+    element-wise for arrays of heat exchangers (e.g. of all buildings and time steps).
     Method of Number of Transfer Units (NTU)
 
-    :param Q: cooling load
+    :param Q: cooling load [W]
+    :param tci: in temperature of primary side (district cooling network) [K]
+    :param tho: out temperature of secondary side [K]
+    :param thi: in temperature of secondary side [K]
+    :param ch: capacity mass flow rate secondary side [W/K]
     :param UA: coefficient representing the area of heat exchanger times the coefficient of transmittance of the
         heat exchanger
-    :param thi: in temperature of primary side
-    :param tho: out temperature of primary side
-    :param tci: in temperature of secondary side
-    :param ch: capacity mass flow rate primary side
-    :return: ``(tco, cc)`` out temperature of secondary side (district cooling network), capacity mass flow rate
-        secondary side
-    """
-
-    m_name = 'mcp' + type + '_' + name + 'kWperC'
-    Q_name = 'Q' + type + '_' + name + 'kWh'
-    T_sup_name = 'T' + type + '_sup_' + name + 'C'
-    T_ret_name = 'T' + type + '_re_' + name + 'C'
-
-    Q = abs(building[Q_name].values) * 1000  # in W
-    if abs(Q).max() > 0:
-        tho = building[T_sup_name].values + 273  # in K
-        thi = building[T_ret_name].values + 273  # in K
-        ch = building[m_name].values * 1000  # in W/K
-        if ch > 0:
-            eff = [0.1, 0]  # FIXME
-            Flag = False
-            tol = 0.00000001
-            while abs((eff[0] - eff[1]) / eff[0]) > tol:
-                if Flag:
-                    eff[0] = eff[1]
-                else:
-                    cmin = ch * (thi - tho) / ((thi - tci) * eff[0])
-                if cmin < ch:
-                    cc = cmin
-                    cmax = ch
-                else:
-                    cc = cmin
-                    cmax = cc
-                    cmin = ch
-                cr = cmin / cmax
-                NTU = UA / cmin
-                eff[1] = calc_plate_HEX(NTU, cr)
-                cmin = ch * (thi - tho) / ((thi - tci) * eff[1])
-                tco = tci + eff[1] * cmin * (thi - tci) / cc
-                Flag = True
-        else:
-            tco = 0.0
-            cc = 0.0
-        if cc > 0.0:
-            if delta_cap_mass_flow > 0 or cc_old.any() > 0:
-                if cc_old.any() > 0:
-                    cc = np.array(
-                        cc_old + delta_cap_mass_flow * HEAT_CAPACITY_OF_WATER_JPERKGK)  # todo:improve this
-                else:  # first run through so no previous values for cc_old
-                    cc = np.array(
-                        cc + delta_cap_mass_flow * HEAT_CAPACITY_OF_WATER_JPERKGK)
-                # recalculate temperature
-                tco = tci + eff[1] * cmin * (thi - tci) / cc
-        t_return = float(tco)
-        mcp_return = float(cc / 1000)
+    :param cc_old: capacity mass flow rate primary side of the previous minimum mass flow iteration, 0 or NaN if none
+    :param delta_cap_mass_flow: mass flow increase of the minimum mass flow iteration
+    :return: ``(Q, tco, mcp, cc)`` cooling load, out temperature of primary side (district cooling network), capacity
+        mass flow rate primary side in [kW/K] and in [W/K]
+    """
+    Q, tci, tho, thi, ch, UA, cc_old, delta_cap_mass_flow = np.broadcast_arrays(
+        *[np.asarray(a, dtype=float) for a in (abs(Q), tci, tho, thi, ch, UA, cc_old, delta_cap_mass_flow)])
 
-    else:
-        t_return = float(tci)
-        mcp_return = 0.0
-        cc = 0.0
+    with np.errstate(all='ignore'):
+        load = Q > 0
+        flow = load & (ch > 0)
+        eff, cmin, cc = calc_HEX_effectiveness(flow, ch, thi - tho, thi - tci, UA, calc_plate_HEX)
+        tco = np.where(flow, tci + eff * cmin * (thi - tci) / cc, 0.0)
+
+        # increase the mass flows of the minimum mass flow iteration
+        has_old = (cc_old != 0) & ~np.isnan(cc_old)
+        increase = (cc > 0.0) & ((delta_cap_mass_flow > 0) | has_old)
+        cc = np.where(increase, np.where(has_old, cc_old, cc) + delta_cap_mass_flow * HEAT_CAPACITY_OF_WATER_JPERKGK,
+                      cc)  # todo:improve this
+        # recalculate temperature
+        tco = np.where(increase, tci + eff * cmin * (thi - tci) / cc, tco)
+
+    t_return = np.where(load, tco, tci)
+    t_return[np.isnan(t_return)] = 0.0
+    return Q, t_return, abs(cc / 1000), abs(cc)
 
-    if np.isnan(t_return):
-        t_return = 0.0
 
-    return Q, t_return, abs(mcp_return), abs(cc)
+def calc_HEX_effectiveness(flow, c_secondary, dT_secondary, dT_inlet, UA, calc_eff):
+    """
+    This function iterates the efficiency of exchange of heat exchangers and the capacity mass flow rate of their
+    primary side (network) required to transfer the load of the secondary side (building).
+
+    :param flow: True for the heat exchangers with flows, the others are skipped
+    :param c_secondary: capacity mass flow rate secondary side
+    :param dT_secondary: temperature difference between in and out of secondary side
+    :param dT_inlet: temperature difference between the in temperatures of both sides
+    :param UA: coefficient representing the area of heat exchanger times the coefficient of transmittance of the
+        heat exchanger
+    :param calc_eff: function of ``(NTU, cr)`` returning the efficiency of exchange, e.g. :py:func:`calc_plate_HEX`
+    :return: ``(eff, cmin, c_primary)`` efficiency of exchange, minimum capacity mass flow rate for that efficiency and
+        capacity mass flow rate primary side, 0 where there are no flows
+    """
+    eff = np.zeros(flow.shape)
+    cmin = np.zeros(flow.shape)
+    c_primary = np.zeros(flow.shape)
+    eff_old = np.full(flow.shape, 0.1)  # FIXME
+    tol = 0.00000001
+    max_iterations = 1000  # the iteration doesn't converge if the network can't supply the load (dT_inlet < 0)
+    c_required = c_secondary * dT_secondary / (dT_inlet * eff_old)
+    iterate = flow.copy()
+    iterations = 0
+    while iterate.any() and iterations < max_iterations:
+        c_req, c_sec = c_required[iterate], c_secondary[iterate]
+        primary_is_min = c_req < c_sec
+        c_min = np.where(primary_is_min, c_req, c_sec)
+        c_max = np.where(primary_is_min, c_sec, c_req)
+        eff_new = calc_eff(UA[iterate] / c_min, c_min / c_max)
+        c_primary[iterate] = c_req
+        eff[iterate] = eff_new
+        cmin[iterate] = c_required[iterate] = c_sec * dT_secondary[iterate] / (dT_inlet[iterate] * eff_new)
+        not_converged = abs((eff_old[iterate] - eff_new) / eff_old[iterate]) > tol
+        eff_old[iterate] = eff_new
+        iterate[iterate] = not_converged
+        iterations += 1
+    return eff, cmin, c_primary
 
 
 def calc_plate_HEX(NTU, cr):
@@ -671,101 +634,66 @@ def calc_shell_HEX(NTU, cr):
 
 def calc_HEX_mix(heat, temperatures, mass_flows):
     '''
-    This function computes the average  temperature between two vectors of heating demand.
-    In this case, domestic hotwater and space heating.
+    This function computes the average out temperature of the heat exchangers of several heating or cooling modes,
+    element-wise for arrays of substations. In this case, e.g. domestic hotwater and space heating.
 
-    :param heat: load heating
-    :param temperatures: out temperature of heat exchanger for different heating modes
+    :param heat: load of each mode
+    :param temperatures: out temperature of heat exchanger for different heating modes, NaN for modes not present
     :param mass_flows: mass flows for each heating mode
     :return:
         tavg: average out temperature.
     '''
-    if sum(mass_flows) > 0:
-        weighted = [0] * len(heat)
-        for g in range(len(heat)):
-            if not abs(heat[g]) > 0:  # check if we have a heat load
-                mass_flows[g] = 0
-            weighted[g] = temperatures[g] * mass_flows[g] / sum(mass_flows)
-        tavg = sum(weighted)
-    else:
-        tavg = np.nanmean(temperatures)
-    return float(tavg)
-
-
-def calc_HEX_heating(building, type, name, thi, UA, ch_old, delta_cap_mass_flow):
+    if not temperatures:
+        return np.nan
+    with np.errstate(all='ignore'):
+        # only count the mass flows of the modes with a load
+        mass_flows_load = [np.where(abs(q) > 0, m, 0.0) for q, m in zip(heat, mass_flows)]
+        total_mass_flow = sum(mass_flows_load)
+        weighted = [np.where(m > 0, t * m / total_mass_flow, 0.0) for t, m in zip(temperatures, mass_flows_load)]
+        tavg = np.where(sum(mass_flows) > 0, sum(weighted), np.nanmean(temperatures, axis=0))
+    return tavg
+
+
+def calc_HEX_heating(Q, thi, tco, tci, cc, UA, ch_old, delta_cap_mass_flow):
     """
-    This function calculates the mass flow rate, temperature of return (secondary side)
-    and heat exchanger area for a shell-tube pleat exchanger in the heating case.
+    This function calculates the mass flow rate and temperature of return (primary side) of shell-tube heat exchangers
+    in the heating case, element-wise for arrays of heat exchangers (e.g. of all buildings and time steps).
 
     Method of Number of Transfer Units (NTU)
 
-    :param Q: load
+    :param Q: heating load [W]
+    :param thi: in temperature of primary side (district heating network) [K]
+    :param tco: out temperature of secondary side [K]
+    :param tci: in temperature of secondary side [K]
+    :param cc: capacity mass flow rate secondary side [W/K]
     :param UA: coefficient representing the area of heat exchanger times the coefficient of transmittance of the
         heat exchanger
-    :param thi: in temperature of secondary side
-    :param tco: out temperature of primary side
-    :param tci: in temperature of primary side
-    :param cc: capacity mass flow rate primary side
-
-    :return: tho = out temperature of secondary side (district cooling network), ch = capacity mass flow rate secondary side
-    """
-
-    m_name = 'mcp' + type + '_' + name + 'kWperC'
-    Q_name = 'Q' + type + '_' + name + 'kWh'
-    T_sup_name = 'T' + type + '_sup_' + name + 'C'
-    T_ret_name = 'T' + type + '_re_' + name + 'C'
-
-    Q = building[Q_name].values * 1000  # in W
-    if Q.max() > 0:
-        tco = building[T_sup_name].values + 273  # in K
-        tci = building[T_ret_name].values + 273  # in K
-        cc = np.array(building[m_name].values * 1000)  # in W/K
-        if cc.max() > 0:
-            eff = [0.1, 0]  # FIXME
-            Flag = False
-            tol = 0.00000001
-            while abs((eff[0] - eff[1]) / eff[0]) > tol:
-                if Flag:
-                    eff[0] = eff[1]
-                else:
-                    cmin = cc * (tco - tci) / ((thi - tci) * eff[0])
-                if cmin < cc:
-                    ch = cmin
-                    cmax = cc
-                else:
-                    ch = cmin
-                    cmax = cmin
-                    cmin = cc
-                cr = cmin / cmax
-                NTU = UA / cmin
-                eff[1] = calc_shell_HEX(NTU, cr)
-                cmin = cc * (tco - tci) / ((thi - tci) * eff[1])
-                tho = thi - eff[1] * cmin * (thi - tci) / ch
-                Flag = True
-        else:
-            tho = 0.0
-            ch = 0.0
-        if ch > 0.0:  # we have flows
-            if delta_cap_mass_flow > 0 or ch_old.any() > 0:  # we have too low mass flows
-                if ch_old.any() > 0:  # use information from previous iteration
-                    ch = np.array(
-                        ch_old + delta_cap_mass_flow * HEAT_CAPACITY_OF_WATER_JPERKGK)  # todo:improve this
-                else:  # first run through so no previous values for ch_old
-                    ch = np.array(
-                        ch + delta_cap_mass_flow * HEAT_CAPACITY_OF_WATER_JPERKGK)
-                # recalculate return temperature
-                tho = thi - eff[1] * cmin * (thi - tci) / ch
-        t_return = float(tho)
-        mcp_return = float(ch / 1000)
+    :param ch_old: capacity mass flow rate primary side of the previous minimum mass flow iteration, 0 or NaN if none
+    :param delta_cap_mass_flow: mass flow increase of the minimum mass flow iteration
 
-    else:
-        t_return = float(thi)
-        mcp_return = 0.0
-        ch = 0.0
-
-    if np.isnan(t_return):
-        t_return = 0.0
-    return Q, t_return, abs(mcp_return), abs(ch)
+    :return: ``(Q, tho, mcp, ch)`` heating load, out temperature of primary side (district heating network), capacity
+        mass flow rate primary side in [kW/K] and in [W/K]
+    """
+    Q, thi, tco, tci, cc, UA, ch_old, delta_cap_mass_flow = np.broadcast_arrays(
+        *[np.asarray(a, dtype=float) for a in (Q, thi, tco, tci, cc, UA, ch_old, delta_cap_mass_flow)])
+
+    with np.errstate(all='ignore'):
+        load = Q > 0
+        flow = load & (cc > 0)
+        eff, cmin, ch = calc_HEX_effectiveness(flow, cc, tco - tci, thi - tci, UA, calc_shell_HEX)
+        tho = np.where(flow, thi - eff * cmin * (thi - tci) / ch, 0.0)
+
+        # increase the mass flows of the minimum mass flow iteration (we have too low mass flows)
+        has_old = (ch_old != 0) & ~np.isnan(ch_old)
+        increase = (ch > 0.0) & ((delta_cap_mass_flow > 0) | has_old)
+        ch = np.where(increase, np.where(has_old, ch_old, ch) + delta_cap_mass_flow * HEAT_CAPACITY_OF_WATER_JPERKGK,
+                      ch)  # todo:improve this
+        # recalculate return temperature
+        tho = np.where(increase, thi - eff * cmin * (thi - tci) / ch, tho)
+
+    t_return = np.where(load, tho, thi)
+    t_return[np.isnan(t_return)] = 0.0
+    return Q, t_return, abs(ch / 1000), abs(ch)
 
 
 def calc_dTm_HEX(thi, tho, tci, tco):
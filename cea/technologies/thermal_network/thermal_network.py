@@ -19,6 +19,9 @@ import cea.config
 import cea.inputlocator
 import cea.technologies.thermal_network.substation_matrix as substation_matrix
 from cea.technologies.thermal_network.thermal_network_loss import calc_temperature_out_per_pipe
+import cea.technologies.thermal_network.network_hydraulics as network_hydraulics
+import cea.technologies.thermal_network.network_temperatures as network_temperatures
+import cea.technologies.thermal_network.time_windows as time_windows
 import cea.utilities.parallel
 import cea.utilities.workerstream
 from cea.constants import HEAT_CAPACITY_OF_WATER_JPERKGK, P_WATER_KGPERM3, HOURS_IN_YEAR
@@ -27,7 +30,7 @@ from cea.optimization.constants import PUMP_ETA
 from cea.resources import geothermal
 from cea.technologies.thermal_network.simplified_thermal_network import thermal_network_simplified
 from cea.technologies.constants import ROUGHNESS, NETWORK_DEPTH, REDUCED_TIME_STEPS, MAX_INITIAL_DIAMETER_ITERATIONS, \
-    MAX_NODE_FLOW
+    MAX_NODE_FLOW, HYDRAULIC_TOLERANCE_KGS, MAX_HYDRAULIC_ITERATIONS, MAX_LOOP_PRESSURE_RESIDUAL_PA
 from cea.utilities import epwreader
 from cea.utilities.standardize_coordinates import get_lat_lon_projected_shapefile, get_projected_coordinate_system
 
@@ -80,6 +83,9 @@ class ThermalNetwork(object):
         self.temperature_control = "VT"  # the control strategy of supply temperatures at plants (constant temperature "CT" or variable temperature "VT")
         self.plant_supply_temperature = 80
         self.equivalent_length_factor = 0.2
+        self.batch_mass_flow_calculation = True  # calculate the edge mass flows of tree networks for all hours at once
+        self.time_window_hours = 730  # number of hours of each time window of the thermal-hydraulic calculation
+        self.resume_from_checkpoint = True  # continue an interrupted calculation from the last finished time window
 
         # replace default values with those in the config file section
         self.copy_config_section(thermal_network_section)
@@ -127,7 +133,9 @@ class ThermalNetwork(object):
                                           "use_representative_week_per_month", "minimum_mass_flow_iteration_limit",
                                           "minimum_edge_mass_flow", "diameter_iteration_limit",
                                           "substation_cooling_systems", "substation_heating_systems",
-                                          "temperature_control", "plant_supply_temperature", "equivalent_length_factor"]
+                                          "temperature_control", "plant_supply_temperature", "equivalent_length_factor",
+                                          "batch_mass_flow_calculation", "time_window_hours",
+                                          "resume_from_checkpoint"]
         for field in thermal_network_section_fields:
             if hasattr(thermal_network_section, field):
                 setattr(self, field, getattr(thermal_network_section, field))
@@ -392,6 +400,8 @@ def thermal_network_main(locator, thermal_network, processes=1):
     - DH_P_Return or DC_P_Return: .csv, return side pressure for each node in a district heating or cooling network at
       each time step
     - DH_P_DeltaP or DC_P_DeltaP.csv, pressure drop over an entire district heating or cooling network at each time step
+    - time-windows/DH_* or time-windows/DC_*: .parquet, results of each time window and a checkpoint of the finished
+      time windows (to resume an interrupted calculation)
 
     .. [Todini & Pilati, 1987] Todini & Pilati. "A gradient method for the analysis of pipe networks," in Computer
        Applications in Water Supply Volume 1 - Systems Analysis and Simulation, 1987.
@@ -495,17 +505,15 @@ def thermal_network_main(locator, thermal_network, processes=1):
     thermal_network.pressure_loss_coeff = [a_p, b_p, c_p, d_p, e_p]
 
     print('Solving hydraulic and thermal network')
-    ## Start solving hydraulic and thermal equations at each time-step
-    nhours = (thermal_network.stop_t - thermal_network.start_t)
-
-    hourly_thermal_results = cea.utilities.parallel.vectorize(hourly_thermal_calculation, processes)(
-        range(thermal_network.start_t, thermal_network.stop_t),
-        repeat(thermal_network, nhours))
+    ## Start solving hydraulic and thermal equations at each time-step, in time windows that are saved as soon as they
+    ## are finished
+    windows = time_windows.calc_time_windows(thermal_network.start_t, thermal_network.stop_t,
+                                             thermal_network.time_window_hours)
+    solve_time_windows(windows, thermal_network, processes=processes)
 
     # save results of hourly values over full year, write to csv
     # edge flow rates (flow direction corresponding to edge_node_df)
-    csv_outputs = {field: [getattr(htr, field) for htr in hourly_thermal_results]
-                   for field in HourlyThermalResults._fields}
+    csv_outputs = time_windows.read_window_results(thermal_network, windows, HourlyThermalResults._fields)
     save_all_results_to_csv(csv_outputs, thermal_network)
 
     # identify all plants
@@ -546,6 +554,64 @@ def thermal_network_main(locator, thermal_network, processes=1):
                 print(key, thermal_network.problematic_edges[key])
 
 
+def solve_time_windows(windows, thermal_network, processes=1):
+    """
+    Run the thermal-hydraulic calculation of the time windows ``windows`` (a list of (start, stop) hours) that are not
+    finished yet, saving the results of each time window as soon as it is finished.
+
+    The time windows are calculated in rounds of one time window per process. The time windows of a round continue
+    from the state at the end of the time windows finished before (see
+    :py:mod:`cea.technologies.thermal_network.time_windows`), so with a single process the time windows are calculated
+    exactly as if all hours were calculated one after the other.
+    """
+    fingerprint = time_windows.calc_fingerprint(thermal_network, thermal_network.time_window_hours)
+    finished_windows = {}
+    if thermal_network.resume_from_checkpoint:
+        finished_windows = {window: state
+                            for window, state in time_windows.read_checkpoint(thermal_network, fingerprint).items()
+                            if window in windows}
+    if finished_windows:
+        print('Resuming from the checkpoint of an earlier run: %i of %i time windows are finished' % (
+            len(finished_windows), len(windows)))
+    else:
+        time_windows.remove_window_results(thermal_network)
+    time_windows.write_checkpoint(thermal_network, fingerprint, finished_windows)
+
+    initial_state = time_windows.get_state(thermal_network)
+    remaining_windows = [window for window in windows if window not in finished_windows]
+    while remaining_windows:
+        state = time_windows.merge_states([initial_state] + [finished_windows[w] for w in sorted(finished_windows)])
+        current_windows, remaining_windows = remaining_windows[:processes], remaining_windows[processes:]
+        window_states = cea.utilities.parallel.vectorize(window_thermal_calculation, processes,
+                                                         on_complete=record_finished_window)(
+            current_windows, repeat(state, len(current_windows)), repeat(thermal_network, len(current_windows)))
+        finished_windows.update(zip(current_windows, window_states))
+
+    time_windows.set_state(thermal_network, time_windows.merge_states(
+        [initial_state] + [finished_windows[w] for w in sorted(finished_windows)]))
+
+
+def window_thermal_calculation(window, state, thermal_network):
+    """
+    Run :py:func:`hourly_thermal_calculation` for each hour of the time window ``window`` (start, stop), continuing
+    from ``state``, and save the results of the time window.
+
+    :return: the state at the end of the time window
+    :rtype: cea.technologies.thermal_network.time_windows.TimeWindowState
+    """
+    time_windows.set_state(thermal_network, state)
+    hourly_thermal_results = [hourly_thermal_calculation(t, thermal_network) for t in range(*window)]
+    time_windows.write_window_results(thermal_network, window, hourly_thermal_results)
+    return time_windows.get_state(thermal_network)
+
+
+def record_finished_window(i, n, args, state):
+    """Record a finished time window in the checkpoint (called by ``vectorize`` in the main process)"""
+    window, _, thermal_network = args
+    time_windows.add_to_checkpoint(thermal_network, window, state)
+    print('Finished time window %i/%i: hours %i to %i' % (i + 1, n, window[0], window[1]))
+
+
 def calculate_pressure_loss_critical_path(dP_timestep, thermal_network):
     dP_all_edges = dP_timestep[0]
     plant_node = thermal_network.all_nodes_df[thermal_network.all_nodes_df['Type'] == 'PLANT'].index[0]
@@ -982,12 +1048,16 @@ def hourly_thermal_calculation(t, thermal_network):
 # ===========================
 
 def calc_mass_flow_edges(edge_node_df, mass_flow_substation_df, all_nodes_df, pipe_diameter_m, pipe_length_m,
-                         T_edge_K, find_loops):
+                         T_edge_K):
     """
     This function carries out the steady-state mass flow rate calculation for a predefined network with predefined mass
     flow rates at each substation based on the method from Todini et al. (1987), Ikonen et al. (2016), Oppelt et al.
     (2016), etc.
 
+    The sparse matrices of the network (and for tree networks their factorization) are computed once per network
+    topology (see :py:mod:`cea.technologies.thermal_network.network_hydraulics`). Tree networks are solved with the
+    mass balance at each node alone, looped networks with the global gradient algorithm of Todini & Pilati (1987).
+
     :param all_nodes_df: DataFrame containing all nodes and whether a node n is a consumer or plant node
                         (and if so, which building that node corresponds to), or neither.
     :param edge_node_df: DataFrame consisting of n rows (number of nodes) and e columns (number of edges)
@@ -1000,8 +1070,6 @@ def calc_mass_flow_edges(edge_node_df, mass_flow_substation_df, all_nodes_df, pi
     :param pipe_length_m: vector containing the length in m of each edge e in the network                (e x 1)
     :param T_edge_K: matrix containing the temperature of the water in each edge e at time t             (t x e)
 
-    :param find_loops: function that returns the loops in a thermal network
-
     :type all_nodes_df: DataFrame(t x n)
     :type edge_node_df: DataFrame
     :type mass_flow_substation_df: DataFrame
@@ -1021,119 +1089,76 @@ def calc_mass_flow_edges(edge_node_df, mass_flow_substation_df, all_nodes_df, pi
     .. [Oppelt, T., et al., 2016] Oppelt, T., et al. Dynamic thermo-hydraulic model of district cooling networks.
        Applied Thermal Engineering, 2016.
     """
-    edge_node_df = edge_node_df.copy()
-    loops, graph = find_loops(edge_node_df)  # identifies all linear independent loops
-    if loops:
-        # print('Fundamental loops in the network:', loops)  # returns nodes that define loop, useful for visiual
-        # verification in testing phase,
-
-        sum_delta_m_num = np.zeros((1, len(loops)))[0]
-
-        # if loops exist:
-        # 1. calculate initial guess solution of matrix A
-        # delete first plant on an edge of matrix and solution space b as these are redundant
-        A = edge_node_df.drop(edge_node_df.index[0], 0)  # solution matrix A without loop equations (kirchhoff 2)
-        b_init = np.nan_to_num(mass_flow_substation_df.drop(mass_flow_substation_df.columns[0], 1).transpose())
-        # solution vector b of node demands
-        mass_flow_edge = np.linalg.lstsq(A, b_init, rcond=-1)[0].transpose()[0]  # solve system
-
-        # setup iterations for implicit matrix solver
-        tolerance = 0.01  # tolerance for mass flow convergence
-        m_old = mass_flow_edge - mass_flow_edge  # initialize m_old vector
-
-        # begin iterations
-        iterations = 0
-        while (abs(mass_flow_edge - m_old) > tolerance).any():  # while difference of mass flow on any  edge > tolerance
-            m_old = np.array(mass_flow_edge)  # iterate over massflow
-
-            # calculate value similar to Hardy Cross correction factor
-            # uses Hardy Cross method but a different variation for calculating the mass flow
-            delta_m_num = calc_pressure_loss_pipe(pipe_diameter_m, pipe_length_m, m_old, T_edge_K,
-                                                  2) * np.sign(m_old)  # calculate pressure losses
-            delta_m_den = abs(calc_pressure_loss_pipe(pipe_diameter_m, pipe_length_m, m_old, T_edge_K,
-                                                      1))  # calculate derivatives of pressure losses
-            delta_m_num = delta_m_num.transpose()
-
-            sum_delta_m_num = np.zeros((1, len(loops)))[0]
-            sum_delta_m_den = np.zeros((1, len(loops)))[0]
-
-            for i in range(len(loops)):
-                # calculate the mass flow correction for each loop
-                # iterate over loops
-                # save the edge number connecting the nodes of the loops into the variable index
-                for j in range(len(loops[i])):
-                    if j == len(loops[i]) - 1:
-                        value = loops[i][0]
-                    else:
-                        value = loops[i][j + 1]
-                    index = graph.get_edge_data(loops[i][j], value)
-                    # check if nodes  defined in clockwise loop, to keep sign convention for Hardy Cross Method
-                    if not (edge_node_df.iloc[loops[i][j]][index['edge_number']] == 1) & \
-                           (edge_node_df.iloc[value][index['edge_number']] == -1):
-                        clockwise = -1
-                    else:
-                        clockwise = 1
-                    sum_delta_m_num[i] = sum_delta_m_num[i] + delta_m_num[index["edge_number"]] * clockwise
-                    sum_delta_m_den[i] = sum_delta_m_den[i] + delta_m_den[index["edge_number"]]
-                # calculate flow correction for each loop
-                if np.isclose(sum_delta_m_den[i], 0):
-                    delta_m = 0
-                else:
-                    delta_m = -sum_delta_m_num[i] / sum_delta_m_den[i]
+    # remove one equation (at plant node) as the mass balances of all nodes are linearly dependent
+    plant_index = np.where(all_nodes_df['Type'] == 'PLANT')[0][0]  # find index of the first plant node
+    hydraulics, edge_signs = network_hydraulics.get_network_hydraulics(edge_node_df.values, plant_index)
+    b = np.delete(np.nan_to_num(np.asarray(mass_flow_substation_df, dtype=float)).ravel(), plant_index)
 
-                # apply mass flow correction to all edges of each loop
-                for j in range(len(loops[i])):
-                    if j == len(loops[i]) - 1:
-                        value = loops[i][0]
-                    else:
-                        value = loops[i][j + 1]
-                    index = graph.get_edge_data(loops[i][j], value)
-                    # check if nodes  defined in clockwise loop
-                    if not (edge_node_df.iloc[loops[i][j]][index['edge_number']] == 1) & \
-                           (edge_node_df.iloc[value][index['edge_number']] == -1):
-                        clockwise = -1
-                    else:
-                        clockwise = 1
-                    # apply loop correction
-                    mass_flow_edge[index["edge_number"]] = mass_flow_edge[index["edge_number"]] + delta_m * clockwise
-            iterations = iterations + 1
-
-            # adapt tolerance to reduce total amount of iterations
-            if iterations < 20:
-                tolerance = 0.01
-            elif iterations < 40:
-                tolerance = 0.02
-            elif iterations < 80:
-                tolerance = 0.04
-            else:
-                print('No convergence of looped massflows after ', iterations, ' iterations with a remaining '
-                                                                               'difference of',
-                      max(abs(mass_flow_edge - m_old)), '.')
-                break
-        # print('Looped massflows converged after ', iterations, ' iterations.')
-
-    else:  # no loops
-        # remove one equation (at plant node) to build a well-determined matrix, A.
-        plant_index = np.where(all_nodes_df['Type'] == 'PLANT')[0][0]  # find index of the first plant node
-        A = edge_node_df.drop(edge_node_df.index[plant_index])
-        b = np.nan_to_num(mass_flow_substation_df.T)
-        b = np.delete(b, plant_index)
-        mass_flow_edge = np.linalg.solve(A.values, b)
+    if hydraulics.is_tree:
+        mass_flow_edge = hydraulics.solve_tree(b)
+    else:
+        pipe_diameter_m = np.ravel(pipe_diameter_m).astype(float)
+        pipe_length_m = np.asarray(pipe_length_m, dtype=float)
+        # pressure loss of laminar flow per mass flow (Hagen-Poiseuille), used for edges with (almost) no flow
+        laminar_derivative = 128 * calc_kinematic_viscosity(T_edge_K) * pipe_length_m / (
+                math.pi * pipe_diameter_m ** 4)
+
+        def calc_pressure_losses(mass_flow_edge):
+            pressure_loss = calc_pressure_loss_pipe(pipe_diameter_m, pipe_length_m, mass_flow_edge, T_edge_K,
+                                                    2) * np.sign(mass_flow_edge)  # calculate pressure losses
+            derivative = abs(calc_pressure_loss_pipe(pipe_diameter_m, pipe_length_m, mass_flow_edge, T_edge_K,
+                                                     1))  # calculate derivatives of pressure losses
+            return pressure_loss, np.maximum(derivative, laminar_derivative)
+
+        mass_flow_edge, iterations, change, pressure_residual = hydraulics.solve_looped(
+            b, calc_pressure_losses, HYDRAULIC_TOLERANCE_KGS, MAX_HYDRAULIC_ITERATIONS)
+        if change > HYDRAULIC_TOLERANCE_KGS:
+            print('No convergence of looped massflows after ', iterations, ' iterations with a remaining difference of',
+                  change, '.')
+        if pressure_residual > MAX_LOOP_PRESSURE_RESIDUAL_PA:
+            print('Error in the defined mass flows, deviation of ', pressure_residual,
+                  ' from 0 pressure in loop. Most likely due to low edge flows within the loop.')
 
     # verify calculated solution
-    plant_index = np.where(all_nodes_df['Type'] == 'PLANT')[0][0]  # find index of the first plant node
-    A = edge_node_df.drop(edge_node_df.index[plant_index])
-    b_verification = A.dot(mass_flow_edge)
-    b_original = np.nan_to_num(mass_flow_substation_df.T)
-    b_original = np.delete(b_original, plant_index)
-    if max(abs(b_original - b_verification)) > 0.01:
-        print('Error in the defined mass flows, deviation of ', max(abs(b_original - b_verification)),
+    b_verification = hydraulics.incidence @ mass_flow_edge
+    if max(abs(b - b_verification)) > 0.01:
+        print('Error in the defined mass flows, deviation of ', max(abs(b - b_verification)),
               ' from node demands.')
-    if loops:
-        if (abs(sum_delta_m_num) > 15000).any():  # 5 kPa is sufficiently small
-            print('Error in the defined mass flows, deviation of ', max(abs(sum_delta_m_num)),
-                  ' from 0 pressure in loop. Most likely due to low edge flows within the loop.')
 
+    mass_flow_edge = mass_flow_edge * edge_signs  # flows in the directions of edge_node_df
+    mass_flow_edge = np.round(mass_flow_edge, decimals=5)
+    return mass_flow_edge
+
+
+def calc_mass_flow_edges_time_steps(edge_node_df, mass_flow_substation, all_nodes_df):
+    """
+    Calculates the mass flow rates in the edges of a tree network for many time steps at once. The edge mass flows of a
+    tree network are a linear function of the node mass flows, so they are obtained with a single sparse matrix product
+    of the path operator of the network (see :py:attr:`NetworkHydraulics.path_operator`) with the node mass flows of
+    all time steps.
+
+    :param edge_node_df: DataFrame consisting of n rows (number of nodes) and e columns (number of edges) indicating the
+                         direction of flow of each edge e at node n (see :py:func:`calc_mass_flow_edges`)   (n x e)
+    :param mass_flow_substation: mass flow rate at each node n at each time step t                            (t x n)
+    :param all_nodes_df: DataFrame containing all nodes and whether a node n is a consumer or plant node
+
+    :return mass_flow_edge: mass flow rate at each edge e at each time step t                                  (t x e)
+    :rtype mass_flow_edge: numpy.ndarray
+    """
+    plant_index = np.where(all_nodes_df['Type'] == 'PLANT')[0][0]  # find index of the first plant node
+    hydraulics, edge_signs = network_hydraulics.get_network_hydraulics(edge_node_df.values, plant_index)
+    if not hydraulics.is_tree:
+        raise ValueError('The mass flows of all time steps can only be calculated at once for networks without loops.')
+    b = np.delete(np.nan_to_num(np.asarray(mass_flow_substation, dtype=float)), plant_index, axis=1)
+
+    mass_flow_edge = (hydraulics.path_operator @ b.T).T
+
+    # verify calculated solution
+    deviation = abs(b - (hydraulics.incidence @ mass_flow_edge.T).T).max(initial=0.0)
+    if deviation > 0.01:
+        print('Error in the defined mass flows, deviation of ', deviation, ' from node demands.')
+
+    mass_flow_edge = mass_flow_edge * edge_signs  # flows in the directions of edge_node_df
     mass_flow_edge = np.round(mass_flow_edge, decimals=5)
     return mass_flow_edge
 
@@ -1548,24 +1573,22 @@ def calc_darcy(pipe_diameter_m, reynolds, pipe_roughness_m):
        Fundamentals of Heat and Mass Transfer. https://doi.org/10.1016/j.applthermaleng.2011.03.022
     """
 
-    darcy = np.zeros(reynolds.size)
+    reynolds = np.ravel(reynolds)
     # necessary to make sure pipe_diameter is 1D vector as input formats can vary
     if hasattr(pipe_diameter_m[0], '__len__'):
         pipe_diameter_m = pipe_diameter_m[0]
-    for rey in range(reynolds.size):
-        if reynolds[rey] <= 1:
-            darcy[rey] = 0
-        elif reynolds[rey] <= 2300:
-            # calculate the Darcy-Weisbach friction factor for laminar flow
-            darcy[rey] = 64 / reynolds[rey]
-        elif reynolds[rey] <= 5000:
-            # calculate the Darcy-Weisbach friction factor for transient flow (for pipe roughness of e/D=0.0002,
-            # @low reynolds numbers lines for smooth pipe nearl identical in Moody Diagram) so smooth pipe approximation used
-            darcy[rey] = 0.316 * reynolds[rey] ** -0.25
-        else:
+    pipe_diameter_m = np.asarray(pipe_diameter_m, dtype=float)[:reynolds.size]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        darcy = np.select(
+            [reynolds <= 1,
+             # calculate the Darcy-Weisbach friction factor for laminar flow
+             reynolds <= 2300,
+             # calculate the Darcy-Weisbach friction factor for transient flow (for pipe roughness of e/D=0.0002,
+             # @low reynolds numbers lines for smooth pipe nearl identical in Moody Diagram) so smooth pipe approximation used
+             reynolds <= 5000],
+            [0.0, 64 / reynolds, 0.316 * reynolds ** -0.25],
             # calculate the Darcy-Weisbach friction factor using the Swamee-Jain equation, applicable for Reynolds= 5000 - 10E8; pipe_roughness=10E-6 - 0.05
-            darcy[rey] = 1.325 * np.log(
-                pipe_roughness_m / (3.7 * pipe_diameter_m[rey]) + 5.74 / reynolds[rey] ** 0.9) ** (-2)
+            1.325 * np.log(pipe_roughness_m / (3.7 * pipe_diameter_m) + 5.74 / reynolds ** 0.9) ** (-2))
 
     return darcy
 
@@ -1696,19 +1719,27 @@ def calc_max_edge_flowrate(thermal_network, processes=1):
         print('\n Diameter iteration number ', iterations)
         diameter_guess_old = diameter_guess
 
-        # hourly_mass_flow_calculation
         time_step_slice = range(thermal_network.start_t, thermal_network.stop_t)
         nhours = thermal_network.stop_t - thermal_network.start_t
 
-        mass_flows = cea.utilities.parallel.vectorize(hourly_mass_flow_calculation, processes)(
-            time_step_slice,
-            repeat(diameter_guess, nhours),
-            repeat(thermal_network, nhours))
+        if not loops and thermal_network.batch_mass_flow_calculation:
+            # the edge mass flows of tree networks are calculated for all time steps at once
+            mass_flow_edges, mass_flow_nodes, thermal_demand = batch_mass_flow_calculation(
+                thermal_network, time_step_slice, diameter_guess, processes)
+        else:
+            # hourly_mass_flow_calculation
+            mass_flows = cea.utilities.parallel.vectorize(hourly_mass_flow_calculation, processes)(
+                time_step_slice,
+                repeat(diameter_guess, nhours),
+                repeat(thermal_network, nhours))
+            mass_flow_edges = [mfe[0] for mfe in mass_flows]
+            mass_flow_nodes = [mfe[1] for mfe in mass_flows]
+            thermal_demand = [mfe[2] for mfe in mass_flows]
 
         # write mass flows to the dataframes
-        thermal_network.edge_mass_flow_df.iloc[time_step_slice] = [mfe[0] for mfe in mass_flows]
-        thermal_network.node_mass_flow_df.iloc[time_step_slice] = [mfe[1] for mfe in mass_flows]
-        thermal_network.thermal_demand.iloc[time_step_slice] = [mfe[2] for mfe in mass_flows]
+        thermal_network.edge_mass_flow_df.iloc[time_step_slice] = mass_flow_edges
+        thermal_network.node_mass_flow_df.iloc[time_step_slice] = mass_flow_nodes
+        thermal_network.thermal_demand.iloc[time_step_slice] = thermal_demand
 
         # update diameter guess for iteration
         pipe_properties_df = assign_pipes_to_edges(thermal_network)
@@ -1822,21 +1853,7 @@ def hourly_mass_flow_calculation(t, diameter_guess, thermal_network):
 
     print('calculating mass flows in edges... time step', t)
 
-    if thermal_network.network_type == 'DH':
-        # set to the highest value in the network and assume no loss within the network
-        T_substation_supply_K = np.array(
-            [float(thermal_network.t_target_supply_C.iloc[t].max()) + 273.15] * len(
-                thermal_network.buildings_demands.keys())).reshape(
-            1, len(thermal_network.buildings_demands.keys()))  # in [K]
-    else:
-        # set to the highest value in the network and assume no loss within the network
-        T_substation_supply_K = np.array(
-            [float(thermal_network.t_target_supply_C.iloc[t].min()) + 273.15] * len(
-                thermal_network.buildings_demands.keys())).reshape(
-            1, len(thermal_network.buildings_demands.keys()))  # in [K]
-
-    T_substation_supply_K = pd.DataFrame(T_substation_supply_K,
-                                         columns=thermal_network.buildings_demands.keys(), index=['T_supply'])
+    T_substation_supply_K = calc_substation_supply_temperatures(thermal_network, t)
 
     min_edge_flow_flag = False
     if t not in thermal_network.delta_cap_mass_flow.keys():
@@ -1844,26 +1861,8 @@ def hourly_mass_flow_calculation(t, diameter_guess, thermal_network):
     iteration = 0
     reset_min_mass_flow_variables(thermal_network, t)
     while min_edge_flow_flag is False:  # too low edge mass flows
-        reset_min_mass_flow_variables(thermal_network, t)  # reset storage variables
-        # calculate substation flow rates and return temperatures
-        if thermal_network.network_type == 'DH' or (
-                thermal_network.network_type == 'DC' and math.isnan(T_substation_supply_K.values[0][0]) is False):
-            _, mdot_all, thermal_demand_for_t = substation_matrix.substation_return_model_main(thermal_network,
-                                                                                               T_substation_supply_K, t,
-                                                                                               thermal_network.building_names)
-        else:
-            mdot_all = pd.DataFrame(data=np.zeros(len(thermal_network.buildings_demands.keys())),
-                                    index=thermal_network.buildings_demands.keys()).T
-            for key in thermal_network.substation_heating_systems:
-                key = 'hs_' + key
-                thermal_network.ch_value[key][t] = 0
-            for key in thermal_network.substation_cooling_systems:
-                key = 'cs_' + key
-                thermal_network.cc_value[key][t] = 0
-            thermal_demand_for_t = np.zeros(len(thermal_network.building_names))
-        # write consumer substation required flow rate to nodes
-        required_flow_rate_df = write_substation_values_to_nodes_df(thermal_network.all_nodes_df, mdot_all)
-        # (1 x n)
+        required_flow_rate_df, thermal_demand_for_t = calc_substation_mass_flows(thermal_network,
+                                                                                 T_substation_supply_K, t)
 
         # initial guess temperature
         T_edge_K_initial = np.array([T_substation_supply_K.values[0][0]] * thermal_network.edge_node_df.shape[1])
@@ -1872,8 +1871,7 @@ def hourly_mass_flow_calculation(t, diameter_guess, thermal_network):
             # solve mass flow rates on edges
             mass_flow_edges_for_t = calc_mass_flow_edges(thermal_network.edge_node_df.copy(), required_flow_rate_df,
                                                          thermal_network.all_nodes_df, diameter_guess,
-                                                         thermal_network.edge_df['pipe length'], T_edge_K_initial,
-                                                         thermal_network.find_loops)
+                                                         thermal_network.edge_df['pipe length'], T_edge_K_initial)
         else:
             mass_flow_edges_for_t = np.zeros(len(thermal_network.edge_node_df.columns))
 
@@ -1886,6 +1884,181 @@ def hourly_mass_flow_calculation(t, diameter_guess, thermal_network):
     return mass_flow_edges_for_t, mass_flow_nodes_for_t, thermal_demand_for_t
 
 
+def batch_substation_mass_flow_calculation(thermal_network, time_steps):
+    """
+    This function calculates the node mass flows of the hours ``time_steps`` (the first pass of the minimum mass flow
+    iteration of :py:func:`hourly_mass_flow_calculation` of each hour), with the substations of all buildings and hours
+    calculated at once.
+
+    :param ThermalNetwork thermal_network: object holding all the information about the thermal network
+    :param time_steps: the time steps to calculate
+
+    :return: the node mass flows (t x n) and the thermal demand of each building (t x b)
+    :rtype: tuple[ndarray, ndarray]
+    """
+
+    print('calculating mass flows in substations of all time steps...')
+
+    time_steps = list(time_steps)
+    for t in time_steps:
+        if t not in thermal_network.delta_cap_mass_flow.keys():
+            thermal_network.delta_cap_mass_flow[t] = 0
+        reset_min_mass_flow_variables(thermal_network, t)  # reset storage variables
+
+    # set to the highest (DH) or lowest (DC) value in the network and assume no loss within the network
+    if thermal_network.network_type == 'DH':
+        T_substation_supply_K = thermal_network.t_target_supply_C.iloc[time_steps].max(axis=1).values + 273.15
+        calculate = np.ones(len(time_steps), dtype=bool)
+    else:
+        T_substation_supply_K = thermal_network.t_target_supply_C.iloc[time_steps].min(axis=1).values + 273.15
+        calculate = ~np.isnan(T_substation_supply_K)
+
+    mdot_all_kgs = np.zeros((len(time_steps), len(thermal_network.building_names)))
+    thermal_demand = np.zeros((len(time_steps), len(thermal_network.building_names)))
+    if calculate.any():
+        # calculate substation flow rates
+        _, mcp_sub_kWK, thermal_demand_calculated = substation_matrix.calc_substation_return(
+            thermal_network, T_substation_supply_K[calculate, np.newaxis],
+            [t for t, c in zip(time_steps, calculate) if c], thermal_network.building_names)
+        mdot_all_kgs[calculate] = np.round(mcp_sub_kWK / (HEAT_CAPACITY_OF_WATER_JPERKGK / 1000), 5)
+        thermal_demand[calculate] = abs(thermal_demand_calculated)
+    for t in [t for t, c in zip(time_steps, calculate) if not c]:
+        for key in thermal_network.substation_heating_systems:
+            thermal_network.ch_value['hs_' + key][t] = 0
+        for key in thermal_network.substation_cooling_systems:
+            thermal_network.cc_value['cs_' + key][t] = 0
+
+    # write consumer substation required flow rate to nodes
+    mass_flow_nodes = write_substation_values_to_nodes(thermal_network.all_nodes_df, thermal_network.building_names,
+                                                       mdot_all_kgs)
+    return mass_flow_nodes, thermal_demand
+
+
+def calc_substation_supply_temperatures(thermal_network, t):
+    """
+    Supply temperature of all substations at time step t for sizing the network: the highest (DH) or lowest (DC)
+    target supply temperature of the buildings, assuming no losses within the network.
+    """
+    if thermal_network.network_type == 'DH':
+        # set to the highest value in the network and assume no loss within the network
+        T_substation_supply_K = np.array(
+            [float(thermal_network.t_target_supply_C.iloc[t].max()) + 273.15] * len(
+                thermal_network.buildings_demands.keys())).reshape(
+            1, len(thermal_network.buildings_demands.keys()))  # in [K]
+    else:
+        # set to the highest value in the network and assume no loss within the network
+        T_substation_supply_K = np.array(
+            [float(thermal_network.t_target_supply_C.iloc[t].min()) + 273.15] * len(
+                thermal_network.buildings_demands.keys())).reshape(
+            1, len(thermal_network.buildings_demands.keys()))  # in [K]
+
+    T_substation_supply_K = pd.DataFrame(T_substation_supply_K,
+                                         columns=thermal_network.buildings_demands.keys(), index=['T_supply'])
+    return T_substation_supply_K
+
+
+def calc_substation_mass_flows(thermal_network, T_substation_supply_K, t):
+    """
+    Calculates the mass flows required by the substations at time step t, written to the nodes of the network.
+
+    :return: the mass flow at each node (1 x n) and the thermal demand of each building
+    :rtype: tuple[DataFrame, ndarray]
+    """
+    reset_min_mass_flow_variables(thermal_network, t)  # reset storage variables
+    # calculate substation flow rates and return temperatures
+    if thermal_network.network_type == 'DH' or (
+            thermal_network.network_type == 'DC' and math.isnan(T_substation_supply_K.values[0][0]) is False):
+        _, mdot_all, thermal_demand_for_t = substation_matrix.substation_return_model_main(thermal_network,
+                                                                                           T_substation_supply_K, t,
+                                                                                           thermal_network.building_names)
+    else:
+        mdot_all = pd.DataFrame(data=np.zeros(len(thermal_network.buildings_demands.keys())),
+                                index=thermal_network.buildings_demands.keys()).T
+        for key in thermal_network.substation_heating_systems:
+            key = 'hs_' + key
+            thermal_network.ch_value[key][t] = 0
+        for key in thermal_network.substation_cooling_systems:
+            key = 'cs_' + key
+            thermal_network.cc_value[key][t] = 0
+        thermal_demand_for_t = np.zeros(len(thermal_network.building_names))
+    # write consumer substation required flow rate to nodes
+    required_flow_rate_df = write_substation_values_to_nodes_df(thermal_network.all_nodes_df, mdot_all)
+    # (1 x n)
+    return required_flow_rate_df, thermal_demand_for_t
+
+
+def batch_mass_flow_calculation(thermal_network, time_step_slice, diameter_guess, processes=1):
+    """
+    Calculates the edge mass flows and node mass flows of all hours of a tree network at once: the node mass flows with
+    the substations of all hours (:py:func:`batch_substation_mass_flow_calculation`) and the edge mass flows of all
+    hours with a single matrix product (:py:func:`calc_mass_flow_edges_time_steps`). Only the hours with too low edge
+    mass flows go through the minimum mass flow iteration of :py:func:`hourly_mass_flow_calculation`, so the results
+    are the same as with :py:func:`hourly_mass_flow_calculation` for each hour.
+
+    :param ThermalNetwork thermal_network: object holding all the information about the thermal network
+    :param time_step_slice: the time steps to calculate
+    :param diameter_guess: Pipe diameter values
+    :param int processes: number of processes to use for the hourly calculations
+
+    :return: the edge mass flows (t x e), node mass flows (t x n) and thermal demand of each building (t x b)
+    :rtype: tuple[ndarray, ndarray, ndarray]
+    """
+    mass_flow_nodes, thermal_demand = batch_substation_mass_flow_calculation(thermal_network, time_step_slice)
+
+    print('calculating mass flows in edges of all time steps...')
+    mass_flow_edges = calc_mass_flow_edges_time_steps(thermal_network.edge_node_df, mass_flow_nodes,
+                                                      thermal_network.all_nodes_df)
+
+    # repeat the hours with too low edge mass flows with the minimum mass flow iteration
+    low_flow_rows = np.where(find_low_edge_mass_flows(thermal_network, mass_flow_edges))[0]
+    if len(low_flow_rows):
+        low_flow_time_steps = [time_step_slice[row] for row in low_flow_rows]
+        for t in low_flow_time_steps:
+            discard_min_mass_flow_variables(thermal_network, t)
+        mass_flows = cea.utilities.parallel.vectorize(hourly_mass_flow_calculation, processes)(
+            low_flow_time_steps,
+            repeat(diameter_guess, len(low_flow_time_steps)),
+            repeat(thermal_network, len(low_flow_time_steps)))
+        mass_flow_edges[low_flow_rows] = [mfe[0] for mfe in mass_flows]
+        mass_flow_nodes[low_flow_rows] = [mfe[1] for mfe in mass_flows]
+        thermal_demand[low_flow_rows] = [mfe[2] for mfe in mass_flows]
+
+    return mass_flow_edges, mass_flow_nodes, thermal_demand
+
+
+def find_low_edge_mass_flows(thermal_network, edge_mass_flows):
+    """
+    Find the time steps with edge mass flows below the minimum edge mass flow (the condition of
+    :py:func:`edge_mass_flow_iteration`, without changing the state of the minimum mass flow iteration).
+
+    :param edge_mass_flows: edge mass flows of each time step (t x e)
+    :return: True for the time steps that need the minimum mass flow iteration (t)
+    :rtype: ndarray
+    """
+    return calc_low_edge_mass_flows(thermal_network, edge_mass_flows).any(axis=1)
+
+
+def calc_low_edge_mass_flows(thermal_network, edge_mass_flows):
+    """
+    Find the edges with mass flows below the minimum edge mass flow (with some tolerance), leaving out the edges without
+    mass flows (zero or NaN).
+
+    :param edge_mass_flows: edge mass flows (an array of any shape)
+    :return: True for the edges with too low mass flows (same shape as ``edge_mass_flows``)
+    :rtype: ndarray
+    """
+    pipe_min_mass_flow = calc_pipe_min_mass_flow(thermal_network)
+    test_edge_flow = np.abs(np.asarray(edge_mass_flows, dtype=float))
+    return ~np.isclose(test_edge_flow, 0) & (test_edge_flow - pipe_min_mass_flow < -pipe_min_mass_flow / 2)
+
+
+def calc_pipe_min_mass_flow(thermal_network):
+    """Minimum acceptable edge mass flow of the minimum mass flow iteration"""
+    if thermal_network.no_convergence_flag:
+        return thermal_network.minimum_edge_mass_flow / 2  # there are problems with convergence so reduce the minimum edge mass flow
+    return thermal_network.minimum_edge_mass_flow  # minimum acceptable mass flow defined in our constants file
+
+
 def edge_mass_flow_iteration(thermal_network, edge_mass_flow_df, iteration_counter, t):
     """
 
@@ -1894,10 +2067,7 @@ def edge_mass_flow_iteration(thermal_network, edge_mass_flow_df, iteration_count
 
     :return:
     """
-    if thermal_network.no_convergence_flag:
-        pipe_min_mass_flow = thermal_network.minimum_edge_mass_flow / 2  # there are problems with convergence so reduce the minimum edge mass flow
-    else:
-        pipe_min_mass_flow = thermal_network.minimum_edge_mass_flow  # minimum acceptable mass flow defined in our constants file
+    pipe_min_mass_flow = calc_pipe_min_mass_flow(thermal_network)
     if isinstance(edge_mass_flow_df, pd.DataFrame):  # make sure we have a pd Dataframe
         test_edge_flow = edge_mass_flow_df
     else:
@@ -1906,10 +2076,10 @@ def edge_mass_flow_iteration(thermal_network, edge_mass_flow_df, iteration_count
     test_edge_flow[
         np.isclose(test_edge_flow,
                    0)] = np.nan  # remove zero values as we are only interested in edges which have mass flows
+    low_edge_flows = calc_low_edge_mass_flows(thermal_network, test_edge_flow.values)
     if np.isnan(test_edge_flow).values.all():
         min_edge_flow_flag = True  # no mass flows
-    elif (
-            test_edge_flow - pipe_min_mass_flow < -pipe_min_mass_flow / 2).values.any():  # some edges have too low mass flows, 0.01 is tolerance
+    elif low_edge_flows.any():  # some edges have too low mass flows
         if iteration_counter < int(
                 thermal_network.minimum_mass_flow_iteration_limit / 5):  # identify buildings connected to edges with low mass flows, but only within the first iteration steps
             # read in all nodes file
@@ -1919,7 +2089,7 @@ def edge_mass_flow_iteration(thermal_network, edge_mass_flow_df, iteration_count
                                                                                     thermal_network.network_name))[
                     'Building']
             # identify which edges
-            edges = np.where((test_edge_flow - pipe_min_mass_flow < -pipe_min_mass_flow / 2).values)[1]
+            edges = np.where(low_edge_flows)[1]
             if len(edges) < len(
                     thermal_network.building_names) / 2:  # time intensive calculation. Only worth it if only isolated edges have low mass flows
                 # identify which nodes, pass these on
@@ -2120,7 +2290,7 @@ def initial_diameter_guess(thermal_network):
                         calc_mass_flow_edges(thermal_network_reduced.edge_node_df.copy(), required_flow_rate_df,
                                              thermal_network_reduced.all_nodes_df,
                                              diameter_guess, thermal_network_reduced.edge_df['pipe length'].values,
-                                             T_edge_initial_K, thermal_network_reduced.find_loops)]
+                                             T_edge_initial_K)]
                     thermal_network_reduced.node_mass_flow_df[:][t:t + 1] = required_flow_rate_df.values
 
                 iteration, \
@@ -2269,8 +2439,7 @@ def solve_network_temperatures(thermal_network, t):
                                                                thermal_network.pipe_properties[:][
                                                                'D_int_m':'D_int_m'].values[0],
                                                                thermal_network.edge_df['pipe length'],
-                                                               t_edge__k,
-                                                               thermal_network.find_loops)
+                                                               t_edge__k)
 
                 # make sure all mass flows are positive and edge node matrix is updated
                 edge_mass_flow_df_2_kgs, \
@@ -2321,8 +2490,7 @@ def solve_network_temperatures(thermal_network, t):
                                                                        thermal_network.pipe_properties[:][
                                                                        'D_int_m':'D_int_m'].values[0],
                                                                        thermal_network.edge_df['pipe length'],
-                                                                       t_edge__k,
-                                                                       thermal_network.find_loops)
+                                                                       t_edge__k)
                         VF_iter = VF_iter + 1
                     elif dt_nodes_max >= dt_tolerance and VF_iter >= 10:
                         for node in nodes_insufficient:
@@ -2466,6 +2634,21 @@ def reset_min_mass_flow_variables(thermal_network, t):
     thermal_network.nodes[t] = []
 
 
+def discard_min_mass_flow_variables(thermal_network, t):
+    '''
+    This function removes the values stored for the minimum mass flow iteration of time step t, so the iteration starts
+    over for that time step
+    :param thermal_network:
+    :return:
+    '''
+    thermal_network.delta_cap_mass_flow.pop(t, None)
+    thermal_network.nodes.pop(t, None)
+    for storage in (thermal_network.cc_old, thermal_network.cc_value, thermal_network.ch_old,
+                    thermal_network.ch_value):
+        for values in storage.values():
+            values.pop(t, None)
+
+
 def calc_plant_heat_requirement(plant_node, t_supply_nodes, t_return_nodes, mass_flow_substations_nodes_df):
     """
     calculate plant heat requirements according to plant supply/return temperatures and flow rate
@@ -2519,6 +2702,10 @@ def calc_supply_temperatures(t, edge_node_df, mass_flow_df, k, thermal_network):
     the node temperature at the corresponding pipe outlet, and the calculation goes on until all the node temperatures
     are solved. At nodes connecting to multiple pipes, the mixing temperature is calculated.
 
+    Unless the water circulates around a loop, the nodes are solved in a single pass in the order of the flows (see
+    :py:mod:`cea.technologies.thermal_network.network_temperatures`), otherwise the node temperatures are iterated
+    (see :py:func:`iterate_supply_temperatures`).
+
     :param edge_node_df: DataFrame consisting of n rows (number of nodes) and e columns (number of edges)
                         and indicating the direction of flow of each edge e at node n: if e points to n,
                         value is 1; if e leaves node n, -1; else, 0. E.g. a plant will only have exiting flows,
@@ -2540,18 +2727,9 @@ def calc_supply_temperatures(t, edge_node_df, mass_flow_df, k, thermal_network):
     all_nodes_df = thermal_network.all_nodes_df
     ##
 
-    z = np.asarray(edge_node_df.copy())  # (nxe) edge-node matrix
-    z_pipe_out = z.clip(min=0)  # pipe outlet matrix
-    z_pipe_in = z.clip(max=0)  # pipe inlet matrix
-
-    m_d = np.zeros((z.shape[1], z.shape[1]))  # (exe) pipe mass flow rate matrix
-    np.fill_diagonal(m_d, mass_flow_df)
-
-    # matrices to store results
-    t_e_out = z_pipe_out.copy()
-    t_e_in = z_pipe_in.copy().dot(-1)
-    t_node = np.zeros(z.shape[0])
-    z_note = z.copy()  # matrix to store information of solved nodes
+    mass_flow_edge = np.ravel(np.asarray(mass_flow_df, dtype=float))  # (1xe) pipe mass flow rates
+    plants = (all_nodes_df['Type'] == 'PLANT').values
+    flow_order = network_temperatures.get_supply_flow_order(edge_node_df.values, mass_flow_edge, plants)
 
     # start node temperature calculation
     flag = 0
@@ -2564,95 +2742,13 @@ def calc_supply_temperatures(t, edge_node_df, mass_flow_df, k, thermal_network):
     t_plant_sup = t_plant_sup_0
     iteration = 0
     while flag == 0:
-        # not_stuck variable is necessary because of looped networks. Here it is possible that we have only a closed
-        # loop remaining and no obvious place to start. In this case, iteration with an initial value is necessary
-        not_stuck = np.array([True] * z.shape[0])
-        # count number of iterations
-        temp_iter = 0
-        # tolerance for convergence of temperature
-        temp_tolerance = 1
-        # initialize delta to some value above the tolerance
-        delta_temp_0 = 2
-        # iterate over temperatures for loop networks
-        while delta_temp_0 >= temp_tolerance:
-            t_e_out_old = np.array(t_e_out)
-
-            # reset_matrixes
-            z_note = z.copy()
-            t_e_out = z_pipe_out.copy()
-            t_e_in = z_pipe_in.copy().dot(-1)
-            t_node = np.zeros(z.shape[0])
-
-            # # calculate the pipe outlet temperature from the plant node
-            for i in range(z.shape[0]):
-                if all_nodes_df.iloc[i]['Type'] == 'PLANT':  # find plant node
-                    # write plant inlet temperature
-                    t_node[i] = t_plant_sup  # assume plant inlet temperature
-                    edge = np.where(t_e_in[i] != 0)[0]  # find edge index
-                    t_e_in[i] = t_e_in[i] * t_node[i]
-                    # calculate pipe outlet temperature
-                    calc_t_out(i, edge, k, m_d, z, t_e_in, t_e_out, t_ground__k, z_note, thermal_network)
-            plant_node = t_node.nonzero()[0]  # the node indices of the plant nodes in the edge-node index
-
-            # Identify all nodes with no in or outflows and delete those values from the z matrixes
-            # This is necessary to avoid getting stuck in a loop network with no mass flows inside the loop
-            for i in range(z_note.shape[0]):
-                if np.isclose(sum(np.dot(m_d, z_pipe_out[i])), 0.0) and np.isclose(sum(np.dot(m_d, z_pipe_in[i])), 0.0):
-                    t_node[i] = np.nan
-                    # no in our outflows, clear in and outflows at this node
-                    # and clear node incoming flows from the corresponding edges
-                    outflowing_edges = [a for a, x in enumerate(z_note[i]) if np.isclose(x, 1.0)]
-                    if outflowing_edges:
-                        for edge in outflowing_edges:  # delete values where we were supposed to flow to
-                            target_node = np.where(z_note[:, edge] == -1)[0]
-                            z_note[target_node, edge] = 0.0
-                            z_pipe_in[target_node, edge] = 0.0
-                            t_e_in[target_node, edge] = 0.0
-                    outflowing_edges = [a for a, x in enumerate(z_note[i]) if np.isclose(x, -1.0)]
-                    if outflowing_edges:
-                        for edge in outflowing_edges:  # delete values where we were supposed to flow to
-                            target_node = np.where(z_note[:, edge] == 1)[0]
-                            z_note[target_node, edge] = 0.0
-                            z_pipe_out[target_node, edge] = 0.0
-                            t_e_out[target_node, edge] = 0.0
-                    target_edges = [a for a, x in enumerate(z_note[i]) if not np.isclose(x, 0.0)]
-                    if target_edges:
-                        for target_edge in target_edges:
-                            z_note[i, target_edge] = 0.0
-                            z_pipe_in[i, target_edge] = 0.0
-                            z_pipe_out[i, target_edge] = 0.0
-                            t_e_in[i, target_edge] = 0.0
-                            t_e_out[i, target_edge] = 0.0
-
-            # # calculate pipe outlet temperature and node temperature for the rest
-            while np.count_nonzero(np.isclose(t_node, 0)) > 0:
-                if not_stuck.any():  # if there are no changes for all elements but we have not yet solved the system
-                    z, z_note, m_d, t_e_out, z_pipe_out, t_node, t_e_in, t_ground__k, not_stuck = calculate_outflow_temp(
-                        z,
-                        z_note,
-                        m_d,
-                        t_e_out,
-                        z_pipe_out,
-                        t_node,
-                        t_e_in,
-                        t_ground__k,
-                        not_stuck,
-                        k, thermal_network)
-                else:  # stuck! this can happen with loops
-                    for i in range(np.shape(t_e_out)[1]):
-                        # check if we have a mass flow on this edge
-                        if np.any(t_e_out[:, i] == 1):
-                            z_note[np.where(t_e_out[:, i] == 1), i] = 0  # remove inflow value from z_note
-                            if temp_iter < 1:  # do this in first iteration only, since there is no previous value
-                                t_e_out[np.where(t_e_out[:, i] == 1), i] = t_node[
-                                    t_node.nonzero()].mean()  # assume some node temperature
-                            else:
-                                t_e_out[np.where(t_e_out[:, i] == 1), i] = t_e_out_old[np.where(t_e_out[:, i] == 1), i]
-                            break
-                    not_stuck = np.array([True] * z.shape[0])
-
-            delta_temp_0 = np.max(abs(t_e_out_old - t_e_out))  # exit condition
-            temp_iter = temp_iter + 1
+        if flow_order is not None:
+            t_node, t_edge_in, t_edge_out = network_temperatures.solve_supply_temperatures(
+                flow_order, t_plant_sup, mass_flow_edge, k, t_ground__k, thermal_network)
+            plant_node = np.where(plants)[0]  # the node indices of the plant nodes in the edge-node index
+        else:
+            t_node, plant_node, t_edge_in, t_edge_out = iterate_supply_temperatures(
+                t_plant_sup, np.asarray(edge_node_df), mass_flow_edge, k, t_ground__k, all_nodes_df, thermal_network)
 
         # set maximum/minimum allowable plant supply temperatures
         t_boiling_K = 100 + 273.15
@@ -2673,12 +2769,6 @@ def calc_supply_temperatures(t, edge_node_df, mass_flow_df, k, thermal_network):
                     # increase by the maximum amount of temperature deficit at nodes
                     t_plant_sup = t_plant_sup + abs(d_t.min())
                     # check if this term is positive, looping causes t_e_out to sink instead of rise.
-
-                    # reset the matrices for supply network temperature calculation
-                    z_note = z.copy()
-                    t_e_out = z_pipe_out.copy()
-                    t_e_in = z_pipe_in.copy().dot(-1)
-                    t_node = np.zeros(z.shape[0])
                     iteration += 1
 
                 elif all(d_t > -0.1) is False and iteration > 30:
@@ -2707,10 +2797,6 @@ def calc_supply_temperatures(t, edge_node_df, mass_flow_df, k, thermal_network):
                     # increase plant supply temperature and re-iterate the node supply temperature calculation
                     # increase by the maximum amount of temperature deficit at nodes
                     t_plant_sup = t_plant_sup - abs(d_t.max())
-                    z_note = z.copy()
-                    t_e_out = z_pipe_out.copy()
-                    t_e_in = z_pipe_in.copy().dot(-1)
-                    t_node = np.zeros(z.shape[0])
                     iteration += 1
                 elif all(d_t < 0.1) is False and iteration > 30:
                     # end iteration if too many iterations
@@ -2737,15 +2823,122 @@ def calc_supply_temperatures(t, edge_node_df, mass_flow_df, k, thermal_network):
                 print('switched control: ', thermal_network.temperature_control, ' temperature:', t_plant_sup)
 
     # calculate pipe heat losses
-    q_loss_edges_kw = np.zeros(z_note.shape[1])
-    for edge in range(z_note.shape[1]):
-        if m_d[edge, edge] > 0:
-            dT_edge = np.nanmax(t_e_in[:, edge]) - np.nanmax(t_e_out[:, edge])
-            q_loss_edges_kw[edge] = m_d[edge, edge] * HEAT_CAPACITY_OF_WATER_JPERKGK / 1000 * dT_edge  # kW
+    q_loss_edges_kw = network_temperatures.calc_edge_heat_losses(mass_flow_edge, t_edge_in, t_edge_out)  # kW
 
     return t_node.T, plant_node, q_loss_edges_kw, switch_control
 
 
+def iterate_supply_temperatures(t_plant_sup, z, m_d, k, t_ground__k, all_nodes_df, thermal_network):
+    """
+    Calculate the node temperatures of the supply network for the plant supply temperature ``t_plant_sup`` by searching
+    for the nodes whose inflows are all known, iterating over the pipe outlet temperatures when the water circulates
+    around a loop (see :py:func:`calc_supply_temperatures`).
+
+    :param z: edge-node matrix (n x e)
+    :param m_d: pipe mass flow rates (1 x e)
+    :param k: aggregated heat conduction coefficient for each pipe (1 x e)
+    :return: the node temperatures (n), the indices of the plant nodes and the inlet and outlet temperature of each
+        pipe (e)
+    """
+    z_pipe_out = z.clip(min=0)  # pipe outlet matrix
+    z_pipe_in = z.clip(max=0)  # pipe inlet matrix
+
+    # matrices to store results
+    t_e_out = z_pipe_out.copy()
+
+    # not_stuck variable is necessary because of looped networks. Here it is possible that we have only a closed
+    # loop remaining and no obvious place to start. In this case, iteration with an initial value is necessary
+    not_stuck = np.array([True] * z.shape[0])
+    # count number of iterations
+    temp_iter = 0
+    # tolerance for convergence of temperature
+    temp_tolerance = 1
+    # initialize delta to some value above the tolerance
+    delta_temp_0 = 2
+    # iterate over temperatures for loop networks
+    while delta_temp_0 >= temp_tolerance:
+        t_e_out_old = np.array(t_e_out)
+
+        # reset_matrixes
+        z_note = z.copy()
+        t_e_out = z_pipe_out.copy()
+        t_e_in = z_pipe_in.copy().dot(-1)
+        t_node = np.zeros(z.shape[0])
+
+        # # calculate the pipe outlet temperature from the plant node
+        for i in range(z.shape[0]):
+            if all_nodes_df.iloc[i]['Type'] == 'PLANT':  # find plant node
+                # write plant inlet temperature
+                t_node[i] = t_plant_sup  # assume plant inlet temperature
+                edge = np.where(t_e_in[i] != 0)[0]  # find edge index
+                t_e_in[i] = t_e_in[i] * t_node[i]
+                # calculate pipe outlet temperature
+                calc_t_out(i, edge, k, m_d, z, t_e_in, t_e_out, t_ground__k, z_note, thermal_network)
+        plant_node = t_node.nonzero()[0]  # the node indices of the plant nodes in the edge-node index
+
+        # Identify all nodes with no in or outflows and delete those values from the z matrixes
+        # This is necessary to avoid getting stuck in a loop network with no mass flows inside the loop
+        for i in range(z_note.shape[0]):
+            if np.isclose(sum(m_d * z_pipe_out[i]), 0.0) and np.isclose(sum(m_d * z_pipe_in[i]), 0.0):
+                t_node[i] = np.nan
+                # no in our outflows, clear in and outflows at this node
+                # and clear node incoming flows from the corresponding edges
+                outflowing_edges = [a for a, x in enumerate(z_note[i]) if np.isclose(x, 1.0)]
+                if outflowing_edges:
+                    for edge in outflowing_edges:  # delete values where we were supposed to flow to
+                        target_node = np.where(z_note[:, edge] == -1)[0]
+                        z_note[target_node, edge] = 0.0
+                        z_pipe_in[target_node, edge] = 0.0
+                        t_e_in[target_node, edge] = 0.0
+                outflowing_edges = [a for a, x in enumerate(z_note[i]) if np.isclose(x, -1.0)]
+                if outflowing_edges:
+                    for edge in outflowing_edges:  # delete values where we were supposed to flow to
+                        target_node = np.where(z_note[:, edge] == 1)[0]
+                        z_note[target_node, edge] = 0.0
+                        z_pipe_out[target_node, edge] = 0.0
+                        t_e_out[target_node, edge] = 0.0
+                target_edges = [a for a, x in enumerate(z_note[i]) if not np.isclose(x, 0.0)]
+                if target_edges:
+                    for target_edge in target_edges:
+                        z_note[i, target_edge] = 0.0
+                        z_pipe_in[i, target_edge] = 0.0
+                        z_pipe_out[i, target_edge] = 0.0
+                        t_e_in[i, target_edge] = 0.0
+                        t_e_out[i, target_edge] = 0.0
+
+        # # calculate pipe outlet temperature and node temperature for the rest
+        while np.count_nonzero(np.isclose(t_node, 0)) > 0:
+            if not_stuck.any():  # if there are no changes for all elements but we have not yet solved the system
+                z, z_note, m_d, t_e_out, z_pipe_out, t_node, t_e_in, t_ground__k, not_stuck = calculate_outflow_temp(
+                    z,
+                    z_note,
+                    m_d,
+                    t_e_out,
+                    z_pipe_out,
+                    t_node,
+                    t_e_in,
+                    t_ground__k,
+                    not_stuck,
+                    k, thermal_network)
+            else:  # stuck! this can happen with loops
+                for i in range(np.shape(t_e_out)[1]):
+                    # check if we have a mass flow on this edge
+                    if np.any(t_e_out[:, i] == 1):
+                        z_note[np.where(t_e_out[:, i] == 1), i] = 0  # remove inflow value from z_note
+                        if temp_iter < 1:  # do this in first iteration only, since there is no previous value
+                            t_e_out[np.where(t_e_out[:, i] == 1), i] = t_node[
+                                t_node.nonzero()].mean()  # assume some node temperature
+                        else:
+                            t_e_out[np.where(t_e_out[:, i] == 1), i] = t_e_out_old[np.where(t_e_out[:, i] == 1), i]
+                        break
+                not_stuck = np.array([True] * z.shape[0])
+
+        delta_temp_0 = np.max(abs(t_e_out_old - t_e_out))  # exit condition
+        temp_iter = temp_iter + 1
+
+    return t_node, plant_node, np.nanmax(t_e_in, axis=0), np.nanmax(t_e_out, axis=0)
+
+
 def calculate_outflow_temp(z, z_note, m_d, t_e_out, z_pipe_out, t_node, t_e_in, t_ground_k, not_stuck, k,
                            thermal_network):
     """
@@ -2753,7 +2946,7 @@ def calculate_outflow_temp(z, z_note, m_d, t_e_out, z_pipe_out, t_node, t_e_in,
 
     :param z: copy of edge-node matrix (n x e)
     :param z_note: copy of z matrix (n x e)
-    :param m_d: pipe mass flow rate matrix (e x e)
+    :param m_d: pipe mass flow rates (1 x e)
     :param t_e_out: storage for outflow temperatures (n x e)
     :param z_pipe_out: matrix storing only outflow index (n x e)
     :param t_node: node temperature vector (n x 1)
@@ -2764,7 +2957,7 @@ def calculate_outflow_temp(z, z_note, m_d, t_e_out, z_pipe_out, t_node, t_e_in,
 
     :type z: dataframe (n x e)
     :type z_note: dataframe(n x e)
-    :type m_d: dataframe(e x e)
+    :type m_d: ndarray (1 x e)
     :type t_e_out: dataframe (n x e)
     :type z_pipe_out: dataframe (n x e)
     :type t_node: ndarray (n x 1)
@@ -2775,7 +2968,7 @@ def calculate_outflow_temp(z, z_note, m_d, t_e_out, z_pipe_out, t_node, t_e_in,
 
     :return z: copy of edge-node matrix (n x e)
     :return z_note: copy of z matrix (n x e)
-    :return m_d: pipe mass flow rate matrix (e x e)
+    :return m_d: pipe mass flow rates (1 x e)
     :return t_e_out: storage for outflow temperatures (n x e)
     :return z_pipe_out: matrix storing only outflow index (n x e)
     :return t_node: node temperature vector (n x 1)
@@ -2785,7 +2978,7 @@ def calculate_outflow_temp(z, z_note, m_d, t_e_out, z_pipe_out, t_node, t_e_in,
 
     :rtype z: dataframe (n x e)
     :rtype z_note: dataframe(n x e)
-    :rtype m_d: dataframe(e x e)
+    :rtype m_d: ndarray (1 x e)
     :rtype t_e_out: dataframe (n x e)
     :rtype z_pipe_out: dataframe (n x e)
     :rtype t_node: ndarray (n x 1)
@@ -2798,8 +2991,8 @@ def calculate_outflow_temp(z, z_note, m_d, t_e_out, z_pipe_out, t_node, t_e_in,
         # check if all inlet flow info towards node j are known (only -1 left in row Z_note[j])
         if np.count_nonzero(z_note[j] == 1) == 0 and np.count_nonzero(z_note[j] == 0) != z.shape[1]:
             # calculate node temperature with merging flows from pipes
-            part1 = np.dot(m_d, np.nan_to_num(t_e_out[j])).sum()  # sum of massflows entering node * Entry Temperature
-            part2 = np.dot(m_d, z_pipe_out[j]).sum()  # total massflow leaving node
+            part1 = (m_d * np.nan_to_num(t_e_out[j])).sum()  # sum of massflows entering node * Entry Temperature
+            part2 = (m_d * z_pipe_out[j]).sum()  # total massflow leaving node
             t_node[j] = part1 / part2
             if np.isnan(t_node[j]):
                 raise ValueError('There are no flow entering/existing node', j,
@@ -2836,6 +3029,9 @@ def calc_return_temperatures(t_ground, edge_node_df, mass_flow_df, mass_flow_sub
     calculates the node temperature at the corresponding pipe outlet, and the calculation goes on until all the node
     temperatures are solved. At nodes connecting to multiple pipes, the mixing temperature is calculated.
 
+    Unless the water circulates around a loop or flows back to more than one node, the nodes are solved in a single pass
+    in the order of the flows (see :py:mod:`cea.technologies.thermal_network.network_temperatures`).
+
     :param t_ground: vector with ground temperatures in K
     :param edge_node_df: DataFrame consisting of n rows (number of nodes) and e columns (number of edges)
                         and indicating the direction of flow of each edge e at node n: if e points to n,
@@ -2855,11 +3051,14 @@ def calc_return_temperatures(t_ground, edge_node_df, mass_flow_df, mass_flow_sub
     z_pipe_out = z.clip(min=0)  # pipe outlet matrix
     z_pipe_in = z.clip(max=0)  # pipe inlet matrix
 
-    m_sub = np.zeros((z.shape[0], z.shape[0]))  # (nxn) substation flow rate matrix
-    np.fill_diagonal(m_sub, mass_flow_substation_df)
+    m_d = np.ravel(np.asarray(mass_flow_df, dtype=float))  # (1xe) pipe mass flow rates
 
-    m_d = np.zeros((z.shape[1], z.shape[1]))  # (exe) pipe mass flow rate matrix
-    np.fill_diagonal(m_d, mass_flow_df)
+    flow_order = network_temperatures.get_return_flow_order(z, m_d, t_return.values[0])
+    if flow_order is not None:
+        t_node, t_e_in, t_e_out = network_temperatures.solve_return_temperatures(
+            flow_order, t_return.values[0], m_d, np.ravel(np.asarray(mass_flow_substation_df, dtype=float)), k,
+            t_ground, thermal_network)
+        return t_node, network_temperatures.calc_edge_heat_losses(m_d, t_e_in, t_e_out)
 
     # matrices to store results
     t_e_out = z_pipe_out.copy()
@@ -2882,13 +3081,12 @@ def calc_return_temperatures(t_ground, edge_node_df, mass_flow_df, mass_flow_sub
         t_e_out = z_pipe_out.copy()
         t_e_in = z_pipe_in.copy().dot(-1)
         t_node = np.zeros(z.shape[0])
-        m_sub = np.zeros((z.shape[0], z.shape[0]))  # (nxn) substation flow rate matrix
-        np.fill_diagonal(m_sub, mass_flow_substation_df)
+        m_sub = np.ravel(np.asarray(mass_flow_substation_df, dtype=float)).copy()  # (1xn) substation flow rates
 
         # Identify all nodes with no in or outflows and delete those values from the z matrixes
         # This is necessary to avoid getting stuck in a loop network with no mass flows inside the loop
         for i in range(z_note.shape[0]):
-            if np.isclose(sum(np.dot(m_d, z_pipe_out[i])), 0) and np.isclose(sum(np.dot(m_d, z_pipe_in[i])), 0):
+            if np.isclose(sum(m_d * z_pipe_out[i]), 0) and np.isclose(sum(m_d * z_pipe_in[i]), 0):
                 t_node[i] = np.nan
                 # no in our outflows, clear in and outflows at this node
                 # and clear node incoming flows from the corresponding edges
@@ -2971,11 +3169,8 @@ def calc_return_temperatures(t_ground, edge_node_df, mass_flow_df, mass_flow_sub
                                                               z_pipe_out, m_sub)
 
         # calculate pipe heat losses
-        q_loss_edges_kW = np.zeros(z_note.shape[1])
-        for edge in range(z_note.shape[1]):
-            if m_d[edge, edge] > 0:
-                dT_edge = np.nanmax(t_e_in[:, edge]) - np.nanmax(t_e_out[:, edge])
-                q_loss_edges_kW[edge] = m_d[edge, edge] * HEAT_CAPACITY_OF_WATER_JPERKGK / 1000 * dT_edge  # kW
+        q_loss_edges_kW = network_temperatures.calc_edge_heat_losses(m_d, np.nanmax(t_e_in, axis=0),
+                                                                     np.nanmax(t_e_out, axis=0))  # kW
 
         delta_temp_0 = np.max(abs(t_e_out_old - t_e_out))
         temp_iter = temp_iter + 1
@@ -2988,31 +3183,32 @@ def calc_return_node_temperature(index, m_d, t_e_out, t_return, z_pipe_out, m_su
     The function calculates the node temperature with merging flows from pipes in the return line.
 
     :param index: node index
-    :param m_d: pipe mass flow matrix (exe)
+    :param m_d: pipe mass flow rates (1xe)
     :param t_e_out: pipe outlet temperatures in edge node matrix (nxe)
     :param t_return: list of substation return temperatures
     :param z_pipe_out: pipe outlet matrix (nxe)
-    :param m_sub: DataFrame substation flow rate
+    :param m_sub: substation flow rates (1xn)
 
     :type index: floatT_return_all_2
-    :type m_d: DataFrame
+    :type m_d: ndarray
     :type t_e_out: DataFrame
     :type t_return: list
     :type z_pipe_out: DataFrame
-    :type m_sub: DataFrame
+    :type m_sub: ndarray
 
     :returns t_node: node temperature with merging flows in the return line
     :rtype t_node: float
 
     """
-    total_mass_flow_to_node = np.dot(m_d, z_pipe_out[index]).sum() + m_sub[index].max()
+    mass_flow_from_substation = max(m_sub[index], 0)
+    total_mass_flow_to_node = (m_d * z_pipe_out[index]).sum() + mass_flow_from_substation
     if np.isclose(total_mass_flow_to_node, 0):
         # set node temperature to nan if no flow to node
         t_node = np.nan
     else:
-        total_mcp_from_edges = np.dot(m_d, np.nan_to_num(t_e_out[index])).sum()
-        total_mcp_from_substations = 0 if np.isclose(m_sub[index].max(), 0) else np.dot(m_sub[index].max(),
-                                                                                        t_return.values[0, index])
+        total_mcp_from_edges = (m_d * np.nan_to_num(t_e_out[index])).sum()
+        total_mcp_from_substations = 0 if np.isclose(mass_flow_from_substation, 0) else \
+            mass_flow_from_substation * t_return.values[0, index]
         t_node = (total_mcp_from_edges + total_mcp_from_substations) / total_mass_flow_to_node
     return t_node
 
@@ -3024,8 +3220,8 @@ def calc_t_out(node, edge, k_old, m_d, z, t_e_in, t_e_out, t_ground, z_note, the
 
     :param node: node index
     :param edge: edge indices
-    :param k_old: DataFrame of aggregated heat conduction coefficient for each pipe (exe)
-    :param m_d: DataFrame of pipe flow rate (exe)
+    :param k_old: aggregated heat conduction coefficient for each pipe (1xe)
+    :param m_d: pipe flow rates (1xe)
     :param z: DataFrame of  edge_node_matrix (nxe)
     :param t_e_in: DataFrame of pipe inlet temperatures [K] in edge_node_matrix (nxe)
     :param t_e_out: DataFrame of  pipe outlet temperatures [K] in edge_node_matrix (nxe)
@@ -3035,7 +3231,7 @@ def calc_t_out(node, edge, k_old, m_d, z, t_e_in, t_e_out, t_ground, z_note, the
     :type node: float
     :type edge: np array
     :type k_old: [kW/K]
-    :type m_d: DataFrame
+    :type m_d: ndarray
     :type z: DataFrame
     :type t_e_in: DataFrame
     :type t_e_out: DataFrame
@@ -3051,12 +3247,10 @@ def calc_t_out(node, edge, k_old, m_d, z, t_e_in, t_e_out, t_ground, z_note, the
     if isinstance(edge, np.ndarray) is False:
         edge = np.array([edge])
 
-    m_d = np.round(m_d, decimals=5)  # round to avoid errors at very very low massflows
-
     for i in range(edge.size):
         e = edge[i]
-        k = k_old[e, e]
-        m = m_d[e, e]
+        k = k_old[e]
+        m = np.round(m_d[e], decimals=5)  # round to avoid errors at very very low massflows
         out_node_index = np.where(z[:, e] == 1)[0].max()
         if np.isclose(abs(m), 0) and np.isclose(z_note[node, e], -1):
             # set outlet temperature to nan if no flow is going out from node to connected edges
@@ -3167,7 +3361,7 @@ def calc_aggregated_heat_conduction_coefficient(mass_flow, edge_df, pipe_propert
         # calculate the aggregated heat conduction coefficient, equation (4) in Wang et al., 2016
         k = L_pipe[pipe] * (1 + extra_heat_transfer_coef) / (R_pipe + R_insulation + R_ground + R_conv) / 1000  # [kW/K]
         k_all.append(k)
-    k_all = abs(np.diag(k_all))
+    k_all = abs(np.array(k_all))
     return k_all
 
 
@@ -3324,6 +3518,31 @@ def extract_network_from_shapefile(edge_shapefile_df, node_shapefile_df):
     return node_shapefile_df, edge_shapefile_df
 
 
+def write_substation_values_to_nodes(all_nodes_df, building_names, values):
+    """
+    The function writes values (mass flows) of each substation to the corresponding nodes for many time steps at once,
+    like :py:func:`write_substation_values_to_nodes_df` does for one time step.
+
+    :param all_nodes_df: DataFrame containing all nodes and whether a node n is a consumer or plant node
+                        (and if so, which building that node corresponds to), or neither.                   (2 x n)
+    :param building_names: the buildings of the columns of ``values``                                      (b)
+    :param values: value of each substation at each time step                                               (t x b)
+
+    :return: values at each node at each time step                                                          (t x n)
+    :rtype: ndarray
+    """
+    column = {name: i for i, name in enumerate(building_names)}
+    consumers = (all_nodes_df['Type'] == 'CONSUMER').values
+    plants = (all_nodes_df['Type'] == 'PLANT').values
+    consumer_values = values[:, [column[name] for name in all_nodes_df.loc[consumers, 'Building']]]
+
+    # all plants supply the same share of the total demand of the network
+    nodes = np.zeros((len(values), len(all_nodes_df)))
+    nodes[:, consumers] = consumer_values
+    nodes[:, plants] = - (consumer_values.sum(axis=1) / plants.sum())[:, np.newaxis]
+    return nodes
+
+
 def write_substation_values_to_nodes_df(all_nodes_df, df_value):
     """
     The function writes values (temperatures or mass flows) from each substations to the corresponding nodes in the
@@ -3338,12 +3557,8 @@ def write_substation_values_to_nodes_df(all_nodes_df, df_value):
 
     """
 
-    nodes_df = pd.DataFrame(index=[0], columns=all_nodes_df.index)
     # it is assumed that if there is more than one plant, they all supply the same amount of heat at each time step
     # (i.e., the amount supplied by each plant is not optimized)
-    number_of_plants = sum(all_nodes_df['Type'] == 'PLANT')
-    consumer_list = all_nodes_df.loc[all_nodes_df['Type'] == 'CONSUMER', 'Building'].values
-    plant_mass_flow = df_value[consumer_list].loc[0].sum() / number_of_plants
 
     # write all flow rates into nodes DataFrame
     ''' NOTE:
@@ -3365,15 +3580,8 @@ def write_substation_values_to_nodes_df(all_nodes_df, df_value):
         '''
 
     # assure only mass flow at network consumer substations are counted
-    for node, row in all_nodes_df.iterrows():
-        if row['Type'] == 'CONSUMER':
-            nodes_df[node] = df_value[row['Building']]
-            if df_value[row['Building']].any() < 0:
-                print('Error, Building trying to be a plant!')
-        elif row['Type'] == 'PLANT':
-            nodes_df[node] = - plant_mass_flow
-        else:
-            nodes_df[node] = 0
+    nodes = write_substation_values_to_nodes(all_nodes_df, df_value.columns, df_value.loc[[0]].values.astype(float))
+    nodes_df = pd.DataFrame(nodes, index=[0], columns=all_nodes_df.index)
     return nodes_df
 
 
@@ -0,0 +1,222 @@
+"""
+Time windows of the thermal-hydraulic calculation of a thermal network.
+
+The hours of the calculation are split into time windows (e.g. a month each) that are calculated one after the other,
+or a few at once when running on several processes. The state carried from one hour to the next (the plant
+temperature control, which switches to constant temperature if the target temperatures can't be reached, and the
+edges with high thermal losses) is handed from each time window to the time windows started after it finished.
+
+The results of each time window are written to a parquet file as soon as the time window is finished, and a
+checkpoint file records the finished time windows and their states. An interrupted calculation is resumed from the
+checkpoint, as long as the inputs of the calculation (see :py:func:`calc_fingerprint`) did not change.
+"""
+
+import collections
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import cea
+
+__author__ = "Daren Thomas"
+__copyright__ = "Copyright 2024, Architecture and Building Systems - ETH Zurich"
+__credits__ = ["Daren Thomas"]
+__license__ = "MIT"
+__version__ = "0.1"
+__maintainer__ = "Daren Thomas"
+__email__ = "cea@arch.ethz.ch"
+__status__ = "Production"
+
+# increase this number whenever a change of the code changes the results of the hourly calculation or the format of
+# the results of the time windows, so that checkpoints of older versions are not resumed
+FINGERPRINT_VERSION = 1
+
+# the settings of the thermal network read by the hourly calculation (see :py:func:`calc_fingerprint`)
+FINGERPRINT_SETTINGS = ['network_type', 'network_name', 'start_t', 'stop_t', 'use_representative_week_per_month',
+                        'minimum_mass_flow_iteration_limit', 'minimum_edge_mass_flow', 'substation_heating_systems',
+                        'substation_cooling_systems', 'temperature_control', 'plant_supply_temperature',
+                        'equivalent_length_factor', 'pressure_loss_coeff']
+
+# the DataFrames of the thermal network read by the hourly calculation
+FINGERPRINT_FRAMES = ['edge_node_df', 'all_nodes_df', 'edge_df', 'pipe_properties', 'edge_mass_flow_df',
+                      'node_mass_flow_df', 't_target_supply_df', 'substations_HEX_specs']
+
+# the state handed from one time window to the next
+TimeWindowState = collections.namedtuple('TimeWindowState', ['temperature_control', 'problematic_edges'])
+
+
+def calc_time_windows(start_t, stop_t, window_hours):
+    """Split the hours ``start_t`` to ``stop_t`` into time windows of ``window_hours`` hours: a list of (start, stop)"""
+    window_hours = max(int(window_hours), 1)
+    return [(start, min(start + window_hours, stop_t)) for start in range(start_t, stop_t, window_hours)]
+
+
+def get_state(thermal_network):
+    """The current state of the calculation of ``thermal_network``"""
+    return TimeWindowState(thermal_network.temperature_control, dict(thermal_network.problematic_edges))
+
+
+def set_state(thermal_network, state):
+    """Continue the calculation of ``thermal_network`` from ``state``"""
+    thermal_network.temperature_control = state.temperature_control
+    thermal_network.problematic_edges = dict(state.problematic_edges)
+
+
+def merge_states(states):
+    """
+    Combine the states at the end of several time windows: the temperature control stays switched to constant
+    temperature once it was switched in any time window, and the smallest mass flow of each problematic edge is kept.
+
+    :param states: the states to combine, starting with the state the calculation started from
+    :rtype: TimeWindowState
+    """
+    temperature_control = states[0].temperature_control
+    problematic_edges = {}
+    for state in states:
+        if state.temperature_control == 'CT':
+            temperature_control = 'CT'
+        for edge, mass_flow in state.problematic_edges.items():
+            if edge not in problematic_edges or problematic_edges[edge] > mass_flow:
+                problematic_edges[edge] = mass_flow
+    return TimeWindowState(temperature_control, problematic_edges)
+
+
+def calc_fingerprint(thermal_network, window_hours):
+    """
+    Hash the inputs of the thermal-hydraulic calculation of each hour: the settings in :py:data:`FINGERPRINT_SETTINGS`,
+    the frames in :py:data:`FINGERPRINT_FRAMES` (the network, the pipes, the mass flows, the target temperatures and
+    the substation heat exchangers), the building demands, the ground temperature and the state the calculation starts
+    from, as well as the version of the calculation (:py:data:`FINGERPRINT_VERSION`) and the time windows.
+    """
+    h = hashlib.sha256()
+    settings = {name: getattr(thermal_network, name) for name in FINGERPRINT_SETTINGS}
+    settings['window_hours'] = window_hours
+    settings['version'] = [cea.__version__, FINGERPRINT_VERSION]
+    h.update(json.dumps(settings, sort_keys=True, default=float).encode())
+    for name in FINGERPRINT_FRAMES:
+        hash_frame(h, getattr(thermal_network, name))
+    for building in sorted(thermal_network.buildings_demands):
+        h.update(repr(building).encode())
+        hash_frame(h, thermal_network.buildings_demands[building])
+    h.update(np.asarray(thermal_network.T_ground_K, dtype=float).tobytes())
+    state = get_state(thermal_network)
+    h.update(json.dumps(state._asdict(), sort_keys=True, default=float).encode())
+    return h.hexdigest()
+
+
+def hash_frame(h, df):
+    """Add the columns, the index and the values of a DataFrame (or Series) to the hash ``h``"""
+    df = pd.DataFrame(df)
+    h.update(repr([str(column) for column in df.columns]).encode())
+    # values of mixed type (e.g. the pipe properties) are hashed by their string representation
+    df = df.apply(lambda column: column.astype(str) if column.dtype == object else column)
+    h.update(pd.util.hash_pandas_object(df).values.tobytes())
+
+
+def read_checkpoint(thermal_network, fingerprint):
+    """
+    Return the finished time windows of an earlier run with the same fingerprint whose results are still there, as
+    a dict ``(start, stop) -> TimeWindowState``.
+    """
+    checkpoint_file = thermal_network.locator.get_thermal_network_checkpoint_file(thermal_network.network_type,
+                                                                                 thermal_network.network_name)
+    if not os.path.exists(checkpoint_file):
+        return {}
+    with open(checkpoint_file, 'r') as f:
+        checkpoint = json.load(f)
+    if checkpoint['fingerprint'] != fingerprint:
+        return {}
+    finished_windows = {}
+    for window in checkpoint['windows']:
+        start, stop = window['start_t'], window['stop_t']
+        if os.path.exists(get_window_results_file(thermal_network, (start, stop))):
+            finished_windows[(start, stop)] = TimeWindowState(window['temperature_control'],
+                                                              window['problematic_edges'])
+    return finished_windows
+
+
+def write_checkpoint(thermal_network, fingerprint, finished_windows):
+    """
+    Record the finished time windows (a dict ``(start, stop) -> TimeWindowState``). The file is written to a
+    temporary location first and then moved into place, so an interruption never leaves a corrupt checkpoint behind.
+    """
+    checkpoint = {'fingerprint': fingerprint,
+                  'windows': [{'start_t': int(start), 'stop_t': int(stop),
+                               'temperature_control': state.temperature_control,
+                               'problematic_edges': {edge: float(mass_flow)
+                                                     for edge, mass_flow in state.problematic_edges.items()}}
+                              for (start, stop), state in sorted(finished_windows.items())]}
+    save_checkpoint(thermal_network, checkpoint)
+
+
+def add_to_checkpoint(thermal_network, window, state):
+    """Record the time window ``window`` as finished, with the state at its end"""
+    checkpoint_file = thermal_network.locator.get_thermal_network_checkpoint_file(thermal_network.network_type,
+                                                                                 thermal_network.network_name)
+    with open(checkpoint_file, 'r') as f:
+        checkpoint = json.load(f)
+    finished_windows = {(w['start_t'], w['stop_t']): TimeWindowState(w['temperature_control'], w['problematic_edges'])
+                        for w in checkpoint['windows']}
+    finished_windows[tuple(window)] = state
+    write_checkpoint(thermal_network, checkpoint['fingerprint'], finished_windows)
+
+
+def save_checkpoint(thermal_network, checkpoint):
+    checkpoint_file = thermal_network.locator.get_thermal_network_checkpoint_file(thermal_network.network_type,
+                                                                                 thermal_network.network_name)
+    temporary_file = checkpoint_file + '.tmp'
+    with open(temporary_file, 'w') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(temporary_file, checkpoint_file)
+
+
+def remove_window_results(thermal_network):
+    """Remove the results of all time windows (and the checkpoint) of an earlier run of the network"""
+    folder = thermal_network.locator.get_thermal_network_time_windows_folder(thermal_network.network_type,
+                                                                            thermal_network.network_name)
+    for path in glob.glob(os.path.join(folder, '*')):
+        os.remove(path)
+
+
+def get_window_results_file(thermal_network, window):
+    start, stop = window
+    return thermal_network.locator.get_thermal_network_time_window_results_file(thermal_network.network_type,
+                                                                               thermal_network.network_name, start,
+                                                                               stop)
+
+
+def write_window_results(thermal_network, window, hourly_results):
+    """
+    Write the results of each hour of a time window (a list of namedtuples) to the parquet file of the time window,
+    with a row per hour and a column ``<field>:<i>`` for each value of each field of the results.
+    """
+    columns = {'t': np.arange(*window)}
+    for field in hourly_results[0]._fields:
+        values = np.array([np.ravel(np.asarray(getattr(result, field), dtype=float)) for result in hourly_results])
+        for i in range(values.shape[1]):
+            columns['%s:%i' % (field, i)] = values[:, i]
+    results_file = get_window_results_file(thermal_network, window)
+    temporary_file = results_file + '.tmp'
+    pd.DataFrame(columns).to_parquet(temporary_file, index=False)
+    os.replace(temporary_file, results_file)
+
+
+def read_window_results(thermal_network, windows, fields):
+    """
+    Read the results of the time windows ``windows`` (in this order).
+
+    :return: a dict ``field -> list`` with the values of the field (an array) for each hour
+    """
+    if not windows:
+        return {field: [] for field in fields}
+    results = pd.concat([pd.read_parquet(get_window_results_file(thermal_network, window)) for window in windows],
+                        ignore_index=True)
+    outputs = {}
+    for field in fields:
+        columns = [column for column in results.columns if column.split(':')[0] == field]
+        outputs[field] = list(results[columns].values)
+    return outputs
@@ -6,11 +6,13 @@ import json
 import os
 import unittest
 
+import numpy as np
 import pandas as pd
 
+from cea.demand.rc_model_SIA_annual import can_use_annual_solver
 from cea.demand.schedule_maker.schedule_maker import schedule_maker_main
 from cea.demand.building_properties import BuildingProperties
-from cea.demand.thermal_loads import calc_thermal_loads
+from cea.demand.thermal_loads import calc_thermal_loads, calc_thermal_loads_batch
 from cea.utilities.date import get_date_range_hours_from_year
 from cea.utilities import epwreader
 
@@ -112,6 +114,72 @@ class TestCalcThermalLoads(unittest.TestCase):
                                    msg="qww_sys_kwh for %(b)s should be: %(qww_sys_kwh).5f, was %(expected_qww_sys_kwh).5f" % locals(),
                                    places=3)
 
+    def test_calc_thermal_loads_annual_solver(self):
+        """The annual R-C-model solver gives the results of the hourly procedure for the buildings it supports"""
+        self.config.general.multiprocessing = False
+        self.config.schedule_maker.schedule_model = "deterministic"
+        buildings = [building for building in self.locator.get_zone_building_names()
+                     if can_use_annual_solver(self.building_properties[building],
+                                              self.use_dynamic_infiltration_calculation)]
+        self.assertTrue(buildings, 'No building of the reference case can use the annual solver')
+
+        rc_model_solver = self.config.demand.rc_model_solver
+        try:
+            for building in buildings:
+                schedule_maker_main(self.locator, self.config, building=building)
+                results = {}
+                for solver in ['hourly', 'annual']:
+                    self.config.demand.rc_model_solver = solver
+                    calc_thermal_loads(building, self.building_properties[building], self.weather_data,
+                                       self.date_range, self.locator, self.use_dynamic_infiltration_calculation,
+                                       self.resolution_output, self.loads_output, self.massflows_output,
+                                       self.temperatures_output, self.config, self.debug)
+                    results[solver] = self.locator.read_demand_results(building)
+                for column in ['Qhs_sys_kWh', 'Qcs_sys_kWh', 'T_int_C']:
+                    np.testing.assert_allclose(results['annual'][column].values, results['hourly'][column].values,
+                                               rtol=1e-9, atol=1e-6, err_msg='%s of %s' % (column, building))
+        finally:
+            self.config.demand.rc_model_solver = rc_model_solver
+
+    def test_calc_thermal_loads_batch(self):
+        """A batch of buildings gives the same results as calculating each building by itself"""
+        self.config.general.multiprocessing = False
+        self.config.schedule_maker.schedule_model = "deterministic"
+        buildings = self.locator.get_zone_building_names()
+        bprs = [self.building_properties[building] for building in buildings]
+        self.assertTrue(any(can_use_annual_solver(bpr, self.use_dynamic_infiltration_calculation) for bpr in bprs),
+                        'No building of the reference case can use the annual solver')
+
+        rc_model_solver = self.config.demand.rc_model_solver
+        try:
+            # the buildings of the batch supported by the annual solver are calculated with it
+            self.config.demand.rc_model_solver = 'annual'
+            expected = {}
+            for building, bpr in zip(buildings, bprs):
+                schedule_maker_main(self.locator, self.config, building=building)
+                calc_thermal_loads(building, bpr, self.weather_data, self.date_range, self.locator,
+                                   self.use_dynamic_infiltration_calculation, self.resolution_output,
+                                   self.loads_output, self.massflows_output, self.temperatures_output, self.config,
+                                   self.debug)
+                expected[building] = self.locator.read_demand_results(building)
+                os.remove(self.locator.find_demand_results_file(building))
+
+            calc_thermal_loads_batch(buildings, bprs, self.weather_data, self.date_range, self.locator,
+                                     self.use_dynamic_infiltration_calculation, self.resolution_output,
+                                     self.loads_output, self.massflows_output, self.temperatures_output, self.config,
+                                     self.debug)
+        finally:
+            self.config.demand.rc_model_solver = rc_model_solver
+
+        for building in buildings:
+            results = self.locator.read_demand_results(building)
+            self.assertEqual(list(results.columns), list(expected[building].columns), building)
+            for column in expected[building].select_dtypes('number').columns:
+                np.testing.assert_allclose(results[column].values, expected[building][column].values,
+                                           rtol=1e-9, atol=1e-6, err_msg='%s of %s' % (column, building))
+            self.assertTrue(os.path.exists(self.locator.get_temporary_file('%sT.csv' % building)),
+                            'Building temp file not produced')
+
 
 def run_for_single_building(building, bpr, weather_data, date, locator,
                             use_dynamic_infiltration_calculation, resolution_output, loads_output,
@@ -0,0 +1,132 @@
+"""
+Test the fingerprints of the inputs of the demand calculation (cea.demand.demand_fingerprint), used to skip buildings
+whose inputs did not change since the last run of the demand script.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import cea.inputlocator
+from cea.demand import demand_fingerprint
+from cea.demand.building_properties import BuildingPropertiesRow
+from cea.demand.demand_writers import YearlyDemandWriter
+
+__author__ = "Daren Thomas"
+__copyright__ = "Copyright 2024, Architecture and Building Systems - ETH Zurich"
+__credits__ = ["Daren Thomas"]
+__license__ = "MIT"
+__version__ = "0.1"
+__maintainer__ = "Daren Thomas"
+__email__ = "cea@arch.ethz.ch"
+__status__ = "Production"
+
+
+def make_building_properties_row(name, **changes):
+    """A BuildingPropertiesRow with synthetic properties, ``changes`` replace the values of the envelope"""
+    geometry = pd.Series({'height_ag': 12.0, 'floors_ag': 4, 'floors_bg': 1, 'Blength': 20.0, 'Bwidth': 10.0,
+                          'footprint': 180.0})
+    envelope = pd.Series({'Awin_ag': 80.0, 'Awall_ag': 320.0, 'a_roof': 0.6, 'n50': 3.0, 'a_wall': 0.6, 'rf_sh': 0.08,
+                          'e_wall': 0.9, 'e_roof': 0.9, 'G_win': 0.5, 'e_win': 0.89, 'U_roof': 0.2, 'Hs_ag': 0.9,
+                          'Hs_bg': 0.0, 'Ns': 1.0, 'Es': 0.9, 'Cm_Af': 165000.0, 'U_wall': 0.3, 'U_base': 0.3,
+                          'U_win': 1.2})
+    for key, value in changes.items():
+        envelope[key] = value
+    hvac = pd.Series({'Tshs0_ahu_C': 40.0, 'dThs0_ahu_C': 20.0, 'Tshs0_aru_C': 40.0, 'dThs0_aru_C': 20.0,
+                      'Tshs0_shu_C': 40.0, 'dThs0_shu_C': 20.0, 'Tscs0_ahu_C': 7.0, 'dTcs0_ahu_C': 6.0,
+                      'Tscs0_aru_C': 7.0, 'dTcs0_aru_C': 6.0, 'Tscs0_scu_C': 18.0, 'dTcs0_scu_C': 3.0,
+                      'Tsww0_C': 60.0, 'type_hs': 'HVAC_HEATING_AS4'})
+    solar = pd.Series({'I_sol': np.linspace(0.0, 1000.0, 8760)})
+    return BuildingPropertiesRow(name=name, geometry=geometry, envelope=envelope,
+                                 typology=pd.Series({'1ST_USE': 'OFFICE'}), hvac=hvac,
+                                 rc_model=pd.Series({'Af': 600.0}), comfort=pd.Series({'Ths_set_C': 21.0}),
+                                 internal_loads=pd.Series({'Occ_m2p': 14.0}), age=pd.Series({'YEAR': 2000}),
+                                 solar=solar, supply=pd.Series({'type_hs': 'SUPPLY_HEATING_AS3'}))
+
+
+class TestDemandFingerprint(unittest.TestCase):
+
+    def setUp(self):
+        self.locator = cea.inputlocator.InputLocator(tempfile.mkdtemp())
+        for building in ['B1001', 'B1002', 'B1003']:
+            for path in [self.locator.get_schedule_model_file(building),
+                         self.locator.get_radiation_building(building)]:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'w') as f:
+                    f.write('DATE,value\n2009-01-01 00:00,1.0\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.locator.scenario, ignore_errors=True)
+
+    def fingerprint(self, bpr, shared_fingerprint='settings'):
+        return demand_fingerprint.calc_building_fingerprint(self.locator, bpr, shared_fingerprint)
+
+    def test_identical_buildings_have_the_same_fingerprint(self):
+        self.assertEqual(self.fingerprint(make_building_properties_row('B1001')),
+                         self.fingerprint(make_building_properties_row('B1001')))
+
+    def test_changed_inputs_change_the_fingerprint(self):
+        fingerprint = self.fingerprint(make_building_properties_row('B1001'))
+        self.assertNotEqual(self.fingerprint(make_building_properties_row('B1001', U_win=1.1)), fingerprint)
+        self.assertNotEqual(self.fingerprint(make_building_properties_row('B1001'), 'other settings'), fingerprint)
+
+        # the solar gains (in slotted SolarProperties)
+        bpr = make_building_properties_row('B1001')
+        bpr.solar.I_sol = bpr.solar.I_sol.copy()
+        bpr.solar.I_sol[100] += 1.0
+        self.assertNotEqual(self.fingerprint(bpr), fingerprint)
+
+        # the schedules and the radiation of the building
+        with open(self.locator.get_radiation_building('B1001'), 'a') as f:
+            f.write('2009-01-01 01:00,2.0\n')
+        self.assertNotEqual(self.fingerprint(make_building_properties_row('B1001')), fingerprint)
+
+    def test_values_without_stable_representation(self):
+        class Unhashable(object):
+            __slots__ = []
+
+        bpr = make_building_properties_row('B1001')
+        bpr.extra = object()
+        with self.assertRaises(TypeError):
+            self.fingerprint(bpr)
+        bpr.extra = Unhashable()
+        with self.assertRaises(TypeError):
+            self.fingerprint(bpr)
+
+    def test_skip_unchanged_buildings(self):
+        buildings = ['B1001', 'B1002', 'B1003']
+        fingerprints = {building: self.fingerprint(make_building_properties_row(building)) for building in buildings}
+        previous_totals = pd.DataFrame({'Name': ['B1001', 'B1002', 'B1003'], 'QH_sys_MWhyr': [1.0, 2.0, 3.0]})
+        previous_totals.to_csv(self.locator.get_total_demand(), index=False)
+        demand_fingerprint.write_fingerprints(self.locator, fingerprints)
+        # the results of B1001 and B1002 are there, B1003 lost its results
+        for building in ['B1001', 'B1002']:
+            previous_totals[previous_totals['Name'] == building].to_csv(
+                self.locator.get_demand_results_file(building), index=False)
+
+        # B1002 changed
+        fingerprints['B1002'] = self.fingerprint(make_building_properties_row('B1002', U_wall=0.25))
+        unchanged_buildings, unchanged_totals = demand_fingerprint.find_unchanged_buildings(self.locator, fingerprints)
+        self.assertEqual(unchanged_buildings, ['B1001'])
+        self.assertEqual(list(unchanged_totals['Name']), ['B1001'])
+
+        # the totals of the unchanged buildings are merged with the ones of the buildings simulated again
+        for building, demand in [('B1002', 20.0), ('B1003', 30.0)]:
+            pd.DataFrame({'Name': [building], 'QH_sys_MWhyr': [demand]}).to_csv(
+                self.locator.get_temporary_file('%sT.csv' % building), index=False)
+        YearlyDemandWriter([], [], []).write_to_csv(buildings, self.locator, unchanged_totals)
+        totals = pd.read_csv(self.locator.get_total_demand())
+        self.assertEqual(list(totals['Name']), buildings)
+        self.assertEqual(list(totals['QH_sys_MWhyr']), [1.0, 20.0, 30.0])
+
+        # without previous fingerprints nothing is skipped
+        demand_fingerprint.remove_fingerprints(self.locator, buildings)
+        self.assertEqual(demand_fingerprint.find_unchanged_buildings(self.locator, fingerprints)[0], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+Test the cache of the weather data read by ``cea.utilities.epwreader.epw_reader``.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from cea.utilities import epwreader
+
+__author__ = "Daren Thomas"
+__copyright__ = "Copyright 2024, Architecture and Building Systems - ETH Zurich"
+__credits__ = ["Daren Thomas"]
+__license__ = "MIT"
+__version__ = "0.1"
+__maintainer__ = "Daren Thomas"
+__email__ = "cea@arch.ethz.ch"
+__status__ = "Production"
+
+WEATHER_DIR = os.path.join(os.path.dirname(epwreader.__file__), '..', 'databases', 'weather')
+
+
+class TestWeatherCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        patcher = mock.patch.object(epwreader, 'get_cache_dir', return_value=self.cache_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_cache_hit_equals_parse(self):
+        # the first year of the New York weather data is a leap year, the 29th of February is dropped
+        for weather_file in ['Zuerich-Kloten_2030_AB1_TMY.epw', 'NewYork-CentralPark_1973_2005_TMY3.epw']:
+            weather_path = os.path.join(WEATHER_DIR, weather_file)
+            expected = epwreader.parse_epw(weather_path)
+            pd.testing.assert_frame_equal(epwreader.epw_reader(weather_path), expected)
+            self.assertTrue(os.path.exists(epwreader.get_cache_file(weather_path)))
+
+            with mock.patch.object(epwreader, 'parse_epw') as parse_epw:
+                cached = epwreader.epw_reader(weather_path)
+            parse_epw.assert_not_called()
+            pd.testing.assert_frame_equal(cached, expected)
+            for column in ['date', 'dayofyear', 'ratio_diffhout', 'wetbulb_C', 'skytemp_C']:
+                pd.testing.assert_series_equal(cached[column], expected[column])
+
+            # changing the weather data does not change the cache
+            cached['drybulb_C'] += 10.0
+            pd.testing.assert_frame_equal(epwreader.epw_reader(weather_path), expected)
+
+    def test_prune_cache(self):
+        for i in range(5):
+            cache_file = os.path.join(self.cache_dir, '%i.npy' % i)
+            open(cache_file, 'w').close()
+            os.utime(cache_file, (1000.0 + i, 1000.0 + i))
+        epwreader.prune_cache(self.cache_dir, 3)
+        self.assertEqual(sorted(os.listdir(self.cache_dir)), ['2.npy', '3.npy', '4.npy'])
+        # nothing to prune without a cache
+        epwreader.prune_cache(os.path.join(self.cache_dir, 'missing'), 3)
+
+    def test_least_recently_used_weather_is_removed(self):
+        weather_paths = [os.path.join(WEATHER_DIR, weather_file) for weather_file in
+                         ['Zuerich-Kloten_2030_AB1_TMY.epw', 'Zuerich-SMA_2015.epw', 'Zug-inducity_2010.epw']]
+        with mock.patch.object(epwreader, 'CACHE_SIZE', 2):
+            for weather_path in weather_paths[:2]:
+                epwreader.epw_reader(weather_path)
+            # reading the first weather file again makes it the most recently used one
+            cache_files = [epwreader.get_cache_file(weather_path) for weather_path in weather_paths]
+            os.utime(cache_files[0], (1000.0, 1000.0))
+            os.utime(cache_files[1], (2000.0, 2000.0))
+            epwreader.epw_reader(weather_paths[0])
+            epwreader.epw_reader(weather_paths[2])
+        self.assertEqual(sorted(os.listdir(self.cache_dir)),
+                         sorted(os.path.basename(cache_files[i]) for i in [0, 2]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,338 @@
+"""
+Test the search of the adjacent buildings of the geometry generator (cea.resources.radiation.geometry_generator) on
+synthetic footprints, against the check of all the buildings of the scene, the cache of the building geometries and the
+reading of the terrain.
+"""
+
+import contextlib
+import io
+import math
+import os
+import pickle
+import shutil
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.geometry import Polygon, box
+from shapely.geometry.polygon import orient
+
+from cea.resources.radiation import geometry_generator
+from cea.resources.radiation.geometry_generator import ElevationMap, calc_building_prisms, calc_solid_keys, \
+    calc_zone_keys, find_potentially_intersecting_buildings, generate_cached_tin, is_geometry_cached, \
+    read_geometry_cache, write_geometry_cache
+
+__author__ = "Daren Thomas"
+__copyright__ = "Copyright 2024, Architecture and Building Systems - ETH Zurich"
+__credits__ = ["Daren Thomas"]
+__license__ = "MIT"
+__version__ = "0.1"
+__maintainer__ = "Daren Thomas"
+__email__ = "cea@arch.ethz.ch"
+__status__ = "Production"
+
+
+def make_scene(rng):
+    """
+    Rows of terraced houses (sharing their walls), L-shaped buildings fitting around a corner of another building and
+    detached buildings, with random heights and elevations. The footprints are oriented counter-clockwise.
+    """
+    footprints = []
+    for row in range(6):
+        x, y = row * 7.0, row * 40.0
+        for _ in range(int(rng.integers(2, 6))):
+            width = rng.uniform(6.0, 12.0)
+            footprints.append(box(x, y, x + width, y + 10.0))
+            x += width
+    for corner in range(4):
+        x, y = 300.0 + corner * 60.0, 0.0
+        footprints.append(box(x, y, x + 10.0, y + 10.0))
+        footprints.append(Polygon([(x + 10.0, y), (x + 20.0, y), (x + 20.0, y + 20.0), (x, y + 20.0), (x, y + 10.0),
+                                   (x + 10.0, y + 10.0)]))
+    for _ in range(20):
+        x, y = rng.uniform(0.0, 500.0, 2)
+        footprints.append(box(x, y + 300.0, x + rng.uniform(5.0, 30.0), y + 300.0 + rng.uniform(5.0, 30.0)))
+    footprints = [orient(footprint, 1.0) for footprint in footprints]
+    z_min = rng.uniform(400.0, 402.0, len(footprints))
+    z_max = z_min + rng.choice([3.0, 9.0, 15.0, 30.0], len(footprints))
+    return np.array(footprints, dtype=object), z_min, z_max
+
+
+def facade_points(footprint, z_min, z_max):
+    """The points 0.1 m in front of the middle of each facade (each edge of a counter-clockwise footprint)"""
+    coords = np.asarray(footprint.exterior.coords)
+    points = []
+    for (x1, y1), (x2, y2) in zip(coords[:-1], coords[1:]):
+        length = math.hypot(x2 - x1, y2 - y1)
+        points.append(((x1 + x2) / 2 + 0.1 * (y2 - y1) / length, (y1 + y2) / 2 - 0.1 * (x2 - x1) / length,
+                       (z_min + z_max) / 2))
+    return np.array(points)
+
+
+def in_solid(point, footprint, z_min, z_max):
+    """The point in solid test of a building extruded from its footprint"""
+    return z_min <= point[2] <= z_max and footprint.contains(shapely.Point(point[0], point[1]))
+
+
+class TestAdjacentBuildings(unittest.TestCase):
+
+    def setUp(self):
+        self.footprints, self.z_min, self.z_max = make_scene(np.random.default_rng(0))
+
+    def brute_force_pairs(self):
+        """
+        The facades intersecting other buildings, checking all the buildings with a corner closer than 100 m (the
+        implementation before the spatial index and the prisms)
+        """
+        pairs = set()
+        corners = shapely.bounds(self.footprints)[:, :2]
+        for i, footprint in enumerate(self.footprints):
+            close = [j for j in range(len(self.footprints)) if math.dist(corners[i], corners[j]) <= 100]
+            for f, point in enumerate(facade_points(footprint, self.z_min[i], self.z_max[i])):
+                for j in close:
+                    if in_solid(point, self.footprints[j], self.z_min[j], self.z_max[j]):
+                        pairs.add((i, f, j))
+        return pairs
+
+    def test_same_adjacent_buildings(self):
+        n = len(self.footprints)
+        bounds = shapely.bounds(self.footprints)
+        boxes = np.column_stack([bounds[:, :2], np.zeros(n), bounds[:, 2:], np.zeros(n)])
+        neighbours = find_potentially_intersecting_buildings(boxes, boxes)
+        self.assertEqual(len(neighbours), n)
+
+        # the solids are stood in for by their index
+        bounding_boxes = np.column_stack([bounds[:, :2], self.z_min, bounds[:, 2:], self.z_max])
+        fake_calculate = types.SimpleNamespace(get_bounding_box=lambda solid: tuple(bounding_boxes[solid]))
+        with mock.patch.object(geometry_generator, 'calculate', fake_calculate):
+            prisms = calc_building_prisms(self.footprints, list(range(n)))
+
+        pairs = set()
+        checked = 0
+        for i, footprint in enumerate(self.footprints):
+            points = facade_points(footprint, self.z_min[i], self.z_max[i])
+            in_prisms = prisms[neighbours[i]].contains(points)
+            for f, point in enumerate(points):
+                for j in neighbours[i][in_prisms[f]]:
+                    checked += 1
+                    if in_solid(point, self.footprints[j], self.z_min[j], self.z_max[j]):
+                        pairs.add((i, f, j))
+
+        expected = self.brute_force_pairs()
+        self.assertEqual(pairs, expected)
+        # the terraced houses and the L-shaped buildings touch
+        self.assertGreater(len(expected), 20)
+        # the prisms leave (almost) only the solids that intersect to check
+        self.assertLessEqual(checked, len(expected) * 1.1)
+
+    def test_neighbours(self):
+        boxes = np.array([[0.0, 0.0, 0.0, 10.0, 10.0, 0.0],
+                          [10.4, 0.0, 0.0, 20.0, 10.0, 0.0],
+                          [20.6, 0.0, 0.0, 30.0, 10.0, 0.0],
+                          [0.0, 10.0, 0.0, 5.0, 15.0, 0.0]])
+        neighbours = find_potentially_intersecting_buildings(boxes, boxes)
+        self.assertEqual([list(n) for n in neighbours], [[0, 1, 3], [0, 1], [2], [0, 3]])
+        self.assertEqual(find_potentially_intersecting_buildings(boxes[:0], boxes), [])
+        self.assertEqual([list(n) for n in find_potentially_intersecting_buildings(boxes[:2], boxes[:0])], [[], []])
+
+    def test_prisms_pickle(self):
+        bounding_boxes = np.array([[0.0, 0.0, 400.0, 10.0, 10.0, 410.0], [10.0, 0.0, 400.0, 20.0, 10.0, 420.0]])
+        fake_calculate = types.SimpleNamespace(get_bounding_box=lambda solid: tuple(bounding_boxes[solid]))
+        with mock.patch.object(geometry_generator, 'calculate', fake_calculate):
+            prisms = calc_building_prisms(np.array([box(0, 0, 10, 10), box(10, 0, 20, 10)], dtype=object), [0, None])
+        prisms = pickle.loads(pickle.dumps(prisms[[1, 0]]))
+        # the prism of a missing solid is empty
+        np.testing.assert_array_equal(prisms.contains([[5.0, 5.0, 405.0], [15.0, 5.0, 405.0], [5.0, 5.0, 411.0]]),
+                                      [[False, True], [False, False], [False, False]])
+
+
+
+class TestGeometryCache(unittest.TestCase):
+
+    def setUp(self):
+        self.geometry_pickle_dir = tempfile.mkdtemp()
+        # two zone buildings followed by two surrounding buildings
+        self.geometries = np.array([box(0, 0, 10, 10), box(10, 0, 20, 10), box(20, 0, 30, 10), box(100, 0, 110, 10)],
+                                   dtype=object)
+        self.buildings_df = pd.DataFrame({'height_ag': [10.0, 12.0, 9.0, 20.0], 'floors_ag': [3, 4, 3, 6]},
+                                         index=['B1001', 'B1002', 'B2001', 'B2002'])
+        self.elevations = np.array([400.0, 400.5, 401.0, 405.0])
+        self.architecture_wwr_df = pd.DataFrame(0.4, index=['B1001', 'B1002'],
+                                                columns=['wwr_west', 'wwr_east', 'wwr_north', 'wwr_south'])
+        bounds = shapely.bounds(self.geometries)
+        boxes = np.column_stack([bounds[:, :2], np.zeros(4), bounds[:, 2:], np.zeros(4)])
+        self.neighbours = find_potentially_intersecting_buildings(boxes[:2], boxes)
+
+    def tearDown(self):
+        shutil.rmtree(self.geometry_pickle_dir, ignore_errors=True)
+
+    def calc_keys(self, neglect_adjacent_buildings=False):
+        solid_keys = calc_solid_keys(self.geometries, self.buildings_df, self.elevations)
+        zone_keys = calc_zone_keys(['B1001', 'B1002'], solid_keys, self.neighbours, self.architecture_wwr_df,
+                                   neglect_adjacent_buildings)
+        return solid_keys, zone_keys
+
+    def test_neighbours(self):
+        # B1002 touches both B1001 and B2001, B2002 is far from the zone
+        self.assertEqual([list(n) for n in self.neighbours], [[0, 1], [0, 1, 2]])
+
+    def test_unchanged_buildings_reuse_the_cache(self):
+        solid_keys, zone_keys = self.calc_keys()
+        self.assertEqual(self.calc_keys(), (solid_keys, zone_keys))
+        self.assertEqual(len(set(solid_keys + zone_keys)), 6)
+
+        # the surrounding building B2001, next to B1002, is higher: only B1002 changes
+        self.buildings_df.loc['B2001', 'height_ag'] = 15.0
+        changed_solid_keys, changed_zone_keys = self.calc_keys()
+        self.assertEqual([a != b for a, b in zip(solid_keys, changed_solid_keys)], [False, False, True, False])
+        self.assertEqual([a != b for a, b in zip(zone_keys, changed_zone_keys)], [False, True])
+
+        # the far building B2002 does not change the zone buildings
+        self.buildings_df.loc['B2002', 'floors_ag'] = 7
+        self.assertEqual(self.calc_keys()[1], changed_zone_keys)
+
+    def test_changed_inputs_regenerate_the_geometry(self):
+        solid_keys, zone_keys = self.calc_keys()
+        footprint, height, floors, elevation = self.geometries[0], 10.0, 3, 400.0
+        for changed_input in ['footprint', 'height', 'floors', 'elevation']:
+            self.geometries[0] = box(0, 0, 10, 11) if changed_input == 'footprint' else footprint
+            self.buildings_df.loc['B1001', 'height_ag'] = 10.5 if changed_input == 'height' else height
+            self.buildings_df.loc['B1001', 'floors_ag'] = 4 if changed_input == 'floors' else floors
+            self.elevations[0] = 400.2 if changed_input == 'elevation' else elevation
+            changed_solid_keys, changed_zone_keys = self.calc_keys()
+            self.assertNotEqual(changed_solid_keys[0], solid_keys[0], msg=changed_input)
+            self.assertEqual(changed_solid_keys[1:], solid_keys[1:], msg=changed_input)
+            # B1002 is next to B1001
+            self.assertEqual([a != b for a, b in zip(zone_keys, changed_zone_keys)], [True, True], msg=changed_input)
+
+    def test_changed_window_to_wall_ratio(self):
+        solid_keys, zone_keys = self.calc_keys()
+        self.architecture_wwr_df.loc['B1002', 'wwr_south'] = 0.5
+        changed_solid_keys, changed_zone_keys = self.calc_keys()
+        self.assertEqual(changed_solid_keys, solid_keys)
+        self.assertEqual([a != b for a, b in zip(zone_keys, changed_zone_keys)], [False, True])
+        # and neglecting the adjacent buildings changes the geometry of all the zone buildings
+        self.assertTrue(all(a != b for a, b in zip(self.calc_keys(neglect_adjacent_buildings=True)[1],
+                                                   changed_zone_keys)))
+
+    def test_geometry_cache_file(self):
+        solid_keys, zone_keys = self.calc_keys()
+        geometry_cache = {('zone', 'B1001'): zone_keys[0], ('zone', 'B1002'): zone_keys[1],
+                          ('surroundings', 'B2001'): solid_keys[2], ('surroundings', '2002'): solid_keys[3]}
+        self.assertEqual(read_geometry_cache(self.geometry_pickle_dir), {})
+        write_geometry_cache(self.geometry_pickle_dir, geometry_cache)
+        # names are read as strings
+        self.assertEqual(read_geometry_cache(self.geometry_pickle_dir), geometry_cache)
+
+        # the geometry is only reused if its file exists
+        for building_type, name in [('zone', 'B1001'), ('surroundings', '2002')]:
+            os.makedirs(os.path.join(self.geometry_pickle_dir, building_type), exist_ok=True)
+            open(os.path.join(self.geometry_pickle_dir, building_type, name), 'w').close()
+        self.assertTrue(is_geometry_cached(geometry_cache, self.geometry_pickle_dir, 'zone', 'B1001', zone_keys[0]))
+        self.assertTrue(is_geometry_cached(geometry_cache, self.geometry_pickle_dir, 'surroundings', 2002,
+                                           solid_keys[3]))
+        self.assertFalse(is_geometry_cached(geometry_cache, self.geometry_pickle_dir, 'zone', 'B1002', zone_keys[1]))
+        self.assertFalse(is_geometry_cached(geometry_cache, self.geometry_pickle_dir, 'zone', 'B1001', zone_keys[1]))
+
+
+
+class FakeRaster(object):
+    """Stands in for a GDAL raster (``gdal.Dataset``) of ``elevation`` with a north-up geo transform"""
+
+    def __init__(self, elevation, geo_transform, nodata=-9999.0):
+        self.elevation = elevation
+        self.geo_transform = geo_transform
+        self.nodata = nodata
+        self.RasterYSize, self.RasterXSize = elevation.shape
+
+    def GetRasterBand(self, _):
+        return self
+
+    def GetNoDataValue(self):
+        return self.nodata
+
+    def GetGeoTransform(self):
+        return self.geo_transform
+
+    def ReadAsArray(self, xoff=0, yoff=0, win_xsize=None, win_ysize=None):
+        win_xsize = self.RasterXSize if win_xsize is None else win_xsize
+        win_ysize = self.RasterYSize if win_ysize is None else win_ysize
+        return self.elevation[yoff:yoff + win_ysize, xoff:xoff + win_xsize].copy()
+
+
+def plane(x, y):
+    return 0.01 * x - 0.02 * y + 400.0
+
+
+class TestTerrain(unittest.TestCase):
+
+    def setUp(self):
+        # 2 x 2 m cells, the upper left corner at (1000, 5000)
+        x, y = np.meshgrid(np.arange(500) * 2.0 + 1001.0, np.arange(400) * -2.0 + 4999.0)
+        elevation = plane(x, y)
+        elevation[10:20, 10:20] = -9999.0
+        self.raster = FakeRaster(elevation, (1000.0, 2.0, 0.0, 5000.0, 0.0, -2.0))
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_read_raster_window(self):
+        full = ElevationMap.read_raster(self.raster)
+        self.assertEqual(full.elevation_map.shape, (400, 500))
+        for bounds in [(1200.0, 4300.0, 1300.0, 4500.0), (1201.3, 4300.7, 1202.1, 4301.5),
+                       # at the edges of the raster
+                       (990.0, 4190.0, 1100.0, 4300.0), (1900.0, 4900.0, 2010.0, 5010.0)]:
+            window = ElevationMap.read_raster(self.raster, bounds)
+            x_start = np.flatnonzero(full.x_coords == window.x_coords[0])[0]
+            y_start = np.flatnonzero(full.y_coords == window.y_coords[0])[0]
+            np.testing.assert_array_equal(window.elevation_map,
+                                          full.elevation_map[y_start:y_start + len(window.y_coords),
+                                                             x_start:x_start + len(window.x_coords)])
+            np.testing.assert_array_equal(window.x_coords, full.x_coords[x_start:x_start + len(window.x_coords)])
+            np.testing.assert_array_equal(window.y_coords, full.y_coords[y_start:y_start + len(window.y_coords)])
+            # the cells cover the bounds, with a margin inside the raster
+            minx, miny, maxx, maxy = bounds
+            self.assertLessEqual(window.x_coords[0] - 1.0, max(minx - 2.0, 1000.0))
+            self.assertGreaterEqual(window.x_coords[-1] + 1.0, min(maxx + 2.0, 2000.0))
+            self.assertLessEqual(window.y_coords[-1] - 1.0, max(miny - 2.0, 4200.0))
+            self.assertGreaterEqual(window.y_coords[0] + 1.0, min(maxy + 2.0, 5000.0))
+
+            # the terrain is a plane: the elevation within the bounds is the same as with the whole raster
+            points = np.column_stack([np.linspace(max(minx, 1001.0), min(maxx, 1999.0), 5),
+                                      np.linspace(max(miny, 4201.0), min(maxy, 4999.0), 5)])
+            np.testing.assert_allclose(window.get_elevation(points), plane(points[:, 0], points[:, 1]))
+
+    def test_cached_tin(self):
+        window = ElevationMap.read_raster(self.raster, (1000.0, 4950.0, 1060.0, 5000.0))
+        fake_construct = types.SimpleNamespace(make_polygon=lambda points: tuple(map(tuple, points)))
+        with mock.patch.object(geometry_generator, 'construct', fake_construct), \
+                contextlib.redirect_stdout(io.StringIO()):
+            tin = generate_cached_tin(window, self.cache_dir)
+            # the cells without data are not part of the TIN
+            self.assertLess(len(tin), 2 * len(window.x_coords) * len(window.y_coords))
+            self.assertTrue(all(z > 0.0 for triangle in tin for _, _, z in triangle))
+            self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+            # a hit does not generate the TIN again, the raster is equal after pickling
+            with mock.patch.object(ElevationMap, 'generate_tin') as generate_tin:
+                self.assertEqual(generate_cached_tin(pickle.loads(pickle.dumps(window)), self.cache_dir), tin)
+            generate_tin.assert_not_called()
+
+            # another raster or another tolerance is a miss, replacing the TIN in the cache
+            other_window = ElevationMap.read_raster(self.raster, (1000.0, 4950.0, 1062.0, 5000.0))
+            for elevation_map, tolerance in [(other_window, geometry_generator.TERRAIN_TIN_TOLERANCE), (window, 1.0)]:
+                cached_files = os.listdir(self.cache_dir)
+                with mock.patch.object(ElevationMap, 'generate_tin', return_value=[]) as generate_tin:
+                    generate_cached_tin(elevation_map, self.cache_dir, tolerance)
+                generate_tin.assert_called_once_with(tolerance)
+                self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+                self.assertNotEqual(os.listdir(self.cache_dir), cached_files)
+
+
+if __name__ == "__main__":
+    unittest.main()
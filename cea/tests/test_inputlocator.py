@@ -4,6 +4,12 @@
 import unittest
 import os
 import pickle
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
 import cea.inputlocator
 
 class TestInputLocator(unittest.TestCase):
@@ -36,3 +42,41 @@ class TestInputLocator(unittest.TestCase):
         locator = pickle.loads(pickle.dumps(self.locator))
         self.assertEqual(locator.scenario, self.locator.scenario)
         self.assertEqual(locator.get_total_demand(), self.locator.get_total_demand())
+
+
+class TestReadDemandResults(unittest.TestCase):
+
+    def setUp(self):
+        self.locator = cea.inputlocator.InputLocator(tempfile.mkdtemp())
+        self.buildings = ['B1000', 'B1001', 'B1002']
+        self.demand = {building: pd.DataFrame({'Name': building,
+                                               'Qww_sys_kWh': np.random.rand(24),
+                                               'Tww_sys_re_C': np.random.rand(24)})
+                       for building in self.buildings}
+
+    def tearDown(self):
+        shutil.rmtree(self.locator.scenario, ignore_errors=True)
+
+    def write_demand_results(self, format):
+        for building, demand in self.demand.items():
+            if format == 'parquet':
+                demand.to_parquet(self.locator.get_demand_results_file(building, format), index=False)
+            else:
+                demand.to_csv(self.locator.get_demand_results_file(building, format), index=False)
+
+    def assert_demand_results_for_buildings(self, columns):
+        expected = pd.concat([self.demand[building] for building in self.buildings], ignore_index=True)
+        if columns:
+            expected = expected[columns]
+        result = self.locator.read_demand_results_for_buildings(self.buildings, columns)
+        pd.testing.assert_frame_equal(result, expected)
+
+    def test_read_demand_results_for_buildings_csv(self):
+        self.write_demand_results('csv')
+        self.assert_demand_results_for_buildings(None)
+        self.assert_demand_results_for_buildings(['Qww_sys_kWh', 'Tww_sys_re_C'])
+
+    def test_read_demand_results_for_buildings_parquet(self):
+        self.write_demand_results('parquet')
+        self.assert_demand_results_for_buildings(None)
+        self.assert_demand_results_for_buildings(['Qww_sys_kWh', 'Tww_sys_re_C'])
@@ -0,0 +1,191 @@
+"""
+Test the sparse solvers of the edge mass flows of thermal networks (cea.technologies.thermal_network.network_hydraulics)
+against a dense solution of the same equations.
+"""
+
+import contextlib
+import io
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import scipy.optimize
+
+import cea.technologies.thermal_network.network_hydraulics as network_hydraulics
+import cea.technologies.thermal_network.thermal_network as thermal_network
+
+__author__ = "Daren Thomas"
+__copyright__ = "Copyright 2024, Architecture and Building Systems - ETH Zurich"
+__credits__ = ["Daren Thomas"]
+__license__ = "MIT"
+__version__ = "0.1"
+__maintainer__ = "Daren Thomas"
+__email__ = "cea@arch.ethz.ch"
+__status__ = "Production"
+
+
+def make_edge_node_df(edges, number_of_nodes):
+    """Edge-node matrix of a list of edges (start node, end node): -1 at the start node, 1 at the end node"""
+    edge_node = np.zeros((number_of_nodes, len(edges)))
+    for e, (start, end) in enumerate(edges):
+        edge_node[start, e] = -1.0
+        edge_node[end, e] = 1.0
+    return pd.DataFrame(edge_node, index=['NODE%i' % n for n in range(number_of_nodes)],
+                        columns=['PIPE%i' % e for e in range(len(edges))])
+
+
+def make_all_nodes_df(number_of_nodes, plant_index=0):
+    types = ['CONSUMER'] * number_of_nodes
+    types[plant_index] = 'PLANT'
+    return pd.DataFrame({'Type': types}, index=['NODE%i' % n for n in range(number_of_nodes)])
+
+
+def make_node_mass_flows(rng, number_of_nodes, plant_index=0):
+    """Mass flows drawn at each node, supplied by the plant"""
+    node_mass_flows = rng.uniform(0.1, 2.0, number_of_nodes)
+    node_mass_flows[rng.random(number_of_nodes) < 0.2] = 0.0
+    node_mass_flows[plant_index] = -node_mass_flows.sum() + node_mass_flows[plant_index]
+    return pd.DataFrame([node_mass_flows], columns=['NODE%i' % n for n in range(number_of_nodes)])
+
+
+def random_tree(rng, number_of_nodes):
+    """Edges of a random tree, with random directions"""
+    edges = []
+    for node in range(1, number_of_nodes):
+        parent = int(rng.integers(0, node))
+        edges.append((parent, node) if rng.random() < 0.7 else (node, parent))
+    return edges
+
+
+def grid(rows, columns):
+    """Edges of a grid of nodes (a network with (rows - 1) * (columns - 1) loops)"""
+    edges = []
+    for r in range(rows):
+        for c in range(columns):
+            node = r * columns + c
+            if c + 1 < columns:
+                edges.append((node, node + 1))
+            if r + 1 < rows:
+                edges.append((node, node + columns))
+    return edges
+
+
+def dense_tree_solution(edge_node_df, node_mass_flows, plant_index=0):
+    """The solution of tree networks used before the sparse solver: a dense solve of the reduced edge-node matrix"""
+    A = edge_node_df.drop(edge_node_df.index[plant_index])
+    b = np.delete(np.nan_to_num(node_mass_flows.T), plant_index)
+    return np.round(np.linalg.solve(A.values, b), decimals=5)
+
+
+def dense_looped_solution(edge_node_df, node_mass_flows, pipe_diameter_m, pipe_length_m, T_edge_K, plant_index=0):
+    """
+    Solve the mass balance at each node and the pressure balance of each edge (for a pressure at each node) of a
+    looped network as one dense system of equations.
+    """
+    A = np.delete(edge_node_df.values, plant_index, axis=0)
+    b = np.delete(node_mass_flows.values.ravel(), plant_index)
+    number_of_edges = A.shape[1]
+
+    def equations(x):
+        # node pressures in kPa, to keep the unknowns of a similar scale
+        mass_flow_edge, pressure_nodes = x[:number_of_edges], x[number_of_edges:] * 1000.0
+        pressure_loss = thermal_network.calc_pressure_loss_pipe(pipe_diameter_m, pipe_length_m, mass_flow_edge,
+                                                                T_edge_K, 2) * np.sign(mass_flow_edge)
+        return np.concatenate([A @ mass_flow_edge - b, (pressure_loss + A.T @ pressure_nodes) / 1000.0])
+
+    def jacobian(x):
+        derivative = np.abs(thermal_network.calc_pressure_loss_pipe(pipe_diameter_m, pipe_length_m,
+                                                                    x[:number_of_edges], T_edge_K, 1))
+        return np.block([[A, np.zeros((A.shape[0], A.shape[0]))],
+                         [np.diag(derivative) / 1000.0, A.T]])
+
+    initial_guess = np.concatenate([np.linalg.lstsq(A, b, rcond=None)[0], np.zeros(A.shape[0])])
+    solution, info, ier, message = scipy.optimize.fsolve(equations, initial_guess, fprime=jacobian,
+                                                         full_output=True, xtol=1e-10)
+    assert ier == 1, message
+    return solution[:number_of_edges]
+
+
+class TestNetworkHydraulics(unittest.TestCase):
+
+    def setUp(self):
+        network_hydraulics._hydraulics_cache.clear()
+
+    def test_tree_network(self):
+        rng = np.random.default_rng(21)
+        for number_of_nodes in [2, 5, 30, 200]:
+            edge_node_df = make_edge_node_df(random_tree(rng, number_of_nodes), number_of_nodes)
+            all_nodes_df = make_all_nodes_df(number_of_nodes)
+            pipe_diameter_m = rng.uniform(0.05, 0.2, number_of_nodes - 1)
+            pipe_length_m = rng.uniform(10.0, 100.0, number_of_nodes - 1)
+            T_edge_K = np.full(number_of_nodes - 1, 333.0)
+            for _ in range(3):
+                node_mass_flows = make_node_mass_flows(rng, number_of_nodes)
+                mass_flow_edge = thermal_network.calc_mass_flow_edges(edge_node_df, node_mass_flows, all_nodes_df,
+                                                                      pipe_diameter_m, pipe_length_m, T_edge_K)
+                np.testing.assert_allclose(mass_flow_edge, dense_tree_solution(edge_node_df, node_mass_flows),
+                                           rtol=0, atol=1e-5)
+
+                # flipping the directions of some edges reuses the matrices of the topology
+                flipped = rng.random(number_of_nodes - 1) < 0.3
+                edge_node_df = edge_node_df * np.where(flipped, -1.0, 1.0)
+                mass_flow_edge = thermal_network.calc_mass_flow_edges(edge_node_df, node_mass_flows, all_nodes_df,
+                                                                      pipe_diameter_m, pipe_length_m, T_edge_K)
+                np.testing.assert_allclose(mass_flow_edge, dense_tree_solution(edge_node_df, node_mass_flows),
+                                           rtol=0, atol=1e-5)
+
+    def test_looped_network(self):
+        rng = np.random.default_rng(22)
+        for rows, columns in [(2, 2), (3, 4), (5, 5)]:
+            number_of_nodes = rows * columns
+            edge_node_df = make_edge_node_df(grid(rows, columns), number_of_nodes)
+            number_of_edges = len(edge_node_df.columns)
+            all_nodes_df = make_all_nodes_df(number_of_nodes)
+            pipe_diameter_m = rng.uniform(0.05, 0.2, number_of_edges)
+            pipe_length_m = rng.uniform(10.0, 100.0, number_of_edges)
+            T_edge_K = np.full(number_of_edges, 333.0)
+            node_mass_flows = make_node_mass_flows(rng, number_of_nodes)
+
+            mass_flow_edge = thermal_network.calc_mass_flow_edges(edge_node_df, node_mass_flows, all_nodes_df,
+                                                                  pipe_diameter_m, pipe_length_m, T_edge_K)
+            expected = dense_looped_solution(edge_node_df, node_mass_flows, pipe_diameter_m, pipe_length_m, T_edge_K)
+            np.testing.assert_allclose(mass_flow_edge, expected, rtol=0, atol=1e-3)
+
+    def test_loop_pressure_residual_warning(self):
+        edge_node_df = make_edge_node_df(grid(3, 3), 9)
+        number_of_edges = len(edge_node_df.columns)
+        node_mass_flows = make_node_mass_flows(np.random.default_rng(23), 9)
+        args = (edge_node_df, node_mass_flows, make_all_nodes_df(9), np.full(number_of_edges, 0.1),
+                np.full(number_of_edges, 50.0), np.full(number_of_edges, 333.0))
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            thermal_network.calc_mass_flow_edges(*args)
+        self.assertNotIn('from 0 pressure in loop', output.getvalue())
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output), \
+                mock.patch.object(thermal_network, 'MAX_LOOP_PRESSURE_RESIDUAL_PA', -1.0):
+            thermal_network.calc_mass_flow_edges(*args)
+        self.assertIn('from 0 pressure in loop', output.getvalue())
+
+    def test_cache_is_bounded(self):
+        rng = np.random.default_rng(24)
+        for number_of_nodes in range(2, network_hydraulics.HYDRAULICS_CACHE_SIZE + 12):
+            edge_node_df = make_edge_node_df(random_tree(rng, number_of_nodes), number_of_nodes)
+            network_hydraulics.get_network_hydraulics(edge_node_df.values, 0)
+            self.assertLessEqual(len(network_hydraulics._hydraulics_cache), network_hydraulics.HYDRAULICS_CACHE_SIZE)
+
+    def test_add_to_cache(self):
+        cache = {}
+        for key in 'abcd':
+            network_hydraulics.add_to_cache(cache, key, key.upper(), 3)
+        self.assertEqual(cache, {'b': 'B', 'c': 'C', 'd': 'D'})
+        # replacing a value of a full cache keeps the others
+        network_hydraulics.add_to_cache(cache, 'c', 'new', 3)
+        self.assertEqual(cache, {'b': 'B', 'c': 'new', 'd': 'D'})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,191 @@
+"""
+Test the single-pass solvers of the node temperatures of thermal networks
+(cea.technologies.thermal_network.network_temperatures) against the search for solvable nodes in
+:py:func:`cea.technologies.thermal_network.thermal_network.iterate_supply_temperatures` and
+:py:func:`cea.technologies.thermal_network.thermal_network.calc_return_temperatures`, which is still used for flow
+patterns with circulating flows.
+"""
+
+import contextlib
+import io
+import unittest
+from unittest import mock
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+import cea.technologies.thermal_network.network_temperatures as network_temperatures
+import cea.technologies.thermal_network.thermal_network as thermal_network
+
+__author__ = "Daren Thomas"
+__copyright__ = "Copyright 2024, Architecture and Building Systems - ETH Zurich"
+__credits__ = ["Daren Thomas"]
+__license__ = "MIT"
+__version__ = "0.1"
+__maintainer__ = "Daren Thomas"
+__email__ = "cea@arch.ethz.ch"
+__status__ = "Production"
+
+T_GROUND_K = 283.0
+
+
+def random_tree_network(number_of_nodes, seed, zero_demand_fraction=0.3):
+    """
+    A random tree with the plant in the middle of the node list, edges in random order and the edge mass flows of the node
+    demands (some zero, so that some branches have no flows). As in the edge-node matrix of each time step, the edges
+    point in the direction of the flows.
+    """
+    rng = np.random.default_rng(seed)
+    tree = nx.random_labeled_tree(number_of_nodes, seed=seed) if hasattr(nx, 'random_labeled_tree') \
+        else nx.random_tree(number_of_nodes, seed=seed)
+    plant = number_of_nodes // 2
+    edges = list(nx.bfs_edges(tree, plant))
+    rng.shuffle(edges)
+    node_types = ['CONSUMER' if rng.random() < 0.6 else 'NONE' for _ in range(number_of_nodes)]
+    node_types[plant] = 'PLANT'
+    demand = np.where(np.array(node_types) == 'CONSUMER',
+                      rng.uniform(0.1, 2.0, number_of_nodes) * (rng.random(number_of_nodes) > zero_demand_fraction), 0.0)
+    # the flow in each edge supplies the demand of all nodes downstream of it
+    downstream_demand = demand.copy()
+    for parent, child in reversed(list(nx.bfs_edges(tree, plant))):
+        downstream_demand[parent] += downstream_demand[child]
+    edge_node = np.zeros((number_of_nodes, len(edges)))
+    mass_flow_edge = np.zeros(len(edges))
+    for e, (start, end) in enumerate(edges):
+        edge_node[start, e], edge_node[end, e] = -1.0, 1.0
+        mass_flow_edge[e] = downstream_demand[end]
+    return edge_node, mass_flow_edge, node_types, demand, rng
+
+
+def acyclic_network(rows, columns, seed):
+    """
+    A grid of nodes with the plant in a corner and all flows pointing away from it: the flows split and merge again, but
+    never circulate around a loop. Some edges have no flows.
+    """
+    rng = np.random.default_rng(seed)
+    grid = nx.grid_2d_graph(rows, columns)
+    nodes = list(grid.nodes())
+    index = {node: i for i, node in enumerate(nodes)}
+    edges = [(u, v) if sum(u) < sum(v) else (v, u) for u, v in grid.edges()]
+    edge_node = np.zeros((len(nodes), len(edges)))
+    for e, (start, end) in enumerate(edges):
+        edge_node[index[start], e], edge_node[index[end], e] = -1.0, 1.0
+    mass_flow_edge = rng.uniform(0.05, 3.0, len(edges))
+    for e in np.where(rng.random(len(edges)) < 0.15)[0]:
+        # no flow in the edge, as long as another flow enters its end node
+        inflows = np.where(edge_node[index[edges[e][1]]] == 1.0)[0]
+        if (mass_flow_edge[inflows] > 0).sum() > 1:
+            mass_flow_edge[e] = 0.0
+    node_types = ['CONSUMER' if rng.random() < 0.6 else 'NONE' for _ in nodes]
+    node_types[0] = 'PLANT'
+    demand = np.where(np.array(node_types) == 'CONSUMER', rng.uniform(0.1, 2.0, len(nodes)), 0.0)
+    return edge_node, mass_flow_edge, node_types, demand, rng
+
+
+class SmallNetwork(object):
+    """The fields of a :py:class:`ThermalNetwork` read by the temperature calculation"""
+
+    def __init__(self, node_types, rng, network_type, temperature_control):
+        number_of_nodes = len(node_types)
+        nodes = ['NODE%i' % n for n in range(number_of_nodes)]
+        self.all_nodes_df = pd.DataFrame({'Type': node_types}, index=nodes)
+        self.T_ground_K = [T_GROUND_K]
+        target = rng.uniform(60.0, 70.0, number_of_nodes) if network_type == 'DH' \
+            else rng.uniform(6.0, 10.0, number_of_nodes)
+        target[np.array(node_types) != 'CONSUMER'] = np.nan
+        self.t_target_supply_df = pd.DataFrame([target], columns=nodes)
+        self.network_type = network_type
+        self.temperature_control = temperature_control
+        self.plant_supply_temperature = 70 if network_type == 'DH' else 8
+        self.problematic_edges = {}
+
+
+class TestNetworkTemperatures(unittest.TestCase):
+
+    def setUp(self):
+        network_temperatures._flow_order_cache.clear()
+        network_temperatures._branch_ends_cache.clear()
+
+    def calc_temperatures(self, network, network_type, temperature_control, seed, node_search=False):
+        """Supply and return temperatures with the single-pass solvers or, with ``node_search``, the node search"""
+        edge_node, mass_flow_edge, node_types, demand, _ = network
+        rng = np.random.default_rng(seed)
+        thermal_network_ = SmallNetwork(node_types, rng, network_type, temperature_control)
+        edge_node_df = pd.DataFrame(edge_node, index=thermal_network_.all_nodes_df.index)
+        k = rng.uniform(0.01, 0.1, edge_node.shape[1])
+        k[:3] = 5.0  # a few edges with very high losses, capped to 30 K
+        t_return = np.where(np.array(node_types) == 'CONSUMER',
+                            rng.uniform(30.0, 40.0, len(node_types)) if network_type == 'DH'
+                            else rng.uniform(14.0, 18.0, len(node_types)), np.nan) + 273.15
+
+        patches = [mock.patch.object(network_temperatures, 'get_supply_flow_order', return_value=None),
+                   mock.patch.object(network_temperatures, 'get_return_flow_order', return_value=None)] \
+            if node_search else []
+        with contextlib.ExitStack() as stack, contextlib.redirect_stdout(io.StringIO()):
+            for patch in patches:
+                stack.enter_context(patch)
+            supply = thermal_network.calc_supply_temperatures(0, edge_node_df.copy(), pd.DataFrame([mass_flow_edge]),
+                                                              k, thermal_network_)
+            ret = thermal_network.calc_return_temperatures(T_GROUND_K, edge_node_df.copy(),
+                                                           pd.DataFrame([mass_flow_edge]), pd.DataFrame([demand]), k,
+                                                           pd.DataFrame([t_return],
+                                                                        columns=thermal_network_.all_nodes_df.index),
+                                                           thermal_network_)
+        return supply, ret, thermal_network_.problematic_edges
+
+    def assert_same_temperatures(self, network, network_type, temperature_control, seed):
+        supply, ret, problematic_edges = self.calc_temperatures(network, network_type, temperature_control, seed)
+        expected_supply, expected_ret, expected_problematic_edges = self.calc_temperatures(
+            network, network_type, temperature_control, seed, node_search=True)
+
+        msg = '%s %s network %i' % (network_type, temperature_control, seed)
+        # node temperatures, plant nodes, edge heat losses and the switch of the temperature control
+        np.testing.assert_allclose(np.asarray(supply[0], dtype=float), np.asarray(expected_supply[0], dtype=float),
+                                   rtol=1e-10, atol=1e-8, err_msg='supply node temperatures of %s' % msg)
+        np.testing.assert_array_equal(np.ravel(supply[1]), np.ravel(expected_supply[1]))
+        np.testing.assert_allclose(np.asarray(supply[2], dtype=float), np.asarray(expected_supply[2], dtype=float),
+                                   rtol=1e-10, atol=1e-8, err_msg='supply heat losses of %s' % msg)
+        self.assertEqual(supply[3], expected_supply[3], msg)
+        np.testing.assert_allclose(np.asarray(ret[0], dtype=float), np.asarray(expected_ret[0], dtype=float),
+                                   rtol=1e-10, atol=1e-8, err_msg='return node temperatures of %s' % msg)
+        np.testing.assert_allclose(np.asarray(ret[1], dtype=float), np.asarray(expected_ret[1], dtype=float),
+                                   rtol=1e-10, atol=1e-8, err_msg='return heat losses of %s' % msg)
+        self.assertEqual(problematic_edges.keys(), expected_problematic_edges.keys(), msg)
+        return problematic_edges
+
+    def test_tree_networks(self):
+        capped = 0
+        for seed in range(6):
+            network = random_tree_network(40, seed)
+            self.assertTrue((network[1] == 0).any(), 'the network should have edges without flows')
+            for network_type, temperature_control in [('DH', 'VT'), ('DC', 'VT'), ('DH', 'CT')]:
+                problematic_edges = self.assert_same_temperatures(network, network_type, temperature_control, seed)
+                capped += len(problematic_edges)
+        # some of the edges with very high losses are capped to 30 K
+        self.assertGreater(capped, 0)
+
+    def test_acyclic_networks(self):
+        for seed in range(4):
+            network = acyclic_network(4, 5, seed)
+            self.assertTrue((network[1] == 0).any(), 'the network should have edges without flows')
+            for network_type, temperature_control in [('DH', 'VT'), ('DC', 'VT'), ('DH', 'CT')]:
+                self.assert_same_temperatures(network, network_type, temperature_control, seed)
+
+    def test_temperature_loss_is_capped(self):
+        """Temperature losses above 30 K are capped, edges without flows have no outlet temperature"""
+        thermal_network_ = SmallNetwork(['PLANT'], np.random.default_rng(0), 'DH', 'VT')
+        edges = np.array([0, 1, 2])
+        t_inlet = np.array([350.0, 350.0, 350.0])
+        with contextlib.redirect_stdout(io.StringIO()):
+            t_outlet = network_temperatures.calc_outlet_temperatures(edges, t_inlet, np.array([0.001, 2.0, 0.0]),
+                                                                     np.array([5.0, 0.01, 5.0]), T_GROUND_K,
+                                                                     thermal_network_)
+        self.assertEqual(t_outlet[0], 350.0 - network_temperatures.MAX_TEMPERATURE_LOSS_K)
+        self.assertTrue(0 < 350.0 - t_outlet[1] < network_temperatures.MAX_TEMPERATURE_LOSS_K)
+        self.assertTrue(np.isnan(t_outlet[2]))
+        self.assertEqual(list(thermal_network_.problematic_edges.keys()), ['0'])
+
+
+if __name__ == "__main__":
+    unittest.main()
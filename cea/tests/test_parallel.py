@@ -0,0 +1,112 @@
+"""
+Test ``cea.utilities.parallel.vectorize`` with a pool of worker processes against the single process mode.
+"""
+
+import contextlib
+import io
+import os
+import unittest
+from itertools import repeat
+
+from cea.utilities import parallel
+
+__author__ = "Daren Thomas"
+__copyright__ = "Copyright 2024, Architecture and Building Systems - ETH Zurich"
+__credits__ = ["Daren Thomas"]
+__license__ = "MIT"
+__version__ = "0.1"
+__maintainer__ = "Daren Thomas"
+__email__ = "cea@arch.ethz.ch"
+__status__ = "Production"
+
+PROCESSES = 3
+
+
+# the functions run by the worker processes need to be module-level functions
+
+def weighted_sum(a, weights, b, offset):
+    print("weighted_sum {a} {b}".format(a=a, b=b))
+    return a * weights[0] + b * weights[1] + offset
+
+
+def worker_pid(_):
+    return os.getpid()
+
+
+def broadcast_call_id(_, value):
+    return parallel._broadcast_cache[0], value
+
+
+def broadcast_cache(_):
+    return parallel._broadcast_cache
+
+
+class TestVectorize(unittest.TestCase):
+
+    def tearDown(self):
+        parallel.shutdown_worker_pool()
+
+    def vectorize(self, func, processes, on_complete=None, chunksize=None):
+        def wrapper(*args):
+            with contextlib.redirect_stdout(io.StringIO()):
+                return parallel.vectorize(func, processes, on_complete, chunksize)(*args)
+
+        return wrapper
+
+    def test_results_match_single_process(self):
+        n = 41
+        args = (range(n), repeat((2.0, -1.0), n), [b ** 2 for b in range(n)], repeat(0.5, n))
+        expected = self.vectorize(weighted_sum, 1)(*args)
+        self.assertEqual(expected, [a * 2.0 - a ** 2 + 0.5 for a in range(n)])
+        for chunksize in [None, 1, 7, 100]:
+            args = (range(n), repeat((2.0, -1.0), n), [b ** 2 for b in range(n)], repeat(0.5, n))
+            self.assertEqual(self.vectorize(weighted_sum, PROCESSES, chunksize=chunksize)(*args), expected)
+
+    def test_on_complete(self):
+        n = 25
+        for processes in [1, PROCESSES]:
+            completed = []
+            result = self.vectorize(weighted_sum, processes,
+                                    on_complete=lambda i, n, args, result: completed.append((i, n, args, result)))(
+                range(n), repeat((1.0, 1.0), n), range(100, 100 + n), repeat(0.0, n))
+            # once per call, in the order of completion
+            self.assertEqual([i for i, _, _, _ in completed], list(range(n)))
+            self.assertTrue(all(total == n for _, total, _, _ in completed))
+            self.assertEqual(sorted(args[0] for _, _, args, _ in completed), list(range(n)))
+            for _, _, args, instance_result in completed:
+                self.assertEqual(args[1:], ((1.0, 1.0), args[0] + 100, 0.0))
+                self.assertEqual(instance_result, result[args[0]])
+
+    def test_pool_is_reused(self):
+        pids = set(self.vectorize(worker_pid, PROCESSES)(range(20)))
+        worker_pool = parallel.get_worker_pool(PROCESSES)
+        self.assertLessEqual(len(pids), PROCESSES)
+        self.assertNotIn(os.getpid(), pids)
+
+        # the calls are run by the same worker processes
+        pids.update(self.vectorize(worker_pid, PROCESSES)(range(20)))
+        self.assertLessEqual(len(pids), PROCESSES)
+        self.assertIs(parallel.get_worker_pool(PROCESSES), worker_pool)
+
+        # a pool with another number of processes replaces it
+        self.vectorize(worker_pid, PROCESSES - 1)(range(20))
+        self.assertIsNot(parallel.get_worker_pool(PROCESSES - 1), worker_pool)
+
+    def test_broadcast_values_are_released(self):
+        first = self.vectorize(broadcast_call_id, PROCESSES, chunksize=1)(range(12), repeat('x' * 10 ** 5, 12))
+        second = self.vectorize(broadcast_call_id, PROCESSES, chunksize=1)(range(12), repeat('y', 12))
+        # all the calls of a call to vectorize share the broadcast values
+        for results, value in [(first, 'x' * 10 ** 5), (second, 'y')]:
+            self.assertEqual(len({call_id for call_id, _ in results}), 1)
+            self.assertIsNotNone(results[0][0])
+            self.assertTrue(all(v == value for _, v in results))
+        self.assertNotEqual(first[0][0], second[0][0])
+
+        # between the calls, none of the worker processes keeps them
+        worker_pool = parallel.get_worker_pool(PROCESSES)
+        self.assertEqual(worker_pool.pool.map(broadcast_cache, range(4 * PROCESSES), chunksize=1),
+                         [(None, None)] * (4 * PROCESSES))
+
+
+if __name__ == "__main__":
+    unittest.main()
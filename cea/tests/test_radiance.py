@@ -0,0 +1,188 @@
+"""
+Test the cache of the daylight coefficients calculated by Daysim (cea.resources.radiation.radiance), which are reused
+by later runs of the radiation script with the same geometry, sensors and radiance parameters, and the reading of the
+results of Daysim.
+"""
+
+import contextlib
+import csv
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from cea.constants import HOURS_IN_YEAR
+from cea.resources.radiation import radiance
+from cea.resources.radiation.radiance import CEADaySim, prune_daylight_coefficients
+
+__author__ = "Daren Thomas"
+__copyright__ = "Copyright 2024, Architecture and Building Systems - ETH Zurich"
+__credits__ = ["Daren Thomas"]
+__license__ = "MIT"
+__version__ = "0.1"
+__maintainer__ = "Daren Thomas"
+__email__ = "cea@arch.ethz.ch"
+__status__ = "Production"
+
+SITE_INFO = "place Zurich_CHE\nlatitude 47.38\nlongitude -8.57\ntime_zone -15\nsite_elevation 413.0\n" \
+            "weather_data_file_units 1\nground_reflectance 0.2\n"
+RADIANCE_PARAMETERS = {"rad_ab": 2, "rad_ad": 1000, "rad_as": 20, "rad_ar": 300, "rad_aa": 0.15, "rad_lr": 8,
+                       "rad_st": 0.5, "rad_sj": 0.7, "rad_lw": 0.05, "rad_dj": 0.7, "rad_ds": 0.0, "rad_dr": 0,
+                       "rad_dp": 32}
+
+
+def read_ill_in_memory(ill_path, max_value):
+    """Read the results of ds_illum at once (the implementation before the results were streamed to a memmap)"""
+    with open(ill_path) as f:
+        reader = csv.reader(f, delimiter=' ')
+        data = np.array([np.array(row[4:], dtype=np.float32) for row in reader]).T
+    if max_value is not None:
+        data = np.clip(data, a_min=0.0, a_max=max_value)
+    if data.shape[1] == HOURS_IN_YEAR + 24:
+        data = np.delete(data, range(1416, 1440), axis=1)
+    return data
+
+
+def write_ill(ill_path, values):
+    """Write the radiation of the sensors (hours x sensors) like ds_illum: month, day, hour, then the sensors"""
+    with open(ill_path, 'w') as f:
+        for hour, row in enumerate(values):
+            f.write('%i %i %.3f  %s\n' % (hour // 720 + 1, hour // 24 % 30 + 1, hour % 24 + 0.5,
+                                          ' '.join('%.2f' % v for v in row)))
+
+
+class TestDaylightCoefficientsCache(unittest.TestCase):
+
+    def setUp(self):
+        self.staging_path = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.staging_path, 'daylight_coefficients')
+        self.cea_daysim = self.make_cea_daysim()
+        rng = np.random.default_rng(0)
+        self.sensor_positions = rng.uniform(0, 100, (20, 3))
+        self.sensor_normals = rng.uniform(-1, 1, (20, 3))
+
+    def tearDown(self):
+        shutil.rmtree(self.staging_path, ignore_errors=True)
+
+    def make_cea_daysim(self, site_info=SITE_INFO, geometry='polygon building_0\n'):
+        cea_daysim = CEADaySim(self.staging_path, 'daysim_bin', 'daysim_lib')
+        for path, content in [(cea_daysim.daysim_material_path, 'void plastic wall\n'),
+                              (cea_daysim.daysim_geometry_path, geometry),
+                              (cea_daysim.wea_weather_path, 'place Zurich_CHE\n')]:
+            with open(path, 'w') as f:
+                f.write(content)
+        cea_daysim.site_info = site_info
+        return cea_daysim
+
+    def make_project(self, name, cea_daysim=None, sensor_positions=None):
+        project = (cea_daysim or self.cea_daysim).initialize_daysim_project(name)
+        project.create_sensor_input_file(self.sensor_positions if sensor_positions is None else sensor_positions,
+                                         self.sensor_normals)
+        return project
+
+    def key(self, project, cea_daysim=None, radiance_parameters=None):
+        return project.daylight_coefficients_key((cea_daysim or self.cea_daysim).hash_common_inputs(),
+                                                 radiance_parameters or RADIANCE_PARAMETERS)
+
+    def test_daylight_coefficients_key(self):
+        key = self.key(self.make_project('chunk_0'))
+        # the name of the project (the chunk) does not matter
+        self.assertEqual(self.key(self.make_project('chunk_1')), key)
+
+        # the sensors, the radiance parameters, the geometry and the site
+        moved_sensors = self.sensor_positions.copy()
+        moved_sensors[3, 2] += 0.01
+        self.assertNotEqual(self.key(self.make_project('chunk_2', sensor_positions=moved_sensors)), key)
+        self.assertNotEqual(self.key(self.make_project('chunk_0'),
+                                     radiance_parameters=dict(RADIANCE_PARAMETERS, rad_ab=3)), key)
+        for changed_input in [dict(geometry='polygon building_1\n'),
+                              dict(site_info=SITE_INFO.replace('latitude 47.38', 'latitude 47.5'))]:
+            cea_daysim = self.make_cea_daysim(**changed_input)
+            self.assertNotEqual(self.key(self.make_project('chunk_0', cea_daysim), cea_daysim), key)
+
+        # the weather data and the name of the place are not inputs of gen_dc
+        cea_daysim = self.make_cea_daysim(site_info=SITE_INFO.replace('Zurich_CHE', 'Zurich-Kloten_CHE'))
+        with open(cea_daysim.wea_weather_path, 'w') as f:
+            f.write('place Zurich-Kloten_CHE\n')
+        self.assertEqual(self.key(self.make_project('chunk_0', cea_daysim), cea_daysim), key)
+
+    def test_parse_site_info(self):
+        site_info = radiance.parse_site_info(SITE_INFO)
+        self.assertEqual(site_info['latitude'], '47.38')
+        self.assertEqual(site_info['ground_reflectance'], '0.2')
+        self.assertEqual(radiance.parse_site_info(None), {})
+
+    def test_save_and_load(self):
+        project = self.make_project('chunk_0')
+        key = self.key(project)
+        self.assertFalse(project.load_daylight_coefficients(self.cache_dir, key))
+
+        dc_files = {'chunk_0.dc': 'daylight coefficients\n', 'chunk_0_shading.dc': 'shading coefficients\n'}
+        for file_name, content in dc_files.items():
+            with open(os.path.join(project.project_path, file_name), 'w') as f:
+                f.write(content)
+        project.save_daylight_coefficients(self.cache_dir, key)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.cache_dir, key))),
+                         ['%s.dc' % radiance.CACHED_PROJECT_NAME, '%s_shading.dc' % radiance.CACHED_PROJECT_NAME])
+        # saving again (e.g. by another process) keeps the first copy
+        project.save_daylight_coefficients(self.cache_dir, key)
+        self.assertEqual(os.listdir(self.cache_dir), [key])
+
+        # another chunk with the same sensors
+        other_project = self.make_project('chunk_7')
+        self.assertEqual(self.key(other_project), key)
+        self.assertTrue(other_project.load_daylight_coefficients(self.cache_dir, key))
+        for file_name, content in dc_files.items():
+            with open(os.path.join(other_project.project_path, file_name.replace('chunk_0', 'chunk_7'))) as f:
+                self.assertEqual(f.read(), content)
+        with open(other_project.hea_path) as f:
+            self.assertIn('shading 1 static_system chunk_7.dc chunk_7.ill', f.read())
+
+    def test_prune_daylight_coefficients(self):
+        for key in ['a', 'b', 'c']:
+            os.makedirs(os.path.join(self.cache_dir, key, 'PROJECT.dc'))
+        prune_daylight_coefficients(self.cache_dir, {'a', 'c', 'd'})
+        self.assertEqual(sorted(os.listdir(self.cache_dir)), ['a', 'c'])
+        # nothing to prune without a cache
+        prune_daylight_coefficients(os.path.join(self.staging_path, 'missing'), {'a'})
+
+
+
+class TestEvalIll(unittest.TestCase):
+
+    def setUp(self):
+        self.staging_path = tempfile.mkdtemp()
+        cea_daysim = CEADaySim(self.staging_path, 'daysim_bin', 'daysim_lib')
+        for path in [cea_daysim.daysim_material_path, cea_daysim.daysim_geometry_path, cea_daysim.wea_weather_path]:
+            open(path, 'w').close()
+        self.project = cea_daysim.initialize_daysim_project('chunk_0')
+        self.ill_path = os.path.join(self.project.project_path, 'chunk_0.ill')
+
+    def tearDown(self):
+        shutil.rmtree(self.staging_path, ignore_errors=True)
+
+    def test_streaming_equals_in_memory(self):
+        rng = np.random.default_rng(0)
+        sensors = 7
+        for hours in [HOURS_IN_YEAR, HOURS_IN_YEAR + 24]:
+            write_ill(self.ill_path, rng.uniform(-5.0, 1200.0, (hours, sensors)))
+            for max_value in [None, 1000.0]:
+                expected = read_ill_in_memory(self.ill_path, max_value)
+                self.assertEqual(expected.shape, (sensors, HOURS_IN_YEAR))
+                # a single hour, a few blocks of hours (the last one shorter), all hours at once
+                for memory_limit in [1, 4 * sensors * 1000, 2 ** 30]:
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        data = self.project.eval_ill(memory_limit, max_value)
+                    self.assertIsInstance(data, np.memmap)
+                    self.assertEqual(data.dtype, np.float32)
+                    np.testing.assert_array_equal(data, expected)
+                    del data
+
+        self.assertTrue(os.path.exists(os.path.join(self.project.project_path, 'chunk_0.ill.npy')))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,331 @@
+"""
+Test the preparation of the Daysim radiation simulation (cea.resources.radiation.main and
+cea.resources.radiation.daysim) on synthetic buildings.
+"""
+
+import os
+import shutil
+import tempfile
+import types
+import unittest
+import warnings
+from unittest import mock
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from shapely.geometry import Polygon, box
+
+from cea.resources.radiation import daysim
+from cea.resources.radiation.daysim import GridSize, SensorGrid
+from cea.resources.radiation.main import calc_chunks, estimate_sensors_number, to_projected_coordinate_system
+from cea.utilities.solar_equations import SENSOR_SCALE_KEY, read_sensor_results
+
+__author__ = "Daren Thomas"
+__copyright__ = "Copyright 2024, Architecture and Building Systems - ETH Zurich"
+__credits__ = ["Daren Thomas"]
+__license__ = "MIT"
+__version__ = "0.1"
+__maintainer__ = "Daren Thomas"
+__email__ = "cea@arch.ethz.ch"
+__status__ = "Production"
+
+UTM_32N = "EPSG:32632"
+
+
+class FakePy3dModel(object):
+    """
+    Stands in for the py3dmodel functions used to create the sensors: a face is a rectangle ``(x, y, z, width, height)``
+    in a vertical plane, divided into a grid of cells of at most ``grid_size`` x ``grid_size`` from its corner
+    """
+
+    class calculate(object):
+        @staticmethod
+        def face_midpt(face):
+            x, y, z, width, height = face
+            return x + width / 2, y, z + height / 2
+
+        @staticmethod
+        def face_area(face):
+            return face[3] * face[4]
+
+    class modify(object):
+        move_pt = staticmethod(lambda pt, normal, distance: pt)
+        move = staticmethod(lambda pt, location_pt, face: face)
+
+    class fetch(object):
+        topo2topotype = staticmethod(lambda face: face)
+
+    class construct(object):
+        @staticmethod
+        def grid_face(face, du, dv):
+            x, y, z, width, height = face
+            return [(x + i * du, y, z + j * dv, min(du, width - i * du), min(dv, height - j * dv))
+                    for i in range(int(np.ceil(width / du))) for j in range(int(np.ceil(height / dv)))]
+
+
+def make_building_geometry(x0=0.0):
+    return types.SimpleNamespace(
+        walls=[(x0, 0.0, 0.0, 5.0, 3.0), (x0, 2.0, 0.0, 2.5, 2.0)], orientation_walls=['north', 'east'],
+        normals_walls=[(0.0, 1.0, 0.0), (1.0, 0.0, 0.0)], intersect_walls=[0, 1],
+        windows=[(x0, 1.0, 1.0, 1.0, 1.0)], orientation_windows=['south'], normals_windows=[(0.0, -1.0, 0.0)],
+        roofs=[(x0, 0.0, 3.0, 4.0, 5.0)])
+
+
+def list_sensors_building(building_geometry, grid_size):
+    """The sensors of a building as lists of the properties of each sensor (the implementation before SensorGrid)"""
+    sensors = dict((key, []) for key in ['dir', 'cord', 'type', 'area', 'orientation', 'intersection'])
+    for srf_type in ['walls', 'windows', 'roofs']:
+        occface_list = getattr(building_geometry, srf_type)
+        if srf_type == 'roofs':
+            orientation_list = ['top'] * len(occface_list)
+            normals_list = [(0.0, 0.0, 1.0)] * len(occface_list)
+            interesection_list = [0] * len(occface_list)
+        else:
+            orientation_list = getattr(building_geometry, "orientation_" + srf_type)
+            normals_list = getattr(building_geometry, "normals_" + srf_type)
+            interesection_list = getattr(building_geometry, "intersect_" + srf_type, [0] * len(occface_list))
+        for orientation, normal, face, intersection in zip(orientation_list, normals_list, occface_list,
+                                                           interesection_list):
+            sensor_surfaces = FakePy3dModel.construct.grid_face(
+                face, grid_size.roof if srf_type == "roofs" else grid_size.walls,
+                grid_size.roof if srf_type == "roofs" else grid_size.walls)
+            sensors['intersection'].extend(intersection for _ in sensor_surfaces)
+            sensors['dir'].extend(normal for _ in sensor_surfaces)
+            sensors['cord'].extend(FakePy3dModel.calculate.face_midpt(x) for x in sensor_surfaces)
+            sensors['type'].extend(srf_type for _ in sensor_surfaces)
+            sensors['orientation'].extend(orientation for _ in sensor_surfaces)
+            sensors['area'].extend(FakePy3dModel.calculate.face_area(x) * (1.0 - intersection)
+                                   for x in sensor_surfaces)
+    return sensors
+
+
+def make_box_zone(width, depth, height):
+    """A single building of ``width`` x ``depth`` m (in UTM zone 32N, near Zurich)"""
+    x0, y0 = 465000.0, 5247000.0
+    return gpd.GeoDataFrame({'Name': ['B1001'], 'height_ag': [height]},
+                            geometry=[box(x0, y0, x0 + width, y0 + depth)], crs=UTM_32N)
+
+
+class TestEstimateSensorsNumber(unittest.TestCase):
+
+    def test_sensors_number(self):
+        grid_size = GridSize(walls=2, roof=4)
+        zone_df = gpd.GeoDataFrame(
+            {'height_ag': [10.0, 15.0]},
+            geometry=[box(0, 0, 9, 5),
+                      # a courtyard building: the walls of the courtyard have sensors too
+                      Polygon([(0, 0), (20, 0), (20, 20), (0, 20)], [[(5, 5), (10, 5), (10, 10), (5, 10)]])],
+            index=pd.Index(['B1001', 'B1002'], name='Name'))
+        expected = [2 * (5 + 3) * 5 + np.ceil(45 / 16), (4 * 10 + 4 * 3) * 8 + np.ceil(375 / 16)]
+        pd.testing.assert_series_equal(estimate_sensors_number(zone_df, grid_size),
+                                       pd.Series(expected, index=zone_df.index).astype(np.int64))
+        self.assertEqual(len(estimate_sensors_number(zone_df.iloc[:0], grid_size)), 0)
+
+    def test_sensors_number_in_meters(self):
+        grid_size = GridSize(walls=200, roof=10)
+        zone_df = make_box_zone(20.0, 20.0, 10.0)
+        # 4 walls with 1 sensor each, 4 roof cells of 10 x 10 m
+        self.assertEqual(estimate_sensors_number(zone_df.set_index('Name'), grid_size)['B1001'], 8)
+
+        # the zone geometry is stored in WGS84: in degrees the roof has a single sensor
+        zone_wgs84 = zone_df.to_crs("EPSG:4326")
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)
+            self.assertEqual(estimate_sensors_number(zone_wgs84.set_index('Name'), grid_size)['B1001'], 5)
+        # back in meters (the round trip adds a tiny fraction of a square meter to the roof: one more roof cell)
+        projected_df = to_projected_coordinate_system(zone_wgs84)
+        self.assertEqual(projected_df.crs.to_epsg(), 32632)
+        self.assertEqual(estimate_sensors_number(projected_df.set_index('Name'), grid_size)['B1001'], 9)
+
+        zone_df = make_box_zone(25.0, 37.0, 10.0)
+        self.assertEqual(estimate_sensors_number(to_projected_coordinate_system(zone_df.to_crs("EPSG:4326"))
+                                                 .set_index('Name'), grid_size)['B1001'], 4 + 10)
+
+
+class TestCalcChunks(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.sensors_number = pd.Series(rng.choice([100, 120, 800, 1500], 200, p=[0.5, 0.4, 0.07, 0.03]),
+                                        index=['B%04i' % i for i in range(200)])
+
+    def check_chunks(self, chunks, num_chunks):
+        self.assertEqual(len(chunks), num_chunks)
+        # each building once, in the order of the buildings in each chunk
+        self.assertEqual(sorted(b for chunk in chunks for b in chunk), sorted(self.sensors_number.index))
+        for chunk in chunks:
+            self.assertEqual(chunk, [b for b in self.sensors_number.index if b in chunk])
+        chunk_sensors = [self.sensors_number[chunk].sum() for chunk in chunks]
+        self.assertEqual(chunk_sensors, sorted(chunk_sensors, reverse=True))
+        return chunk_sensors
+
+    def test_balanced_chunks(self):
+        for num_chunks in [1, 4, 8, 13]:
+            chunk_sensors = self.check_chunks(calc_chunks(self.sensors_number, num_chunks), num_chunks)
+            # no chunk has more than the average plus the largest building
+            self.assertLessEqual(max(chunk_sensors),
+                                 self.sensors_number.sum() / num_chunks + self.sensors_number.max())
+
+            # better than chunks of consecutive buildings
+            size = -(-len(self.sensors_number) // num_chunks)
+            consecutive = [self.sensors_number.iloc[i:i + size].sum() for i in range(0, len(self.sensors_number), size)]
+            self.assertLessEqual(max(chunk_sensors), max(consecutive))
+            if num_chunks > 1:
+                self.assertLess(max(chunk_sensors) / np.mean(chunk_sensors), 1.05)
+
+    def test_large_building(self):
+        self.sensors_number['B0042'] = 10 ** 6
+        chunks = calc_chunks(self.sensors_number, 4)
+        self.check_chunks(chunks, 4)
+        self.assertEqual(chunks[0], ['B0042'])
+
+    def test_more_chunks_than_buildings(self):
+        self.sensors_number = self.sensors_number.iloc[:3]
+        self.check_chunks(calc_chunks(self.sensors_number, 8), 3)
+        self.assertEqual(calc_chunks(self.sensors_number.iloc[:0], 4), [])
+
+
+
+class TestSensorGrid(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(daysim, 'py3dmodel', FakePy3dModel)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.grid_size = GridSize(roof=2, walls=1)
+        self.output_dir = tempfile.mkdtemp()
+        self.locator = types.SimpleNamespace(
+            get_radiation_metadata=lambda building: os.path.join(self.output_dir, building + '_geometry.csv'))
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    def test_sensors_building_matches_lists(self):
+        building_geometry = make_building_geometry()
+        sensors = daysim.calc_sensors_building(building_geometry, self.grid_size)
+        expected = list_sensors_building(building_geometry, self.grid_size)
+        self.assertIsInstance(sensors, SensorGrid)
+        self.assertEqual(len(sensors.area), 15 + 3 * 2 + 1 + 2 * 3)
+        np.testing.assert_array_equal(sensors.coords, np.array(expected['cord']))
+        np.testing.assert_array_equal(sensors.dirs, np.array(expected['dir']))
+        np.testing.assert_array_equal(sensors.area, expected['area'])
+        np.testing.assert_array_equal(sensors.intersection, expected['intersection'])
+        self.assertEqual([daysim.SENSOR_TYPES[t] for t in sensors.type], expected['type'])
+        self.assertEqual([daysim.SENSOR_ORIENTATIONS[o] for o in sensors.orientation], expected['orientation'])
+        # the sensors of the intersecting wall have no area
+        self.assertTrue((sensors.area[15:21] == 0.0).all())
+
+        groups = daysim.calc_surface_groups(sensors)
+        self.assertEqual([daysim.SURFACE_GROUPS[g] for g in groups],
+                         [f"{t}_{o}" for t, o in zip(expected['type'], expected['orientation'])])
+
+    def test_sensor_metadata(self):
+        building_geometry = make_building_geometry()
+        sensors = daysim.calc_sensors_building(building_geometry, self.grid_size)
+        daysim.write_sensor_metadata('B1001', sensors, self.locator)
+
+        expected = list_sensors_building(building_geometry, self.grid_size)
+        expected = pd.DataFrame({'BUILDING': 'B1001',
+                                 'SURFACE': ['srf' + str(x) for x in range(len(expected['area']))],
+                                 'orientation': expected['orientation'],
+                                 'intersection': expected['intersection'],
+                                 'Xcoor': [x[0] for x in expected['cord']],
+                                 'Ycoor': [x[1] for x in expected['cord']],
+                                 'Zcoor': [x[2] for x in expected['cord']],
+                                 'Xdir': [x[0] for x in expected['dir']],
+                                 'Ydir': [x[1] for x in expected['dir']],
+                                 'Zdir': [x[2] for x in expected['dir']],
+                                 'AREA_m2': expected['area'],
+                                 'TYPE': expected['type']})
+        pd.testing.assert_frame_equal(pd.read_csv(self.locator.get_radiation_metadata('B1001')), expected)
+
+    def test_concatenate_and_slice(self):
+        buildings = [daysim.calc_sensors_building(make_building_geometry(x0), self.grid_size) for x0 in [0.0, 10.0]]
+        sensors = daysim.concatenate_sensor_grids(buildings)
+        n = len(buildings[0].area)
+        for building, (start, stop) in zip(buildings, [(0, n), (n, 2 * n)]):
+            for expected, actual in zip(building, daysim.slice_sensor_grid(sensors, start, stop)):
+                np.testing.assert_array_equal(actual, expected)
+
+        empty = daysim.concatenate_sensor_grids([])
+        self.assertEqual(empty.coords.shape, (0, 3))
+        self.assertEqual(len(daysim.calc_surface_groups(empty)), 0)
+
+    def test_unrecognized_surface(self):
+        sensors = daysim.calc_sensors_building(make_building_geometry(), self.grid_size)
+        sensors.orientation[0] = daysim.SENSOR_ORIENTATIONS.index('top')
+        with self.assertRaises(ValueError):
+            daysim.calc_surface_groups(sensors)
+
+    def test_sensor_codes(self):
+        self.assertEqual(list(daysim.get_sensor_codes(3)), ['srf0', 'srf1', 'srf2'])
+        self.assertEqual(list(daysim.get_sensor_codes(2500)), ['srf' + str(x) for x in range(2500)])
+        self.assertEqual(list(daysim.get_sensor_codes(0)), [])
+
+
+
+def make_sensor_grid(n, rng):
+    """A random SensorGrid of ``n`` sensors on the walls and windows, without windows facing west"""
+    sensors = SensorGrid(coords=rng.uniform(size=(n, 3)), dirs=rng.uniform(size=(n, 3)), area=rng.uniform(0.5, 4.0, n),
+                         type=rng.choice([0, 1], n).astype(np.uint8),
+                         orientation=rng.choice([0, 1, 2], n).astype(np.uint8),
+                         intersection=rng.choice([0, 1], n, p=[0.9, 0.1]).astype(np.int8))
+    # and a few sensors on the roof
+    sensors.type[-5:] = daysim.SENSOR_TYPES.index('roofs')
+    sensors.orientation[-5:] = daysim.SENSOR_ORIENTATIONS.index('top')
+    return sensors
+
+
+class TestSensorResults(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.locator = types.SimpleNamespace(
+            get_radiation_building=lambda building: os.path.join(self.output_dir, building + '_radiation.csv'))
+        rng = np.random.default_rng(0)
+        self.sensors = make_sensor_grid(300, rng)
+        self.sensor_values = rng.uniform(0.0, 1000.0, (300, 48)).astype(np.float32)
+        self.date = pd.date_range('2005-01-01', periods=48, freq='h')
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    def test_aggregated_results_equal_dense_sum(self):
+        daysim.write_aggregated_results('B1001', self.sensor_values, self.sensors, self.locator, self.date)
+        results = pd.read_csv(self.locator.get_radiation_building('B1001'), index_col='Date')
+        self.assertEqual(list(results.index), [str(d) for d in self.date])
+
+        labels = np.array([f"{daysim.SENSOR_TYPES[t]}_{daysim.SENSOR_ORIENTATIONS[o]}"
+                           for t, o in zip(self.sensors.type, self.sensors.orientation)])
+        for surface in daysim.SURFACE_GROUPS:
+            in_surface = labels == surface
+            radiation_kW = (self.sensor_values[in_surface].astype(np.float64)
+                            * self.sensors.area[in_surface, np.newaxis]).sum(axis=0) / 1000
+            # the results are rounded to 2 decimals
+            np.testing.assert_allclose(results[f"{surface}_kW"], radiation_kW, atol=0.0051, err_msg=surface)
+            np.testing.assert_allclose(results[f"{surface}_m2"], self.sensors.area[in_surface].sum(), atol=0.0051)
+        # surfaces without sensors
+        self.assertTrue((results[['windows_west_kW', 'windows_west_m2']] == 0.0).all(axis=None))
+
+    def test_sensor_results_round_trip(self):
+        sensor_data_path = os.path.join(self.output_dir, 'B1001_insolation_Whm2.feather')
+        self.sensor_values[0, :3] = [-1.0, 0.04, 3276.7]
+        for data_format, tolerance in [('float32', 0.0), ('int16', daysim.SENSOR_INT16_SCALE / 2)]:
+            daysim.write_sensor_results(sensor_data_path, self.sensor_values, data_format)
+            results = read_sensor_results(sensor_data_path)
+            self.assertEqual(list(results.columns), ['srf' + str(x) for x in range(300)])
+            self.assertTrue((results.dtypes == np.float32).all())
+            # within half the quantization step of the int16 format (and the precision of float32)
+            np.testing.assert_allclose(results.to_numpy(), self.sensor_values.T, rtol=np.finfo(np.float32).eps,
+                                       atol=tolerance)
+
+        table = daysim.feather.read_table(sensor_data_path)
+        self.assertEqual(table.schema.metadata[SENSOR_SCALE_KEY], str(daysim.SENSOR_INT16_SCALE).encode())
+        self.assertTrue(all(str(field.type) == 'int16' for field in table.schema))
+        with self.assertRaises(ValueError):
+            daysim.write_sensor_results(sensor_data_path, self.sensor_values, 'float16')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+"""
+Test the selection of the sample buildings and the surrogate models of the simplified radiation
+(cea.resources.radiation.simplified.main) on synthetic buildings.
+"""
+
+import unittest
+import warnings
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from shapely.geometry import box
+
+from cea.resources.radiation.daysim import SURFACE_GROUPS
+from cea.resources.radiation.main import to_projected_coordinate_system
+from cea.resources.radiation.simplified.main import calc_building_features, calc_surface_features, \
+    fit_surrogate_models, select_sample_buildings
+
+__author__ = "Daren Thomas"
+__copyright__ = "Copyright 2024, Architecture and Building Systems - ETH Zurich"
+__credits__ = ["Daren Thomas"]
+__license__ = "MIT"
+__version__ = "0.1"
+__maintainer__ = "Daren Thomas"
+__email__ = "cea@arch.ethz.ch"
+__status__ = "Production"
+
+UTM_32N = "EPSG:32632"
+
+
+def make_zone():
+    """
+    Three 10 x 10 m buildings in a row from west to east, 10 m apart, with a fourth building 100 m north of the first
+    one (in UTM zone 32N, near Zurich)
+    """
+    x0, y0 = 465000.0, 5247000.0
+    geometry = [box(x0, y0, x0 + 10, y0 + 10), box(x0 + 20, y0, x0 + 30, y0 + 10), box(x0 + 40, y0, x0 + 50, y0 + 10),
+                box(x0, y0 + 110, x0 + 10, y0 + 120)]
+    return gpd.GeoDataFrame({'Name': ['B1001', 'B1002', 'B1003', 'B1004'], 'height_ag': [10.0, 30.0, 12.0, 20.0]},
+                            geometry=geometry, crs=UTM_32N)
+
+
+class TestBuildingFeatures(unittest.TestCase):
+
+    def test_obstruction_angles(self):
+        features = calc_building_features(make_zone(), buffer_m=15.0)
+        self.assertEqual(list(features.index), ['B1001', 'B1002', 'B1003', 'B1004'])
+        np.testing.assert_array_equal(features['height_ag'], [10.0, 30.0, 12.0, 20.0])
+
+        # B1001 looks east at B1002 (30 m high, 10 m away): above half of its height for the facade, above its
+        # height for the roof
+        self.assertAlmostEqual(features.loc['B1001', 'obstruction_east'], np.degrees(np.arctan((30.0 - 5.0) / 10.0)))
+        self.assertAlmostEqual(features.loc['B1001', 'obstruction_top'], np.degrees(np.arctan((30.0 - 10.0) / 10.0)))
+        self.assertEqual(features.loc['B1001', 'obstruction_west'], 0.0)
+        # B1002 has lower neighbours on both sides, the largest angle of each facade is kept
+        self.assertAlmostEqual(features.loc['B1002', 'obstruction_east'], 0.0)
+        self.assertAlmostEqual(features.loc['B1003', 'obstruction_west'], np.degrees(np.arctan((30.0 - 6.0) / 10.0)))
+        # B1004 is further than the buffer from the others
+        self.assertTrue((features.loc['B1004'].drop('height_ag') == 0.0).all())
+        self.assertTrue((features.loc[['B1001', 'B1002', 'B1003'], 'obstruction_north'] == 0.0).all())
+
+    def test_features_in_meters(self):
+        """The zone geometry is stored in WGS84, the features are calculated in its projected coordinate system"""
+        expected = calc_building_features(make_zone(), buffer_m=15.0)
+        zone_wgs84 = make_zone().to_crs("EPSG:4326")
+        pd.testing.assert_frame_equal(calc_building_features(to_projected_coordinate_system(zone_wgs84), 15.0),
+                                      expected, atol=0.1)
+        # in degrees, all buildings are neighbours and the obstruction angles are off
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)
+            features_in_degrees = calc_building_features(zone_wgs84, 15.0)
+        self.assertFalse(np.allclose(features_in_degrees, expected, atol=0.1))
+
+
+class TestSampleBuildings(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.features = pd.DataFrame({'height_ag': rng.uniform(10.0, 20.0, 30),
+                                      'obstruction_top': rng.uniform(0.0, 10.0, 30)},
+                                     index=['B%04i' % i for i in range(30)])
+        # two outliers
+        self.features.loc['B0007'] = [80.0, 5.0]
+        self.features.loc['B0021'] = [15.0, 60.0]
+
+    def test_sample_covers_the_features(self):
+        sample = select_sample_buildings(self.features, 5)
+        self.assertEqual(len(sample), 5)
+        self.assertEqual(len(set(sample)), 5)
+        # in the order of the buildings
+        self.assertEqual(sample, [b for b in self.features.index if b in sample])
+        self.assertIn('B0007', sample)
+        self.assertIn('B0021', sample)
+
+        # the first sample building is the most typical one
+        values = (self.features - self.features.mean()) / self.features.std(ddof=0)
+        self.assertEqual(select_sample_buildings(self.features, 1), [values.pow(2).sum(axis=1).idxmin()])
+
+    def test_sample_size_larger_than_zone(self):
+        self.assertEqual(select_sample_buildings(self.features.iloc[:4], 10), list(self.features.index[:4]))
+
+    def test_constant_features(self):
+        self.features['obstruction_top'] = 0.0
+        sample = select_sample_buildings(self.features, 3)
+        self.assertEqual(len(set(sample)), 3)
+        self.assertIn('B0007', sample)
+
+
+class TestSurrogateModels(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.features = pd.DataFrame(rng.uniform(0.0, 40.0, (8, 6)), index=['B%04i' % i for i in range(8)],
+                                     columns=['height_ag', 'obstruction_north', 'obstruction_east',
+                                              'obstruction_south', 'obstruction_west', 'obstruction_top'])
+        hours = 24
+        self.sample_data = rng.uniform(50.0, 500.0, (len(SURFACE_GROUPS), len(self.features), hours))
+        # the windows to the west are missing in two of the sample buildings
+        self.sample_data[SURFACE_GROUPS.index('windows_west'), [2, 5]] = np.nan
+
+    def loo_errors(self, surface, model):
+        """The error of the annual radiation of each sample building, refitting the model without it"""
+        g = SURFACE_GROUPS.index(surface)
+        valid = ~np.isnan(self.sample_data[g]).any(axis=1)
+        y = self.sample_data[g][valid]
+        x = calc_surface_features(self.features, surface, model)[valid]
+        errors = []
+        for i in range(len(y)):
+            others = np.arange(len(y)) != i
+            beta = np.linalg.lstsq(x[others], y[others], rcond=None)[0]
+            errors.append(abs((y[i] - x[i] @ beta).sum()) / y.sum(axis=1).mean())
+        return np.array(errors)
+
+    def test_leave_one_out_errors(self):
+        for model in ['mean', 'regression']:
+            coefficients, errors = fit_surrogate_models(self.sample_data, self.features, model)
+            self.assertEqual(list(errors.index), list(SURFACE_GROUPS))
+            for g, surface in enumerate(SURFACE_GROUPS):
+                expected = self.loo_errors(surface, model)
+                self.assertAlmostEqual(errors.loc[surface, 'mean_error'], expected.mean(), msg=surface)
+                self.assertAlmostEqual(errors.loc[surface, 'max_error'], expected.max(), msg=surface)
+                self.assertEqual(coefficients[g].shape, (1 if model == 'mean' else 3, self.sample_data.shape[2]))
+
+    def test_mean_model(self):
+        coefficients, _ = fit_surrogate_models(self.sample_data, self.features, 'mean')
+        g = SURFACE_GROUPS.index('windows_west')
+        np.testing.assert_allclose(coefficients[g][0], np.nanmean(self.sample_data[g], axis=0))
+
+    def test_regression_model_is_exact_for_linear_data(self):
+        x = calc_surface_features(self.features, 'walls_south', 'regression')
+        beta = np.array([[300.0, 200.0], [2.0, -1.0], [-3.0, 0.5]])
+        sample_data = self.sample_data[:, :, :2].copy()
+        sample_data[SURFACE_GROUPS.index('walls_south')] = x @ beta
+        coefficients, errors = fit_surrogate_models(sample_data, self.features, 'regression')
+        np.testing.assert_allclose(coefficients[SURFACE_GROUPS.index('walls_south')], beta)
+        self.assertAlmostEqual(errors.loc['walls_south', 'max_error'], 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+"""
+Test the whole-year solver of the R-C-model (cea.demand.rc_model_SIA_annual) against the hourly procedure of
+:py:func:`cea.demand.thermal_loads.calc_Qhs_Qcs` on synthetic buildings, without the reference case.
+"""
+
+import copy
+import types
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from cea.constants import HOURS_IN_YEAR
+from cea.demand import rc_model_SIA_annual, thermal_loads, ventilation_air_flows_simple
+from cea.demand.rc_model_SIA_annual import can_use_annual_solver
+
+__author__ = "Daren Thomas"
+__copyright__ = "Copyright 2024, Architecture and Building Systems - ETH Zurich"
+__credits__ = ["Daren Thomas"]
+__license__ = "MIT"
+__version__ = "0.1"
+__maintainer__ = "Daren Thomas"
+__email__ = "cea@arch.ethz.ch"
+__status__ = "Production"
+
+# the buildings supported by the annual solver: emission systems, ventilation, power of the systems and hemisphere
+BUILDINGS = [dict(),
+             dict(class_hs='FLOOR_HEATING', class_cs='FLOOR_COOLING', mech_vent=False, win_vent=True),
+             dict(class_hs='NONE', class_cs='NONE'),
+             dict(q_max_Wm2=(15, 10), heat_rec=False),  # the heating and cooling systems reach their power
+             dict(southern_hemisphere=True, win_vent=True),
+             dict(class_cs='NONE', q_max_Wm2=(10, 5))]
+
+
+def make_building(seed, class_hs='RADIATOR', class_cs='CEILING_COOLING', mech_vent=True, win_vent=False,
+                  heat_rec=True, q_max_Wm2=(80, 60), southern_hemisphere=False):
+    """
+    The building properties and the time series data of a 500 m2 building with synthetic weather, occupancy and
+    set points, ready for the R-C-model (as after the calculation of the set points in
+    :py:func:`cea.demand.thermal_loads.calc_thermal_loads`)
+    """
+    rng = np.random.default_rng(seed)
+    hours = np.arange(HOURS_IN_YEAR)
+    T_ext = 10 - 12 * np.cos(2 * np.pi * hours / HOURS_IN_YEAR) + 6 * np.sin(2 * np.pi * hours / 24) + \
+        rng.normal(0, 2, HOURS_IN_YEAR)
+    if southern_hemisphere:
+        T_ext = 20 - (T_ext - 10)
+    weather_data = pd.DataFrame({'drybulb_C': T_ext, 'wetbulb_C': T_ext - 2,
+                                 'relhum_percent': rng.uniform(30, 90, HOURS_IN_YEAR), 'skytemp_C': T_ext - 10,
+                                 'windspd_ms': rng.uniform(0, 5, HOURS_IN_YEAR)})
+    seasons = {'heat_starts': '01|04', 'heat_ends': '30|09', 'cool_starts': '01|10', 'cool_ends': '31|03'} \
+        if southern_hemisphere else \
+        {'heat_starts': '16|09', 'heat_ends': '31|05', 'cool_starts': '01|06', 'cool_ends': '15|09'}
+    hvac = dict(seasons, **{'MECH_VENT': mech_vent, 'WIN_VENT': win_vent, 'HEAT_REC': heat_rec, 'NIGHT_FLSH': False,
+                            'ECONOMIZER': False, 'class_hs': class_hs, 'class_cs': class_cs, 'convection_hs': 0.5,
+                            'convection_cs': 0.3, 'Qhsmax_Wm2': q_max_Wm2[0], 'Qcsmax_Wm2': q_max_Wm2[1],
+                            'Tc_sup_air_ahu_C': 16.0, 'Tc_sup_air_aru_C': 14.0, 'has-heating-season': True,
+                            'has-cooling-season': True, 'dT_Qhs': 0.5, 'dThs_C': 0.3, 'dT_Qcs': -0.4,
+                            'dTcs_C': -0.2, 'type_ctrl': 'T1'})
+    I_sol = np.clip(np.sin(2 * np.pi * (hours - 6) / 24), 0, None) * rng.uniform(2000, 15000, HOURS_IN_YEAR)
+    bpr = types.SimpleNamespace(
+        name='B%04i' % seed, hvac=hvac,
+        rc_model={'Atot': 4.5 * 500, 'Am': 2.5 * 500, 'Awin_ag': 60.0, 'Htr_w': 60 * 2.0, 'Htr_op': 300.0,
+                  'Cm': 165000 * 500, 'Af': 500.0, 'Aef': 550.0, 'U_wall': 0.4, 'U_roof': 0.3, 'U_win': 2.0,
+                  'Awall_ag': 400.0, 'Aroof': 200.0, 'Aop_bg': 150.0, 'U_base': 0.5},
+        architecture=types.SimpleNamespace(Hs_ag=0.8, e_wall=0.9, e_roof=0.9, e_win=0.89, win_wall=0.3, n50=2.0),
+        geometry={'floor_height': 3.0}, solar=types.SimpleNamespace(I_sol=I_sol),
+        comfort={'RH_max_pc': 70, 'Tcs_set_C': 26})
+
+    tsd = thermal_loads.initialize_timestep_data(bpr, weather_data)
+    occupied = (np.sin(2 * np.pi * (hours - 8) / 24) > 0).astype(float)
+    tsd['Qs'] = pd.Series(occupied * 70 * 20)
+    tsd['El'] = occupied * 5 * 500
+    tsd['Ea'] = occupied * 8 * 500
+    tsd['Epro'] = np.zeros(HOURS_IN_YEAR)
+    tsd['w_int'] = occupied * 0.0001
+    tsd['ve_lps'] = occupied * 10 * 20 + 1
+    tsd['Qcdata_sys'] = np.zeros(HOURS_IN_YEAR)
+    tsd['Qcre_sys'] = rng.uniform(0, 10, HOURS_IN_YEAR)
+    # set backs at night, some of them without any heating
+    tsd['ta_hs_set'] = np.where(occupied > 0, 21.0, np.where(rng.random(HOURS_IN_YEAR) < 0.3, np.nan, 16.0))
+    tsd['ta_cs_set'] = np.where(occupied > 0, 24.0, np.nan)
+    for key in ['RSE_wall', 'RSE_roof', 'RSE_win']:
+        tsd[key] = np.full(HOURS_IN_YEAR, 0.04)
+    t_start = next(thermal_loads.get_hours(bpr)) - 1
+    tsd['T_int'][t_start] = tsd['T_ext'][t_start]
+    tsd['x_int'][t_start] = thermal_loads.convert_rh_to_moisture_content(tsd['rh_ext'][t_start],
+                                                                          tsd['T_ext'][t_start])
+    return bpr, tsd
+
+
+def make_config(rc_model_solver):
+    return types.SimpleNamespace(demand=types.SimpleNamespace(overheating_warning=False,
+                                                              rc_model_solver=rc_model_solver))
+
+
+def calc_loads(rc_model_solver, bpr, tsd):
+    return thermal_loads.calc_Qhs_Qcs(bpr, copy.deepcopy(tsd), False, make_config(rc_model_solver))
+
+
+class TestAnnualSolver(unittest.TestCase):
+
+    def assert_tsd_equal(self, tsd, expected, msg):
+        self.assertEqual(sorted(tsd), sorted(expected), msg)
+        for key, expected_values in expected.items():
+            values, expected_values = np.asarray(tsd[key]), np.asarray(expected_values)
+            if expected_values.dtype.kind in 'SUO':
+                np.testing.assert_array_equal(values, expected_values, err_msg='%s of %s' % (key, msg))
+            else:
+                np.testing.assert_allclose(values, expected_values, rtol=1e-12, atol=1e-9,
+                                           err_msg='%s of %s' % (key, msg))
+
+    def test_annual_equals_hourly(self):
+        for seed, building in enumerate(BUILDINGS):
+            bpr, tsd = make_building(seed, **building)
+            self.assertTrue(can_use_annual_solver(bpr, False), building)
+            expected = calc_loads('hourly', bpr, tsd)
+            self.assert_tsd_equal(calc_loads('annual', bpr, tsd), expected, str(building))
+            if building.get('q_max_Wm2') == (15, 10):
+                # the power of the heating system is reached
+                self.assertAlmostEqual(np.nanmax(expected['Qhs_sen_sys']), 15 * bpr.rc_model['Af'])
+
+    def test_batch_equals_hourly(self):
+        bprs, tsds, expected = [], [], []
+        for seed, building in enumerate(BUILDINGS):
+            bpr, tsd = make_building(seed, **building)
+            expected.append(calc_loads('hourly', bpr, tsd))
+            ventilation_air_flows_simple.calc_m_ve_required(tsd)
+            ventilation_air_flows_simple.calc_m_ve_leakage_simple(bpr, tsd)
+            bprs.append(bpr)
+            tsds.append(tsd)
+        tsds = rc_model_SIA_annual.calc_heating_cooling_loads_batch(bprs, tsds, make_config('annual'))
+        for building, tsd, expected_tsd in zip(BUILDINGS, tsds, expected):
+            self.assert_tsd_equal(tsd, expected_tsd, str(building))
+
+    def test_unsupported_buildings(self):
+        bpr, _ = make_building(0)
+        self.assertFalse(can_use_annual_solver(bpr, True))
+        for changed_hvac in [dict(NIGHT_FLSH=True), dict(ECONOMIZER=True), dict(class_hs='CENTRAL_AC'),
+                             dict(class_cs='DECENTRALIZED_AC')]:
+            unsupported_bpr = copy.copy(bpr)
+            unsupported_bpr.hvac = dict(bpr.hvac, **changed_hvac)
+            self.assertFalse(can_use_annual_solver(unsupported_bpr, False), changed_hvac)
+
+
+if __name__ == "__main__":
+    unittest.main()
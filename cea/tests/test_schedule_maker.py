@@ -0,0 +1,218 @@
+"""
+Test the schedule-maker (cea.demand.schedule_maker.schedule_maker) on synthetic buildings with the weekly schedules of
+the CH use types.
+"""
+
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import cea.inputlocator
+import cea.demand.schedule_maker.schedule_maker as schedule_maker
+from cea.datamanagement.schedule_helper import read_cea_schedule
+
+__author__ = "Daren Thomas"
+__copyright__ = "Copyright 2024, Architecture and Building Systems - ETH Zurich"
+__credits__ = ["Daren Thomas"]
+__license__ = "MIT"
+__version__ = "0.1"
+__maintainer__ = "Daren Thomas"
+__email__ = "cea@arch.ethz.ch"
+__status__ = "Production"
+
+USE_TYPES_FOLDER = os.path.join(os.path.dirname(cea.inputlocator.__file__), 'databases', 'CH', 'archetypes',
+                                'use_types')
+USE_TYPES = ['OFFICE', 'MULTI_RES', 'RETAIL', 'SERVERROOM']
+DATE_RANGE = pd.date_range('2009-01-01', periods=8760, freq='h')
+
+
+def per_hour_yearly_vector(date_range, days_in_schedule, schedule_array, monthly_multiplier,
+                           normalize_first_daily_profile=False):
+    """The yearly schedule expanded hour by hour, as get_yearly_vectors did before its lookup table"""
+    array_week, array_sat, array_sun = schedule_array.reshape(3, int(len(schedule_array) / days_in_schedule))
+    if normalize_first_daily_profile:
+        norm_weekday_max = array_week.sum() ** -1 if array_week.sum() != 0.0 else 0.0
+        norm_sat_max = array_sat.sum() ** -1 if array_sat.sum() != 0.0 else 0.0
+        norm_sun_max = array_sun.sum() ** -1 if array_sun.sum() != 0.0 else 0.0
+    else:
+        norm_weekday_max, norm_sat_max, norm_sun_max = 1.0, 1.0, 1.0
+
+    yearly_array = []
+    for date in date_range:
+        month_year = monthly_multiplier[date.month - 1]
+        if 0 <= date.dayofweek < 5:  # weekday
+            yearly_array.append(array_week[date.hour] * month_year * norm_weekday_max)
+        elif date.dayofweek == 5:  # saturday
+            yearly_array.append(array_sat[date.hour] * month_year * norm_sat_max)
+        else:  # sunday
+            yearly_array.append(array_sun[date.hour] * month_year * norm_sun_max)
+    return np.array(yearly_array)
+
+
+class TestYearlyVectors(unittest.TestCase):
+
+    def test_same_as_per_hour_expansion(self):
+        rng = np.random.default_rng(9)
+        # a regular and a leap year, starting on different days of the week
+        for date_range in [DATE_RANGE, pd.date_range('2016-01-01', periods=8784, freq='h')]:
+            for trial in range(6):
+                schedule_array = rng.random(72) * rng.choice([1, 10, 1000])
+                if trial % 3 == 0:
+                    # no water consumption on saturdays
+                    schedule_array[24:48] = 0.0
+                monthly_multiplier = list(rng.uniform(0.5, 1.5, 12))
+                for normalize_first_daily_profile in [False, True]:
+                    yearly_vector = schedule_maker.get_yearly_vectors(date_range, 3, schedule_array.copy(),
+                                                                      monthly_multiplier, normalize_first_daily_profile)
+                    expected = per_hour_yearly_vector(date_range, 3, schedule_array.copy(), monthly_multiplier,
+                                                      normalize_first_daily_profile)
+                    # in the same order of operations, bit for bit
+                    np.testing.assert_array_equal(yearly_vector, expected)
+
+    def test_schedules_of_the_use_types(self):
+        for use_type in USE_TYPES:
+            daily_schedule, monthly_multiplier = read_cea_schedule(
+                os.path.join(USE_TYPES_FOLDER, use_type + '.csv'))
+            monthly_multiplier = monthly_multiplier['MONTHLY_MULTIPLIER']
+            days_in_schedule = len(set(daily_schedule['DAY']))
+            for variable in ['OCCUPANCY', 'WATER', 'APPLIANCES']:
+                schedule_array = np.asarray(daily_schedule[variable], dtype=float)
+                np.testing.assert_array_equal(
+                    schedule_maker.get_yearly_vectors(DATE_RANGE, days_in_schedule, schedule_array,
+                                                      monthly_multiplier, normalize_first_daily_profile=True),
+                    per_hour_yearly_vector(DATE_RANGE, days_in_schedule, schedule_array, monthly_multiplier,
+                                           normalize_first_daily_profile=True), err_msg=use_type)
+
+
+class TestStochasticOccupancy(unittest.TestCase):
+
+    def setUp(self):
+        daily_schedule, monthly_multiplier = read_cea_schedule(os.path.join(USE_TYPES_FOLDER, 'OFFICE.csv'))
+        self.deterministic_schedule = schedule_maker.get_yearly_vectors(
+            DATE_RANGE, 3, np.asarray(daily_schedule['OCCUPANCY'], dtype=float),
+            monthly_multiplier['MONTHLY_MULTIPLIER'])
+
+    def test_fixed_seed_reproduces_the_schedule(self):
+        # more occupants than a block of the individual model
+        number_of_occupants = schedule_maker.OCCUPANT_BLOCK_SIZE + 100
+        for calc_schedule in [schedule_maker.calc_occupancy_schedule,
+                              schedule_maker.calc_aggregate_occupancy_schedule]:
+            schedule = calc_schedule(self.deterministic_schedule, number_of_occupants,
+                                     schedule_maker.get_random_generator(42, 'B1001'))
+            self.assertEqual(len(schedule), len(DATE_RANGE))
+            self.assertTrue(((schedule >= 0) & (schedule <= number_of_occupants)).all())
+            # the random numbers of a building only depend on the seed and its name
+            np.testing.assert_array_equal(
+                calc_schedule(self.deterministic_schedule, number_of_occupants,
+                              schedule_maker.get_random_generator(42, 'B1001')), schedule)
+            self.assertFalse(np.array_equal(
+                calc_schedule(self.deterministic_schedule, number_of_occupants,
+                              schedule_maker.get_random_generator(42, 'B1002')), schedule))
+            self.assertFalse(np.array_equal(
+                calc_schedule(self.deterministic_schedule, number_of_occupants,
+                              schedule_maker.get_random_generator(43, 'B1001')), schedule))
+
+    def test_aggregate_mode_matches_individual_occupants(self):
+        number_of_occupants = 300
+        for seed in range(2):
+            individual = schedule_maker.calc_occupancy_schedule(
+                self.deterministic_schedule, number_of_occupants, schedule_maker.get_random_generator(seed, 'B1001'))
+            aggregate = schedule_maker.calc_aggregate_occupancy_schedule(
+                self.deterministic_schedule, number_of_occupants, schedule_maker.get_random_generator(seed, 'B1001'))
+            # the mean number of occupants of the year and of each hour of the day
+            self.assertAlmostEqual(aggregate.mean() / individual.mean(), 1.0, delta=0.01)
+            np.testing.assert_allclose(aggregate.reshape(-1, 24).mean(axis=0) / number_of_occupants,
+                                       individual.reshape(-1, 24).mean(axis=0) / number_of_occupants, atol=0.01)
+
+    def test_no_occupants(self):
+        rng = schedule_maker.get_random_generator(0, 'B1001')
+        np.testing.assert_array_equal(schedule_maker.calc_occupancy_schedule(self.deterministic_schedule, 0, rng), 0.0)
+        np.testing.assert_array_equal(
+            schedule_maker.calc_aggregate_occupancy_schedule(self.deterministic_schedule, 0, rng), 0.0)
+
+
+class TestDeduplicatedSchedules(unittest.TestCase):
+
+    def setUp(self):
+        self.locator = cea.inputlocator.InputLocator(tempfile.mkdtemp())
+        self.buildings = ['B%04i' % i for i in range(8)]
+        for i, building in enumerate(self.buildings):
+            shutil.copy(os.path.join(USE_TYPES_FOLDER, USE_TYPES[i % len(USE_TYPES)] + '.csv'),
+                        self.locator.get_building_weekly_schedules(building))
+
+        rng = np.random.default_rng(0)
+        n = len(self.buildings)
+        self.internal_loads = pd.DataFrame({variable: rng.uniform(0.0, 10.0, n) for variable in [
+            'Qs_Wp', 'X_ghp', 'Vww_ldp', 'Vw_ldp', 'Ea_Wm2', 'El_Wm2', 'Ev_kWveh', 'Ed_Wm2', 'Epro_Wm2', 'Qcre_Wm2',
+            'Qhpro_Wm2', 'Qcpro_Wm2']}, index=self.buildings)
+        self.internal_loads['Occ_m2p'] = rng.uniform(5.0, 30.0, n)
+        # a building without occupants and one without appliances
+        self.internal_loads.loc['B0001', 'Occ_m2p'] = 0.0
+        self.internal_loads.loc['B0002', 'Ea_Wm2'] = 0.0
+        self.indoor_comfort = pd.DataFrame({'Ve_lsp': rng.uniform(5.0, 15.0, n), 'Ths_set_C': 21.0,
+                                            'Ths_setb_C': 16.0, 'Tcs_set_C': 26.0, 'Tcs_setb_C': 28.0},
+                                           index=self.buildings)
+        self.prop_geometry = pd.DataFrame({'Aocc': rng.uniform(500.0, 20000.0, n),
+                                           'Aef': rng.uniform(500.0, 20000.0, n)}, index=self.buildings)
+        schedule_maker._schedule_model_cache.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.locator.scenario, ignore_errors=True)
+        schedule_maker._schedule_model_cache.clear()
+
+    def test_same_schedules_as_calc_schedules(self):
+        expected = {}
+        for building in self.buildings:
+            schedule_maker.calc_schedules(self.locator, building, DATE_RANGE, self.internal_loads.loc[building],
+                                          self.indoor_comfort.loc[building], self.prop_geometry.loc[building],
+                                          stochastic_schedule=False)
+            expected[building] = pd.read_csv(self.locator.get_schedule_model_file(building))
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            schedule_maker.calc_deduplicated_schedules(self.locator, self.buildings, DATE_RANGE, self.internal_loads,
+                                                       self.indoor_comfort, self.prop_geometry)
+        self.assertEqual(len(os.listdir(self.locator.get_schedule_model_profiles_folder())), len(USE_TYPES))
+
+        for building in self.buildings:
+            self.assertFalse(os.path.exists(self.locator.get_schedule_model_file(building)))
+            schedules = schedule_maker.read_schedule_model(self.locator, building)
+            self.assertEqual(list(schedules.columns), list(expected[building].columns))
+            self.assertTrue((schedules['DATE'] == expected[building]['DATE']).all())
+            # the number of occupants is rounded from the exact profile
+            np.testing.assert_array_equal(schedules['people_p'], expected[building]['people_p'], err_msg=building)
+            for column in expected[building].columns[1:]:
+                # the schedule files of the buildings are written with three decimals
+                np.testing.assert_allclose(schedules[column],
+                                           pd.to_numeric(expected[building][column].replace('OFF', np.nan)),
+                                           rtol=1e-12, atol=5e-4 + 1e-9, err_msg='%s %s' % (building, column))
+
+    def test_schedule_model_cache_is_bounded(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            schedule_maker.calc_deduplicated_schedules(self.locator, self.buildings, DATE_RANGE, self.internal_loads,
+                                                       self.indoor_comfort, self.prop_geometry)
+        profiles_folder = self.locator.get_schedule_model_profiles_folder()
+        profile = os.path.join(profiles_folder, os.listdir(profiles_folder)[0])
+        for i in range(schedule_maker.SCHEDULE_MODEL_CACHE_SIZE + 5):
+            path = os.path.join(profiles_folder, 'copy%i.csv' % i)
+            shutil.copy(profile, path)
+            schedule_maker.read_cached_csv(path)
+        self.assertEqual(len(schedule_maker._schedule_model_cache), schedule_maker.SCHEDULE_MODEL_CACHE_SIZE)
+        self.assertNotIn(os.path.join(profiles_folder, 'copy0.csv'),
+                         [path for path, _ in schedule_maker._schedule_model_cache])
+
+        # a modified file replaces its previous version
+        schedule_maker.read_cached_csv(path)
+        os.utime(path, (0, os.path.getmtime(path) + 10))
+        self.assertEqual(len(schedule_maker.read_cached_csv(path)), len(DATE_RANGE))
+        self.assertEqual([key for key in schedule_maker._schedule_model_cache if key[0] == path],
+                         [(path, os.path.getmtime(path))])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -241,10 +241,14 @@ def extract_locator_methods(locator):
     """Return the list of locator methods that point to files"""
     ignore = {
         "ensure_parent_folder_exists",
+        "find_demand_results_file",
+        "find_schedule_model_file",
         "get_plant_nodes",
         "get_temporary_file",
         "get_weather_names",
         "get_zone_building_names",
+        "read_demand_results",
+        "read_demand_results_for_buildings",
         "verify_database_template",
         "get_optimization_network_all_individuals_results_file",  # TODO: remove this when we know how
         "get_optimization_network_generation_individuals_results_file",  # TODO: remove this when we know how
@@ -0,0 +1,47 @@
+"""Test the input file checks of the scripts in cea/scripts.yml"""
+
+
+
+
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import cea.config
+import cea.inputlocator
+import cea.scripts
+
+
+class TestMissingInputFiles(unittest.TestCase):
+    def setUp(self):
+        self.scenario = tempfile.mkdtemp()
+        self.config = cea.config.Configuration()
+        self.config.scenario = self.scenario
+        self.locator = cea.inputlocator.InputLocator(self.scenario)
+        patcher = mock.patch.object(cea.inputlocator.InputLocator, 'get_zone_building_names', return_value=['B1000'])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.scenario, ignore_errors=True)
+
+    def missing_demand_results(self, script_name):
+        script = cea.scripts.by_name(script_name, plugins=[])
+        return [path for method_name, path in script.missing_input_files(self.config)
+                if method_name.endswith('demand_results_file')]
+
+    def test_demand_results_in_parquet_format_are_found(self):
+        for script_name in ['sewage-potential', 'thermal-network']:
+            self.assertEqual(self.missing_demand_results(script_name),
+                             [self.locator.get_demand_results_file('B1000')])
+
+        # a scenario that only stores the demand results in parquet format (demand:results-format = parquet)
+        with open(self.locator.get_demand_results_file('B1000', 'parquet'), 'w'):
+            pass
+        for script_name in ['sewage-potential', 'thermal-network']:
+            self.assertEqual(self.missing_demand_results(script_name), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
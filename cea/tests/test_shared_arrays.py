@@ -0,0 +1,100 @@
+"""
+Test sending the arrays and DataFrames of ``cea.utilities.shared_arrays`` to the worker processes of
+``cea.utilities.parallel.vectorize``.
+"""
+
+import contextlib
+import io
+import pickle
+import unittest
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+from cea.utilities import parallel
+from cea.utilities.shared_arrays import SharedArray, SharedDataFrame, SharedMemoryBlock, share_dataframe
+
+__author__ = "Daren Thomas"
+__copyright__ = "Copyright 2024, Architecture and Building Systems - ETH Zurich"
+__credits__ = ["Daren Thomas"]
+__license__ = "MIT"
+__version__ = "0.1"
+__maintainer__ = "Daren Thomas"
+__email__ = "cea@arch.ethz.ch"
+__status__ = "Production"
+
+PROCESSES = 2
+
+
+def read_in_worker(i, array, view, df):
+    """Return copies of what the worker process received, and whether it can write to the arrays"""
+    return (i, np.array(array), np.array(view), df.copy(), array.flags.writeable,
+            df['drybulb_C'].to_numpy().flags.writeable)
+
+
+def make_weather_data():
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({'date': pd.date_range('2005-01-01', periods=48, freq='h'),
+                         'drybulb_C': rng.normal(10.0, 5.0, 48),
+                         'dayofyear': np.repeat(np.arange(1, 3), 24),
+                         'presweathobs': ['9'] * 48})
+
+
+class TestSharedArrays(unittest.TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        parallel.shutdown_worker_pool()
+
+    def test_round_trip_through_worker(self):
+        weather_data = make_weather_data()
+        solar = np.arange(24.0 * 5).reshape(5, 24)
+        block = SharedMemoryBlock([solar, np.arange(10)])
+        shared_weather, shared_df = share_dataframe(weather_data)
+        self.assertIsInstance(block.arrays[0], SharedArray)
+        self.assertIsInstance(shared_df, SharedDataFrame)
+        self.assertIsInstance(shared_df['drybulb_C'].values, SharedArray)
+        # the arrays are read-only copies
+        self.assertFalse(block.arrays[0].flags.writeable)
+        self.assertFalse(np.shares_memory(block.arrays[0], solar))
+
+        with block, shared_weather, contextlib.redirect_stdout(io.StringIO()):
+            results = parallel.vectorize(read_in_worker, PROCESSES, chunksize=1)(
+                range(4), repeat(block.arrays[0], 4), repeat(block.arrays[0][1:, ::2], 4), repeat(shared_df, 4))
+        for i, (j, array, view, df, array_writeable, column_writeable) in enumerate(results):
+            self.assertEqual(i, j)
+            np.testing.assert_array_equal(array, solar)
+            np.testing.assert_array_equal(view, solar[1:, ::2])
+            pd.testing.assert_frame_equal(df, weather_data)
+            self.assertFalse(array_writeable)
+            self.assertFalse(column_writeable)
+
+    def test_pickle_only_sends_the_position(self):
+        values = np.random.default_rng(1).normal(size=10 ** 5)
+        with SharedMemoryBlock([values]) as block:
+            self.assertLess(len(pickle.dumps(block.arrays[0])), 1000)
+            np.testing.assert_array_equal(pickle.loads(pickle.dumps(block.arrays[0])), values)
+            # copies and the results of computations are not in the shared memory block
+            self.assertEqual(len(pickle.loads(pickle.dumps(block.arrays[0].copy()))), len(values))
+            self.assertEqual(type(block.arrays[0] * 2.0), np.ndarray)
+        # after closing the block, the arrays are pickled with their data
+        np.testing.assert_array_equal(pickle.loads(pickle.dumps(block.arrays[0])), values)
+
+    def test_single_process(self):
+        weather_data = make_weather_data()
+        solar = np.arange(24.0)
+        block = SharedMemoryBlock([solar], processes=1)
+        self.assertIsNone(block.shared_memory)
+        self.assertIs(block.arrays[0], solar)
+        shared_weather, shared_df = share_dataframe(weather_data, processes=1)
+        self.assertIsNone(shared_weather.shared_memory)
+        self.assertIs(shared_df, weather_data)
+        with block, shared_weather, contextlib.redirect_stdout(io.StringIO()):
+            results = parallel.vectorize(read_in_worker, 1)(range(2), repeat(solar, 2), repeat(solar[::2], 2),
+                                                            repeat(weather_data, 2))
+        pd.testing.assert_frame_equal(results[1][3], weather_data)
+
+
+if __name__ == "__main__":
+    unittest.main()
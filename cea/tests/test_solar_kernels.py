@@ -0,0 +1,306 @@
+"""
+Test the radiation kernels of the PV, SC and PVT models (cea.technologies.solar) and of
+cea.utilities.solar_equations, which calculate all groups of panels at once (groups x hours), against the per-group
+and per-hour calculation they replaced, on a synthetic year.
+"""
+
+import os
+import types
+import unittest
+from math import acos, asin, cos, degrees, exp, radians, sin, tan, atan
+
+import numpy as np
+import pandas as pd
+import pvlib
+
+import cea.inputlocator
+from cea.constants import HOURS_IN_YEAR
+from cea.technologies.solar import constants, photovoltaic, solar_collector
+from cea.utilities import solar_equations
+
+__author__ = "Daren Thomas"
+__copyright__ = "Copyright 2024, Architecture and Building Systems - ETH Zurich"
+__credits__ = ["Daren Thomas"]
+__license__ = "MIT"
+__version__ = "0.1"
+__maintainer__ = "Daren Thomas"
+__email__ = "cea@arch.ethz.ch"
+__status__ = "Production"
+
+CONVERSION_DATABASE = os.path.join(os.path.dirname(cea.inputlocator.__file__), 'databases', 'CH', 'components',
+                                   'CONVERSION.xlsx')
+LATITUDE, LONGITUDE = 47.37, 8.54
+
+
+# the per-hour calculation of a single group of panels, as before the kernels were calculated for all groups at once
+
+def scalar_incident_angle_beam(g, lat, ha, tilt, teta_z):
+    part1 = sin(lat) * sin(g) * cos(tilt) - cos(lat) * sin(g) * sin(tilt) * cos(teta_z)
+    part2 = cos(lat) * cos(g) * cos(ha) * cos(tilt) + sin(lat) * cos(g) * cos(ha) * sin(tilt) * cos(teta_z)
+    part3 = cos(g) * sin(ha) * sin(tilt) * sin(teta_z)
+    return acos(part1 + part2 + part3)
+
+
+def scalar_angle_of_incidence(g, lat, ha, tilt, teta_z):
+    n_E = sin(tilt) * sin(teta_z)
+    n_N = sin(tilt) * cos(teta_z)
+    n_Z = cos(tilt)
+    s_E = -cos(g) * sin(ha)
+    s_N = sin(g) * cos(lat) - cos(g) * sin(lat) * cos(ha)
+    s_Z = cos(g) * cos(lat) * cos(ha) + sin(g) * sin(lat)
+    return acos(n_E * s_E + n_N * s_N + n_Z * s_Z)
+
+
+def scalar_diffuseground_comp(tilt_radians):
+    tilt = degrees(tilt_radians)
+    teta_ed = 59.68 - 0.1388 * tilt + 0.001497 * tilt ** 2
+    teta_eG = 90 - 0.5788 * tilt + 0.002693 * tilt ** 2
+    return radians(teta_ed), radians(teta_eG)
+
+
+def scalar_transmittance_glazing(teta, n, K, L):
+    teta_r = asin(sin(teta) / n)
+    part1 = teta_r + teta
+    part2 = teta_r - teta
+    return exp((-K * L) / cos(teta_r)) * (
+            1 - 0.5 * ((sin(part2) ** 2) / (sin(part1) ** 2) + (tan(part2) ** 2) / (tan(part1) ** 2)))
+
+
+def scalar_absorbed_radiation_PV(I_sol, I_direct, I_diffuse, tilt, Sz, teta, tetaed, tetaeg, panel_properties_PV):
+    n, Pg, K = constants.n, constants.Pg, constants.K
+    a0, a1, a2, a3, a4 = [panel_properties_PV['PV_a%i' % i] for i in range(5)]
+    L = panel_properties_PV['PV_th']
+    lim1, lim2, lim3 = radians(0), radians(90), radians(89.999)
+    if teta < lim1:
+        teta = min(lim3, abs(teta))
+    if teta >= lim2:
+        teta = lim3
+    if Sz < lim1:
+        Sz = min(lim3, abs(Sz))
+    if Sz >= lim2:
+        Sz = lim3
+    Rb = cos(teta) / cos(Sz) if Sz <= radians(85) else 0
+    m = 1 / cos(Sz)
+    M = np.clip(a0 + a1 * m + a2 * m ** 2 + a3 * m ** 3 + a4 * m ** 4, 0.001, 1.1)
+    Ta_n = exp(-K * L) * (1 - ((n - 1) / (n + 1)) ** 2)
+    kteta_B = scalar_transmittance_glazing(teta, n, K, L) / Ta_n if teta < radians(90) else 0
+    kteta_D = scalar_transmittance_glazing(tetaed, n, K, L) / Ta_n
+    kteta_eG = scalar_transmittance_glazing(tetaeg, n, K, L) / Ta_n
+    absorbed_radiation_Wperm2 = M * Ta_n * (kteta_B * I_direct * Rb + kteta_D * I_diffuse * (1 + cos(tilt)) / 2 +
+                                            kteta_eG * I_sol * Pg * (1 - cos(tilt)) / 2)
+    return max(absorbed_radiation_Wperm2, 0.0)
+
+
+def scalar_limit_incidence_angle(teta_deg):
+    if teta_deg < 0:
+        teta_deg = min(89, abs(teta_deg))
+    if teta_deg >= 90:
+        teta_deg = 89.999
+    return teta_deg
+
+
+def scalar_IAM_beam_SC(solar_properties, teta_z_deg, tilt_angle_deg, type_SCpanel, latitude_deg):
+    def calc_teta_L(Az, teta_z, tilt, Sz):
+        return scalar_limit_incidence_angle(degrees(abs(atan(tan(Sz) * cos(teta_z - Az)) - tilt)))
+
+    def calc_teta_T(Az, Sz, teta_z):
+        teta_ta = sin(Sz) * sin(abs(teta_z - Az))
+        return scalar_limit_incidence_angle(degrees(atan(teta_ta / cos(teta_ta))))
+
+    def calc_IAMb(teta_l, teta_T):
+        if type_SCpanel == 'FP':
+            return -0.00000002127039627042 * teta_l ** 4 + 0.00000143550893550934 * teta_l ** 3 - \
+                0.00008493589743580050 * teta_l ** 2 + 0.00041588966590833100 * teta_l + 0.99930069929920900000
+        IAML = -0.00000003365384615386 * teta_l ** 4 + 0.00000268745143745027 * teta_l ** 3 - \
+            0.00010196678321666700 * teta_l ** 2 + 0.00088830613832779900 * teta_l + 0.99793706293541500000
+        IAMT = 0.000000002794872 * teta_T ** 5 - 0.000000534731935 * teta_T ** 4 + 0.000027381118880 * teta_T ** 3 - \
+            0.000326340326281 * teta_T ** 2 + 0.002973799531468 * teta_T + 1.000713286764210
+        return IAMT * IAML
+
+    g_rad, ha_rad = np.radians(solar_properties.g), np.radians(solar_properties.ha)
+    Sz_rad, Az_rad = np.radians(solar_properties.Sz), np.radians(solar_properties.Az)
+    teta_z_rad, tilt_rad = radians(teta_z_deg), radians(tilt_angle_deg)
+    if type_SCpanel == 'FP':
+        incidence_angle_rad = np.vectorize(scalar_incident_angle_beam)(g_rad, radians(latitude_deg), ha_rad, tilt_rad,
+                                                                       teta_z_rad)
+        teta_L_deg = np.vectorize(scalar_limit_incidence_angle)(np.degrees(incidence_angle_rad))
+        teta_T_deg = 0
+    else:
+        teta_L_deg = np.vectorize(calc_teta_L)(Az_rad, teta_z_rad, tilt_rad, Sz_rad)
+        teta_T_deg = np.vectorize(calc_teta_T)(Az_rad, Sz_rad, teta_z_rad)
+    return np.vectorize(calc_IAMb)(teta_L_deg, teta_T_deg)
+
+
+def make_solar_inputs(number_groups=5, seed=0):
+    """The solar position, weather and mean hourly radiation of groups of panels of a synthetic year"""
+    times = pd.date_range('2005-01-01', periods=HOURS_IN_YEAR, freq='h', tz='Europe/Zurich')
+    solar_position = pvlib.solarposition.get_solarposition(times, LATITUDE, LONGITUDE)
+    day_of_year = times.dayofyear.values
+    solar_properties = pd.DataFrame({
+        'g': np.degrees(pvlib.solarposition.declination_spencer71(day_of_year)),
+        'ha': pvlib.solarposition.hour_angle(times, LONGITUDE,
+                                             pvlib.solarposition.equation_of_time_spencer71(day_of_year)),
+        'Sz': solar_position.zenith.values, 'Az': solar_position.azimuth.values})
+
+    rng = np.random.default_rng(seed)
+    weather_data = pd.DataFrame({
+        'drybulb_C': 10 + 10 * np.sin(np.arange(HOURS_IN_YEAR) / HOURS_IN_YEAR * 2 * np.pi) +
+        rng.normal(0, 2, HOURS_IN_YEAR),
+        'ratio_diffhout': rng.uniform(0.1, 1.0, HOURS_IN_YEAR)})
+    weather_data.loc[5, 'ratio_diffhout'] = np.nan
+    elevation = np.clip(90 - solar_position.zenith.values, 0, None)
+    hourly_radiation = pd.DataFrame({group: elevation * rng.uniform(3, 12) for group in range(number_groups)})
+    orientations = ['roofs_top', 'walls_south', 'walls_east', 'roofs_top', 'walls_west']
+    prop_observers = pd.DataFrame({
+        'surface_azimuth_deg': rng.uniform(90, 270, number_groups),
+        'area_installed_module_m2': rng.uniform(5, 50, number_groups),
+        'B_deg': rng.uniform(0, 90, number_groups),
+        'type_orientation': [orientations[group % len(orientations)] for group in range(number_groups)]})
+    sensor_groups = {'number_groups': number_groups, 'number_points': {}, 'hourlydata_groups': hourly_radiation,
+                     'prop_observers': prop_observers}
+    return times, solar_properties, weather_data, sensor_groups
+
+
+class TestSolarKernels(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.times, cls.solar_properties, cls.weather_data, cls.sensor_groups = make_solar_inputs()
+        cls.prop_observers = cls.sensor_groups['prop_observers']
+        config = types.SimpleNamespace(solar=types.SimpleNamespace(type_PVpanel='PV1', type_SCpanel='FP'))
+        cls.panel_properties_PV = photovoltaic.calc_properties_PV_db(CONVERSION_DATABASE, config)
+
+    def group_column(self, column):
+        return self.prop_observers[column].values.astype(float)[:, np.newaxis]
+
+    def test_radiation_types(self):
+        I_sol, I_direct, I_diffuse = solar_equations.calc_radiation_types(self.sensor_groups['hourlydata_groups'],
+                                                                          self.weather_data)
+        for group in self.prop_observers.index:
+            expected = solar_equations.cal_radiation_type(group, self.sensor_groups['hourlydata_groups'],
+                                                          self.weather_data)
+            np.testing.assert_array_equal(I_sol[group], expected.I_sol)
+            np.testing.assert_array_equal(I_direct[group], expected.I_direct)
+            np.testing.assert_array_equal(I_diffuse[group], expected.I_diffuse)
+
+    def test_incidence_angles(self):
+        g, ha = np.radians(self.solar_properties.g.values), np.radians(self.solar_properties.ha.values)
+        lat = radians(LATITUDE)
+        tilt, teta_z = np.radians(self.group_column('B_deg')), np.radians(self.group_column('surface_azimuth_deg'))
+        angle_of_incidence = solar_equations.calc_angle_of_incidence(g, lat, ha, tilt, teta_z)
+        incident_angle_beam = solar_equations.calc_incident_angle_beam(g, lat, ha, tilt, teta_z)
+        self.assertEqual(angle_of_incidence.shape, (len(self.prop_observers), HOURS_IN_YEAR))
+        for group in self.prop_observers.index:
+            np.testing.assert_allclose(angle_of_incidence[group], np.vectorize(scalar_angle_of_incidence)(
+                g, lat, ha, tilt[group, 0], teta_z[group, 0]), rtol=1e-12)
+            np.testing.assert_allclose(incident_angle_beam[group], np.vectorize(scalar_incident_angle_beam)(
+                g, lat, ha, tilt[group, 0], teta_z[group, 0]), rtol=1e-12)
+
+    def test_pv_generation(self):
+        potential = photovoltaic.calc_pv_generation(self.sensor_groups, self.weather_data, self.times,
+                                                    self.solar_properties, LATITUDE, self.panel_properties_PV)
+
+        # each group of panels by itself, hour by hour
+        Sz_rad = np.radians(self.solar_properties.Sz)
+        el_output_PV_kW = {}
+        radiation_kWh = 0.0
+        for group in self.prop_observers.index:
+            radiation_Wperm2 = solar_equations.cal_radiation_type(group, self.sensor_groups['hourlydata_groups'],
+                                                                  self.weather_data)
+            tilt_angle_deg, area_m2 = self.prop_observers.loc[group, ['B_deg', 'area_installed_module_m2']]
+            tilt_rad = radians(tilt_angle_deg)
+            teta_deg = pvlib.irradiance.aoi(tilt_angle_deg, radians(self.prop_observers.loc[group,
+                                                                                            'surface_azimuth_deg']),
+                                            self.solar_properties.Sz, self.solar_properties.Az)
+            teta_ed_rad, teta_eg_rad = scalar_diffuseground_comp(tilt_rad)
+            absorbed_radiation_Wperm2 = np.vectorize(scalar_absorbed_radiation_PV)(
+                radiation_Wperm2.I_sol, radiation_Wperm2.I_direct, radiation_Wperm2.I_diffuse, tilt_rad, Sz_rad,
+                np.radians(teta_deg), teta_ed_rad, teta_eg_rad, self.panel_properties_PV)
+            T_cell_C = photovoltaic.calc_cell_temperature(absorbed_radiation_Wperm2, self.weather_data.drybulb_C.values,
+                                                          self.panel_properties_PV)
+            el_output_PV_kW[group] = photovoltaic.calc_PV_power(absorbed_radiation_Wperm2, T_cell_C,
+                                                                self.panel_properties_PV['PV_n'], area_m2,
+                                                                self.panel_properties_PV['PV_Bref'],
+                                                                self.panel_properties_PV['misc_losses'])
+            radiation_kWh = radiation_kWh + radiation_Wperm2.I_sol.values * area_m2 / 1000
+
+        np.testing.assert_allclose(potential['E_PV_gen_kWh'], sum(el_output_PV_kW.values()), rtol=1e-10, atol=1e-12)
+        np.testing.assert_allclose(potential['radiation_kWh'], radiation_kWh, rtol=1e-12)
+        self.assertAlmostEqual(potential['Area_PV_m2'].iloc[0], self.prop_observers['area_installed_module_m2'].sum())
+        for orientation, groups in self.prop_observers.groupby('type_orientation').groups.items():
+            np.testing.assert_allclose(potential['PV_%s_E_kWh' % orientation],
+                                       sum(el_output_PV_kW[group] for group in groups), rtol=1e-10, atol=1e-12)
+
+    def test_pvt_absorbed_radiation(self):
+        """The absorbed radiation of the PV of the PVT panels, with the angle of incidence of solar_equations"""
+        g, ha = np.radians(self.solar_properties.g.values), np.radians(self.solar_properties.ha.values)
+        Sz_rad = np.radians(self.solar_properties.Sz.values)
+        tilt, teta_z = np.radians(self.group_column('B_deg')), np.radians(self.group_column('surface_azimuth_deg'))
+        I_sol, I_direct, I_diffuse = solar_equations.calc_radiation_types(self.sensor_groups['hourlydata_groups'],
+                                                                          self.weather_data)
+        teta_rad = solar_equations.calc_angle_of_incidence(g, radians(LATITUDE), ha, tilt, teta_z)
+        teta_ed_rad, teta_eg_rad = photovoltaic.calc_diffuseground_comp(tilt)
+        absorbed_radiation_Wperm2 = photovoltaic.calc_absorbed_radiation_PV(I_sol, I_direct, I_diffuse, tilt, Sz_rad,
+                                                                            teta_rad, teta_ed_rad, teta_eg_rad,
+                                                                            self.panel_properties_PV)
+        for group in self.prop_observers.index:
+            self.assertEqual((teta_ed_rad[group, 0], teta_eg_rad[group, 0]), scalar_diffuseground_comp(tilt[group, 0]))
+            expected = np.vectorize(scalar_absorbed_radiation_PV)(I_sol[group], I_direct[group], I_diffuse[group],
+                                                                  tilt[group, 0], Sz_rad, teta_rad[group],
+                                                                  teta_ed_rad[group, 0], teta_eg_rad[group, 0],
+                                                                  self.panel_properties_PV)
+            np.testing.assert_allclose(absorbed_radiation_Wperm2[group], expected, rtol=1e-10, atol=1e-12)
+
+    def test_IAM_beam_SC(self):
+        for type_SCpanel in ['FP', 'ET']:
+            IAM_b = solar_collector.calc_IAM_beam_SC(self.solar_properties, self.group_column('surface_azimuth_deg'),
+                                                     self.group_column('B_deg'), type_SCpanel, LATITUDE)
+            self.assertEqual(IAM_b.shape, (len(self.prop_observers), HOURS_IN_YEAR))
+            for group in self.prop_observers.index:
+                expected = scalar_IAM_beam_SC(self.solar_properties,
+                                              self.prop_observers.loc[group, 'surface_azimuth_deg'],
+                                              self.prop_observers.loc[group, 'B_deg'], type_SCpanel, LATITUDE)
+                np.testing.assert_allclose(IAM_b[group], expected, rtol=1e-12, err_msg=type_SCpanel)
+
+    def test_collector_kernels(self):
+        rng = np.random.default_rng(1)
+        I_direct, I_diffuse = rng.uniform(0, 800, HOURS_IN_YEAR), rng.uniform(0, 300, HOURS_IN_YEAR)
+        IAM_b = rng.uniform(0.5, 1.0, HOURS_IN_YEAR)
+        np.testing.assert_allclose(solar_collector.calc_q_rad(0.8, IAM_b, 0.9, I_direct, I_diffuse, 0.6),
+                                   np.vectorize(solar_collector.calc_q_rad)(0.8, IAM_b, 0.9, I_direct, I_diffuse, 0.6),
+                                   rtol=1e-12)
+        flows = rng.uniform(0, 0.5, HOURS_IN_YEAR)
+        Tm, Te = rng.uniform(20, 80, HOURS_IN_YEAR), rng.uniform(-10, 30, HOURS_IN_YEAR)
+        np.testing.assert_allclose(solar_collector.calc_qloss_network(flows, 0.3, 50.0, Tm, Te, 0.5),
+                                   np.vectorize(solar_collector.calc_qloss_network)(flows, 0.3, 50.0, Tm, Te, 0.5),
+                                   rtol=1e-12)
+        dP = rng.uniform(0, 2000, HOURS_IN_YEAR)
+        np.testing.assert_allclose(solar_collector.calc_Eaux_SC(flows, dP, 0.4, 0.2, 50.0),
+                                   np.vectorize(solar_collector.calc_Eaux_SC)(flows, dP, 0.4, 0.2, 50.0), rtol=1e-12)
+
+    def test_optimal_mass_flow(self):
+        rng = np.random.default_rng(2)
+        q = [rng.uniform(-50, 100, HOURS_IN_YEAR) for _ in range(4)]
+        E = [rng.uniform(0, 10, HOURS_IN_YEAR) for _ in range(4)]
+        # ties between the flow rates go to the first one
+        q[2][:100], E[2][:100] = q[1][:100], E[1][:100]
+        m, dP = [0.01, 0.02, 0.03, 0.04], [100.0, 200.0, 300.0, 400.0]
+        mass_flow, pressure_drop = solar_collector.calc_optimal_mass_flow(*q, *E, *m, *dP, 30.0)
+
+        const = 30.0 / 3600
+        balances = [abs(q[0]) - E[0] * 2, q[1] - E[1] * 2, q[2] - E[2] * 2, q[3] - E[3] * 2]
+        for t in range(HOURS_IN_YEAR):
+            balances_time = [balances[0][t], balances[1][t], balances[2][t], balances[3][t]]
+            ix = np.where(balances_time == np.max(balances_time))[0][0]
+            self.assertEqual(mass_flow[t], m[ix] * const)
+            self.assertEqual(pressure_drop[t], dP[ix] * 30.0)
+
+        heat = rng.uniform(-10, 10, HOURS_IN_YEAR)
+        mass_flow_2, pressure_drop_2 = solar_collector.calc_optimal_mass_flow_2(mass_flow.copy(), heat,
+                                                                                pressure_drop.copy())
+        np.testing.assert_array_equal(mass_flow_2, np.where(heat <= 0, 0, mass_flow))
+        np.testing.assert_array_equal(pressure_drop_2, np.where(heat <= 0, 0, pressure_drop))
+
+
+if __name__ == "__main__":
+    unittest.main()
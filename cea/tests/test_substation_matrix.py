@@ -0,0 +1,301 @@
+"""
+Test the substation model (cea.technologies.thermal_network.substation_matrix), which calculates the heat exchangers of
+all buildings and time steps at once, against the model of one heat exchanger of one building at a time step it
+replaced.
+"""
+
+import contextlib
+import io
+import types
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import cea.technologies.thermal_network.substation_matrix as substation_matrix
+from cea.constants import HEAT_CAPACITY_OF_WATER_JPERKGK
+from cea.technologies.thermal_network.substation_matrix import calc_HEX_cooling, calc_HEX_heating, \
+    calc_plate_HEX, calc_shell_HEX, calc_substation_return
+
+__author__ = "Daren Thomas"
+__copyright__ = "Copyright 2024, Architecture and Building Systems - ETH Zurich"
+__credits__ = ["Daren Thomas"]
+__license__ = "MIT"
+__version__ = "0.1"
+__maintainer__ = "Daren Thomas"
+__email__ = "cea@arch.ethz.ch"
+__status__ = "Production"
+
+MAX_ITERATIONS = 1000
+HEATING = ['ahu', 'aru', 'shu', 'ww']
+COOLING = ['ahu', 'aru', 'scu', 'data', 're']
+
+
+def scalar_HEX_effectiveness(c_secondary, dT_secondary, dT_inlet, UA, calc_eff, max_iterations=MAX_ITERATIONS):
+    """The iteration of the efficiency of exchange of one heat exchanger: ``(eff, cmin, c_primary, iterations)``"""
+    eff = [0.1, 0]
+    flag = False
+    tol = 0.00000001
+    iterations = 0
+    while abs((eff[0] - eff[1]) / eff[0]) > tol and iterations < max_iterations:
+        if flag:
+            eff[0] = eff[1]
+        else:
+            cmin = c_secondary * dT_secondary / (dT_inlet * eff[0])
+        if cmin < c_secondary:
+            c_primary = cmin
+            cmax = c_secondary
+        else:
+            c_primary = cmin
+            cmax = cmin
+            cmin = c_secondary
+        eff[1] = calc_eff(UA / cmin, cmin / cmax)
+        cmin = c_secondary * dT_secondary / (dT_inlet * eff[1])
+        flag = True
+        iterations += 1
+    return eff[1], cmin, c_primary, iterations
+
+
+def scalar_HEX_heating(Q, thi, tco, tci, cc, UA, ch_old, delta_cap_mass_flow):
+    """One shell-tube heat exchanger in the heating case, as calculated before the substations were vectorized"""
+    Q, thi, tco, tci, cc, UA, ch_old = [np.float64(v) for v in (Q, thi, tco, tci, cc, UA, ch_old)]
+    if not Q > 0:
+        return Q, (0.0 if np.isnan(thi) else thi), 0.0, 0.0
+    with np.errstate(all='ignore'):
+        if cc > 0:
+            eff, cmin, ch, _ = scalar_HEX_effectiveness(cc, tco - tci, thi - tci, UA, calc_shell_HEX)
+            tho = thi - eff * cmin * (thi - tci) / ch
+        else:
+            tho = 0.0
+            ch = 0.0
+        has_old = ch_old != 0 and not np.isnan(ch_old)
+        if ch > 0.0 and (delta_cap_mass_flow > 0 or has_old):
+            ch = (ch_old if has_old else ch) + delta_cap_mass_flow * HEAT_CAPACITY_OF_WATER_JPERKGK
+            tho = thi - eff * cmin * (thi - tci) / ch
+    return Q, (0.0 if np.isnan(tho) else tho), abs(ch / 1000), abs(ch)
+
+
+def scalar_HEX_cooling(Q, tci, tho, thi, ch, UA, cc_old, delta_cap_mass_flow):
+    """One plate heat exchanger in the cooling case, as calculated before the substations were vectorized"""
+    Q, tci, tho, thi, ch, UA, cc_old = [np.float64(v) for v in (abs(Q), tci, tho, thi, ch, UA, cc_old)]
+    if not Q > 0:
+        return Q, (0.0 if np.isnan(tci) else tci), 0.0, 0.0
+    with np.errstate(all='ignore'):
+        if ch > 0:
+            eff, cmin, cc, _ = scalar_HEX_effectiveness(ch, thi - tho, thi - tci, UA, calc_plate_HEX)
+            tco = tci + eff * cmin * (thi - tci) / cc
+        else:
+            tco = 0.0
+            cc = 0.0
+        has_old = cc_old != 0 and not np.isnan(cc_old)
+        if cc > 0.0 and (delta_cap_mass_flow > 0 or has_old):
+            cc = (cc_old if has_old else cc) + delta_cap_mass_flow * HEAT_CAPACITY_OF_WATER_JPERKGK
+            tco = tci + eff * cmin * (thi - tci) / cc
+    return Q, (0.0 if np.isnan(tco) else tco), abs(cc / 1000), abs(cc)
+
+
+def scalar_HEX_mix(heat, temperatures, mass_flows):
+    """The average return temperature of the heat exchangers of one substation"""
+    mass_flows = list(mass_flows)
+    if sum(mass_flows) > 0:
+        for g in range(len(heat)):
+            if not abs(heat[g]) > 0:
+                mass_flows[g] = 0
+        return sum(t * m / sum(mass_flows) for t, m in zip(temperatures, mass_flows))
+    with np.errstate(all='ignore'):
+        return np.nanmean(temperatures) if temperatures else np.nan
+
+
+def scalar_substation_return(thermal_network, capacity_mass_flows, T_supply_K, t, name):
+    """
+    The return temperature, heat capacity and demand of the substation of one building at one time step, the capacity
+    mass flows of the minimum mass flow iteration are kept in ``capacity_mass_flows`` ({(key, t, name): value})
+    """
+    if thermal_network.network_type == 'DH':
+        systems, UA_prefix, calc_HEX = substation_matrix.HEATING_SYSTEMS, 'UA_heating_', scalar_HEX_heating
+    else:
+        systems, UA_prefix, calc_HEX = substation_matrix.COOLING_SYSTEMS, 'UA_cooling_', scalar_HEX_cooling
+    HEX_UA = thermal_network.substations_HEX_specs.loc[name].HEX_UA
+    demand = thermal_network.buildings_demands[name].loc[t]
+    temperatures, mass_flows, heat = [], [], []
+    for key, load_type, building_system in systems:
+        if UA_prefix + key not in HEX_UA.columns:
+            continue
+        Q, t_return, mcp, cap = calc_HEX(demand['Q' + load_type + '_' + building_system + 'kWh'] * 1000, T_supply_K,
+                                         demand['T' + load_type + '_sup_' + building_system + 'C'] + 273,
+                                         demand['T' + load_type + '_re_' + building_system + 'C'] + 273,
+                                         demand['mcp' + load_type + '_' + building_system + 'kWperC'] * 1000,
+                                         float(HEX_UA[UA_prefix + key]['0']),
+                                         capacity_mass_flows.get((key, t, name), 0.0),
+                                         thermal_network.delta_cap_mass_flow[t])
+        capacity_mass_flows[(key, t, name)] = cap
+        temperatures.append(t_return)
+        mass_flows.append(mcp)
+        heat.append(Q)
+    return scalar_HEX_mix(heat, temperatures, mass_flows), sum(mass_flows), sum(heat)
+
+
+def make_thermal_network(network_type, building_names, time_steps, seed):
+    """
+    The demands of random buildings with all heating and cooling systems, some of them without loads at some time steps
+    (with NaN or 0 temperatures), and their substations sized by the substation model
+    """
+    rng = np.random.default_rng(seed)
+    demands = {}
+    for name in building_names:
+        demand = pd.DataFrame(0.0, index=range(time_steps), columns=substation_matrix.BUILDINGS_DEMANDS_COLUMNS)
+        demand['Name'] = name
+        systems = [(system, 1) for system in substation_matrix.HEATING_SYSTEMS] + \
+                  [(system, -1) for system in substation_matrix.COOLING_SYSTEMS]
+        for (_, load_type, building_system), sign in systems:
+            Q = rng.uniform(0, 50, time_steps) * (rng.random(time_steps) < 0.6) * sign
+            if load_type == 'ww_sys':
+                T_sup = rng.uniform(55, 65, time_steps)
+            else:
+                T_sup = rng.uniform(35, 70, time_steps) if sign > 0 else rng.uniform(6, 14, time_steps)
+            T_re = T_sup + (rng.uniform(-20, -5, time_steps) if sign > 0 else rng.uniform(4, 10, time_steps))
+            no_load = np.nan if rng.random() < 0.5 else 0.0
+            demand['Q' + load_type + '_' + building_system + 'kWh'] = Q
+            demand['T' + load_type + '_sup_' + building_system + 'C'] = np.where(Q != 0, T_sup, no_load)
+            demand['T' + load_type + '_re_' + building_system + 'C'] = np.where(Q != 0, T_re, no_load)
+            with np.errstate(all='ignore'):
+                demand['mcp' + load_type + '_' + building_system + 'kWperC'] = np.where(Q != 0,
+                                                                                       abs(Q / (T_sup - T_re)), 0.0)
+        demands[name] = demand
+
+    locator = types.SimpleNamespace(read_demand_results=lambda name, columns: demands[name].copy())
+    substation_systems = {'heating': HEATING if network_type == 'DH' else [],
+                          'cooling': COOLING if network_type == 'DC' else []}
+    with contextlib.redirect_stdout(io.StringIO()):
+        buildings_demands = substation_matrix.determine_building_supply_temperatures(building_names, locator,
+                                                                                     substation_systems)
+        substations_HEX_specs, _ = substation_matrix.substation_HEX_design_main(buildings_demands,
+                                                                               substation_systems, None)
+    return types.SimpleNamespace(network_type=network_type, buildings_demands=buildings_demands,
+                                 substations_HEX_specs=substations_HEX_specs, substation_heating_systems=HEATING,
+                                 substation_cooling_systems=COOLING, ch_old={}, ch_value={}, cc_old={}, cc_value={},
+                                 delta_cap_mass_flow={})
+
+
+class TestHeatExchangers(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        n = 2000
+        self.Q = rng.uniform(0, 50000, n) * (rng.random(n) < 0.8)
+        self.T_network = rng.uniform(278, 290, n)
+        self.T_in = rng.uniform(283, 295, n)
+        self.T_out = self.T_in + rng.uniform(2, 10, n)
+        self.c_secondary = rng.uniform(500, 5000, n) * (rng.random(n) < 0.9)
+        self.UA = rng.uniform(500, 20000, n)
+        # no previous iteration (0 or NaN) or the capacity mass flow of the previous one
+        self.c_old = np.choose(rng.integers(0, 3, n), [np.zeros(n), np.full(n, np.nan), rng.uniform(500, 8000, n)])
+        self.delta_cap_mass_flow = rng.choice([0.0, 0.0, 0.05], n)
+
+    def assert_equals_scalar(self, calc_HEX, scalar_HEX, args):
+        results = calc_HEX(*args)
+        expected = np.array([scalar_HEX(*values) for values in zip(*args)]).T
+        for result, expected_result in zip(results, expected):
+            np.testing.assert_allclose(result, expected_result, rtol=1e-9, atol=1e-9)
+        return results
+
+    def test_heating(self):
+        T_network = self.T_network + 60  # the supply temperature of the network is above the return of the building
+        self.assert_equals_scalar(calc_HEX_heating, scalar_HEX_heating,
+                                  (self.Q, T_network, self.T_out + 30, self.T_in + 30, self.c_secondary, self.UA,
+                                   self.c_old, self.delta_cap_mass_flow))
+
+    def test_cooling(self):
+        self.assert_equals_scalar(calc_HEX_cooling, scalar_HEX_cooling,
+                                  (-self.Q, self.T_network, self.T_in, self.T_out, self.c_secondary, self.UA,
+                                   self.c_old, self.delta_cap_mass_flow))
+
+    def test_nan_previous_iteration(self):
+        """a NaN capacity mass flow of the previous iteration (a building without a stored value) is the same as 0"""
+        for calc_HEX, T_network in [(calc_HEX_heating, self.T_network + 60), (calc_HEX_cooling, self.T_network)]:
+            args = [self.Q, T_network, self.T_in, self.T_out, self.c_secondary, self.UA]
+            for with_nan, with_zero in zip(calc_HEX(*args, np.nan, self.delta_cap_mass_flow),
+                                           calc_HEX(*args, 0.0, self.delta_cap_mass_flow)):
+                np.testing.assert_array_equal(with_nan, with_zero)
+
+    def test_iterations_are_capped(self):
+        """
+        The iteration doesn't converge if the network can't supply the load (the network is colder than the building in
+        the heating case), it stops after MAX_ITERATIONS
+        """
+        T_out, T_in = self.T_out + 30, self.T_in + 30
+        with np.errstate(all='ignore'):
+            iterations = [scalar_HEX_effectiveness(c, t_out - t_in, t_network - t_in, UA, calc_shell_HEX)[3]
+                          for c, t_out, t_in, t_network, UA in zip(self.c_secondary + 1, T_out, T_in, self.T_network,
+                                                                   self.UA)]
+        self.assertIn(MAX_ITERATIONS, iterations)
+        self.assert_equals_scalar(calc_HEX_heating, scalar_HEX_heating,
+                                  (self.Q, self.T_network, T_out, T_in, self.c_secondary, self.UA, self.c_old,
+                                   self.delta_cap_mass_flow))
+
+        # the network is warmer than the building in the cooling case
+        self.assert_equals_scalar(calc_HEX_cooling, scalar_HEX_cooling,
+                                  (-self.Q, self.T_network + 20, self.T_in, self.T_out, self.c_secondary, self.UA,
+                                   self.c_old, self.delta_cap_mass_flow))
+
+
+class TestSubstationReturn(unittest.TestCase):
+
+    def setUp(self):
+        substation_matrix._substation_arrays_cache.clear()
+
+    def tearDown(self):
+        substation_matrix._substation_arrays_cache.clear()
+
+    def test_substation_return(self):
+        building_names = ['B%03i' % i for i in range(12)]
+        time_steps = list(range(6))
+        for network_type in ['DH', 'DC']:
+            thermal_network = make_thermal_network(network_type, building_names, len(time_steps), seed=1)
+            if network_type == 'DH':
+                key_prefix, cap_old, cap_value = 'hs_', thermal_network.ch_old, thermal_network.ch_value
+                systems = HEATING
+            else:
+                key_prefix, cap_old, cap_value = 'cs_', thermal_network.cc_old, thermal_network.cc_value
+                systems = COOLING
+            for key in [key_prefix + system for system in systems]:
+                cap_old[key] = {t: pd.DataFrame(index=['0']) for t in time_steps}
+                cap_value[key] = {t: pd.DataFrame(index=['0']) for t in time_steps}
+            target = np.array([[thermal_network.buildings_demands[name]['T_sup_target_' + network_type][t]
+                                for name in building_names] for t in time_steps])
+            T_supply_K = (np.nanmax(target) if network_type == 'DH' else np.nanmin(target)) + 273.15
+            T_supply_K = T_supply_K + np.random.default_rng(2).uniform(-1, 1, target.shape)
+
+            expected_capacity_mass_flows = {}
+            # the minimum mass flow iterations, increasing the mass flows of the previous one
+            for delta_cap_mass_flow in [0.0, 0.05, 0.02]:
+                for t in time_steps:
+                    thermal_network.delta_cap_mass_flow[t] = delta_cap_mass_flow
+                T_return_K, mcp_kWK, thermal_demand = calc_substation_return(thermal_network, T_supply_K, time_steps,
+                                                                             building_names)
+                for row, t in enumerate(time_steps):
+                    for b, name in enumerate(building_names):
+                        expected = scalar_substation_return(thermal_network, expected_capacity_mass_flows,
+                                                            T_supply_K[row, b], t, name)
+                        msg = '%s %s at %s' % (network_type, name, t)
+                        np.testing.assert_allclose([T_return_K[row, b], mcp_kWK[row, b], thermal_demand[row, b]],
+                                                   expected, rtol=1e-9, atol=1e-9, err_msg=msg)
+                for (key, t, name), value in expected_capacity_mass_flows.items():
+                    self.assertAlmostEqual(float(cap_old[key][t][name]['0']), value, delta=1e-9 * value)
+                    self.assertAlmostEqual(float(cap_value[key][t][name]['0']), value, delta=1e-9 * value)
+
+    def test_substation_arrays_cache(self):
+        thermal_network = make_thermal_network('DH', ['B%03i' % i for i in range(12)], 2, seed=3)
+        building_lists = [tuple('B%03i' % i for i in range(start, start + 3))
+                          for start in range(substation_matrix.SUBSTATION_ARRAYS_CACHE_SIZE + 2)]
+        arrays = [substation_matrix.get_substation_arrays(thermal_network, names) for names in building_lists]
+        # the oldest lists of buildings are dropped, the others are kept
+        self.assertEqual(list(substation_matrix._substation_arrays_cache), building_lists[2:])
+        self.assertIs(substation_matrix.get_substation_arrays(thermal_network, building_lists[-1]), arrays[-1])
+        self.assertIsNot(substation_matrix.get_substation_arrays(thermal_network, building_lists[0]), arrays[0])
+        self.assertEqual(len(substation_matrix._substation_arrays_cache),
+                         substation_matrix.SUBSTATION_ARRAYS_CACHE_SIZE)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,168 @@
+"""
+Test the calculation of the mass flows of a tree network for all time steps at once
+(:py:func:`cea.technologies.thermal_network.thermal_network.batch_mass_flow_calculation`) against the calculation
+hour by hour (:py:func:`cea.technologies.thermal_network.thermal_network.hourly_mass_flow_calculation`).
+"""
+
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import cea.technologies.thermal_network.substation_matrix as substation_matrix
+import cea.technologies.thermal_network.thermal_network as thermal_network_module
+
+__author__ = "Daren Thomas"
+__copyright__ = "Copyright 2024, Architecture and Building Systems - ETH Zurich"
+__credits__ = ["Daren Thomas"]
+__license__ = "MIT"
+__version__ = "0.1"
+__maintainer__ = "Daren Thomas"
+__email__ = "cea@arch.ethz.ch"
+__status__ = "Production"
+
+HOURS = 48
+NUMBER_OF_NODES = 12
+HEATING_SYSTEMS = ['ahu', 'aru', 'shu', 'ww']
+COOLING_SYSTEMS = ['ahu', 'aru', 'scu']
+
+
+def make_building_demand(rng, name):
+    """Random demand results of a building, with the columns read by the thermal network"""
+    demand = pd.DataFrame(0.0, index=range(HOURS), columns=substation_matrix.BUILDINGS_DEMANDS_COLUMNS)
+    demand['Name'] = name
+
+    def fill(load, supply, ret, mcp, low, high, sign):
+        on = rng.random(HOURS) < 0.7
+        q = np.where(on, rng.uniform(1.0, 60.0, HOURS) * sign, 0.0)
+        t_supply = rng.uniform(low, high, HOURS)
+        t_return = t_supply + (rng.uniform(-20.0, -5.0, HOURS) if sign > 0 else rng.uniform(4.0, 10.0, HOURS))
+        demand[load] = q
+        demand[supply] = np.where(on, t_supply, np.nan)
+        demand[ret] = np.where(on, t_return, np.nan)
+        demand[mcp] = np.where(on, np.abs(q / (t_supply - t_return)), 0.0)
+
+    for system in ['ahu', 'aru', 'shu']:
+        fill('Qhs_sys_%s_kWh' % system, 'Ths_sys_sup_%s_C' % system, 'Ths_sys_re_%s_C' % system,
+             'mcphs_sys_%s_kWperC' % system, 35.0, 70.0, 1)
+    fill('Qww_sys_kWh', 'Tww_sys_sup_C', 'Tww_sys_re_C', 'mcpww_sys_kWperC', 55.0, 65.0, 1)
+    for system in ['ahu', 'aru', 'scu']:
+        fill('Qcs_sys_%s_kWh' % system, 'Tcs_sys_sup_%s_C' % system, 'Tcs_sys_re_%s_C' % system,
+             'mcpcs_sys_%s_kWperC' % system, 6.0, 14.0, -1)
+    return demand
+
+
+class SmallTreeNetwork(object):
+    """The fields of a :py:class:`ThermalNetwork` read by the mass flow calculation, for a random tree network"""
+
+    def __init__(self, network_type, folder, seed, minimum_edge_mass_flow):
+        rng = np.random.default_rng(seed)
+        self.network_type = network_type
+        self.network_name = ''
+        self.substation_heating_systems = HEATING_SYSTEMS
+        self.substation_cooling_systems = COOLING_SYSTEMS
+        self.substation_systems = {'heating': HEATING_SYSTEMS if network_type == 'DH' else [],
+                                   'cooling': COOLING_SYSTEMS if network_type == 'DC' else []}
+        self.minimum_edge_mass_flow = minimum_edge_mass_flow
+        self.minimum_mass_flow_iteration_limit = 30
+        self.no_convergence_flag = False
+        self.delta_cap_mass_flow = {}
+        self.nodes = {}
+        self.cc_old = {}
+        self.ch_old = {}
+        self.cc_value = {}
+        self.ch_value = {}
+
+        # a random tree with the plant at the first node and a building at every other node
+        nodes = ['NODE%i' % n for n in range(NUMBER_OF_NODES)]
+        edge_node = np.zeros((NUMBER_OF_NODES, NUMBER_OF_NODES - 1))
+        for node in range(1, NUMBER_OF_NODES):
+            parent = int(rng.integers(0, node))
+            edge_node[parent, node - 1], edge_node[node, node - 1] = -1.0, 1.0
+        self.edge_node_df = pd.DataFrame(edge_node, index=nodes,
+                                         columns=['PIPE%i' % e for e in range(NUMBER_OF_NODES - 1)])
+        self.building_names = pd.Index(['B%02i' % n for n in range(1, NUMBER_OF_NODES)])
+        self.all_nodes_df = pd.DataFrame({'Type': ['PLANT'] + ['CONSUMER'] * (NUMBER_OF_NODES - 1),
+                                          'Building': ['NONE'] + list(self.building_names)}, index=nodes)
+        self.edge_df = pd.DataFrame({'pipe length': rng.uniform(10.0, 100.0, NUMBER_OF_NODES - 1)},
+                                    index=self.edge_node_df.columns)
+        self.node_types_file = os.path.join(folder, 'nodes_%s_%i.csv' % (network_type, seed))
+        self.all_nodes_df.to_csv(self.node_types_file)
+
+        # the network reads the demand results and the node types through its locator
+        self.demands = {name: make_building_demand(rng, name) for name in self.building_names}
+        self.locator = self
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.buildings_demands = substation_matrix.determine_building_supply_temperatures(
+                self.building_names, self, self.substation_systems)
+            self.substations_HEX_specs, _ = substation_matrix.substation_HEX_design_main(
+                self.buildings_demands, self.substation_systems, self)
+        self.t_target_supply_C = thermal_network_module.read_properties_from_buildings(
+            self.buildings_demands, 'T_sup_target_' + network_type)
+
+    def read_demand_results(self, building, columns=None):
+        return self.demands[building][columns].copy()
+
+    def get_thermal_network_node_types_csv_file(self, network_type, network_name):
+        return self.node_types_file
+
+
+class TestBatchMassFlowCalculation(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def make_network(self, network_type, seed, minimum_edge_mass_flow):
+        return SmallTreeNetwork(network_type, self.folder, seed, minimum_edge_mass_flow)
+
+    def assert_same_mass_flows(self, network_type, seed, minimum_edge_mass_flow):
+        diameter_guess = np.full(NUMBER_OF_NODES - 1, 0.1)
+        time_steps = range(HOURS)
+        with contextlib.redirect_stdout(io.StringIO()):
+            hourly_network = self.make_network(network_type, seed, minimum_edge_mass_flow)
+            hourly = [thermal_network_module.hourly_mass_flow_calculation(t, diameter_guess, hourly_network)
+                      for t in time_steps]
+            batch_network = self.make_network(network_type, seed, minimum_edge_mass_flow)
+            batch = thermal_network_module.batch_mass_flow_calculation(batch_network, time_steps, diameter_guess)
+
+        for i, name in enumerate(['edge mass flows', 'node mass flows', 'thermal demand']):
+            np.testing.assert_allclose(batch[i], np.array([result[i] for result in hourly]), rtol=1e-9, atol=1e-9,
+                                       err_msg='%s of %s network %i' % (name, network_type, seed))
+        self.assertEqual(batch_network.delta_cap_mass_flow, hourly_network.delta_cap_mass_flow)
+        return batch_network, batch
+
+    def test_batch_mass_flow_calculation(self):
+        for network_type in ['DH', 'DC']:
+            for seed in range(3):
+                self.assert_same_mass_flows(network_type, seed, minimum_edge_mass_flow=0.1)
+
+    def test_batch_mass_flow_calculation_with_low_edge_mass_flows(self):
+        """The hours with too low edge mass flows go through the minimum mass flow iteration"""
+        for network_type in ['DH', 'DC']:
+            batch_network, batch = self.assert_same_mass_flows(network_type, seed=4, minimum_edge_mass_flow=0.5)
+            self.assertTrue(any(delta > 0 for delta in batch_network.delta_cap_mass_flow.values()),
+                            'no hour of the %s network needed the minimum mass flow iteration' % network_type)
+
+    def test_find_low_edge_mass_flows(self):
+        thermal_network = self.make_network('DH', 0, minimum_edge_mass_flow=0.1)
+        edge_mass_flows = np.array([[0.0, 0.2, -0.3], [0.04, 0.2, 0.3], [0.0, -0.04, np.nan], [0.0, 0.0, 0.0]])
+        np.testing.assert_array_equal(thermal_network_module.find_low_edge_mass_flows(thermal_network,
+                                                                                      edge_mass_flows),
+                                      [False, True, True, False])
+        for t, flows in enumerate(edge_mass_flows):
+            thermal_network_module.reset_min_mass_flow_variables(thermal_network, t)
+            _, done = thermal_network_module.edge_mass_flow_iteration(thermal_network, pd.DataFrame([flows]), 0, t)
+            self.assertEqual(done, not thermal_network_module.find_low_edge_mass_flows(thermal_network,
+                                                                                       flows[np.newaxis])[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+"""
+Test the checkpoints of the thermal-hydraulic calculation of a thermal network in time windows
+(cea.technologies.thermal_network.time_windows).
+"""
+
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import cea.inputlocator
+import cea.technologies.thermal_network.thermal_network as thermal_network_module
+import cea.technologies.thermal_network.time_windows as time_windows
+
+__author__ = "Daren Thomas"
+__copyright__ = "Copyright 2024, Architecture and Building Systems - ETH Zurich"
+__credits__ = ["Daren Thomas"]
+__license__ = "MIT"
+__version__ = "0.1"
+__maintainer__ = "Daren Thomas"
+__email__ = "cea@arch.ethz.ch"
+__status__ = "Production"
+
+
+class SmallThermalNetwork(object):
+    """The fields of a :py:class:`ThermalNetwork` read by the time windows, for a network of three nodes"""
+
+    def __init__(self, locator):
+        self.locator = locator
+        self.network_type = 'DH'
+        self.network_name = ''
+        self.start_t = 0
+        self.stop_t = 100
+        self.use_representative_week_per_month = False
+        self.minimum_mass_flow_iteration_limit = 30
+        self.minimum_edge_mass_flow = 0.1
+        self.substation_heating_systems = ['ahu', 'aru', 'shu', 'ww']
+        self.substation_cooling_systems = ['ahu', 'aru', 'scu']
+        self.temperature_control = 'VT'
+        self.plant_supply_temperature = 80
+        self.equivalent_length_factor = 0.2
+        self.pressure_loss_coeff = [np.float64(1.0), 2.0, 3.0, 4.0, 5.0]
+        self.time_window_hours = 30
+        self.resume_from_checkpoint = True
+        self.problematic_edges = {}
+
+        self.edge_node_df = pd.DataFrame([[-1.0, 0.0], [1.0, -1.0], [0.0, 1.0]], index=['NODE0', 'NODE1', 'NODE2'],
+                                         columns=['PIPE0', 'PIPE1'])
+        self.all_nodes_df = pd.DataFrame({'Type': ['PLANT', 'NONE', 'CONSUMER'], 'Building': ['B0', 'NONE', 'B1'],
+                                          'coordinates': [(0.0, 0.0), (1.0, 0.0), (2.0, 0.0)]},
+                                         index=self.edge_node_df.index)
+        self.edge_df = pd.DataFrame({'pipe length': [10.0, 20.0], 'Pipe_DN': [50, 80]}, index=['PIPE0', 'PIPE1'])
+        self.pipe_properties = pd.DataFrame({'PIPE0': ['ISO', 0.05], 'PIPE1': ['ISO', 0.08]},
+                                            index=['Type_mat', 'D_int_m'])
+        self.edge_mass_flow_df = pd.DataFrame(np.ones((self.stop_t, 2)), columns=self.edge_df.index)
+        self.node_mass_flow_df = pd.DataFrame(np.ones((self.stop_t, 3)), columns=self.edge_node_df.index)
+        self.t_target_supply_df = pd.DataFrame(np.full((self.stop_t, 3), 60.0), columns=self.edge_node_df.index)
+        self.substations_HEX_specs = pd.DataFrame({'A_hex_hs_ahu': [1.0, 2.0]}, index=['B0', 'B1'])
+        self.buildings_demands = {'B1': pd.DataFrame({'Qhs_sys_ahu_kWh': np.arange(self.stop_t, dtype=float)})}
+        self.T_ground_K = np.full(self.stop_t, 283.0)
+
+
+class Interruption(Exception):
+    pass
+
+
+def fake_hourly_thermal_calculation(t, thermal_network):
+    """A stand-in for the hourly calculation that depends on a setting and on the state carried between hours"""
+    if t == 50:
+        thermal_network.temperature_control = 'CT'
+    if t % 17 == 0:
+        thermal_network.problematic_edges['PIPE%i' % (t % 2)] = t * 0.01
+    offset = 100.0 if thermal_network.temperature_control == 'CT' else 0.0
+    values = {field: np.full(2, t * thermal_network.minimum_edge_mass_flow + offset)
+              for field in thermal_network_module.HourlyThermalResults._fields}
+    return thermal_network_module.HourlyThermalResults(**values)
+
+
+class TestTimeWindowCheckpoints(unittest.TestCase):
+
+    def setUp(self):
+        self.locator = cea.inputlocator.InputLocator(tempfile.mkdtemp())
+        self.hours = []
+
+    def tearDown(self):
+        shutil.rmtree(self.locator.scenario, ignore_errors=True)
+
+    def hourly_thermal_calculation(self, interrupt_at=None):
+        def hourly_thermal_calculation(t, thermal_network):
+            if t == interrupt_at:
+                raise Interruption()
+            self.hours.append(t)
+            return fake_hourly_thermal_calculation(t, thermal_network)
+        return hourly_thermal_calculation
+
+    def solve(self, thermal_network, interrupt_at=None):
+        windows = time_windows.calc_time_windows(thermal_network.start_t, thermal_network.stop_t,
+                                                 thermal_network.time_window_hours)
+        with mock.patch.object(thermal_network_module, 'hourly_thermal_calculation',
+                               self.hourly_thermal_calculation(interrupt_at)):
+            thermal_network_module.solve_time_windows(windows, thermal_network)
+        return time_windows.read_window_results(thermal_network, windows,
+                                                thermal_network_module.HourlyThermalResults._fields)
+
+    def assert_same_results(self, results, expected):
+        for field in thermal_network_module.HourlyThermalResults._fields:
+            np.testing.assert_array_equal(np.array(results[field]), np.array(expected[field]))
+
+    def test_resume_interrupted_calculation(self):
+        expected_network = SmallThermalNetwork(cea.inputlocator.InputLocator(tempfile.mkdtemp()))
+        try:
+            expected = self.solve(expected_network)
+        finally:
+            shutil.rmtree(expected_network.locator.scenario, ignore_errors=True)
+        self.hours = []
+
+        # interrupt the calculation in the third time window (hours 60 to 90)
+        with self.assertRaises(Interruption):
+            self.solve(SmallThermalNetwork(self.locator), interrupt_at=75)
+        self.assertEqual(self.hours, list(range(75)))
+
+        # only the hours of the unfinished time windows are calculated again, continuing from the state at the end
+        # of the finished time windows
+        self.hours = []
+        thermal_network = SmallThermalNetwork(self.locator)
+        results = self.solve(thermal_network)
+        self.assertEqual(self.hours, list(range(60, 100)))
+        self.assert_same_results(results, expected)
+        self.assertEqual(thermal_network.temperature_control, expected_network.temperature_control)
+        self.assertEqual(thermal_network.problematic_edges, expected_network.problematic_edges)
+
+    def test_changed_setting_invalidates_checkpoint(self):
+        self.solve(SmallThermalNetwork(self.locator))
+        checkpoint_file = self.locator.get_thermal_network_checkpoint_file('DH', '')
+        with open(checkpoint_file) as f:
+            fingerprint = json.load(f)['fingerprint']
+
+        changes = {'minimum_edge_mass_flow': 0.2, 'minimum_mass_flow_iteration_limit': 10,
+                   'equivalent_length_factor': 0.3, 'pressure_loss_coeff': [1.0, 2.0, 3.0, 4.0, 6.0],
+                   'substation_heating_systems': ['ahu', 'aru', 'shu'], 'plant_supply_temperature': 70,
+                   'time_window_hours': 25}
+        for name, value in changes.items():
+            thermal_network = SmallThermalNetwork(self.locator)
+            setattr(thermal_network, name, value)
+            self.assertNotEqual(time_windows.calc_fingerprint(thermal_network, thermal_network.time_window_hours),
+                                fingerprint, msg=name)
+
+        with mock.patch.object(time_windows, 'FINGERPRINT_VERSION', time_windows.FINGERPRINT_VERSION + 1):
+            thermal_network = SmallThermalNetwork(self.locator)
+            self.assertNotEqual(time_windows.calc_fingerprint(thermal_network, thermal_network.time_window_hours),
+                                fingerprint)
+
+        # a changed setting starts the calculation over and gives the results of the new setting
+        self.hours = []
+        thermal_network = SmallThermalNetwork(self.locator)
+        thermal_network.minimum_edge_mass_flow = 0.2
+        results = self.solve(thermal_network)
+        self.assertEqual(self.hours, list(range(100)))
+        self.assertEqual(results['plant_heat_requirement'][10][0], 10 * 0.2)
+
+        # the same settings resume from the checkpoint without calculating any hour again
+        self.hours = []
+        thermal_network = SmallThermalNetwork(self.locator)
+        thermal_network.minimum_edge_mass_flow = 0.2
+        self.solve(thermal_network)
+        self.assertEqual(self.hours, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,16 @@
 """
 Energyplus file reader
+
+The weather data returned by ``epw_reader`` is cached in a binary file (see ``get_cache_file``), keyed by the hash of
+the contents of the epw file. Later calls load the weather data from the cache with memory mapping instead of parsing
+the epw file again. Only the ``CACHE_SIZE`` most recently used weather files are kept in the cache.
 """
 
+import hashlib
+import os
+import tempfile
+
 import pandas as pd
-import math
 import cea.inputlocator
 import numpy as np
 from cea.constants import BOLTZMANN, KELVIN_OFFSET, HOURS_IN_YEAR
@@ -24,6 +31,11 @@ from cea.utilities.date import get_date_range_hours_from_year
 HOR_IR_SKY_NO_VALUE = 9999
 OPAQUE_SKY_NO_VALUE = 99
 
+# change this when the weather data returned by `epw_reader` changes, to invalidate the cached weather data
+CACHE_VERSION = 1
+# number of weather files kept in the cache, the least recently used ones are removed
+CACHE_SIZE = 8
+
 def epw_to_dataframe(weather_path):
     epw_labels = ['year', 'month', 'day', 'hour', 'minute', 'datasource', 'drybulb_C', 'dewpoint_C', 'relhum_percent',
                   'atmos_Pa', 'exthorrad_Whm2', 'extdirrad_Whm2', 'horirsky_Whm2', 'glohorrad_Whm2',
@@ -39,6 +51,15 @@ def epw_to_dataframe(weather_path):
 
 
 def epw_reader(weather_path):
+    cache_file = get_cache_file(weather_path)
+    epw_data = read_cache(cache_file)
+    if epw_data is None:
+        epw_data = parse_epw(weather_path)
+        write_cache(cache_file, epw_data)
+    return epw_data
+
+
+def parse_epw(weather_path):
     epw_data = epw_to_dataframe(weather_path)
 
     year = epw_data["year"][0]
@@ -63,39 +84,117 @@ def epw_reader(weather_path):
     try:
         epw_data['ratio_diffhout'] = epw_data['difhorrad_Whm2'] / epw_data['glohorrad_Whm2']
         epw_data['ratio_diffhout'] = epw_data['ratio_diffhout'].replace(np.inf, np.nan)
-        epw_data['wetbulb_C'] = np.vectorize(calc_wetbulb)(epw_data['drybulb_C'], epw_data['relhum_percent'])
-        epw_data['skytemp_C'] = np.vectorize(calc_skytemp)(epw_data['horirsky_Whm2'],
-                                                           epw_data['drybulb_C'], epw_data['dewpoint_C'],
-                                                           epw_data['opaqskycvr_tenths'])
+        epw_data['wetbulb_C'] = calc_wetbulb(epw_data['drybulb_C'].values, epw_data['relhum_percent'].values)
+        epw_data['skytemp_C'] = calc_skytemp(epw_data['horirsky_Whm2'].values,
+                                             epw_data['drybulb_C'].values, epw_data['dewpoint_C'].values,
+                                             epw_data['opaqskycvr_tenths'].values)
     except ValueError as e:
         raise ValueError(f"Errors found in the provided weather file: {e}") from e
 
     return epw_data
 
 
+def get_cache_file(weather_path):
+    """The cache file of the weather data of ``weather_path``, named after the hash of its contents"""
+    h = hashlib.sha256()
+    with open(weather_path, 'rb') as f:
+        h.update(f.read())
+    h.update(str(CACHE_VERSION).encode())
+    return os.path.join(get_cache_dir(), h.hexdigest() + '.npy')
+
+
+def get_cache_dir():
+    return os.path.join(tempfile.gettempdir(), 'cea-weather-cache')
+
+
+def read_cache(cache_file):
+    """
+    Load the weather data from the cache file (or return ``None`` if there is none). The file is memory mapped,
+    copy-on-write: changing the weather data does not change the cache file.
+    """
+    if not os.path.exists(cache_file):
+        return None
+    try:
+        record = np.load(cache_file, mmap_mode='c')[0]
+    except (OSError, ValueError):
+        # a broken cache file is replaced with a new one
+        return None
+    try:
+        # mark the cache file as recently used
+        os.utime(cache_file)
+    except OSError:
+        pass
+    return pd.DataFrame(dict((name, record[name]) for name in record.dtype.names), copy=False)
+
+
+def write_cache(cache_file, epw_data):
+    """
+    Save the weather data to the cache file as a single record with a field for each column, so each column can be
+    mapped to a contiguous array. The cache is skipped if the folder is not writable or the data can't be stored.
+    """
+    columns = [(column, epw_data[column].to_numpy()) for column in epw_data.columns]
+    if not all(isinstance(values.dtype, np.dtype) and values.dtype.kind in 'biufM' for _, values in columns):
+        return
+    record = np.empty(1, dtype=[(str(column), values.dtype, values.shape) for column, values in columns])
+    for column, values in columns:
+        record[0][str(column)] = values
+    temporary_file = '%s.%i.tmp' % (cache_file, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(temporary_file, 'wb') as f:
+            np.save(f, record)
+        os.replace(temporary_file, cache_file)
+    except OSError:
+        if os.path.exists(temporary_file):
+            os.remove(temporary_file)
+        return
+    prune_cache(os.path.dirname(cache_file), CACHE_SIZE)
+
+
+def prune_cache(cache_dir, cache_size):
+    """Remove the least recently used cache files, keeping the ``cache_size`` most recent ones"""
+    try:
+        cache_files = sorted((entry for entry in os.scandir(cache_dir) if entry.name.endswith('.npy')),
+                             key=lambda entry: entry.stat().st_mtime, reverse=True)
+    except OSError:
+        return
+    for entry in cache_files[cache_size:]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            # e.g. the file is still mapped by another process (on Windows)
+            pass
+
+
 def calc_horirsky(Tdrybulb, Tdewpoint, N):
     """
     Based on the equation found here:
     https://energyplus.net/assets/nrel_custom/pdfs/pdfs_v24.1.0/EngineeringReference.pdf (Section 5.1.2)
 
+    The arguments can be scalars or arrays.
+
     :param Tdrybulb: Dry bulb temperature [C]
     :param Tdewpoint: Wet bulb temperature [C]
     :param N: opaque skycover in [tenths], minimum is 0, maximum is 10 see: http://glossary.ametsoc.org/wiki/Sky_cover
     :return: horizontal infrared radiation intensity [Whm2]
     """
-
-    if N == OPAQUE_SKY_NO_VALUE:
-        raise ValueError(f"Opaque Sky Cover (column 23) has a missing value. (found {N})")
-    elif N > 10:
-        raise ValueError(f"Opaque Sky Cover (column 23) is above 10. (found {N})")
-    elif N < 0:
-        raise ValueError(f"Opaque Sky Cover (column 23) is below 0. (found {N})")
-
-    sky_e = (0.787 + 0.764 * math.log((Tdewpoint + KELVIN_OFFSET) / KELVIN_OFFSET)) * (
+    N = np.asarray(N)
+    invalid = (N == OPAQUE_SKY_NO_VALUE) | (N > 10) | (N < 0)
+    if np.any(invalid):
+        # report the first invalid value
+        n = N[invalid].flat[0]
+        if n == OPAQUE_SKY_NO_VALUE:
+            raise ValueError(f"Opaque Sky Cover (column 23) has a missing value. (found {n})")
+        elif n > 10:
+            raise ValueError(f"Opaque Sky Cover (column 23) is above 10. (found {n})")
+        else:
+            raise ValueError(f"Opaque Sky Cover (column 23) is below 0. (found {n})")
+
+    sky_e = (0.787 + 0.764 * np.log((np.asarray(Tdewpoint) + KELVIN_OFFSET) / KELVIN_OFFSET)) * (
             1 + 0.0224 * N - 0.0035 * N ** 2 + 0.00028 * N ** 3)
-    hor_IR = sky_e * BOLTZMANN * (Tdrybulb + KELVIN_OFFSET) ** 4
+    hor_IR = sky_e * BOLTZMANN * (np.asarray(Tdrybulb) + KELVIN_OFFSET) ** 4
 
-    return hor_IR
+    return hor_IR[()]
 
 
 def calc_skytemp(hor_IR_Whm2, Tdrybulb, Tdewpoint, N):
@@ -106,30 +205,39 @@ def calc_skytemp(hor_IR_Whm2, Tdrybulb, Tdewpoint, N):
     or:
     https://bigladdersoftware.com/epx/docs/8-6/engineering-reference/climate-calculations.html
 
+    The arguments can be scalars or arrays.
+
     :param hor_IR_Whm2: horizontal infrared radiation intensity [Whm2], minimum is 0
     :param Tdrybulb: Dry bulb temperature [C]
     :param Tdewpoint: Wet bulb temperature [C]
     :param N: opaque skycover in [tenths], minimum is 0, maximum is 10 see: http://glossary.ametsoc.org/wiki/Sky_cover
     :return: sky temperature [C]
     """
-
-    hor_IR = hor_IR_Whm2
-    if hor_IR == HOR_IR_SKY_NO_VALUE:
+    hor_IR_Whm2, Tdrybulb, Tdewpoint, N = np.broadcast_arrays(hor_IR_Whm2, Tdrybulb, Tdewpoint, N)
+    missing = hor_IR_Whm2 == HOR_IR_SKY_NO_VALUE
+    negative = hor_IR_Whm2 < 0
+    if np.any(negative):
+        raise ValueError(f"Horizontal infrared radiation intensity (column 12) is below 0. "
+                         f"(found {hor_IR_Whm2[negative].flat[0]})")
+
+    hor_IR = hor_IR_Whm2.astype(float)
+    if np.any(missing):
         # Calculate value based on equation if missing
-        hor_IR = calc_horirsky(Tdrybulb, Tdewpoint, N)
-    elif hor_IR < 0:
-        raise ValueError(f"Horizontal infrared radiation intensity (column 12) is below 0. (found {hor_IR})")
+        hor_IR[missing] = calc_horirsky(Tdrybulb[missing], Tdewpoint[missing], N[missing])
 
     sky_T = ((hor_IR / BOLTZMANN) ** 0.25) - KELVIN_OFFSET
 
-    return sky_T  # sky temperature in C
+    return sky_T[()]  # sky temperature in C
 
 
 def calc_wetbulb(Tdrybulb, RH):
-    Tw = Tdrybulb * math.atan(0.151977 * ((RH + 8.313659) ** (0.5))) + math.atan(Tdrybulb + RH) - math.atan(
-        RH - 1.676331) + (0.00391838 * (RH ** (3 / 2))) * math.atan(0.023101 * RH) - 4.686035
+    """The arguments can be scalars or arrays."""
+    Tdrybulb = np.asarray(Tdrybulb)
+    RH = np.asarray(RH)
+    Tw = Tdrybulb * np.arctan(0.151977 * ((RH + 8.313659) ** (0.5))) + np.arctan(Tdrybulb + RH) - np.arctan(
+        RH - 1.676331) + (0.00391838 * (RH ** (3 / 2))) * np.arctan(0.023101 * RH) - 4.686035
 
-    return Tw  # wetbulb temperature in C
+    return Tw[()]  # wetbulb temperature in C
 
 
 def main(config):
@@ -13,9 +13,17 @@ This module exports the function `map` which is intended to replace both ``map_a
 (which was used when ``config.multiprocessing == False``). This simplifies multiprocessing.
 """
 
+import atexit
+import logging
 import multiprocessing
+import multiprocessing.resource_tracker
+import multiprocessing.shared_memory
+import operator
+import os
+import pickle
 import sys
-import logging
+import threading
+import uuid
 from itertools import repeat
 from cea.utilities.workerstream import stream_from_queue, QueueWorkerStream
 
@@ -29,7 +37,7 @@ __email__ = "cea@arch.ethz.ch"
 __status__ = "Production"
 
 
-def vectorize(func, processes=1, on_complete=None):
+def vectorize(func, processes=1, on_complete=None, chunksize=None):
     """
     Similar to ``numpy.vectorize``, this function wraps ``func`` so that it operates on sequences (of same length)
     of inputs and outputs a sequence of results, similar to ``map(func, *args)``.
@@ -37,6 +45,13 @@ def vectorize(func, processes=1, on_complete=None):
     The main point of using ``vectorize`` is to unify single-processing with multi-processing - if processes > 1,
     then multiprocessing is used and the function will be run on a pool of processes. STDOUT and STDERR of these
     processes are fed through a ``cea.workerstream.QueueWorkerStream`` so it can be shown in the dashboard job output.
+    The pool is kept alive between calls (see :py:func:`get_worker_pool`), so scripts run one after the other (e.g. in
+    a workflow) don't pay for starting the worker processes each time.
+
+    Arguments constructed with ``itertools.repeat`` are broadcast: they are pickled only once per call and each worker
+    process unpickles them only once (and releases them at the end of the call), instead of sending them along with
+    every call to ``func``. Use ``repeat`` for large arguments that are the same for all calls, like the locator, the
+    config or the weather data.
 
     The parameter ``on_complete`` is an optional callable that is called for each completed call of ``func``. It takes
     4 arguments:
@@ -48,92 +63,237 @@ def vectorize(func, processes=1, on_complete=None):
 
     .. note: due to the way multiprocessing works, ``func`` and ``on_complete`` need to be module-level functions
 
-    .. note: the if processes > 1, then the first argument to the vectorized ``func`` will be converted to a list before
-        running. This should not have any side effects, but is necessary if the args are constructed with
-        ``itertools.repeat``.
+    .. note: the if processes > 1, then the args not constructed with ``itertools.repeat`` will be converted to lists
+        before running.
 
     :param func: The function to vectorize
     :param int processes: The number of processes to use (use ``config.get_number_of_processes()``)
     :param on_complete: An optional function to call for each completed call to ``func``.
+    :param int chunksize: The number of calls sent to a worker process at once (default: a few chunks per process)
     """
     if processes > 1:
-        return __multiprocess_wrapper(func, processes, on_complete)
+        return __multiprocess_wrapper(func, processes, on_complete, chunksize)
     else:
         return single_process_wrapper(func, on_complete)
 
 
-def __multiprocess_wrapper(func, processes, on_complete):
-    """Create a worker pool to map the function, taking care to set up STDOUT and STDERR"""
+class WorkerPool(object):
+    """
+    A ``multiprocessing.Pool`` together with the queue its worker processes use for STDOUT and STDERR. The worker
+    processes keep a cache of the broadcast arguments of the current call, cleared at the end of the call (see
+    :py:meth:`clear_broadcast_cache`).
+    """
 
-    def wrapper(*args):
-        print("Using {processes} CPU's".format(processes=processes))
-        pool = multiprocessing.Pool(processes)
-        manager = multiprocessing.Manager()
+    def __init__(self, processes):
+        self.processes = processes
+        self.queue = multiprocessing.Queue()
+        # all worker processes wait at the barrier, so each of them takes exactly one task of clear_broadcast_cache
+        self.barrier = multiprocessing.Barrier(processes)
+        if os.name == 'posix':
+            # share the resource tracker of this process with the workers, so the shared memory they attach to is
+            # only tracked (and cleaned up) here
+            multiprocessing.resource_tracker.ensure_running()
+        self.pool = multiprocessing.Pool(processes, initializer=_initialize_worker,
+                                         initargs=(self.queue, self.barrier))
+
+    def clear_broadcast_cache(self):
+        """Release the broadcast arguments of the last call in all worker processes"""
+        results = self.pool.map_async(_clear_broadcast_cache, range(self.processes), chunksize=1)
+        while not results.ready():
+            stream_all_from_queue(self.queue)
+            results.wait(timeout=0.1)
+        results.get()
+        if self.barrier.broken:
+            self.barrier.reset()
+
+    def close(self):
+        # the worker processes only exit once their output is written to the queue, so keep processing the queue
+        # while waiting for them
+        stream_all_from_queue(self.queue)
+        self.pool.close()
+        join = threading.Thread(target=self.pool.join)
+        join.start()
+        while join.is_alive():
+            stream_all_from_queue(self.queue)
+            join.join(timeout=0.1)
+        # process the rest of the queue
+        stream_all_from_queue(self.queue)
 
-        # a queue for STDOUT and STDERR output of sub-processes (see cea.utilities.workerstream.QueueWorkerStream)
-        queue = manager.Queue()
+    def terminate(self):
+        self.pool.terminate()
+        self.pool.join()
 
-        # make sure the first arg is a list (not a generator) since we need the length of the sequence
-        args = [list(a) for a in args]
-        n = len(args[0])  # the number of iterations to map
 
-        # set up the list of i-values for on_complete
-        i_queue = manager.Queue()
-        for i in range(n):
-            i_queue.put(i)
+_worker_pool = None
 
-        args = [repeat(func, n),
-                repeat(queue, n),
-                repeat(on_complete, n),
-                repeat(i_queue, n),
-                repeat(n, n)] + args
-        args = zip(*args)
 
-        map_result = pool.map_async(__apply_func_with_worker_stream, args)
+def get_worker_pool(processes):
+    """Return the worker pool with ``processes`` worker processes, starting it (again) if necessary"""
+    global _worker_pool
+    if _worker_pool is not None and _worker_pool.processes != processes:
+        shutdown_worker_pool()
+    if _worker_pool is None:
+        _worker_pool = WorkerPool(processes)
+    return _worker_pool
 
-        while not map_result.ready():
-            stream_from_queue(queue)
-        result = map_result.get()
 
-        pool.close()
-        pool.join()
+def terminate_worker_pool():
+    """Stop the worker processes of the worker pool immediately, abandoning the calls still running"""
+    global _worker_pool
+    if _worker_pool is not None:
+        _worker_pool.terminate()
+        _worker_pool = None
+
+
+@atexit.register
+def shutdown_worker_pool():
+    """Stop the worker processes of the worker pool (it will be started again by the next call that needs it)"""
+    global _worker_pool
+    if _worker_pool is not None:
+        _worker_pool.close()
+        _worker_pool = None
+
+
+def __multiprocess_wrapper(func, processes, on_complete, chunksize):
+    """Map the function on the worker pool, taking care to set up STDOUT and STDERR"""
+
+    def wrapper(*args):
+        print("Using {processes} CPU's".format(processes=processes))
+        worker_pool = get_worker_pool(processes)
+
+        # arguments constructed with itertools.repeat are broadcast, the others are converted to lists (not
+        # generators) since we need the length of the sequence
+        broadcast_positions = [p for p, a in enumerate(args) if isinstance(a, repeat)]
+        args = [a if isinstance(a, repeat) else list(a) for a in args]
+        n = min(operator.length_hint(a) if isinstance(a, repeat) else len(a) for a in args)  # the number of iterations
+        broadcast_values = [next(args[p]) for p in broadcast_positions] if n else []
+        tasks = [[a[i] for a in args if not isinstance(a, repeat)] for i in range(n)]
+
+        # send the calls to the workers in chunks
+        size = chunksize if chunksize is not None else max(1, -(-n // (processes * 4)))
+        chunks = [range(start, min(start + size, n)) for start in range(0, n, size)]
+
+        # put the pickled broadcast values in shared memory for the worker processes
+        blob = pickle.dumps(broadcast_values, protocol=pickle.HIGHEST_PROTOCOL)
+        shared_memory = multiprocessing.shared_memory.SharedMemory(create=True, size=max(len(blob), 1))
+        shared_memory.buf[:len(blob)] = blob
+        broadcast = (uuid.uuid4().hex, shared_memory.name, len(blob), broadcast_positions)
+
+        def call_args(i):
+            instance_args = list(tasks[i])
+            for p, value in zip(broadcast_positions, broadcast_values):
+                instance_args.insert(p, value)
+            return tuple(instance_args)
+
+        result = [None] * n
+        try:
+            results = worker_pool.pool.imap_unordered(
+                __apply_func_with_worker_stream,
+                [(func, broadcast, [(i, tasks[i]) for i in chunk]) for chunk in chunks])
+            completed = 0
+            for _ in chunks:
+                while True:
+                    stream_all_from_queue(worker_pool.queue)
+                    try:
+                        chunk_results = results.next(timeout=0.1)
+                        break
+                    except multiprocessing.TimeoutError:
+                        pass
+                for i, instance_result in chunk_results:
+                    result[i] = instance_result
+                    if on_complete:
+                        on_complete(completed, n, call_args(i), instance_result)
+                    completed += 1
+        except BaseException:
+            # don't leave the remaining calls running on the worker pool
+            terminate_worker_pool()
+            raise
+        finally:
+            shared_memory.close()
+            shared_memory.unlink()
+
+        # don't keep the broadcast values in the worker processes until the next call
+        worker_pool.clear_broadcast_cache()
 
         # process the rest of the queue
-        while not queue.empty():
-            stream_from_queue(queue)
+        stream_all_from_queue(worker_pool.queue)
         return result
 
     return wrapper
 
 
-def __apply_func_with_worker_stream(args):
+def stream_all_from_queue(queue):
+    """Stream the output waiting in the queue to STDOUT / STDERR without waiting for more"""
+    while not queue.empty():
+        stream_from_queue(queue)
+
+
+def _initialize_worker(queue, barrier):
     """
-    Call func, using ``queue`` to redirect stdout and stderr, with a tuple of args because multiprocessing.Pool.map
-    only accepts one argument for the function.
+    Set up a worker process of the worker pool: logging and printing to stderr and stdout through the queue.
 
     This function is called _inside_ a separate process.
     """
-
-    # set up logging
+    global _worker_barrier
+    _worker_barrier = barrier
     logger = multiprocessing.log_to_stderr()
     logger.setLevel(logging.WARNING)
     from cea import suppress_3rd_party_debug_loggers
     suppress_3rd_party_debug_loggers()
 
-    # unpack the arguments
-    func, queue, on_complete, i_queue, n, args = args[0], args[1], args[2], args[3], args[4], args[5:]
-
-    # set up printing to stderr and stdout to go through the queue
     sys.stdout = QueueWorkerStream('stdout', queue)
     sys.stderr = QueueWorkerStream('stderr', queue)
 
-    # CALL
-    result = func(*args)
 
-    if on_complete:
-        on_complete(i_queue.get(), n, args, result)
+# the broadcast values of the current call (call_id, values) - in the worker processes
+_broadcast_cache = (None, None)
+# the barrier of the worker pool (see WorkerPool.clear_broadcast_cache) - in the worker processes
+_worker_barrier = None
+
+# seconds to wait for the other worker processes to clear their broadcast cache
+CLEAR_BROADCAST_CACHE_TIMEOUT = 60
 
-    return result
+
+def _clear_broadcast_cache(_):
+    """
+    Release the broadcast values of the last call, then wait until all the worker processes did the same.
+
+    This function is called _inside_ a separate process.
+    """
+    global _broadcast_cache
+    _broadcast_cache = (None, None)
+    try:
+        _worker_barrier.wait(timeout=CLEAR_BROADCAST_CACHE_TIMEOUT)
+    except threading.BrokenBarrierError:
+        # a worker process did not take its task (e.g. it was restarted), the others don't need to wait for it
+        pass
+
+
+def __apply_func_with_worker_stream(args):
+    """
+    Call func for each instance of a chunk of calls, inserting the broadcast values of the call to vectorize into the
+    args of each instance. Returns the results as a list of (index, result) pairs.
+
+    This function is called _inside_ a separate process.
+    """
+    global _broadcast_cache
+    func, (call_id, shared_memory_name, size, broadcast_positions), chunk = args
+
+    if _broadcast_cache[0] != call_id:
+        shared_memory = multiprocessing.shared_memory.SharedMemory(name=shared_memory_name)
+        try:
+            _broadcast_cache = (call_id, pickle.loads(bytes(shared_memory.buf[:size])))
+        finally:
+            shared_memory.close()
+
+    chunk_results = []
+    for i, instance_args in chunk:
+        instance_args = list(instance_args)
+        for p, value in zip(broadcast_positions, _broadcast_cache[1]):
+            instance_args.insert(p, value)
+        # CALL
+        chunk_results.append((i, func(*instance_args)))
+    return chunk_results
 
 
 def single_process_wrapper(func, on_complete):
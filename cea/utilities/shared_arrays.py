@@ -0,0 +1,185 @@
+"""
+Share large read-only numpy arrays and DataFrames (e.g. the weather data or the solar gains of the buildings) with the
+worker processes of ``cea.utilities.parallel.vectorize`` without copying them into each worker.
+
+The parent process copies the arrays into a :py:class:`SharedMemoryBlock` once. When such an array (or a DataFrame
+created with :py:func:`share_dataframe`) is pickled to be sent to a worker, only the name of the shared memory block
+and the position of the array in it are sent - the worker attaches to the shared memory block and reads the array
+from there. The arrays are read-only, both in the parent and in the workers.
+
+Use the block as a context manager, the shared memory is released when leaving the ``with`` block. Without worker
+processes (``processes == 1``) no shared memory is created and the arrays are used as they are::
+
+    block, weather_data = share_dataframe(weather_data, processes)
+    with block:
+        vectorize(func, processes)(repeat(weather_data, n), building_names)
+"""
+
+import multiprocessing.shared_memory
+import weakref
+
+import numpy as np
+import pandas as pd
+
+try:
+    from numpy.lib.array_utils import byte_bounds
+except ImportError:
+    # numpy < 2.0
+    from numpy import byte_bounds
+
+__author__ = "Daren Thomas"
+__copyright__ = "Copyright 2024, Architecture and Building Systems - ETH Zurich"
+__credits__ = ["Daren Thomas"]
+__license__ = "MIT"
+__version__ = "0.1"
+__maintainer__ = "Daren Thomas"
+__email__ = "cea@arch.ethz.ch"
+__status__ = "Production"
+
+ALIGNMENT = 64  # bytes
+
+# the shared memory blocks attached to by this process (they stay open as long as arrays use them)
+_attached = weakref.WeakValueDictionary()
+
+
+class SharedMemoryBlock(object):
+    """
+    A block of shared memory holding copies of a list of arrays (see ``arrays``). With ``processes == 1`` there are no
+    worker processes to share the arrays with: ``arrays`` holds the arrays themselves and no shared memory is created.
+    """
+
+    def __init__(self, arrays, processes=None):
+        if processes is not None and processes <= 1:
+            self.shared_memory = None
+            self.name = None
+            self.arrays = list(arrays)
+            return
+        arrays = [np.ascontiguousarray(a) for a in arrays]
+        offsets = []
+        size = 0
+        for a in arrays:
+            offsets.append(size)
+            size += -(-a.nbytes // ALIGNMENT) * ALIGNMENT
+        self.shared_memory = multiprocessing.shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.name = self.shared_memory.name
+        self.size = self.shared_memory.size
+        self.address = np.frombuffer(self.shared_memory.buf, dtype=np.uint8).ctypes.data
+        self.arrays = []
+        for a, offset in zip(arrays, offsets):
+            shared_array = np.asarray(SharedBuffer(self.shared_memory, offset, a.shape, None, a.dtype,
+                                                   readonly=False)).view(SharedArray)
+            shared_array.block = self
+            shared_array[...] = a
+            shared_array.flags.writeable = False
+            self.arrays.append(shared_array)
+
+    def close(self):
+        """
+        Release the shared memory. Arrays still in use (in this process or in the workers) remain valid, but the
+        arrays can't be sent to workers anymore.
+        """
+        if self.shared_memory is not None:
+            self.shared_memory.unlink()
+            self.shared_memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class SharedBuffer(object):
+    """
+    Expose a region of a shared memory block to numpy with the ``__array_interface__`` protocol. Arrays created from
+    it keep it (and thereby the shared memory block) alive.
+    """
+
+    def __init__(self, shared_memory, offset, shape, strides, dtype, readonly):
+        # the temporary array only serves to find the address of the shared memory
+        address = np.frombuffer(shared_memory.buf, dtype=np.uint8).ctypes.data
+        self.shared_memory = shared_memory
+        self.__array_interface__ = {
+            'version': 3,
+            'data': (address + offset, readonly),
+            'shape': tuple(shape),
+            'strides': None if strides is None else tuple(strides),
+            'typestr': np.dtype(dtype).str,
+        }
+
+
+class SharedArray(np.ndarray):
+    """
+    A numpy array (or a view of one) in a :py:class:`SharedMemoryBlock`. Pickling it only pickles its position in the
+    shared memory block, it is unpickled as a read-only ``numpy.ndarray`` in the shared memory block. The results of
+    computations with it are plain ``numpy.ndarray`` objects.
+    """
+
+    def __array_finalize__(self, obj):
+        # views of a SharedArray share the memory of the SharedArray
+        self.block = getattr(obj, 'block', None)
+
+    def __array_wrap__(self, array, context=None, return_scalar=False):
+        array = array.view(np.ndarray)
+        if return_scalar:
+            return array[()]
+        return array
+
+    def __reduce__(self):
+        block = self.block
+        if block is not None and block.shared_memory is not None:
+            low, high = byte_bounds(self)
+            # copies of a SharedArray (e.g. ``copy()``) are also SharedArray objects, but not in the shared memory
+            if block.address <= low and high <= block.address + block.size:
+                return attach_array, (block.name, self.ctypes.data - block.address, self.shape, self.strides,
+                                      self.dtype.str)
+        return self.view(np.ndarray).__reduce__()
+
+
+def attach_array(name, offset, shape, strides, dtype):
+    """Return a read-only array in the shared memory block ``name`` - this is how a SharedArray is unpickled"""
+    shared_memory = _attached.get(name)
+    if shared_memory is None:
+        shared_memory = multiprocessing.shared_memory.SharedMemory(name=name)
+        _attached[name] = shared_memory
+    return np.asarray(SharedBuffer(shared_memory, offset, shape, strides, dtype, readonly=True))
+
+
+class SharedDataFrame(pd.DataFrame):
+    """
+    A DataFrame with its numeric columns in shared memory (see :py:func:`share_dataframe`). It is unpickled as a
+    ``pandas.DataFrame`` using the arrays in the shared memory block.
+    """
+
+    def __reduce__(self):
+        columns = [self[column].values if isinstance(self[column].values, SharedArray) else self[column]
+                   for column in self.columns]
+        return rebuild_dataframe, (list(self.columns), self.index, columns)
+
+    def __reduce_ex__(self, protocol):
+        return self.__reduce__()
+
+
+def rebuild_dataframe(column_names, index, columns):
+    return pd.DataFrame(dict(zip(column_names, columns)), index=index, copy=False)
+
+
+def share_dataframe(df, processes=None):
+    """
+    Copy the numeric columns of a DataFrame into a new :py:class:`SharedMemoryBlock`.
+
+    :param df: the DataFrame to share (the column names must be unique)
+    :type df: pandas.DataFrame
+    :param int processes: the number of processes of the calculation, with 1 the DataFrame is not copied
+    :return: the shared memory block (close it when done) and the DataFrame with its numeric columns in it
+    :rtype: tuple[SharedMemoryBlock, SharedDataFrame]
+    """
+    if processes is not None and processes <= 1:
+        return SharedMemoryBlock([], processes), df
+    numeric_columns = [column for column in df.columns
+                       if isinstance(df[column].dtype, np.dtype) and df[column].dtype.kind in 'biuf']
+    block = SharedMemoryBlock([df[column].to_numpy() for column in numeric_columns])
+    shared_columns = dict(zip(numeric_columns, block.arrays))
+    shared_df = SharedDataFrame(dict((column, shared_columns.get(column, df[column])) for column in df.columns),
+                                index=df.index, copy=False)
+    return block, shared_df
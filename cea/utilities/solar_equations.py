@@ -27,6 +27,9 @@ __status__ = "Production"
 
 from cea.utilities.date import get_date_range_hours_from_year
 
+# the key in the metadata of the sensor radiation files with the scale of radiation stored as integers
+SENSOR_SCALE_KEY = b'cea_insolation_scale'
+
 
 def _ephem_setup(latitude, longitude, altitude, pressure, temperature):
     # observer
@@ -206,6 +209,22 @@ def get_equation_of_time(day_date):
 
 # filter sensor points with low solar potential
 
+def read_sensor_results(radiation_sensor_path):
+    """
+    Read the hourly radiation of the sensors of a building (one column per sensor) [Wh/m2]. The radiation is stored
+    either as float32 or as int16 scaled by the factor in the metadata of the file (see
+    :py:func:`cea.resources.radiation.daysim.write_sensor_results`).
+
+    :rtype: pandas.DataFrame
+    """
+    table = feather.read_table(radiation_sensor_path)
+    sensors_rad = table.to_pandas()
+    metadata = table.schema.metadata or {}
+    if SENSOR_SCALE_KEY in metadata:
+        sensors_rad = sensors_rad.astype(np.float32) * np.float32(metadata[SENSOR_SCALE_KEY].decode())
+    return sensors_rad
+
+
 def filter_low_potential(radiation_sensor_path, metadata_csv_path, config):
     """
     To filter the sensor points/hours with low radiation potential.
@@ -242,7 +261,7 @@ def filter_low_potential(radiation_sensor_path, metadata_csv_path, config):
             return x
 
     # read radiation file
-    sensors_rad = feather.read_feather(radiation_sensor_path)
+    sensors_rad = read_sensor_results(radiation_sensor_path)
     sensors_metadata = pd.read_csv(metadata_csv_path)
 
     # join total radiation to sensor_metadata
@@ -644,11 +663,12 @@ def calc_surface_azimuth(xdir, ydir, B):
 # calculate angle of incident
 
 def calc_incident_angle_beam(g, lat, ha, tilt, teta_z):
-    # calculate incident angle beam radiation
-    part1 = sin(lat) * sin(g) * cos(tilt) - cos(lat) * sin(g) * sin(tilt) * cos(teta_z)
-    part2 = cos(lat) * cos(g) * cos(ha) * cos(tilt) + sin(lat) * cos(g) * cos(ha) * sin(tilt) * cos(teta_z)
-    part3 = cos(g) * sin(ha) * sin(tilt) * sin(teta_z)
-    teta_B = acos(part1 + part2 + part3)
+    # calculate incident angle beam radiation (the arguments can be arrays, e.g. hours x groups of panels)
+    part1 = np.sin(lat) * np.sin(g) * np.cos(tilt) - np.cos(lat) * np.sin(g) * np.sin(tilt) * np.cos(teta_z)
+    part2 = np.cos(lat) * np.cos(g) * np.cos(ha) * np.cos(tilt) + np.sin(lat) * np.cos(g) * np.cos(ha) * np.sin(
+        tilt) * np.cos(teta_z)
+    part3 = np.cos(g) * np.sin(ha) * np.sin(tilt) * np.sin(teta_z)
+    teta_B = np.arccos(part1 + part2 + part3)
     return teta_B  # in radains
 
 
@@ -657,33 +677,36 @@ def calc_angle_of_incidence(g, lat, ha, tilt, teta_z):
     To calculate angle of incidence from solar vector and surface normal vector.
     (Validated with Sandia pvlib.irrandiance.aoi)
 
+    The arguments can be floats or arrays that broadcast against each other, e.g. the solar position of each hour
+    (shape ``(hours,)``) and the panel angles of each group of panels (shape ``(groups, 1)``).
+
     :param lat: latitude of the location of case study [radians]
     :param g: declination of the solar position [radians]
     :param ha: hour angle [radians]
     :param tilt: panel surface tilt angle [radians]
     :param teta_z: panel surface azimuth angle [radians]
     :type lat: float
-    :type g: float
-    :type ha: float
-    :type tilt: float
-    :type teta_z: float
+    :type g: float or np.ndarray
+    :type ha: float or np.ndarray
+    :type tilt: float or np.ndarray
+    :type teta_z: float or np.ndarray
     :return teta_B: angle of incidence [radians]
-    :rtype teta_B: float
+    :rtype teta_B: float or np.ndarray
 
     .. [Sproul, A. B., 2017] Sproul, A.B. (2007). Derivation of the solar geometric relationships using vector analysis.
        Renewable Energy, 32(7), 1187-1205.
     """
     # surface normal vector
-    n_E = sin(tilt) * sin(teta_z)
-    n_N = sin(tilt) * cos(teta_z)
-    n_Z = cos(tilt)
+    n_E = np.sin(tilt) * np.sin(teta_z)
+    n_N = np.sin(tilt) * np.cos(teta_z)
+    n_Z = np.cos(tilt)
     # solar vector
-    s_E = -cos(g) * sin(ha)
-    s_N = sin(g) * cos(lat) - cos(g) * sin(lat) * cos(ha)
-    s_Z = cos(g) * cos(lat) * cos(ha) + sin(g) * sin(lat)
+    s_E = -np.cos(g) * np.sin(ha)
+    s_N = np.sin(g) * np.cos(lat) - np.cos(g) * np.sin(lat) * np.cos(ha)
+    s_Z = np.cos(g) * np.cos(lat) * np.cos(ha) + np.sin(g) * np.sin(lat)
 
     # angle of incidence
-    teta_B = acos(n_E * s_E + n_N * s_N + n_Z * s_Z)
+    teta_B = np.arccos(n_E * s_E + n_N * s_N + n_Z * s_Z)
     return teta_B
 
 
@@ -779,3 +802,21 @@ def cal_radiation_type(group, hourly_radiation, weather_data):
         'I_diffuse']  # calculate direct radiation
     radiation_Wperm2.fillna(0, inplace=True)  # set nan to zero
     return radiation_Wperm2
+
+
+def calc_radiation_types(hourly_radiation, weather_data):
+    """
+    Split the mean hourly radiation of all groups of sensors into direct and diffuse radiation at once
+    (see :py:func:`cal_radiation_type` for a single group).
+
+    :param hourly_radiation: mean hourly radiation of the sensors of each group [Wh/m2] (one column per group)
+    :type hourly_radiation: dataframe
+    :param weather_data: weather data read from the epw file
+    :type weather_data: dataframe
+    :return: total, direct and diffuse radiation [Wh/m2], each an array of shape (groups, hours)
+    :rtype: tuple[np.ndarray, np.ndarray, np.ndarray]
+    """
+    I_sol = hourly_radiation.values.T.astype(float)
+    I_diffuse = weather_data.ratio_diffhout.values * I_sol  # calculate diffuse radiation
+    I_direct = I_sol - I_diffuse  # calculate direct radiation
+    return tuple(np.where(np.isnan(I), 0.0, I) for I in (I_sol, I_direct, I_diffuse))  # set nan to zero